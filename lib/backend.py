@@ -48,6 +48,7 @@
 
 import base64
 import errno
+import heapq
 import logging
 import os
 import os.path
@@ -57,7 +58,9 @@ import re
 import shutil
 import signal
 import stat
+import sys
 import tempfile
+import threading
 import time
 import zlib
 import contextlib
@@ -69,6 +72,7 @@ from ganeti import utils
 from ganeti import ssh
 from ganeti import hypervisor
 from ganeti.hypervisor import hv_base
+from ganeti.hypervisor import hv_xen
 from ganeti import constants
 from ganeti.storage import bdev
 from ganeti.storage import drbd
@@ -123,6 +127,32 @@ _RCMD_INVALID_DELAY = 10
 #: command requests arrive
 _RCMD_LOCK_TIMEOUT = _RCMD_INVALID_DELAY * 0.8
 
+#: Maximum number of sections of L{VerifyNode} running at the same time
+_VERIFY_NODE_MAX_THREADS = 8
+
+#: Maximum number of nodes checked at the same time for SSH and TCP
+#: connectivity by L{VerifyNode}
+_VERIFY_NODE_MAX_TARGETS = 16
+
+#: Maximum number of nodes whose SSH key files are updated at the same time
+_SSH_UPDATE_MAX_PARALLEL = 16
+
+#: Base delay (in seconds) before retrying a failed SSH key file update; it is
+#: doubled with every further attempt
+_SSH_UPDATE_BACKOFF = 5
+
+#: Time (in seconds) after which no new attempt is made to update the SSH key
+#: files of a node
+_SSH_UPDATE_NODE_TIMEOUT = 10 * 60
+
+#: Time (in seconds) after which a single attempt to update the SSH key files
+#: of a node is aborted; it then counts as a failed attempt
+_SSH_UPDATE_ATTEMPT_TIMEOUT = 60
+
+#: Digests of the files checked by L{VerifyNode}, see L{utils.FingerprintCache}
+_fingerprint_cache = utils.FingerprintCache(
+  utils.PathJoin(pathutils.RUN_DIR, "verify-fingerprints"))
+
 
 class RPCFail(Exception):
   """Class denoting RPC failure.
@@ -1106,54 +1136,35 @@ def _VerifySshClutter(node_status_list, my_name):
   return result
 
 
-def VerifyNode(what, cluster_name, all_hvparams):
-  """Verify the status of the local node.
-
-  Based on the input L{what} parameter, various checks are done on the
-  local node.
-
-  If the I{filelist} key is present, this list of
-  files is checksummed and the file/checksum pairs are returned.
+def _VerifyHypervisorSection(what, vm_capable, result, all_hvparams):
+  """Runs all hypervisor-related checks of L{VerifyNode}.
 
-  If the I{nodelist} key is present, we check that we have
-  connectivity via ssh with the target nodes (and check the hostname
-  report).
+  """
+  # The checks share the output of the Xen toolstack queries
+  with hv_xen.XenQueryScope():
+    _VerifyHypervisors(what, vm_capable, result, all_hvparams)
+    _VerifyHvparams(what, vm_capable, result)
+    _VerifyInstanceList(what, vm_capable, result, all_hvparams)
+    _VerifyNodeInfo(what, vm_capable, result, all_hvparams)
 
-  If the I{node-net-test} key is present, we check that we have
-  connectivity to the given nodes via both primary IP and, if
-  applicable, secondary IPs.
 
-  @type what: C{dict}
-  @param what: a dictionary of things to check:
-      - filelist: list of files for which to compute checksums
-      - nodelist: list of nodes we should check ssh communication with
-      - node-net-test: list of nodes we should check node daemon port
-        connectivity with
-      - hypervisor: list with hypervisors to run the verify for
-  @type cluster_name: string
-  @param cluster_name: the cluster's name
-  @type all_hvparams: dict of dict of strings
-  @param all_hvparams: a dictionary mapping hypervisor names to hvparams
-  @rtype: dict
-  @return: a dictionary with the same keys as the input dict, and
-      values representing the result of the checks
+def _VerifyFilesSection(what, result):
+  """Computes the checksums of the files requested by L{VerifyNode}.
 
   """
-  result = {}
-  my_name = netutils.Hostname.GetSysName()
-  port = netutils.GetDaemonPort(constants.NODED)
-  vm_capable = my_name not in what.get(constants.NV_NONVMNODES, [])
-
-  _VerifyHypervisors(what, vm_capable, result, all_hvparams)
-  _VerifyHvparams(what, vm_capable, result)
-
   if constants.NV_FILELIST in what:
-    fingerprints = utils.FingerprintFiles(map(vcluster.LocalizeVirtualPath,
-                                              what[constants.NV_FILELIST]))
+    files = map(vcluster.LocalizeVirtualPath, what[constants.NV_FILELIST])
+    (fingerprints, hits) = _fingerprint_cache.FingerprintFiles(files)
     result[constants.NV_FILELIST] = \
       dict((vcluster.MakeVirtualPath(key), value)
            for (key, value) in fingerprints.items())
+    result[constants.NV_FILELIST_CACHE_HITS] = (hits, len(files))
+
 
+def _VerifySshSetupSection(what, result, my_name):
+  """Verifies the client certificate and the SSH key files.
+
+  """
   if constants.NV_CLIENT_CERT in what:
     result[constants.NV_CLIENT_CERT] = _VerifyClientCertificate()
 
@@ -1165,57 +1176,88 @@ def VerifyNode(what, cluster_name, all_hvparams):
       result[constants.NV_SSH_CLUTTER] = \
         _VerifySshClutter(what[constants.NV_SSH_SETUP], my_name)
 
-  if constants.NV_NODELIST in what:
-    (nodes, bynode, mcs) = what[constants.NV_NODELIST]
 
-    # Add nodes from other groups (different for each node)
-    try:
-      nodes.extend(bynode[my_name])
-    except KeyError:
-      pass
+def _VerifyNodeListSection(what, result, my_name, cluster_name):
+  """Verifies the SSH connectivity to other nodes, in parallel.
 
-    # Use a random order
-    random.shuffle(nodes)
+  """
+  if constants.NV_NODELIST not in what:
+    return
 
-    # Try to contact all nodes
-    val = {}
+  (nodes, bynode, mcs) = what[constants.NV_NODELIST]
+
+  # Add nodes from other groups (different for each node)
+  try:
+    nodes.extend(bynode[my_name])
+  except KeyError:
+    pass
+
+  # Use a random order
+  random.shuffle(nodes)
+
+  # We only test if master candidates can communicate to other nodes.
+  # We cannot test if normal nodes cannot communicate with other nodes,
+  # because the administrator might have installed additional SSH keys,
+  # over which Ganeti has no power.
+  if my_name in mcs:
     ssh_port_map = ssconf.SimpleStore().GetSshPortMap()
-    for node in nodes:
-      # We only test if master candidates can communicate to other nodes.
-      # We cannot test if normal nodes cannot communicate with other nodes,
-      # because the administrator might have installed additional SSH keys,
-      # over which Ganeti has no power.
-      if my_name in mcs:
-        success, message = _GetSshRunner(cluster_name). \
-                              VerifyNodeHostname(node, ssh_port_map[node])
-        if not success:
-          val[node] = message
-
-    result[constants.NV_NODELIST] = val
-
-  if constants.NV_NODENETTEST in what:
-    result[constants.NV_NODENETTEST] = tmp = {}
-    my_pip = my_sip = None
-    for name, pip, sip in what[constants.NV_NODENETTEST]:
-      if name == my_name:
-        my_pip = pip
-        my_sip = sip
-        break
-    if not my_pip:
-      tmp[my_name] = ("Can't find my own primary/secondary IP"
-                      " in the node list")
-    else:
-      for name, pip, sip in what[constants.NV_NODENETTEST]:
-        fail = []
-        if not netutils.TcpPing(pip, port, source=my_pip):
-          fail.append("primary")
-        if sip != pip:
-          if not netutils.TcpPing(sip, port, source=my_sip):
-            fail.append("secondary")
-        if fail:
-          tmp[name] = ("failure using the %s interface(s)" %
-                       " and ".join(fail))
+    runner = _GetSshRunner(cluster_name)
+
+    # Try to contact all nodes
+    checks = utils.RunParallel(runner.VerifyNodeHostname,
+                               [(node, ssh_port_map[node]) for node in nodes],
+                               _VERIFY_NODE_MAX_TARGETS)
+  else:
+    checks = []
+
+  result[constants.NV_NODELIST] = \
+    dict((node, message)
+         for (node, (success, message)) in zip(nodes, checks)
+         if not success)
+
+
+def _VerifyNodeNetTestSection(what, result, my_name, port):
+  """Verifies the TCP connectivity to other nodes, in parallel.
+
+  """
+  if constants.NV_NODENETTEST not in what:
+    return
+
+  result[constants.NV_NODENETTEST] = tmp = {}
+  my_pip = my_sip = None
+  for name, pip, sip in what[constants.NV_NODENETTEST]:
+    if name == my_name:
+      my_pip = pip
+      my_sip = sip
+      break
+  if not my_pip:
+    tmp[my_name] = ("Can't find my own primary/secondary IP"
+                    " in the node list")
+    return
+
+  def _PingNode(pip, sip):
+    fail = []
+    if not netutils.TcpPing(pip, port, source=my_pip):
+      fail.append("primary")
+    if sip != pip:
+      if not netutils.TcpPing(sip, port, source=my_sip):
+        fail.append("secondary")
+    return fail
+
+  targets = what[constants.NV_NODENETTEST]
+  failures = utils.RunParallel(_PingNode,
+                               [(pip, sip) for (_, pip, sip) in targets],
+                               _VERIFY_NODE_MAX_TARGETS)
+  for ((name, _, _), fail) in zip(targets, failures):
+    if fail:
+      tmp[name] = ("failure using the %s interface(s)" %
+                   " and ".join(fail))
+
 
+def _VerifyMasterIpSection(what, result, my_name, port):
+  """Verifies that the master IP is reachable.
+
+  """
   if constants.NV_MASTERIP in what:
     # FIXME: add checks on incoming data structures (here and in the
     # rest of the function)
@@ -1227,6 +1269,11 @@ def VerifyNode(what, cluster_name, all_hvparams):
     result[constants.NV_MASTERIP] = netutils.TcpPing(master_ip, port,
                                                      source=source)
 
+
+def _VerifyLocalSection(what, vm_capable, result, my_name):
+  """Runs the quick checks of L{VerifyNode} on local files and settings.
+
+  """
   if constants.NV_USERSCRIPTS in what:
     result[constants.NV_USERSCRIPTS] = \
       [script for script in what[constants.NV_USERSCRIPTS]
@@ -1248,19 +1295,65 @@ def VerifyNode(what, cluster_name, all_hvparams):
         else:
           tmp.append("out of band helper %s is not a file" % path)
 
-  if constants.NV_LVLIST in what and vm_capable:
+  if constants.NV_VERSION in what:
+    result[constants.NV_VERSION] = (constants.PROTOCOL_VERSION,
+                                    constants.RELEASE_VERSION)
+
+  if constants.NV_NODESETUP in what:
+    result[constants.NV_NODESETUP] = tmpr = []
+    if not os.path.isdir("/sys/block") or not os.path.isdir("/sys/class/net"):
+      tmpr.append("The sysfs filesytem doesn't seem to be mounted"
+                  " under /sys, missing required directories /sys/block"
+                  " and /sys/class/net")
+    if (not os.path.isdir("/proc/sys") or
+        not os.path.isfile("/proc/sysrq-trigger")):
+      tmpr.append("The procfs filesystem doesn't seem to be mounted"
+                  " under /proc, missing required directory /proc/sys and"
+                  " the file /proc/sysrq-trigger")
+
+  if constants.NV_TIME in what:
+    result[constants.NV_TIME] = utils.SplitTime(time.time())
+
+  if constants.NV_BRIDGES in what and vm_capable:
+    result[constants.NV_BRIDGES] = [bridge
+                                    for bridge in what[constants.NV_BRIDGES]
+                                    if not utils.BridgeExists(bridge)]
+
+  if what.get(constants.NV_ACCEPTED_STORAGE_PATHS) == my_name:
+    result[constants.NV_ACCEPTED_STORAGE_PATHS] = \
+        filestorage.ComputeWrongFileStoragePaths()
+
+  if what.get(constants.NV_FILE_STORAGE_PATH):
+    pathresult = filestorage.CheckFileStoragePath(
+        what[constants.NV_FILE_STORAGE_PATH])
+    if pathresult:
+      result[constants.NV_FILE_STORAGE_PATH] = pathresult
+
+  if what.get(constants.NV_SHARED_FILE_STORAGE_PATH):
+    pathresult = filestorage.CheckFileStoragePath(
+        what[constants.NV_SHARED_FILE_STORAGE_PATH])
+    if pathresult:
+      result[constants.NV_SHARED_FILE_STORAGE_PATH] = pathresult
+
+
+def _VerifyLvmSection(what, vm_capable, result):
+  """Runs the LVM checks of L{VerifyNode}.
+
+  """
+  if not vm_capable:
+    return
+
+  if constants.NV_LVLIST in what:
     try:
       val = GetVolumeList(utils.ListVolumeGroups().keys())
     except RPCFail, err:
       val = str(err)
     result[constants.NV_LVLIST] = val
 
-  _VerifyInstanceList(what, vm_capable, result, all_hvparams)
-
-  if constants.NV_VGLIST in what and vm_capable:
+  if constants.NV_VGLIST in what:
     result[constants.NV_VGLIST] = utils.ListVolumeGroups()
 
-  if constants.NV_PVLIST in what and vm_capable:
+  if constants.NV_PVLIST in what:
     check_exclusive_pvs = constants.NV_EXCLUSIVEPVS in what
     val = bdev.LogicalVolume.GetPVInfo(what[constants.NV_PVLIST],
                                        filter_allocatable=False,
@@ -1272,29 +1365,33 @@ def VerifyNode(what, cluster_name, all_hvparams):
         pvi.lv_list = []
     result[constants.NV_PVLIST] = map(objects.LvmPvInfo.ToDict, val)
 
-  if constants.NV_VERSION in what:
-    result[constants.NV_VERSION] = (constants.PROTOCOL_VERSION,
-                                    constants.RELEASE_VERSION)
 
-  _VerifyNodeInfo(what, vm_capable, result, all_hvparams)
+def _VerifyDrbdSection(what, vm_capable, result):
+  """Runs the DRBD checks of L{VerifyNode}.
 
-  if constants.NV_DRBDVERSION in what and vm_capable:
-    try:
-      drbd_version = DRBD8.GetProcInfo().GetVersionString()
-    except errors.BlockDeviceError, err:
-      logging.warning("Can't get DRBD version", exc_info=True)
-      drbd_version = str(err)
-    result[constants.NV_DRBDVERSION] = drbd_version
+  """
+  if not vm_capable:
+    return
 
-  if constants.NV_DRBDLIST in what and vm_capable:
-    try:
-      used_minors = drbd.DRBD8.GetUsedDevs()
-    except errors.BlockDeviceError, err:
-      logging.warning("Can't get used minors list", exc_info=True)
-      used_minors = str(err)
-    result[constants.NV_DRBDLIST] = used_minors
+  # Both read /proc/drbd
+  with drbd.DRBD8StateScope():
+    if constants.NV_DRBDVERSION in what:
+      try:
+        drbd_version = DRBD8.GetProcInfo().GetVersionString()
+      except errors.BlockDeviceError, err:
+        logging.warning("Can't get DRBD version", exc_info=True)
+        drbd_version = str(err)
+      result[constants.NV_DRBDVERSION] = drbd_version
 
-  if constants.NV_DRBDHELPER in what and vm_capable:
+    if constants.NV_DRBDLIST in what:
+      try:
+        used_minors = drbd.DRBD8.GetUsedDevs()
+      except errors.BlockDeviceError, err:
+        logging.warning("Can't get used minors list", exc_info=True)
+        used_minors = str(err)
+      result[constants.NV_DRBDLIST] = used_minors
+
+  if constants.NV_DRBDHELPER in what:
     status = True
     try:
       payload = drbd.DRBD8.GetUsermodeHelper()
@@ -1304,44 +1401,88 @@ def VerifyNode(what, cluster_name, all_hvparams):
       payload = str(err)
     result[constants.NV_DRBDHELPER] = (status, payload)
 
-  if constants.NV_NODESETUP in what:
-    result[constants.NV_NODESETUP] = tmpr = []
-    if not os.path.isdir("/sys/block") or not os.path.isdir("/sys/class/net"):
-      tmpr.append("The sysfs filesytem doesn't seem to be mounted"
-                  " under /sys, missing required directories /sys/block"
-                  " and /sys/class/net")
-    if (not os.path.isdir("/proc/sys") or
-        not os.path.isfile("/proc/sysrq-trigger")):
-      tmpr.append("The procfs filesystem doesn't seem to be mounted"
-                  " under /proc, missing required directory /proc/sys and"
-                  " the file /proc/sysrq-trigger")
 
-  if constants.NV_TIME in what:
-    result[constants.NV_TIME] = utils.SplitTime(time.time())
+def _VerifyOsSection(what, vm_capable, result):
+  """Diagnoses the OS definitions for L{VerifyNode}.
 
+  """
   if constants.NV_OSLIST in what and vm_capable:
     result[constants.NV_OSLIST] = DiagnoseOS()
 
-  if constants.NV_BRIDGES in what and vm_capable:
-    result[constants.NV_BRIDGES] = [bridge
-                                    for bridge in what[constants.NV_BRIDGES]
-                                    if not utils.BridgeExists(bridge)]
 
-  if what.get(constants.NV_ACCEPTED_STORAGE_PATHS) == my_name:
-    result[constants.NV_ACCEPTED_STORAGE_PATHS] = \
-        filestorage.ComputeWrongFileStoragePaths()
+def VerifyNode(what, cluster_name, all_hvparams):
+  """Verify the status of the local node.
 
-  if what.get(constants.NV_FILE_STORAGE_PATH):
-    pathresult = filestorage.CheckFileStoragePath(
-        what[constants.NV_FILE_STORAGE_PATH])
-    if pathresult:
-      result[constants.NV_FILE_STORAGE_PATH] = pathresult
+  Based on the input L{what} parameter, various checks are done on the
+  local node.
 
-  if what.get(constants.NV_SHARED_FILE_STORAGE_PATH):
-    pathresult = filestorage.CheckFileStoragePath(
-        what[constants.NV_SHARED_FILE_STORAGE_PATH])
-    if pathresult:
-      result[constants.NV_SHARED_FILE_STORAGE_PATH] = pathresult
+  If the I{filelist} key is present, this list of
+  files is checksummed and the file/checksum pairs are returned.
+
+  If the I{nodelist} key is present, we check that we have
+  connectivity via ssh with the target nodes (and check the hostname
+  report).
+
+  If the I{node-net-test} key is present, we check that we have
+  connectivity to the given nodes via both primary IP and, if
+  applicable, secondary IPs.
+
+  @type what: C{dict}
+  @param what: a dictionary of things to check:
+      - filelist: list of files for which to compute checksums; the number
+        of checksums taken from the cache and the number of files are
+        returned under I{filelist-cache-hits}
+      - nodelist: list of nodes we should check ssh communication with
+      - node-net-test: list of nodes we should check node daemon port
+        connectivity with
+      - hypervisor: list with hypervisors to run the verify for
+      - timings: if present, the time in seconds spent in each section of
+        the verification is returned
+  @type cluster_name: string
+  @param cluster_name: the cluster's name
+  @type all_hvparams: dict of dict of strings
+  @param all_hvparams: a dictionary mapping hypervisor names to hvparams
+  @rtype: dict
+  @return: a dictionary with the same keys as the input dict, and
+      values representing the result of the checks
+
+  """
+  # Independent sections run concurrently, so the time spent is the one of
+  # the slowest section rather than the sum of all of them
+  result = {}
+  my_name = netutils.Hostname.GetSysName()
+  port = netutils.GetDaemonPort(constants.NODED)
+  vm_capable = my_name not in what.get(constants.NV_NONVMNODES, [])
+
+  sections = [
+    ("hypervisor", _VerifyHypervisorSection,
+     (what, vm_capable, result, all_hvparams)),
+    ("files", _VerifyFilesSection, (what, result)),
+    ("ssh-setup", _VerifySshSetupSection, (what, result, my_name)),
+    ("nodelist", _VerifyNodeListSection,
+     (what, result, my_name, cluster_name)),
+    ("node-net-test", _VerifyNodeNetTestSection,
+     (what, result, my_name, port)),
+    ("master-ip", _VerifyMasterIpSection, (what, result, my_name, port)),
+    ("local", _VerifyLocalSection, (what, vm_capable, result, my_name)),
+    ("lvm", _VerifyLvmSection, (what, vm_capable, result)),
+    ("drbd", _VerifyDrbdSection, (what, vm_capable, result)),
+    ("oslist", _VerifyOsSection, (what, vm_capable, result)),
+    ]
+
+  def _RunSection(fn, args):
+    start = time.time()
+    fn(*args)
+    return time.time() - start
+
+  timings = utils.RunParallel(_RunSection,
+                              [(fn, args) for (_, fn, args) in sections],
+                              _VERIFY_NODE_MAX_THREADS)
+
+  if constants.NV_TIMINGS in what:
+    result[constants.NV_TIMINGS] = \
+      dict((name, timing)
+           for ((name, _, _), timing) in zip(sections, timings))
 
   return result
 
@@ -1415,6 +1556,145 @@ def _InitSshUpdateData(data, noded_cert_file, ssconf_store):
   data[constants.SSHS_CLUSTER_NAME] = cluster_name
 
 
+def _SshUpdateFn(run_cmd_fn, cluster_name, node, ssh_port, data,
+                 ssh_update_debug, ssh_update_verbose):
+  """Returns a function running C{ssh_update} on a node with the given data.
+
+  """
+  return compat.partial(run_cmd_fn, cluster_name, node, pathutils.SSH_UPDATE,
+                        ssh_port, data, debug=ssh_update_debug,
+                        verbose=ssh_update_verbose, use_cluster_key=False,
+                        ask_key=False, strict_host_check=False,
+                        timeout=_SSH_UPDATE_ATTEMPT_TIMEOUT)
+
+
+def _SshUpdateError(attempts, last_exception):
+  """Returns the error reported for a node whose SSH key files weren't updated.
+
+  The message is the same as the one of L{utils.RetryByNumberOfTimes}.
+
+  @rtype: L{errors.SshUpdateError}
+
+  """
+  return errors.SshUpdateError("Error after %s retries. Last exception: %s."
+                               % (attempts, last_exception))
+
+
+def _RunSshUpdates(updates, max_parallel=_SSH_UPDATE_MAX_PARALLEL,
+                   backoff=None, timeout=None, _time_fn=time.time):
+  """Updates the SSH key files of several nodes in parallel.
+
+  Each update is attempted up to the given number of times. After a failure,
+  the next attempt on the same node is scheduled C{backoff} seconds later,
+  with the delay doubling on each further failure. Nodes waiting for their next
+  attempt don't take up any of the C{max_parallel} slots, so an unreachable
+  node does not hold up the others. No attempt is started later than
+  C{timeout} seconds after this function was called.
+
+  @type updates: list of tuples of (string, callable, int)
+  @param updates: node names, the functions updating their key files and the
+    maximum number of attempts; the functions raise L{errors.OpExecError} on
+    failures worth retrying
+  @type max_parallel: int
+  @param max_parallel: maximum number of updates running at the same time
+  @type backoff: number
+  @param backoff: the delay before the first retry, defaults to
+    L{_SSH_UPDATE_BACKOFF}
+  @type timeout: number
+  @param timeout: the time after which no new attempt is started, defaults
+    to L{_SSH_UPDATE_NODE_TIMEOUT}
+  @rtype: dict
+  @return: for each node whose update did not succeed, a tuple of the number
+    of attempts and the last exception
+  @raise Exception: any other exception raised by an update is re-raised
+    once the updates in progress are done; no new ones are started
+
+  """
+  if not updates:
+    return {}
+  if backoff is None:
+    backoff = _SSH_UPDATE_BACKOFF
+  if timeout is None:
+    timeout = _SSH_UPDATE_NODE_TIMEOUT
+
+  deadline = _time_fn() + timeout
+  cond = threading.Condition()
+  # Heap of (earliest start, position in updates, attempt)
+  pending = [(0, idx, 1) for idx in range(len(updates))]
+  failures = {}
+  state = {
+    "running": 0,
+    "error": None,
+    }
+
+  def _Next():
+    cond.acquire()
+    try:
+      while state["error"] is None and (pending or state["running"]):
+        if pending:
+          delay = pending[0][0] - _time_fn()
+          if delay <= 0:
+            state["running"] += 1
+            return heapq.heappop(pending)
+          cond.wait(delay)
+        else:
+          # A running update might have to be retried
+          cond.wait()
+      return None
+    finally:
+      cond.release()
+
+  def _Done(idx, attempt, err, exc_info):
+    cond.acquire()
+    try:
+      state["running"] -= 1
+      if exc_info is not None:
+        if state["error"] is None:
+          state["error"] = exc_info
+      elif err is not None:
+        retry_at = _time_fn() + backoff * 2 ** (attempt - 1)
+        if attempt < updates[idx][2] and retry_at <= deadline:
+          heapq.heappush(pending, (retry_at, idx, attempt + 1))
+        else:
+          failures[updates[idx][0]] = (attempt, err)
+      cond.notifyAll()
+    finally:
+      cond.release()
+
+  def _Worker():
+    while True:
+      item = _Next()
+      if item is None:
+        break
+
+      (_, idx, attempt) = item
+      (node, fn, _) = updates[idx]
+      err = None
+      exc_info = None
+      try:
+        fn()
+      except errors.OpExecError, err:
+        logging.error("Error after retry no. %s on node '%s': %s.",
+                      attempt - 1, node, err)
+      except: # pylint: disable=W0702
+        exc_info = sys.exc_info()
+      _Done(idx, attempt, err, exc_info)
+
+  threads = [threading.Thread(target=_Worker)
+             for _ in range(min(len(updates), max(1, max_parallel)))]
+  for thread in threads:
+    thread.setDaemon(True)
+    thread.start()
+  for thread in threads:
+    thread.join()
+
+  exc_info = state["error"]
+  if exc_info is not None:
+    raise exc_info[0], exc_info[1], exc_info[2]
+
+  return failures
+
+
 def AddNodeSshKey(node_uuid, node_name,
                   potential_master_candidates,
                   to_authorized_keys=False,
@@ -1551,6 +1831,7 @@ def AddNodeSshKeyBulk(node_list,
   ssh_port_map = ssconf_store.GetSshPortMap()
 
   # Update the target nodes themselves
+  target_updates = []
   for node_info in node_list:
     logging.debug("Updating SSH key files of target node '%s'.", node_info.name)
     if node_info.get_public_keys:
@@ -1559,21 +1840,22 @@ def AddNodeSshKeyBulk(node_list,
       all_keys = ssh.QueryPubKeyFile(None, key_file=pub_key_file)
       node_data[constants.SSHS_SSH_PUBLIC_KEYS] = \
         (constants.SSHS_OVERRIDE, all_keys)
-
-      try:
-        backoff = 5  # seconds
-        utils.RetryByNumberOfTimes(
-            constants.SSHS_MAX_RETRIES, backoff,
-            errors.SshUpdateError,
-            run_cmd_fn, cluster_name, node_info.name, pathutils.SSH_UPDATE,
-            ssh_port_map.get(node_info.name), node_data,
-            debug=ssh_update_debug, verbose=ssh_update_verbose,
-            use_cluster_key=False, ask_key=False, strict_host_check=False)
-      except errors.SshUpdateError as e:
-        # Clean up the master's public key file if adding key fails
-        if node_info.to_public_keys:
-          ssh.RemovePublicKey(node_info.uuid)
-        raise e
+      target_updates.append(
+        (node_info.name,
+         _SshUpdateFn(run_cmd_fn, cluster_name, node_info.name,
+                      ssh_port_map.get(node_info.name), node_data,
+                      ssh_update_debug, ssh_update_verbose),
+         constants.SSHS_MAX_RETRIES))
+
+  target_failures = _RunSshUpdates(target_updates)
+  if target_failures:
+    failed = [node_info for node_info in node_list
+              if node_info.name in target_failures]
+    # Clean up the master's public key file if adding keys fails
+    for node_info in failed:
+      if node_info.to_public_keys:
+        ssh.RemovePublicKey(node_info.uuid)
+    raise _SshUpdateError(*target_failures[failed[0].name])
 
   # Update all nodes except master and the target nodes
   keys_by_uuid_auth = ssh.QueryPubKeyFile(
@@ -1597,7 +1879,7 @@ def AddNodeSshKeyBulk(node_list,
   master_node = ssconf_store.GetMasterNode()
   online_nodes = ssconf_store.GetOnlineNodeList()
 
-  node_errors = []
+  updates = []
   for node in all_nodes:
     if node == master_node:
       logging.debug("Skipping master node '%s'.", master_node)
@@ -1607,32 +1889,38 @@ def AddNodeSshKeyBulk(node_list,
       continue
     if node in potential_master_candidates:
       logging.debug("Updating SSH key files of node '%s'.", node)
-      try:
-        backoff = 5  # seconds
-        utils.RetryByNumberOfTimes(
-            constants.SSHS_MAX_RETRIES, backoff, errors.SshUpdateError,
-            run_cmd_fn, cluster_name, node, pathutils.SSH_UPDATE,
-            ssh_port_map.get(node), pot_mc_data,
-            debug=ssh_update_debug, verbose=ssh_update_verbose,
-            use_cluster_key=False, ask_key=False, strict_host_check=False)
-      except errors.SshUpdateError as last_exception:
-        error_msg = ("When adding the key of node '%s', updating SSH key"
-                     " files of node '%s' failed after %s retries."
-                     " Not trying again. Last error was: %s." %
-                     (node, node_info.name, constants.SSHS_MAX_RETRIES,
-                      last_exception))
-        node_errors.append((node, error_msg))
-        # We only log the error and don't throw an exception, because
-        # one unreachable node shall not abort the entire procedure.
-        logging.error(error_msg)
-
+      updates.append(
+        (node, _SshUpdateFn(run_cmd_fn, cluster_name, node,
+                            ssh_port_map.get(node), pot_mc_data,
+                            ssh_update_debug, ssh_update_verbose),
+         constants.SSHS_MAX_RETRIES))
     else:
       if to_authorized_keys:
-        run_cmd_fn(cluster_name, node, pathutils.SSH_UPDATE,
-                   ssh_port_map.get(node), base_data,
-                   debug=ssh_update_debug, verbose=ssh_update_verbose,
-                   use_cluster_key=False, ask_key=False,
-                   strict_host_check=False)
+        # Normal nodes are not retried, and failing to update one of them
+        # aborts the operation
+        updates.append(
+          (node, _SshUpdateFn(run_cmd_fn, cluster_name, node,
+                              ssh_port_map.get(node), base_data,
+                              ssh_update_debug, ssh_update_verbose),
+           1))
+
+  failures = _RunSshUpdates(updates)
+
+  node_errors = []
+  for (node, _, attempts) in updates:
+    if node not in failures:
+      continue
+    if attempts == 1:
+      raise failures[node][1]
+    error_msg = ("When adding the key of node '%s', updating SSH key"
+                 " files of node '%s' failed after %s retries."
+                 " Not trying again. Last error was: %s." %
+                 (node, node_info.name, constants.SSHS_MAX_RETRIES,
+                  _SshUpdateError(*failures[node])))
+    node_errors.append((node, error_msg))
+    # We only log the error and don't throw an exception, because
+    # one unreachable node shall not abort the entire procedure.
+    logging.error(error_msg)
 
   return node_errors
 
@@ -1856,6 +2144,7 @@ def RemoveNodeSshKeyBulk(node_list,
       all_nodes_to_remove = [node_info.name for node_info in node_list]
       logging.debug("Removing keys of nodes '%s' from all nodes but itself and"
                     " master.", ", ".join(all_nodes_to_remove))
+      updates = []
       for node in all_nodes:
         if node == master_node:
           logging.debug("Skipping master node '%s'.", master_node)
@@ -1871,43 +2160,35 @@ def RemoveNodeSshKeyBulk(node_list,
           raise errors.OpExecError("No SSH port information available for"
                                    " node '%s', map: %s." %
                                    (node, ssh_port_map))
-        error_msg_final = ("When removing the key of node '%s', updating the"
-                           " SSH key files of node '%s' failed. Last error"
-                           " was: %s.")
         if node in potential_master_candidates:
           logging.debug("Updating key setup of potential master candidate node"
                         " %s.", node)
-          try:
-            backoff = 5  # seconds
-            utils.RetryByNumberOfTimes(
-                constants.SSHS_MAX_RETRIES, backoff, errors.SshUpdateError,
-                run_cmd_fn, cluster_name, node, pathutils.SSH_UPDATE,
-                ssh_port, pot_mc_data,
-                debug=ssh_update_debug, verbose=ssh_update_verbose,
-                use_cluster_key=False, ask_key=False, strict_host_check=False)
-          except errors.SshUpdateError as last_exception:
-            error_msg = error_msg_final % (
-                node_info.name, node, last_exception)
-            result_msgs.append((node, error_msg))
-            logging.error(error_msg)
-
+          node_data = pot_mc_data
+        elif from_authorized_keys:
+          logging.debug("Updating key setup of normal node %s.", node)
+          node_data = base_data
         else:
-          if from_authorized_keys:
-            logging.debug("Updating key setup of normal node %s.", node)
-            try:
-              backoff = 5  # seconds
-              utils.RetryByNumberOfTimes(
-                  constants.SSHS_MAX_RETRIES, backoff, errors.SshUpdateError,
-                  run_cmd_fn, cluster_name, node, pathutils.SSH_UPDATE,
-                  ssh_port, base_data,
-                  debug=ssh_update_debug, verbose=ssh_update_verbose,
-                  use_cluster_key=False, ask_key=False, strict_host_check=False)
-            except errors.SshUpdateError as last_exception:
-              error_msg = error_msg_final % (
-                  node_info.name, node, last_exception)
-              result_msgs.append((node, error_msg))
-              logging.error(error_msg)
-
+          continue
+        updates.append(
+          (node, _SshUpdateFn(run_cmd_fn, cluster_name, node, ssh_port,
+                              node_data, ssh_update_debug,
+                              ssh_update_verbose),
+           constants.SSHS_MAX_RETRIES))
+
+      failures = _RunSshUpdates(updates)
+
+      error_msg_final = ("When removing the key of node '%s', updating the"
+                         " SSH key files of node '%s' failed. Last error"
+                         " was: %s.")
+      for (node, _, _) in updates:
+        if node in failures:
+          error_msg = error_msg_final % (
+              node_info.name, node, _SshUpdateError(*failures[node]))
+          result_msgs.append((node, error_msg))
+          logging.error(error_msg)
+
+  target_updates = []
+  no_changes = False
   for node_info in node_list:
     if node_info.clear_authorized_keys or node_info.from_public_keys or \
         node_info.clear_public_keys:
@@ -1944,25 +2225,28 @@ def RemoveNodeSshKeyBulk(node_list,
       # If we have no changes to any keyfile, just return
       if not (constants.SSHS_SSH_PUBLIC_KEYS in data or
               constants.SSHS_SSH_AUTHORIZED_KEYS in data):
-        return
+        no_changes = True
+        break
 
       logging.debug("Updating SSH key setup of target node '%s'.",
                     node_info.name)
-      try:
-        backoff = 5  # seconds
-        utils.RetryByNumberOfTimes(
-            constants.SSHS_MAX_RETRIES, backoff,
-            errors.SshUpdateError,
-            run_cmd_fn, cluster_name, node_info.name, pathutils.SSH_UPDATE,
-            ssh_port, data,
-            debug=ssh_update_debug, verbose=ssh_update_verbose,
-            use_cluster_key=False, ask_key=False, strict_host_check=False)
-      except errors.SshUpdateError as last_exception:
-        result_msgs.append(
-            (node_info.name,
-             ("Removing SSH keys from node '%s' failed."
-              " This can happen when the node is already unreachable."
-              " Error: %s" % (node_info.name, last_exception))))
+      target_updates.append(
+        (node_info.name,
+         _SshUpdateFn(run_cmd_fn, cluster_name, node_info.name, ssh_port,
+                      data, ssh_update_debug, ssh_update_verbose),
+         constants.SSHS_MAX_RETRIES))
+
+  target_failures = _RunSshUpdates(target_updates)
+  for (node, _, _) in target_updates:
+    if node in target_failures:
+      result_msgs.append(
+          (node,
+           ("Removing SSH keys from node '%s' failed."
+            " This can happen when the node is already unreachable."
+            " Error: %s" % (node, _SshUpdateError(*target_failures[node])))))
+
+  if no_changes:
+    return
 
   if all_keys_to_remove and from_public_keys:
     for node_uuid in nodes_remove_from_public_keys:
@@ -2566,6 +2850,8 @@ def GetAllInstancesInfo(hypervisor_list, all_hvparams):
       - state: xen state of instance (string)
       - time: cpu time of instance (float)
       - vcpus: the number of vcpus
+      - error: why some of the above values may be out of date; only
+        present if the hypervisor couldn't retrieve all of them (string)
 
   """
   output = {}
@@ -2573,13 +2859,16 @@ def GetAllInstancesInfo(hypervisor_list, all_hvparams):
     hvparams = all_hvparams[hname]
     iinfo = hypervisor.GetHypervisor(hname).GetAllInstancesInfo(hvparams)
     if iinfo:
-      for name, _, memory, vcpus, state, times in iinfo:
+      for info in iinfo:
+        (name, _, memory, vcpus, state, times) = info[:6]
         value = {
           "memory": memory,
           "vcpus": vcpus,
           "state": state,
           "time": times,
           }
+        if len(info) > 6:
+          value["error"] = info[6]
         if name in output:
           # we only check static parameters, like memory and vcpus,
           # and not state and time which can change between the
@@ -3775,12 +4064,13 @@ def BlockdevGetmirrorstatus(disks):
 
   """
   stats = []
-  for dsk in disks:
-    rbd = _RecursiveFindBD(dsk)
-    if rbd is None:
-      _Fail("Can't find device %s", dsk)
+  with drbd.DRBD8StateScope():
+    for dsk in disks:
+      rbd = _RecursiveFindBD(dsk)
+      if rbd is None:
+        _Fail("Can't find device %s", dsk)
 
-    stats.append(rbd.CombinedSyncStatus())
+      stats.append(rbd.CombinedSyncStatus())
 
   return stats
 
@@ -3797,19 +4087,20 @@ def BlockdevGetmirrorstatusMulti(disks):
 
   """
   result = []
-  for disk in disks:
-    try:
-      rbd = _RecursiveFindBD(disk)
-      if rbd is None:
-        result.append((False, "Can't find device %s" % disk))
-        continue
+  with drbd.DRBD8StateScope():
+    for disk in disks:
+      try:
+        rbd = _RecursiveFindBD(disk)
+        if rbd is None:
+          result.append((False, "Can't find device %s" % disk))
+          continue
 
-      status = rbd.CombinedSyncStatus()
-    except errors.BlockDeviceError, err:
-      logging.exception("Error while getting disk status")
-      result.append((False, str(err)))
-    else:
-      result.append((True, status))
+        status = rbd.CombinedSyncStatus()
+      except errors.BlockDeviceError, err:
+        logging.exception("Error while getting disk status")
+        result.append((False, str(err)))
+      else:
+        result.append((True, status))
 
   assert len(disks) == len(result)
 
@@ -3864,15 +4155,16 @@ def BlockdevFind(disk):
            information
 
   """
-  try:
-    rbd = _RecursiveFindBD(disk)
-  except errors.BlockDeviceError, err:
-    _Fail("Failed to find device: %s", err, exc=True)
+  with drbd.DRBD8StateScope():
+    try:
+      rbd = _RecursiveFindBD(disk)
+    except errors.BlockDeviceError, err:
+      _Fail("Failed to find device: %s", err, exc=True)
 
-  if rbd is None:
-    return None
+    if rbd is None:
+      return None
 
-  return rbd.GetSyncStatus()
+    return rbd.GetSyncStatus()
 
 
 def BlockdevGetdimensions(disks):
@@ -4783,6 +5075,18 @@ def JobQueueUpdate(file_name, content):
                   gid=getents.daemons_gid, mode=constants.JOB_QUEUE_FILES_PERMS)
 
 
+def JobQueueUpdateMany(files):
+  """Updates several files in the queue directory.
+
+  @type files: list of (str, str)
+  @param files: list of job file names and their new contents, as
+      accepted by L{JobQueueUpdate}
+
+  """
+  for (file_name, content) in files:
+    JobQueueUpdate(file_name, content)
+
+
 def JobQueueRename(old, new):
   """Renames a job queue file.
 
@@ -1881,6 +1881,26 @@ def FormatQueryResult(result, unit=None, format_override=None, separator=None,
   @type verbose: boolean
   @param verbose: whether to use verbose field descriptions or not
 
+  """
+  (columns, stats) = _GetQueryColumns(result.fields, unit, format_override,
+                                      separator, verbose)
+
+  table = FormatTable(result.data, columns, header, separator)
+
+  return (_GetQueryStatus(result, stats), table)
+
+
+def _GetQueryColumns(fdefs, unit, format_override, separator, verbose):
+  """Prepares the table columns for formatting query results.
+
+  See L{FormatQueryResult} for the parameters.
+
+  @type fdefs: list of L{objects.QueryFieldDefinition}
+  @param fdefs: Field definitions
+  @rtype: tuple; (list of L{TableColumn}, dict)
+  @return: Columns and a dictionary counting the result status of the
+    formatted values
+
   """
   if unit is None:
     if separator:
@@ -1898,7 +1918,7 @@ def FormatQueryResult(result, unit=None, format_override=None, separator=None,
       stats[status] += 1
 
   columns = []
-  for fdef in result.fields:
+  for fdef in fdefs:
     assert fdef.title and fdef.name
     (fn, align_right) = _GetColumnFormatter(fdef, format_override, unit)
     columns.append(TableColumn(fdef.title,
@@ -1906,8 +1926,19 @@ def FormatQueryResult(result, unit=None, format_override=None, separator=None,
                                                      verbose),
                                align_right))
 
-  table = FormatTable(result.data, columns, header, separator)
+  return (columns, stats)
+
+
+def _GetQueryStatus(result, stats):
+  """Determines the overall status of a formatted query result.
+
+  @type result: L{objects.QueryResponse}
+  @param result: result of query operation
+  @type stats: dict
+  @param stats: Status counters as returned by L{_GetQueryColumns}, after
+    formatting all rows
 
+  """
   # Collect statistics
   assert len(stats) == len(constants.RS_ALL)
   assert compat.all(count >= 0 for count in stats.values())
@@ -1923,7 +1954,7 @@ def FormatQueryResult(result, unit=None, format_override=None, separator=None,
   else:
     status = QR_NORMAL
 
-  return (status, table)
+  return status
 
 
 def _GetUnknownFields(fdefs):
@@ -2005,13 +2036,25 @@ def GenericList(resource, fields, names, unit, separator, header, cl=None,
 
   found_unknown = _WarnUnknownFields(response.fields)
 
-  (status, data) = FormatQueryResult(response, unit=unit, separator=separator,
-                                     header=header,
-                                     format_override=format_override,
-                                     verbose=verbose)
+  if separator is None:
+    (status, data) = FormatQueryResult(response, unit=unit,
+                                       separator=separator, header=header,
+                                       format_override=format_override,
+                                       verbose=verbose)
 
-  for line in data:
-    ToStdout(line)
+    for line in data:
+      ToStdout(line)
+  else:
+    # Without aligned columns every row can be printed as soon as it has been
+    # formatted, there is no need to keep the whole table in memory
+    (columns, stats) = _GetQueryColumns(response.fields, unit,
+                                        format_override, separator, verbose)
+
+    for line in _FormatSeparatedRows(response.data, columns, header,
+                                     separator):
+      ToStdout(line)
+
+    status = _GetQueryStatus(response, stats)
 
   assert ((found_unknown and status == QR_UNKNOWN) or
           (not found_unknown and status != QR_UNKNOWN))
@@ -2123,6 +2166,9 @@ def FormatTable(rows, columns, header, separator):
   @param separator: String used to separate columns
 
   """
+  if separator is not None:
+    return list(_FormatSeparatedRows(rows, columns, header, separator))
+
   if header:
     data = [[col.title for col in columns]]
     colwidth = [len(col.title) for col in columns]
@@ -2136,18 +2182,13 @@ def FormatTable(rows, columns, header, separator):
 
     formatted = [col.format(value) for value, col in zip(row, columns)]
 
-    if separator is None:
-      # Update column widths
-      for idx, (oldwidth, value) in enumerate(zip(colwidth, formatted)):
-        # Modifying a list's items while iterating is fine
-        colwidth[idx] = max(oldwidth, len(value))
+    # Update column widths
+    for idx, (oldwidth, value) in enumerate(zip(colwidth, formatted)):
+      # Modifying a list's items while iterating is fine
+      colwidth[idx] = max(oldwidth, len(value))
 
     data.append(formatted)
 
-  if separator is not None:
-    # Return early if a separator is used
-    return [separator.join(row) for row in data]
-
   if columns and not columns[-1].align_right:
     # Avoid unnecessary spaces at end of line
     colwidth[-1] = 0
@@ -2159,6 +2200,25 @@ def FormatTable(rows, columns, header, separator):
   return [fmt % tuple(row) for row in data]
 
 
+def _FormatSeparatedRows(rows, columns, header, separator):
+  """Formats table rows with columns divided by a separator.
+
+  See L{FormatTable} for the parameters.
+
+  @rtype: generator
+  @return: One line per row, formatted when requested
+
+  """
+  if header:
+    yield separator.join([col.title for col in columns])
+
+  for row in rows:
+    assert len(row) == len(columns)
+
+    yield separator.join([col.format(value)
+                          for value, col in zip(row, columns)])
+
+
 def FormatTimestamp(ts):
   """Formats a given timestamp.
 
@@ -145,6 +145,7 @@ __all__ = [
   "MAINTAIN_NODE_HEALTH_OPT",
   "MASTER_NETDEV_OPT",
   "MASTER_NETMASK_OPT",
+  "MAX_PARALLEL_OPT",
   "MAX_TRACK_OPT",
   "MC_OPT",
   "MIGRATION_MODE_OPT",
@@ -170,6 +171,7 @@ __all__ = [
   "NODE_PARAMS_OPT",
   "NODE_PLACEMENT_OPT",
   "NODE_POWERED_OPT",
+  "NODE_TIMEOUT_OPT",
   "NODEGROUP_OPT",
   "NODEGROUP_OPT_NAME",
   "NOHDR_OPT",
@@ -1380,6 +1382,16 @@ FAILURE_ONLY_OPT = cli_option("--failure-only", default=False,
                               help=("Hide successful results and show failures"
                                     " only (determined by the exit code)"))
 
+MAX_PARALLEL_OPT = cli_option("--max-parallel", dest="max_parallel",
+                              type="int", default=1, metavar="<N>",
+                              help=("Maximum number of nodes to work on at"
+                                    " the same time"))
+
+NODE_TIMEOUT_OPT = cli_option("--node-timeout", dest="node_timeout",
+                              type="int", default=None, metavar="<seconds>",
+                              help=("Maximum time to wait for each node"
+                                    " (default: no limit)"))
+
 REASON_OPT = cli_option("--reason", default=[],
                         help="The reason for executing the command")
 
@@ -37,10 +37,12 @@
 
 from cStringIO import StringIO
 import os
+import threading
 import time
 import OpenSSL
 import tempfile
 import itertools
+import logging
 
 from ganeti.cli import *
 from ganeti import bootstrap
@@ -70,6 +72,11 @@ GROUPS_OPT = cli_option("--groups", default=False,
                         action="store_true", dest="groups",
                         help="Arguments are node groups instead of nodes")
 
+RELAY_OPT = cli_option("--relay", dest="relay", default=False,
+                       action="store_true",
+                       help=("Let master candidates which already received"
+                             " the file copy it on to other nodes"))
+
 FORCE_FAILOVER = cli_option("--yes-do-it", dest="yes_do_it",
                             help="Override interactive check for --no-voting",
                             default=False, action="store_true")
@@ -650,6 +657,104 @@ def ShowClusterConfig(opts, args):
   return 0
 
 
+def _CopyFileToNodes(copy_fn, nodes, relays, max_parallel):
+  """Copies a file to nodes, possibly relaying it through other nodes.
+
+  At most C{max_parallel} copies run at the same time. Without relays, all
+  copies are made by the master node; otherwise every node, including the
+  master node, makes only one copy at a time, and relays start copying the
+  file on to other nodes as soon as they have it. If a copy made by a relay
+  fails, it is retried from the master node.
+
+  @type copy_fn: callable
+  @param copy_fn: function copying the file, called with the source node
+      (C{None} for the master node) and the target node; returns whether the
+      copy succeeded
+  @type nodes: list of string
+  @param nodes: the nodes to copy the file to
+  @type relays: set of string
+  @param relays: the nodes which can copy the file on to other nodes
+  @type max_parallel: int
+  @param max_parallel: maximum number of copies running at the same time
+  @rtype: list of string
+  @return: the nodes to which the file could not be copied
+
+  """
+  max_parallel = max(1, max_parallel)
+  cond = threading.Condition()
+  pending = list(nodes)
+  from_master = set()
+  failed = set()
+  # Number of copies each source can still start, None being the master node
+  if relays:
+    slots = {None: 1}
+  else:
+    slots = {None: max_parallel}
+  state = {"running": 0}
+
+  def _Next():
+    cond.acquire()
+    try:
+      while pending or state["running"]:
+        sources = sorted(src for (src, free) in slots.items()
+                         if src is not None and free > 0)
+        for node in pending:
+          if sources and node not in from_master:
+            source = sources[0]
+          elif slots[None] > 0:
+            source = None
+          else:
+            continue
+          pending.remove(node)
+          slots[source] -= 1
+          state["running"] += 1
+          return (source, node)
+        cond.wait()
+      return None
+    finally:
+      cond.release()
+
+  def _Done(source, node, success):
+    cond.acquire()
+    try:
+      state["running"] -= 1
+      slots[source] += 1
+      if success:
+        if node in relays:
+          slots[node] = 1
+      elif source is None:
+        failed.add(node)
+      else:
+        from_master.add(node)
+        pending.append(node)
+      cond.notifyAll()
+    finally:
+      cond.release()
+
+  def _Worker():
+    while True:
+      item = _Next()
+      if item is None:
+        break
+      (source, node) = item
+      try:
+        success = copy_fn(source, node)
+      except Exception: # pylint: disable=W0703
+        logging.exception("Copying to node %s failed", node)
+        success = False
+      _Done(source, node, success)
+
+  threads = [threading.Thread(target=_Worker)
+             for _ in range(min(len(nodes), max_parallel))]
+  for thread in threads:
+    thread.setDaemon(True)
+    thread.start()
+  for thread in threads:
+    thread.join()
+
+  return [node for node in nodes if node in failed]
+
+
 def ClusterCopyFile(opts, args):
   """Copy a file from master to some nodes.
 
@@ -673,22 +778,114 @@ def ClusterCopyFile(opts, args):
   try:
     cluster_name = cl.QueryConfigValues(["cluster_name"])[0]
 
-    results = GetOnlineNodes(nodes=opts.nodes, cl=qcl, filter_master=True,
-                             secondary_ips=opts.use_replication_network,
-                             nodegroup=opts.nodegroup)
-    ports = GetNodesSshPorts(opts.nodes, qcl)
+    names = GetOnlineNodes(nodes=opts.nodes, cl=qcl, filter_master=True,
+                           nodegroup=opts.nodegroup)
+    if names:
+      node_info = qcl.QueryNodes(names=names,
+                                 fields=["name", "sip", "ndp/ssh_port",
+                                         "master_candidate"],
+                                 use_locking=False)
+    else:
+      node_info = []
   finally:
     cl.Close()
     qcl.Close()
 
+  targets = []
+  ports = {}
+  relays = set()
+  for (name, sip, port, master_candidate) in node_info:
+    if opts.use_replication_network:
+      node = sip
+    else:
+      node = name
+    targets.append(node)
+    ports[node] = port
+    # Only the SSH keys of master candidates are authorized on all nodes
+    if opts.relay and master_candidate:
+      relays.add(node)
+
   srun = ssh.SshRunner(cluster_name)
-  for (node, port) in zip(results, ports):
-    if not srun.CopyFileToNode(node, port, filename):
-      ToStderr("Copy of file %s to node %s:%d failed", filename, node, port)
+
+  def _Copy(source, node):
+    if source is None:
+      return srun.CopyFileToNode(node, ports[node], filename,
+                                 timeout=opts.node_timeout)
+
+    command = srun.BuildCopyCmd(node, ports[node], filename, source=source)
+    result = utils.RunCmd(srun.BuildCmd(source, constants.SSH_LOGIN_USER,
+                                        utils.ShellQuoteArgs(command),
+                                        port=ports[source]),
+                          timeout=opts.node_timeout)
+    if result.failed:
+      logging.error("Copy from node %s to node %s failed (%s) error '%s'",
+                    source, node, result.fail_reason, result.output)
+    return not result.failed
+
+  for node in _CopyFileToNodes(_Copy, targets, relays, opts.max_parallel):
+    ToStderr("Copy of file %s to node %s:%d failed", filename, node,
+             ports[node])
 
   return 0
 
 
+def _RunClusterCommandParallel(run_fn, nodes, master_node, max_parallel,
+                               failure_only):
+  """Runs a command on several nodes at the same time.
+
+  The output of each node is printed as it arrives, with every line prefixed
+  by the node name. If the master node is among the nodes, the command is run
+  on it only after all other nodes are done.
+
+  @type run_fn: callable
+  @param run_fn: function running the command, called with the node name and
+      the function to pass the output lines to (or C{None}); returns a
+      L{utils.RunResult}
+  @type nodes: list of string
+  @param nodes: the nodes to run the command on
+  @type master_node: string
+  @param master_node: the name of the master node
+  @type max_parallel: int
+  @param max_parallel: maximum number of nodes to run the command on at the
+      same time
+  @type failure_only: bool
+  @param failure_only: whether to only print the output of failed commands,
+      once they are done
+  @rtype: list of tuples
+  @return: the nodes on which the command failed and the reasons
+
+  """
+  lock = threading.Lock()
+
+  def _Output(name, line):
+    lock.acquire()
+    try:
+      ToStdout("%s: %s", name, line)
+    finally:
+      lock.release()
+
+  def _Run(name):
+    if failure_only:
+      result = run_fn(name, None)
+      if result.failed:
+        for line in result.output.splitlines():
+          _Output(name, line)
+    else:
+      result = run_fn(name, compat.partial(_Output, name))
+    return result
+
+  others = [name for name in nodes if name != master_node]
+  results = dict(zip(others,
+                     utils.RunParallel(_Run, [(name, ) for name in others],
+                                       max_parallel)))
+  if master_node in nodes:
+    results[master_node] = _Run(master_node)
+
+  return [(name, results[name].fail_reason)
+          for name in nodes
+          if results[name].failed]
+
+
 def RunClusterCommand(opts, args):
   """Run a command on some nodes.
 
@@ -705,7 +902,7 @@ def RunClusterCommand(opts, args):
   command = " ".join(args)
 
   nodes = GetOnlineNodes(nodes=opts.nodes, cl=qcl, nodegroup=opts.nodegroup)
-  ports = GetNodesSshPorts(nodes, qcl)
+  ports = dict(zip(nodes, GetNodesSshPorts(nodes, qcl)))
 
   cluster_name, master_node = cl.QueryConfigValues(["cluster_name",
                                                     "master_node"])
@@ -717,8 +914,25 @@ def RunClusterCommand(opts, args):
     nodes.remove(master_node)
     nodes.append(master_node)
 
-  for (name, port) in zip(nodes, ports):
-    result = srun.Run(name, constants.SSH_LOGIN_USER, command, port=port)
+  def _Run(name, line_fn):
+    return utils.RunCmd(srun.BuildCmd(name, constants.SSH_LOGIN_USER, command,
+                                      port=ports[name]),
+                        timeout=opts.node_timeout, line_fn=line_fn)
+
+  if opts.max_parallel > 1:
+    failed = _RunClusterCommandParallel(_Run, nodes, master_node,
+                                        opts.max_parallel, opts.failure_only)
+    ToStdout("------------------------------------------------")
+    if failed:
+      ToStdout("Command failed on %d of %d node(s):", len(failed), len(nodes))
+      for (name, reason) in failed:
+        ToStdout("  %s: %s", name, reason)
+    else:
+      ToStdout("Command succeeded on all %d node(s)", len(nodes))
+    return 0
+
+  for name in nodes:
+    result = _Run(name, None)
 
     if opts.failure_only and result.exit_code == constants.EXIT_SUCCESS:
       # Do not output anything for successful commands
@@ -1578,12 +1792,19 @@ def QueueOps(opts, args):
     drain_flag = command == "drain"
     client.SetQueueDrainFlag(drain_flag)
   elif command == "info":
-    result = client.QueryConfigValues(["drain_flag"])
-    if result[0]:
+    (drain_flag, stats) = client.QueryConfigValues(["drain_flag",
+                                                    "job_replication"])
+    if drain_flag:
       val = "set"
     else:
       val = "unset"
     ToStdout("The drain flag is %s" % val)
+    if stats:
+      ToStdout("Job file replication: %d file(s) in %d batch(es), at most %d"
+               " per batch", stats["files"], stats["batches"],
+               stats["max_batch"])
+      ToStdout("Replication latency: %.3fs average, %.3fs maximum",
+               stats["avg_latency"], stats["max_latency"])
   else:
     raise errors.OpPrereqError("Command '%s' is not valid." % command,
                                errors.ECODE_INVAL)
@@ -2515,11 +2736,13 @@ commands = {
     "", "Shows the cluster master"),
   "copyfile": (
     ClusterCopyFile, [ArgFile(min=1, max=1)],
-    [NODE_LIST_OPT, USE_REPL_NET_OPT, NODEGROUP_OPT],
+    [NODE_LIST_OPT, USE_REPL_NET_OPT, NODEGROUP_OPT, MAX_PARALLEL_OPT,
+     NODE_TIMEOUT_OPT, RELAY_OPT],
     "[-n node...] <filename>", "Copies a file to all (or only some) nodes"),
   "command": (
     RunClusterCommand, [ArgCommand(min=1)],
-    [NODE_LIST_OPT, NODEGROUP_OPT, SHOW_MACHINE_OPT, FAILURE_ONLY_OPT],
+    [NODE_LIST_OPT, NODEGROUP_OPT, SHOW_MACHINE_OPT, FAILURE_ONLY_OPT,
+     MAX_PARALLEL_OPT, NODE_TIMEOUT_OPT],
     "[-n node...] <command>", "Runs a command on all (or only some) nodes"),
   "info": (
     ShowClusterConfig, ARGS_NONE, [ROMAN_OPT],
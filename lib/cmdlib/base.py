@@ -73,20 +73,23 @@ class LUWConfdClient(object):
   def __init__(self, lu):
     self.lu = lu
 
+  def _Client(self):
+    return self.lu.wconfd.GetSharedClient()
+
   def TryUpdateLocks(self, req):
-    self.lu.wconfd.Client().TryUpdateLocks(self.lu.wconfdcontext, req)
+    self._Client().TryUpdateLocks(self.lu.wconfdcontext, req)
     self.lu.wconfdlocks = \
-      self.lu.wconfd.Client().ListLocks(self.lu.wconfdcontext)
+      self._Client().ListLocks(self.lu.wconfdcontext)
 
   def DownGradeLocksLevel(self, level):
-    self.lu.wconfd.Client().DownGradeLocksLevel(self.lu.wconfdcontext, level)
+    self._Client().DownGradeLocksLevel(self.lu.wconfdcontext, level)
     self.lu.wconfdlocks = \
-      self.lu.wconfd.Client().ListLocks(self.lu.wconfdcontext)
+      self._Client().ListLocks(self.lu.wconfdcontext)
 
   def FreeLocksLevel(self, level):
-    self.lu.wconfd.Client().FreeLocksLevel(self.lu.wconfdcontext, level)
+    self._Client().FreeLocksLevel(self.lu.wconfdcontext, level)
     self.lu.wconfdlocks = \
-      self.lu.wconfd.Client().ListLocks(self.lu.wconfdcontext)
+      self._Client().ListLocks(self.lu.wconfdcontext)
 
 
 class LogicalUnit(object): # pylint: disable=R0902
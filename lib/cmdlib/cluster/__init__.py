@@ -330,7 +330,7 @@ class LUClusterDestroy(LogicalUnit):
                                                      master_params, ems)
     result.Warn("Error disabling the master IP address", self.LogWarning)
 
-    self.wconfd.Client().PrepareClusterDestruction(self.wconfdcontext)
+    self.wconfd.GetSharedClient().PrepareClusterDestruction(self.wconfdcontext)
 
     # signal to the job queue that the cluster is gone
     LUClusterDestroy.clusterHasBeenDestroyed = True
@@ -85,6 +85,11 @@ def _GetAllHypervisorParameters(cluster, instances):
   return hvp_data
 
 
+#: Sections of the node verification taking longer than this number of
+#: seconds are reported
+_SLOW_NODE_VERIFY_SECTION = 10.0
+
+
 class _VerifyErrors(object):
   """Mix-in for cluster/group verify LUs.
 
@@ -700,6 +705,26 @@ class LUClusterVerifyGroup(LogicalUnit, _VerifyErrors):
                     "user scripts not present or not executable: %s" %
                     utils.CommaJoin(sorted(broken_scripts)))
 
+  def _VerifyNodeTimings(self, ninfo, nresult):
+    """Report the slow sections of the node verification.
+
+    @type ninfo: L{objects.Node}
+    @param ninfo: the node to check
+    @param nresult: the remote results for the node
+
+    """
+    timings = nresult.get(constants.NV_TIMINGS, None)
+    if not isinstance(timings, dict):
+      return
+
+    slow = sorted(((timing, name) for (name, timing) in timings.items()
+                   if timing >= _SLOW_NODE_VERIFY_SECTION), reverse=True)
+    if slow:
+      self._feedback_fn("  - NOTICE: node %s: slow verification checks: %s" %
+                        (ninfo.name,
+                         utils.CommaJoin("%s (%.1fs)" % (name, timing)
+                                         for (timing, name) in slow)))
+
   def _VerifyNodeNetwork(self, ninfo, nresult):
     """Check the node network connectivity results.
 
@@ -1884,6 +1909,7 @@ class LUClusterVerifyGroup(LogicalUnit, _VerifyErrors):
       constants.NV_HVINFO: self.cfg.GetHypervisorType(),
       constants.NV_NODESETUP: None,
       constants.NV_TIME: None,
+      constants.NV_TIMINGS: None,
       constants.NV_MASTERIP: (self.cfg.GetMasterNodeName(), master_ip),
       constants.NV_OSLIST: None,
       constants.NV_NONVMNODES: self.cfg.GetNonVmCapableNodeNameList(),
@@ -2109,6 +2135,7 @@ class LUClusterVerifyGroup(LogicalUnit, _VerifyErrors):
 
       nimg.call_ok = self._VerifyNode(node_i, nresult)
       self._VerifyNodeTime(node_i, nresult, nvinfo_starttime, nvinfo_endtime)
+      self._VerifyNodeTimings(node_i, nresult)
       self._VerifyNodeNetwork(node_i, nresult)
       self._VerifyNodeUserScripts(node_i, nresult)
       self._VerifyOob(node_i, nresult)
@@ -43,7 +43,6 @@ much memory.
 # pylint: disable=R0904
 # R0904: Too many public methods
 
-import copy
 import os
 import random
 import logging
@@ -56,6 +55,7 @@ from ganeti.config.utils import ConfigSync, ConfigManager
 from ganeti.config.verify import (VerifyType, VerifyNic, VerifyIpolicy,
                                   ValidateConfig)
 
+from ganeti import compat
 from ganeti import errors
 from ganeti import utils
 from ganeti import constants
@@ -111,7 +111,7 @@ def GetConfig(ec_id, livelock, **kwargs):
   # if the config is to be opened in the accept_foreign mode, we should
   # also tell the RPC client not to check for the master node
   accept_foreign = kwargs.get('accept_foreign', False)
-  kwargs['wconfd'] = wc.Client(allow_non_master=accept_foreign)
+  kwargs['wconfd'] = wc.GetSharedClient(allow_non_master=accept_foreign)
 
   return ConfigWriter(**kwargs)
 
@@ -119,6 +119,66 @@ def GetConfig(ec_id, livelock, **kwargs):
 # job id used for resource management at config upgrade time
 _UPGRADE_CONFIG_JID = "jid-cfg-upgrade"
 
+# configuration members whose objects can be written back individually
+_DELTA_CONTAINERS = ("instances", "nodes", "nodegroups", "networks", "disks")
+
+# configuration to start the next online ConfigWriter with
+_config_snapshot = None
+
+
+class _ConfigSnapshot(object):
+  """Configuration objects passed on to the next L{ConfigWriter}.
+
+  """
+  def __init__(self, serial_no, data):
+    """Initializes this class.
+
+    @type serial_no: int
+    @param serial_no: the serial number of the configuration
+    @type data: L{objects.ConfigData}
+    @param data: unmodified, upgraded objects built from the configuration
+
+    """
+    self.serial_no = serial_no
+    self._data = data
+
+  def TakeData(self):
+    """Returns the objects of this snapshot.
+
+    The objects are returned only once, as they are modified in place by
+    their user.
+
+    @rtype: L{objects.ConfigData} or None
+
+    """
+    (data, self._data) = (self._data, None)
+    return data
+
+
+def SetConfigSnapshot(data):
+  """Provides a recent configuration for the next L{ConfigWriter}.
+
+  The next online L{ConfigWriter} created uses the configuration for its
+  first read, if WConfd reports it as unchanged; it then doesn't need to
+  transfer, parse and upgrade the configuration again.
+
+  @type data: L{_ConfigSnapshot}
+  @param data: the configuration as returned by
+      L{ConfigWriter.GetConfigSnapshot}
+
+  """
+  global _config_snapshot # pylint: disable=W0603
+  _config_snapshot = data
+
+
+def _TakeConfigSnapshot():
+  """Returns and forgets the configuration set by L{SetConfigSnapshot}.
+
+  """
+  global _config_snapshot # pylint: disable=W0603
+  (data, _config_snapshot) = (_config_snapshot, None)
+  return data
+
 
 def _MatchNameComponentIgnoreCase(short_name, names):
   """Wrapper around L{utils.text.MatchNameComponent}.
@@ -165,8 +225,13 @@ class ConfigWriter(object):
                accept_foreign=False, wconfdcontext=None, wconfd=None):
     self.write_count = 0
     self._config_data = None
+    # configuration objects to use for the first read, if WConfd reports
+    # that they are still current
+    self._config_snapshot = None
     self._SetConfigData(None)
     self._offline = offline
+    if not offline:
+      self._config_snapshot = _TakeConfigSnapshot()
     if cfg_file is None:
       self._cfg_file = pathutils.CLUSTER_CONF_FILE
     else:
@@ -186,6 +251,7 @@ class ConfigWriter(object):
     self._lock_count = 0
     self._lock_current_shared = None
     self._lock_forced = False
+    self._ResetDirty()
 
   def _ConfigData(self):
     return self._config_data
@@ -1383,6 +1449,7 @@ class ConfigWriter(object):
 
     """
     self._ConfigData().cluster.install_image = install_image
+    self._MarkDirty("cluster")
 
   @ConfigSync(shared=1)
   def GetInstanceCommunicationNetwork(self):
@@ -1405,6 +1472,7 @@ class ConfigWriter(object):
 
     """
     self._ConfigData().cluster.instance_communication_network = network_name
+    self._MarkDirty("cluster")
 
   @ConfigSync(shared=1)
   def GetZeroingImage(self):
@@ -1437,6 +1505,7 @@ class ConfigWriter(object):
 
     """
     self._ConfigData().cluster.compression_tools = tools
+    self._MarkDirty("cluster")
 
   @ConfigSync()
   def AddNodeGroup(self, group, ec_id, check_uuid=True):
@@ -1485,6 +1554,8 @@ class ConfigWriter(object):
 
     self._ConfigData().nodegroups[group.uuid] = group
     self._ConfigData().cluster.serial_no += 1
+    self._MarkDirty("nodegroups", group.uuid)
+    self._MarkDirty("cluster")
 
   @ConfigSync()
   def RemoveNodeGroup(self, group_uuid):
@@ -1504,6 +1575,8 @@ class ConfigWriter(object):
 
     del self._ConfigData().nodegroups[group_uuid]
     self._ConfigData().cluster.serial_no += 1
+    self._MarkDirty("nodegroups", group_uuid)
+    self._MarkDirty("cluster")
 
   def _UnlockedLookupNodeGroup(self, target):
     """Lookup a node group's UUID.
@@ -1748,6 +1821,7 @@ class ConfigWriter(object):
 
     inst = self._ConfigData().instances[inst_uuid]
     inst.name = new_name
+    self._MarkDirty("instances", inst_uuid)
 
     instance_disks = self._UnlockedGetInstanceDisks(inst_uuid)
     for (_, disk) in enumerate(instance_disks):
@@ -1757,9 +1831,11 @@ class ConfigWriter(object):
         disk.logical_id = (disk.logical_id[0],
                            utils.PathJoin(file_storage_dir, inst.name,
                                           os.path.basename(disk.logical_id[1])))
+        self._MarkDirty("disks", disk.uuid)
 
     # Force update of ssconf files
     self._ConfigData().cluster.serial_no += 1
+    self._MarkDirty("cluster")
 
   def MarkInstanceDown(self, inst_uuid):
     """Mark the status of an instance to down in the configuration.
@@ -2037,6 +2113,7 @@ class ConfigWriter(object):
 
     """
     self._UnlockedGetDiskInfo(disk_uuid).nodes = nodes
+    self._MarkDirty("disks", disk_uuid)
 
   @ConfigSync()
   def SetDiskLogicalID(self, disk_uuid, logical_id):
@@ -2059,6 +2136,7 @@ class ConfigWriter(object):
                                    logical_id)
 
     disk.logical_id = logical_id
+    self._MarkDirty("disks", disk_uuid)
 
   def _UnlockedGetInstanceNames(self, inst_uuids):
     return [self._UnlockedGetInstanceName(uuid) for uuid in inst_uuids]
@@ -2080,6 +2158,8 @@ class ConfigWriter(object):
     assert node.uuid in self._ConfigData().nodegroups[node.group].members
     self._ConfigData().nodes[node.uuid] = node
     self._ConfigData().cluster.serial_no += 1
+    self._MarkDirty("nodes", node.uuid)
+    self._MarkDirty("cluster")
 
   @ConfigSync()
   def AddNode(self, node, ec_id):
@@ -2104,6 +2184,8 @@ class ConfigWriter(object):
     self._UnlockedRemoveNodeFromGroup(self._ConfigData().nodes[node_uuid])
     del self._ConfigData().nodes[node_uuid]
     self._ConfigData().cluster.serial_no += 1
+    self._MarkDirty("nodes", node_uuid)
+    self._MarkDirty("cluster")
 
   def ExpandNodeName(self, short_name):
     """Attempt to expand an incomplete node name into a node UUID.
@@ -2473,6 +2555,7 @@ class ConfigWriter(object):
         mod_list.append(node)
         node.master_candidate = True
         node.serial_no += 1
+        self._MarkDirty("nodes", node.uuid)
         mc_now += 1
       if mc_now != mc_max:
         # this should not happen
@@ -2480,6 +2563,7 @@ class ConfigWriter(object):
                         " fill the candidate pool (%d/%d)", mc_now, mc_max)
       if mod_list:
         self._ConfigData().cluster.serial_no += 1
+        self._MarkDirty("cluster")
 
     return mod_list
 
@@ -2579,8 +2663,14 @@ class ConfigWriter(object):
       obj.serial_no += 1
       obj.mtime = now
 
+    for (node, old_group, new_group) in resmod:
+      self._MarkDirty("nodes", node.uuid)
+      self._MarkDirty("nodegroups", old_group.uuid)
+      self._MarkDirty("nodegroups", new_group.uuid)
+
     # Force ssconf update
     self._ConfigData().cluster.serial_no += 1
+    self._MarkDirty("cluster")
 
   def _BumpSerialNo(self):
     """Bump up the serial number of the config.
@@ -2601,6 +2691,32 @@ class ConfigWriter(object):
             self._AllNICs() +
             [self._ConfigData().cluster])
 
+  @ConfigSync(shared=1)
+  def GetConfigSnapshot(self):
+    """Returns the current configuration for passing it to a new process.
+
+    The returned value includes the current configuration objects, which
+    are shared with this ConfigWriter and must not be modified; it is meant
+    to be passed to L{SetConfigSnapshot} in a forked process.
+
+    @return: an opaque value, or C{None} if the configuration wasn't
+        received from WConfd
+
+    """
+    data = self._ConfigData()
+    if self._offline or data is None:
+      return None
+    return _ConfigSnapshot(data.serial_no, data)
+
+  def IsConfigSnapshotCurrent(self, snapshot):
+    """Checks whether WConfd still has the configuration of a snapshot.
+
+    @param snapshot: a value returned by L{GetConfigSnapshot}
+    @rtype: bool
+
+    """
+    return self._wconfd.ReadConfigSince(snapshot.serial_no) is None
+
   def GetConfigManager(self, shared=False, forcelock=False):
     """Returns a ConfigManager, which is suitable to perform a synchronized
     block of configuration operations.
@@ -2618,6 +2734,67 @@ class ConfigWriter(object):
   def _LockCount(self):
     return self._lock_count
 
+  def _ResetDirty(self):
+    """Forget about all objects marked as modified.
+
+    """
+    self._dirty_objects = dict((name, set()) for name in _DELTA_CONTAINERS)
+    self._dirty_cluster = False
+    self._dirty_full = False
+    self._base_serial = None
+
+  def _MarkDirty(self, container, uuid=None):
+    """Mark an object as modified under the exclusive configuration lock.
+
+    Only marked objects are sent to WConfd when the configuration is written
+    back, see L{_GetConfigDelta}.
+
+    @type container: string
+    @param container: either C{"cluster"} or one of L{_DELTA_CONTAINERS}
+    @type uuid: string
+    @param uuid: the UUID of the modified (added or removed) object
+
+    """
+    if container == "cluster":
+      self._dirty_cluster = True
+    else:
+      self._dirty_objects[container].add(uuid)
+
+  def _RequireFullWrite(self):
+    """Request the whole configuration to be written back.
+
+    """
+    self._dirty_full = True
+
+  def _GetConfigDelta(self):
+    """Compute the partial update for the objects marked as modified.
+
+    @rtype: dict or None
+    @return: the update to be sent to WConfd, or C{None} if the whole
+        configuration needs to be written
+
+    """
+    if (self._dirty_full or self._base_serial is None or
+        not (self._dirty_cluster or compat.any(self._dirty_objects.values()))):
+      return None
+
+    data = self._ConfigData()
+    delta = {
+      "base_serial_no": self._base_serial,
+      "serial_no": data.serial_no,
+      "mtime": data.mtime,
+      }
+    if self._dirty_cluster:
+      delta["cluster"] = data.cluster.ToDict()
+    for name in _DELTA_CONTAINERS:
+      uuids = self._dirty_objects[name]
+      if not uuids:
+        continue
+      objs = getattr(data, name)
+      delta[name] = dict((uuid, objs[uuid].ToDict() if uuid in objs else None)
+                         for uuid in uuids)
+    return delta
+
   def _OpenConfig(self, shared, force=False):
     """Read the config data from WConfd or disk.
 
@@ -2632,6 +2809,8 @@ class ConfigWriter(object):
         return # we already have the lock, do nothing
     else:
       self._lock_current_shared = shared
+      if not shared:
+        self._ResetDirty()
     if force:
       self._lock_forced = True
     # Read the configuration data. If offline, read the file directly.
@@ -2674,27 +2853,54 @@ class ConfigWriter(object):
       # Upgrade configuration if needed
       self._UpgradeConfig(saveafter=True)
     else:
+      # Objects handed out before may have been modified in memory, e.g. by
+      # a failed LU, so the configuration is only ever reused from a snapshot
+      # which hasn't been used yet
+      snapshot = self._config_snapshot
+      if snapshot is None:
+        snapshot_serial = -1
+      else:
+        snapshot_serial = snapshot.serial_no
+
       if shared and not force:
         if self._config_data is None:
           logging.debug("Requesting config, as I have no up-to-date copy")
-          dict_data = self._wconfd.ReadConfig()
+          dict_data = self._wconfd.ReadConfigSince(snapshot_serial)
+          unchanged = dict_data is None
         else:
           dict_data = None
+          unchanged = False
+          snapshot = None
       else:
         # poll until we acquire the lock
         while True:
-          dict_data = \
-              self._wconfd.LockConfig(self._GetWConfdContext(), bool(shared))
-          logging.debug("Received config from WConfd.LockConfig [shared=%s]",
-                        bool(shared))
-          if dict_data is not None:
+          (locked, dict_data) = \
+              self._wconfd.LockConfigSince(self._GetWConfdContext(),
+                                           bool(shared), snapshot_serial)
+          logging.debug("Received config from WConfd.LockConfigSince"
+                        " [shared=%s, unchanged=%s]", bool(shared),
+                        locked and dict_data is None)
+          if locked:
             break
           time.sleep(random.random())
+        unchanged = dict_data is None
+
+      if snapshot is not None:
+        self._config_snapshot = None
 
       try:
-        if dict_data is not None:
+        if unchanged:
+          logging.debug("Config unchanged since serial %d, using the snapshot",
+                        snapshot_serial)
+          self._SetConfigData(snapshot.TakeData())
+        elif dict_data is not None:
           self._SetConfigData(objects.ConfigData.FromDict(dict_data))
+          full_write = self._dirty_full
+          self._dirty_full = False
           self._UpgradeConfig()
+          self._dirty_full = self._dirty_full or full_write
+        if not shared:
+          self._base_serial = self._ConfigData().serial_no
       except Exception, err:
         raise errors.ConfigurationError(err)
 
@@ -2717,6 +2923,21 @@ class ConfigWriter(object):
       self._wconfd.UnlockConfig(self._GetWConfdContext())
       self._lock_forced = False
 
+  def _SerializeForComparison(self):
+    """Serializes the configuration data for detecting modifications.
+
+    The keys are sorted and private fields included, so the results for two
+    points in time are equal if and only if the configuration written back
+    would be the same.
+
+    @rtype: string
+
+    """
+    return serializer.DumpJson(
+      self._ConfigData().ToDict(_with_private=True),
+      private_encoder=serializer.EncodeWithPrivateFields,
+      sort_keys=True)
+
   # TODO: To WConfd
   def _UpgradeConfig(self, saveafter=False):
     """Run any upgrade steps.
@@ -2730,10 +2951,10 @@ class ConfigWriter(object):
         "safe" place.
 
     """
-    # Keep a copy of the persistent part of _config_data to check for changes
-    # Serialization doesn't guarantee order in dictionaries
+    # Keep a snapshot of the persistent part of _config_data to check for
+    # changes; serializing it is much cheaper than a deep copy
     if saveafter:
-      oldconf = copy.deepcopy(self._ConfigData().ToDict())
+      oldconf = self._SerializeForComparison()
     else:
       oldconf = None
 
@@ -2743,14 +2964,17 @@ class ConfigWriter(object):
     for item in self._AllUUIDObjects():
       if item.uuid is None:
         item.uuid = self._GenerateUniqueID(_UPGRADE_CONFIG_JID)
+        self._RequireFullWrite()
     if not self._ConfigData().nodegroups:
       default_nodegroup_name = constants.INITIAL_NODE_GROUP_NAME
       default_nodegroup = objects.NodeGroup(name=default_nodegroup_name,
                                             members=[])
       self._UnlockedAddNodeGroup(default_nodegroup, _UPGRADE_CONFIG_JID, True)
+      self._RequireFullWrite()
     for node in self._ConfigData().nodes.values():
       if not node.group:
         node.group = self._UnlockedLookupNodeGroup(None)
+        self._RequireFullWrite()
       # This is technically *not* an upgrade, but needs to be done both when
       # nodegroups are being added, and upon normally loading the config,
       # because the members list of a node group is discarded upon
@@ -2758,7 +2982,7 @@ class ConfigWriter(object):
       self._UnlockedAddNodeToGroup(node.uuid, node.group)
 
     if saveafter:
-      modified = (oldconf != self._ConfigData().ToDict())
+      modified = (oldconf != self._SerializeForComparison())
     else:
       modified = True # can't prove it didn't change, but doesn't matter
     if modified and saveafter:
@@ -2799,8 +3023,10 @@ class ConfigWriter(object):
     else:
       try:
         if releaselock:
-          res = self._wconfd.WriteConfigAndUnlock(self._GetWConfdContext(),
-                                                  self._ConfigData().ToDict())
+          res = self._WriteConfigDeltaAndUnlock()
+          if res is None:
+            res = self._wconfd.WriteConfigAndUnlock(self._GetWConfdContext(),
+                                                    self._ConfigData().ToDict())
           if not res:
             logging.warning("WriteConfigAndUnlock indicates we already have"
                             " released the lock; assuming this was just a retry"
@@ -2815,6 +3041,28 @@ class ConfigWriter(object):
 
     self.write_count += 1
 
+  def _WriteConfigDeltaAndUnlock(self):
+    """Send only the modified objects to WConfd and release the lock.
+
+    @rtype: bool or None
+    @return: the result of the WConfd call, or C{None} if the whole
+        configuration has to be written instead
+
+    """
+    delta = self._GetConfigDelta()
+    self._ResetDirty()
+    if delta is None:
+      return None
+    try:
+      return self._wconfd.WriteConfigDeltaAndUnlock(self._GetWConfdContext(),
+                                                    delta)
+    except errors.LockError:
+      raise
+    except Exception, err: # pylint: disable=W0703
+      logging.warning("Partial configuration update failed (%s), writing the"
+                      " whole configuration", err)
+      return None
+
   def _GetAllHvparamsStrings(self, hypervisors):
     """Get the hvparams of all given hypervisors from the config.
 
@@ -2972,6 +3220,7 @@ class ConfigWriter(object):
     """
     self._ConfigData().cluster.volume_group_name = vg_name
     self._ConfigData().cluster.serial_no += 1
+    self._MarkDirty("cluster")
 
   @ConfigSync(shared=1)
   def GetDiagnoseDataCollectorFilename(self):
@@ -2987,6 +3236,7 @@ class ConfigWriter(object):
     """
     self._ConfigData().cluster.diagnose_data_collector_filename = fn
     self._ConfigData().cluster.serial_no += 1
+    self._MarkDirty("cluster")
 
   @ConfigSync(shared=1)
   def GetDRBDHelper(self):
@@ -3002,6 +3252,7 @@ class ConfigWriter(object):
     """
     self._ConfigData().cluster.drbd_usermode_helper = drbd_helper
     self._ConfigData().cluster.serial_no += 1
+    self._MarkDirty("cluster")
 
   @ConfigSync(shared=1)
   def GetMACPrefix(self):
@@ -3099,6 +3350,7 @@ class ConfigWriter(object):
   def UpdateOfflineCluster(self, target, feedback_fn):
     self._ConfigData().cluster = target
     target.serial_no += 1
+    self._MarkDirty("cluster")
     target.mtime = time.time()
     self.VerifyConfigAndLog(feedback_fn=feedback_fn)
 
@@ -3199,6 +3451,8 @@ class ConfigWriter(object):
     net.ctime = net.mtime = time.time()
     self._ConfigData().networks[net.uuid] = net
     self._ConfigData().cluster.serial_no += 1
+    self._MarkDirty("networks", net.uuid)
+    self._MarkDirty("cluster")
 
   def _UnlockedLookupNetwork(self, target):
     """Lookup a network's UUID.
@@ -3249,6 +3503,8 @@ class ConfigWriter(object):
 
     del self._ConfigData().networks[network_uuid]
     self._ConfigData().cluster.serial_no += 1
+    self._MarkDirty("networks", network_uuid)
+    self._MarkDirty("cluster")
 
   def _UnlockedGetGroupNetParams(self, net_uuid, node_uuid):
     """Get the netparams (mode, link) of a network.
@@ -3320,6 +3576,7 @@ class ConfigWriter(object):
 
     """
     self._ConfigData().cluster.candidate_certs = certs
+    self._MarkDirty("cluster")
 
   @ConfigSync()
   def AddNodeToCandidateCerts(self, node_uuid, cert_digest,
@@ -3349,6 +3606,7 @@ class ConfigWriter(object):
           warn_fn("Overriding differing certificate digest for node %s"
                   % node_uuid)
     cluster.candidate_certs[node_uuid] = cert_digest
+    self._MarkDirty("cluster")
 
   @ConfigSync()
   def RemoveNodeFromCandidateCerts(self, node_uuid,
@@ -3368,6 +3626,7 @@ class ConfigWriter(object):
                 " in the candidate map." % node_uuid)
       return
     del cluster.candidate_certs[node_uuid]
+    self._MarkDirty("cluster")
 
   def FlushConfig(self):
     """Force the distribution of configuration to master candidates.
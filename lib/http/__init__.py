@@ -73,9 +73,11 @@ HTTP_WWW_AUTHENTICATE = "WWW-Authenticate"
 HTTP_AUTHORIZATION = "Authorization"
 HTTP_AUTHENTICATION_INFO = "Authentication-Info"
 HTTP_ALLOW = "Allow"
+HTTP_ACCEPT = "Accept"
 
 HTTP_APP_OCTET_STREAM = "application/octet-stream"
 HTTP_APP_JSON = "application/json"
+HTTP_APP_NDJSON = "application/x-ndjson"
 
 _SSL_UNEXPECTED_EOF = "Unexpected EOF"
 
@@ -97,6 +99,14 @@ class HttpError(Exception):
   """
 
 
+class HttpNoMessage(HttpError):
+  """Internal exception for a connection closed before a message was sent.
+
+  This should only be used for internal error reporting.
+
+  """
+
+
 class HttpConnectionClosed(Exception):
   """Internal exception for a closed connection.
 
@@ -791,7 +801,7 @@ class HttpMessageReader(object):
   PS_BODY = "entity-body"
   PS_COMPLETE = "complete"
 
-  def __init__(self, sock, msg, read_timeout):
+  def __init__(self, sock, msg, read_timeout, unparsed=""):
     """Reads an HTTP message from a socket.
 
     @type sock: socket
@@ -800,11 +810,17 @@ class HttpMessageReader(object):
     @param msg: Object for the read message
     @type read_timeout: float
     @param read_timeout: Read timeout for socket
+    @type unparsed: string
+    @param unparsed: Data already read from the socket, usually the
+      C{unparsed} attribute of the reader of the previous message
 
     """
     self.sock = sock
     self.msg = msg
 
+    #: Data read after the end of the message (e.g. a pipelined request)
+    self.unparsed = ""
+
     self.start_line_buffer = None
     self.header_buffer = StringIO()
     self.body_buffer = StringIO()
@@ -812,11 +828,14 @@ class HttpMessageReader(object):
     self.content_length = None
     self.peer_will_close = None
 
-    buf = ""
+    buf = unparsed
     eof = False
+
+    if buf:
+      # The whole message may have been read already
+      buf = self._ContinueParsing(buf, eof)
+
     while self.parser_status != self.PS_COMPLETE:
-      # TODO: Don't read more than necessary (Content-Length), otherwise
-      # data might be lost and/or an error could occur
       data = SocketOperation(sock, SOCKOP_RECV, SOCK_BUF_SIZE, read_timeout)
 
       if data:
@@ -832,13 +851,16 @@ class HttpMessageReader(object):
       if (eof and
           self.parser_status in (self.PS_START_LINE,
                                  self.PS_HEADERS)):
+        if self.parser_status == self.PS_START_LINE and not buf:
+          raise HttpNoMessage("Connection closed before a message was sent")
         raise HttpError("Connection closed prematurely")
 
     # Parse rest
     buf = self._ContinueParsing(buf, True)
 
     assert self.parser_status == self.PS_COMPLETE
-    assert not buf, "Parser didn't read full response"
+
+    self.unparsed = buf
 
     # Body is complete
     msg.body = self.body_buffer.getvalue()
@@ -910,8 +932,14 @@ class HttpMessageReader(object):
 
     if self.parser_status == self.PS_BODY:
       # TODO: Implement max size for body_buffer
-      self.body_buffer.write(buf)
-      buf = ""
+      if self.content_length is None:
+        self.body_buffer.write(buf)
+        buf = ""
+      else:
+        # Anything after the body belongs to the next message
+        missing = max(0, self.content_length - self.body_buffer.tell())
+        self.body_buffer.write(buf[:missing])
+        buf = buf[missing:]
 
       # Check whether we've read everything
       #
@@ -34,6 +34,7 @@
 import logging
 import pycurl
 import threading
+import time
 from cStringIO import StringIO
 
 from ganeti import http
@@ -42,6 +43,13 @@ from ganeti import netutils
 from ganeti import locking
 
 
+#: Maximum number of idle connections kept per (host, port) in a L{CurlPool}
+CURL_POOL_MAX_IDLE_PER_HOST = 4
+
+#: Number of seconds after which an idle pooled connection is closed
+CURL_POOL_IDLE_TIMEOUT = 60.0
+
+
 class HttpClientRequest(object):
   def __init__(self, host, port, method, path, headers=None, post_data=None,
                read_timeout=None, curl_config_fn=None, nicename=None,
@@ -130,13 +138,16 @@ class HttpClientRequest(object):
     return "https://%s%s" % (address, self.path)
 
 
-def _StartRequest(curl, req):
+def _StartRequest(curl, req, keep_alive=False):
   """Starts a request on a cURL object.
 
   @type curl: pycurl.Curl
   @param curl: cURL object
   @type req: L{HttpClientRequest}
   @param req: HTTP request
+  @type keep_alive: bool
+  @param keep_alive: Whether the connection and the SSL session may be reused
+    by later requests on the same cURL object
 
   """
   logging.debug("Starting request %r", req)
@@ -170,9 +181,15 @@ def _StartRequest(curl, req):
   else:
     curl.setopt(pycurl.TIMEOUT, int(req.read_timeout))
 
-  # Disable SSL session ID caching (pycurl >= 7.16.0)
+  # SSL session ID caching (pycurl >= 7.16.0) is only useful if the cURL
+  # object is going to be reused
   if hasattr(pycurl, "SSL_SESSIONID_CACHE"):
-    curl.setopt(pycurl.SSL_SESSIONID_CACHE, False)
+    curl.setopt(pycurl.SSL_SESSIONID_CACHE, keep_alive)
+
+  if keep_alive:
+    curl.setopt(pycurl.FORBID_REUSE, False)
+    if hasattr(pycurl, "TCP_KEEPALIVE"):
+      curl.setopt(pycurl.TCP_KEEPALIVE, True)
 
   curl.setopt(pycurl.WRITEFUNCTION, resp_buffer.write)
 
@@ -254,15 +271,205 @@ class _NoOpRequestMonitor(object): # pylint: disable=W0232
   Disable = acquire
 
 
+class CurlPool(object):
+  """Pool of reusable cURL objects.
+
+  Idle cURL objects are kept per (host, port), together with the cURL multi
+  objects used for processing requests. As libcurl keeps the connection
+  cache with the multi object and the SSL session ID cache with the easy
+  handle, a request using pooled objects can reuse the existing connection
+  (or at least the SSL session) instead of doing a full TCP and SSL
+  handshake.
+
+  """
+  def __init__(self, max_idle=CURL_POOL_MAX_IDLE_PER_HOST,
+               idle_timeout=CURL_POOL_IDLE_TIMEOUT,
+               _curl=pycurl.Curl, _curl_multi=pycurl.CurlMulti,
+               _time_fn=time.time):
+    """Initializes this class.
+
+    @type max_idle: int
+    @param max_idle: Maximum number of idle cURL objects per (host, port)
+    @type idle_timeout: number
+    @param idle_timeout: Seconds after which an idle cURL object is closed
+
+    """
+    self._max_idle = max_idle
+    self._idle_timeout = idle_timeout
+    self._curl = _curl
+    self._curl_multi = _curl_multi
+    self._time_fn = _time_fn
+
+    # Can be used by several threads at the same time
+    self._lock = threading.Lock()
+
+    # Idle objects, (host, port) as key, list of (curl, last use) as value
+    self._idle = {}
+
+    # Idle multi objects; usually there is only one, more are only created
+    # when several threads process requests at the same time
+    self._idle_multi = []
+
+    self.hits = 0
+    self.misses = 0
+    self.evictions = 0
+
+  def _ExpireIdleUnlocked(self, now):
+    """Closes all cURL objects which have been idle for too long.
+
+    """
+    for (key, handles) in self._idle.items():
+      keep = []
+
+      for (curl, last_use) in handles:
+        if now - last_use > self._idle_timeout:
+          self.evictions += 1
+          curl.close()
+        else:
+          keep.append((curl, last_use))
+
+      if keep:
+        self._idle[key] = keep
+      else:
+        del self._idle[key]
+
+  def Get(self, host, port):
+    """Returns a cURL object for a request to the given host and port.
+
+    """
+    self._lock.acquire()
+    try:
+      self._ExpireIdleUnlocked(self._time_fn())
+
+      handles = self._idle.get((host, port), None)
+      if handles:
+        (curl, _) = handles.pop()
+        if not handles:
+          del self._idle[(host, port)]
+        self.hits += 1
+      else:
+        curl = None
+        self.misses += 1
+    finally:
+      self._lock.release()
+
+    if curl is None:
+      return self._curl()
+
+    # Drop all options set for the previous request; live connections and
+    # the SSL session ID cache are kept
+    curl.reset()
+
+    return curl
+
+  def Release(self, host, port, curl, reusable=True):
+    """Returns a cURL object to the pool.
+
+    @type reusable: bool
+    @param reusable: Whether the object can be used for further requests;
+      objects whose last request failed are closed instead
+
+    """
+    if not reusable:
+      curl.close()
+      return
+
+    self._lock.acquire()
+    try:
+      handles = self._idle.setdefault((host, port), [])
+      if len(handles) >= self._max_idle:
+        self.evictions += 1
+        curl.close()
+      else:
+        handles.append((curl, self._time_fn()))
+    finally:
+      self._lock.release()
+
+  def GetMulti(self):
+    """Returns a cURL multi object for processing requests.
+
+    The multi object is used by the calling thread only, until it is given
+    back using L{ReleaseMulti}.
+
+    """
+    self._lock.acquire()
+    try:
+      if self._idle_multi:
+        return self._idle_multi.pop()
+    finally:
+      self._lock.release()
+
+    return self._curl_multi()
+
+  def ReleaseMulti(self, multi):
+    """Returns a cURL multi object to the pool.
+
+    @param multi: multi object without any easy handles left
+
+    """
+    self._lock.acquire()
+    try:
+      self._idle_multi.append(multi)
+    finally:
+      self._lock.release()
+
+  def Close(self):
+    """Closes all idle cURL objects.
+
+    """
+    self._lock.acquire()
+    try:
+      for handles in self._idle.values():
+        for (curl, _) in handles:
+          curl.close()
+      self._idle.clear()
+
+      for multi in self._idle_multi:
+        multi.close()
+      del self._idle_multi[:]
+    finally:
+      self._lock.release()
+
+  def GetStats(self):
+    """Returns usage counters for this pool.
+
+    @rtype: dict
+
+    """
+    self._lock.acquire()
+    try:
+      return {
+        "hits": self.hits,
+        "misses": self.misses,
+        "evictions": self.evictions,
+        "idle": sum(len(handles) for handles in self._idle.values()),
+        }
+    finally:
+      self._lock.release()
+
+  def GetLockInfo(self, requested): # pylint: disable=W0613
+    """Returns the pool counters in the format used by the lock monitor.
+
+    @type requested: set
+    @param requested: Requested information, see C{query.LQ_*}
+
+    """
+    stats = self.GetStats()
+    return [("rpc-pool", ("hits=%(hits)s misses=%(misses)s"
+                          " evictions=%(evictions)s idle=%(idle)s" % stats),
+             None, None)]
+
+
 class _PendingRequestMonitor(object):
   _LOCK = "_lock"
 
-  def __init__(self, owner, pending_fn):
+  def __init__(self, owner, pending_fn, curl_pool=None):
     """Initializes this class.
 
     """
     self._owner = owner
     self._pending_fn = pending_fn
+    self._curl_pool = curl_pool
 
     # The lock monitor runs in another thread, hence locking is necessary
     self._lock = locking.SharedLock("PendingHttpRequests")
@@ -301,6 +508,9 @@ class _PendingRequestMonitor(object):
             name = req.nicename
           result.append(("rpc/%s" % name, None, [owner_name], None))
 
+      if self._curl_pool:
+        result.extend(self._curl_pool.GetLockInfo(requested))
+
     return result
 
 
@@ -352,14 +562,17 @@ def _ProcessCurlRequests(multi, requests):
     multi.select(1.0)
 
 
-def ProcessRequests(requests, lock_monitor_cb=None, _curl=pycurl.Curl,
-                    _curl_multi=pycurl.CurlMulti,
+def ProcessRequests(requests, lock_monitor_cb=None, curl_pool=None,
+                    _curl=pycurl.Curl, _curl_multi=pycurl.CurlMulti,
                     _curl_process=_ProcessCurlRequests):
   """Processes any number of HTTP client requests.
 
   @type requests: list of L{HttpClientRequest}
   @param requests: List of all requests
   @param lock_monitor_cb: Callable for registering with lock monitor
+  @type curl_pool: L{CurlPool} or None
+  @param curl_pool: Pool to take cURL objects from and to return them to; if
+    not given, a new cURL object is used for every request
 
   """
   assert compat.all((req.error is None and
@@ -368,30 +581,52 @@ def ProcessRequests(requests, lock_monitor_cb=None, _curl=pycurl.Curl,
                      req.resp_body is None)
                     for req in requests)
 
+  if curl_pool is None:
+    get_curl_fn = lambda _: _curl()
+  else:
+    get_curl_fn = lambda req: curl_pool.Get(req.host, req.port)
+
   # Prepare all requests
   curl_to_client = \
     dict((client.GetCurlHandle(), client)
-         for client in map(lambda req: _StartRequest(_curl(), req), requests))
+         for client in [_StartRequest(get_curl_fn(req), req,
+                                      keep_alive=(curl_pool is not None))
+                        for req in requests])
 
   assert len(curl_to_client) == len(requests)
 
   if lock_monitor_cb:
     monitor = _PendingRequestMonitor(threading.currentThread(),
-                                     curl_to_client.values)
+                                     curl_to_client.values,
+                                     curl_pool=curl_pool)
     lock_monitor_cb(monitor)
   else:
     monitor = _NoOpRequestMonitor
 
+  if curl_pool is None:
+    multi = _curl_multi()
+  else:
+    # The connection cache is kept with the multi object
+    multi = curl_pool.GetMulti()
+
   # Process all requests and act based on the returned values
-  for (curl, msg) in _curl_process(_curl_multi(), curl_to_client.keys()):
+  for (curl, msg) in _curl_process(multi, curl_to_client.keys()):
     monitor.acquire(shared=0)
     try:
-      curl_to_client.pop(curl).Done(msg)
+      client = curl_to_client.pop(curl)
+      client.Done(msg)
     finally:
       monitor.release()
 
+    if curl_pool is not None:
+      req = client.GetCurrentRequest()
+      curl_pool.Release(req.host, req.port, curl, reusable=(msg is None))
+
   assert not curl_to_client, "Not all requests were processed"
 
+  if curl_pool is not None:
+    curl_pool.ReleaseMulti(multi)
+
   # Don't try to read information anymore as all requests have been processed
   monitor.Disable()
 
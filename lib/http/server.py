@@ -33,13 +33,18 @@
 
 import BaseHTTPServer
 import cgi
+import errno
 import logging
 import os
+import resource
+import select
 import socket
 import time
 import signal
 import asyncore
 
+import OpenSSL
+
 from ganeti import http
 from ganeti import utils
 from ganeti import netutils
@@ -68,6 +73,9 @@ DEFAULT_ERROR_MESSAGE = """\
 </html>
 """
 
+#: Value of the "Connection" header for persistent connections
+_CONNECTION_KEEP_ALIVE = "keep-alive"
+
 
 def _DateTimeHeader(gmnow=None):
   """Return the current date and time formatted for a message header.
@@ -277,13 +285,16 @@ class HttpResponder(object):
     """
     self._handler = handler
 
-  def __call__(self, fn):
+  def __call__(self, fn, keep_alive=False):
     """Handles a request.
 
     @type fn: callable
     @param fn: Callback for retrieving HTTP request, must return a tuple
       containing request message (L{http.HttpMessage}) and C{None} or the
       message reader (L{_HttpClientToServerMessageReader})
+    @type keep_alive: bool
+    @param keep_alive: Whether the connection may be kept open for further
+      requests if the client supports it
 
     """
     response_msg = http.HttpMessage()
@@ -293,6 +304,10 @@ class HttpResponder(object):
 
     force_close = True
 
+    # Used for the response if the request can't be read
+    request_msg = http.HttpMessage()
+    req_msg_reader = None
+
     try:
       (request_msg, req_msg_reader) = fn()
 
@@ -315,8 +330,13 @@ class HttpResponder(object):
       # Only wait for client to close if we didn't have any exception.
       force_close = False
 
+    keep_alive = (keep_alive and not force_close and
+                  req_msg_reader is not None and
+                  not req_msg_reader.peer_will_close)
+
     return (request_msg, req_msg_reader, force_close,
-            self._Finalize(self.responses, response_msg))
+            self._Finalize(self.responses, response_msg,
+                           keep_alive=keep_alive))
 
   @staticmethod
   def _SetError(responses, handler, response_msg, err):
@@ -356,15 +376,23 @@ class HttpResponder(object):
     response_msg.body = body
 
   @staticmethod
-  def _Finalize(responses, msg):
+  def _Finalize(responses, msg, keep_alive=False):
     assert msg.start_line.reason is None
 
     if not msg.headers:
       msg.headers = {}
 
+    if keep_alive:
+      connection = _CONNECTION_KEEP_ALIVE
+
+      # The client can only find the end of the response through its length
+      # if the connection isn't closed
+      msg.headers[http.HTTP_CONTENT_LENGTH] = len(msg.body or "")
+    else:
+      connection = "close"
+
     msg.headers.update({
-      # TODO: Keep-alive is not supported
-      http.HTTP_CONNECTION: "close",
+      http.HTTP_CONNECTION: connection,
       http.HTTP_DATE: _DateTimeHeader(),
       http.HTTP_SERVER: http.HTTP_GANETI_VERSION,
       })
@@ -388,7 +416,9 @@ class HttpServerRequestExecutor(object):
   This class implements the server side of HTTP. It's based on code of
   Python's BaseHTTPServer, from both version 2.4 and 3k. It does not
   support non-ASCII character encodings. Keep-alive connections are
-  not supported.
+  only supported if requested by the caller.
+
+  @ivar requests_handled: Number of requests read from the connection
 
   """
   # Timeouts in seconds for socket layer
@@ -396,9 +426,16 @@ class HttpServerRequestExecutor(object):
   READ_TIMEOUT = 10
   CLOSE_TIMEOUT = 1
 
-  def __init__(self, server, handler, sock, client_addr):
+  # How long to wait for another request on a persistent connection
+  KEEP_ALIVE_TIMEOUT = 5
+
+  def __init__(self, server, handler, sock, client_addr, keep_alive=False):
     """Initializes this class.
 
+    @type keep_alive: bool
+    @param keep_alive: Whether to serve further requests on the same
+      connection if the client supports it
+
     """
     responder = HttpResponder(handler)
 
@@ -411,6 +448,11 @@ class HttpServerRequestExecutor(object):
     request_msg_reader = None
     force_close = True
 
+    # Data read after the end of the previous request
+    unparsed = ""
+
+    self.requests_handled = 0
+
     logging.debug("Connection from %s:%s", client_addr[0], client_addr[1])
     try:
       # Block for closing connection
@@ -424,9 +466,30 @@ class HttpServerRequestExecutor(object):
             # Ignore rest
             return
 
-        (request_msg, request_msg_reader, force_close, response_msg) = \
-          responder(compat.partial(self._ReadRequest, sock, self.READ_TIMEOUT))
-        if response_msg:
+        while True:
+          # Every request starts out like the first one
+          request_msg_reader = None
+          force_close = True
+
+          try:
+            (request_msg, request_msg_reader, force_close, response_msg) = \
+              responder(compat.partial(self._ReadRequest, sock,
+                                       self.READ_TIMEOUT, unparsed=unparsed),
+                        keep_alive=keep_alive)
+          except http.HttpNoMessage:
+            if not self.requests_handled:
+              raise
+            # The client closed the persistent connection; any other error
+            # is reported just like for the first request
+            logging.debug("Persistent connection from %s:%s closed by client",
+                          client_addr[0], client_addr[1])
+            break
+
+          self.requests_handled += 1
+
+          if not response_msg:
+            break
+
           # HttpMessage.start_line can be of different types
           # Instance of 'HttpClientToServerStartLine' has no 'code' member
           # pylint: disable=E1103,E1101
@@ -434,6 +497,16 @@ class HttpServerRequestExecutor(object):
                        request_msg.start_line, response_msg.start_line.code)
           self._SendResponse(sock, request_msg, response_msg,
                              self.WRITE_TIMEOUT)
+
+          if (response_msg.headers.get(http.HTTP_CONNECTION) !=
+              _CONNECTION_KEEP_ALIVE):
+            break
+
+          # Pipelined requests may have been read along with this one
+          unparsed = request_msg_reader.unparsed
+          if not (unparsed or
+                  self._WaitForRequest(sock, self.KEEP_ALIVE_TIMEOUT)):
+            break
       finally:
         http.ShutdownConnection(sock, self.CLOSE_TIMEOUT, self.WRITE_TIMEOUT,
                                 request_msg_reader, force_close)
@@ -443,14 +516,29 @@ class HttpServerRequestExecutor(object):
       logging.debug("Disconnected %s:%s", client_addr[0], client_addr[1])
 
   @staticmethod
-  def _ReadRequest(sock, timeout):
+  def _WaitForRequest(sock, timeout):
+    """Waits for another request on a persistent connection.
+
+    @rtype: bool
+    @return: Whether data is available before the timeout expired
+
+    """
+    if isinstance(sock, OpenSSL.SSL.ConnectionType) and sock.pending():
+      # Data has already been read from the socket by OpenSSL
+      return True
+
+    return utils.WaitForFdCondition(sock, select.POLLIN, timeout) is not None
+
+  @staticmethod
+  def _ReadRequest(sock, timeout, unparsed=""):
     """Reads a request sent by client.
 
     """
     msg = http.HttpMessage()
 
     try:
-      reader = _HttpClientToServerMessageReader(sock, msg, timeout)
+      reader = _HttpClientToServerMessageReader(sock, msg, timeout,
+                                                unparsed=unparsed)
     except http.HttpSocketTimeout:
       raise http.HttpError("Timeout while reading request")
     except socket.error, err:
@@ -471,15 +559,53 @@ class HttpServerRequestExecutor(object):
       raise http.HttpError("Error sending response: %s" % err)
 
 
+def AddPreforkOptions(parser):
+  """Adds the command line options for pre-forked workers to a parser.
+
+  @type parser: optparse.OptionParser
+
+  """
+  parser.add_option("--prefork-workers", dest="prefork_workers",
+                    default=0, type="int", metavar="NUM",
+                    help=("Serve requests from NUM pre-forked worker"
+                          " processes instead of forking once per"
+                          " connection"))
+  parser.add_option("--prefork-max-requests", dest="prefork_max_requests",
+                    default=1000, type="int", metavar="NUM",
+                    help=("Replace a pre-forked worker after it served NUM"
+                          " requests (0 for no limit)"))
+  parser.add_option("--prefork-max-memory-growth",
+                    dest="prefork_max_memory_growth",
+                    default=100, type="int", metavar="MIB",
+                    help=("Replace a pre-forked worker once its memory usage"
+                          " grew by more than MIB mebibytes (0 for no"
+                          " limit)"))
+
+
+def _GetMaxRss():
+  """Returns the maximum resident set size of this process in KiB.
+
+  """
+  return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
 class HttpServer(http.HttpBase, asyncore.dispatcher):
   """Generic HTTP server class
 
+  By default a child process is forked for every incoming connection. If
+  C{prefork_workers} is given, a fixed number of long-lived worker processes
+  is started instead. They accept connections from the shared listening
+  socket, serve several requests per persistent connection and are replaced
+  after a number of requests or if their memory usage grew too much.
+
   """
   MAX_CHILDREN = 20
 
   def __init__(self, mainloop, local_address, port, handler,
                ssl_params=None, ssl_verify_peer=False,
-               request_executor_class=None, ssl_verify_callback=None):
+               request_executor_class=None, ssl_verify_callback=None,
+               prefork_workers=0, worker_max_requests=None,
+               worker_max_memory_growth=None):
     """Initializes the HTTP server
 
     @type mainloop: ganeti.daemon.Mainloop
@@ -496,6 +622,15 @@ class HttpServer(http.HttpBase, asyncore.dispatcher):
     @type request_executor_class: class
     @param request_executor_class: a class derived from the
         HttpServerRequestExecutor class
+    @type prefork_workers: int
+    @param prefork_workers: Number of pre-forked worker processes, zero to
+        fork one child per connection
+    @type worker_max_requests: int or None
+    @param worker_max_requests: Number of requests after which a pre-forked
+        worker is replaced
+    @type worker_max_memory_growth: int or None
+    @param worker_max_memory_growth: Growth of the maximum resident set size,
+        in MiB, after which a pre-forked worker is replaced
 
     """
     http.HttpBase.__init__(self)
@@ -510,6 +645,9 @@ class HttpServer(http.HttpBase, asyncore.dispatcher):
     self.local_address = local_address
     self.port = port
     self.handler = handler
+    self._prefork_workers = prefork_workers
+    self._worker_max_requests = worker_max_requests
+    self._worker_max_memory_growth = worker_max_memory_growth
     family = netutils.IPAddress.GetAddressFamily(local_address)
     self.socket = self._CreateSocket(ssl_params, ssl_verify_peer, family,
                                      ssl_verify_callback)
@@ -518,15 +656,30 @@ class HttpServer(http.HttpBase, asyncore.dispatcher):
     self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
 
     self._children = []
-    self.set_socket(self.socket)
-    self.accepting = True
+
+    # Pre-forked workers accept connections themselves, the main process only
+    # supervises them and must not poll the listening socket
+    if not self._prefork_workers:
+      self.set_socket(self.socket)
+      self.accepting = True
+
     mainloop.RegisterSignal(self)
 
   def Start(self):
     self.socket.bind((self.local_address, self.port))
     self.socket.listen(1024)
 
+    if self._prefork_workers:
+      self._SpawnWorkers()
+
   def Stop(self):
+    if self._prefork_workers:
+      for pid in self._children:
+        try:
+          os.kill(pid, signal.SIGTERM)
+        except OSError:
+          pass
+
     self.socket.close()
 
   def handle_accept(self):
@@ -536,6 +689,10 @@ class HttpServer(http.HttpBase, asyncore.dispatcher):
     if signum == signal.SIGCHLD:
       self._CollectChildren(True)
 
+      if self._prefork_workers:
+        # Replace workers which exited
+        self._SpawnWorkers()
+
   def _CollectChildren(self, quick):
     """Checks whether any child processes are done
 
@@ -600,6 +757,73 @@ class HttpServer(http.HttpBase, asyncore.dispatcher):
     else:
       self._children.append(pid)
 
+  def _SpawnWorkers(self):
+    """Forks pre-forked workers until the configured number is running.
+
+    """
+    # pylint: disable=W0212
+    while len(self._children) < self._prefork_workers:
+      pid = os.fork()
+      if pid == 0:
+        # Child process
+        try:
+          self._RunWorker()
+        except Exception: # pylint: disable=W0703
+          logging.exception("Error in pre-forked worker")
+          os._exit(1)
+        os._exit(0)
+      else:
+        logging.debug("Started pre-forked worker %s", pid)
+        self._children.append(pid)
+
+  def _RunWorker(self):
+    """Main function of a pre-forked worker process.
+
+    Returns once the worker should be replaced.
+
+    """
+    # The signal handlers of the main loop are of no use in a worker, which
+    # must simply terminate when asked to
+    for signum in [signal.SIGTERM, signal.SIGINT, signal.SIGCHLD]:
+      signal.signal(signum, signal.SIG_DFL)
+
+    # In case the handler code uses temporary files
+    utils.ResetTempfileModule()
+
+    start_rss = _GetMaxRss()
+    requests_handled = 0
+
+    while True:
+      try:
+        (connection, client_addr) = self.socket.accept()
+      except socket.error, err:
+        if err.args and err.args[0] in (errno.EINTR, errno.EAGAIN,
+                                        errno.ECONNABORTED):
+          continue
+        raise
+
+      try:
+        executor = self.request_executor(self, self.handler, connection,
+                                         client_addr, keep_alive=True)
+      except Exception: # pylint: disable=W0703
+        logging.exception("Error while handling request from %s:%s",
+                          client_addr[0], client_addr[1])
+        requests_handled += 1
+      else:
+        requests_handled += executor.requests_handled
+
+      if (self._worker_max_requests and
+          requests_handled >= self._worker_max_requests):
+        logging.debug("Pre-forked worker served %s requests, exiting",
+                      requests_handled)
+        break
+
+      if (self._worker_max_memory_growth and
+          (_GetMaxRss() - start_rss) > self._worker_max_memory_growth * 1024):
+        logging.info("Memory usage of pre-forked worker grew from %s KiB to"
+                     " %s KiB, exiting", start_rss, _GetMaxRss())
+        break
+
 
 class HttpServerHandler(object):
   """Base class for handling HTTP server requests.
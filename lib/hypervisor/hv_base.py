@@ -368,7 +368,9 @@ class BaseHypervisor(object):
     @param hvparams: hypervisor parameter
 
     @rtype: (string, string, int, int, HvInstanceState, int)
-    @return: list of tuples (name, id, memory, vcpus, state, times)
+    @return: list of tuples (name, id, memory, vcpus, state, times); if
+        some of the information of an instance couldn't be retrieved, its
+        tuple can have the error message as an additional seventh element
 
     """
     raise NotImplementedError
@@ -37,6 +37,7 @@ import os
 import os.path
 import re
 import tempfile
+import threading
 import time
 import logging
 import pwd
@@ -64,8 +65,8 @@ from ganeti import pathutils
 from ganeti.hypervisor import hv_base
 from ganeti.utils import wrapper as utils_wrapper
 
-from ganeti.hypervisor.hv_kvm.monitor import QmpConnection, QmpMessage, \
-                                             MonitorSocket
+from ganeti.hypervisor.hv_kvm.monitor import QmpConnection, \
+                                             QmpConnectionManager
 from ganeti.hypervisor.hv_kvm.netdev import OpenTap
 
 
@@ -158,15 +159,44 @@ _SCSI_BUS = "scsi.0"
 
 _MIGRATION_CAPS_DELIM = ":"
 
+# QMP connections kept open by this process, see L{QmpConnectionScope}
+_qmp_connections = QmpConnectionManager()
+
+
+class QmpConnectionScope(object):
+  """Reuses QMP connections to instances for the duration of a request.
+
+  To be used with the C{with} statement around code talking to the monitors
+  of instances, such as an RPC request. The connections are closed when the
+  scope is left, as QEMU serves only one QMP client at a time.
+
+  """
+  def __init__(self, _manager=None):
+    if _manager is None:
+      _manager = _qmp_connections
+    self._manager = _manager
+
+  def __enter__(self):
+    self._manager.Enter()
+    return self._manager
+
+  def __exit__(self, exc_type, exc_value, traceback):
+    self._manager.Exit()
+
 
 def _with_qmp(fn):
-  """Wrapper used on hotplug related methods"""
+  """Wrapper used on hotplug related methods.
+
+  The wrapped method is called with the instance's QMP connection as an
+  additional argument after the instance.
+
+  """
   def wrapper(self, instance, *args, **kwargs):
-    """Create a QmpConnection and run the wrapped method"""
-    if not getattr(self, "qmp", None):
-      filename = self._InstanceQmpMonitor(instance.name)# pylint: disable=W0212
-      self.qmp = QmpConnection(filename)
-    return fn(self, instance, *args, **kwargs)
+    """Run the wrapped method with the instance's QMP connection"""
+    filename = self._InstanceQmpMonitor(instance.name)# pylint: disable=W0212
+    with QmpConnectionScope():
+      return _qmp_connections.Run(
+        filename, lambda qmp: fn(self, instance, qmp, *args, **kwargs))
   return wrapper
 
 
@@ -390,6 +420,122 @@ def _AnalyzeSerializedRuntime(serialized_runtime):
   return (kvm_cmd, kvm_nics, hvparams, kvm_disks)
 
 
+class KVMCapabilityCache(object):
+  """Cache of the output of KVM capability probes.
+
+  Probing the KVM binary (C{--help}, C{-M ?}, C{-device ?}) means a fork and
+  exec of QEMU. The outputs only depend on the binary itself, so they are
+  kept in memory and in a file shared by all processes on the node, keyed by
+  the path and the (device, inode, mtime, size) of the binary. Upgrading or
+  replacing the binary therefore invalidates the cached entries.
+
+  """
+  def __init__(self, cache_file, _stat_fn=os.stat):
+    """Initializes this class.
+
+    @type cache_file: string or None
+    @param cache_file: file in which to persist the probe outputs; if C{None},
+      they are only kept in memory
+
+    """
+    self._cache_file = cache_file
+    self._stat_fn = _stat_fn
+    self._lock = threading.Lock()
+    self._entries = {}
+
+  def _GetIdentity(self, kvm_path):
+    """Returns the identity of the binary, or C{None} if it can't be stat'ed.
+
+    """
+    try:
+      st = self._stat_fn(kvm_path)
+    except EnvironmentError:
+      return None
+    return [st.st_dev, st.st_ino, st.st_mtime, st.st_size]
+
+  def _ReadFile(self):
+    """Reads the persisted entries, ignoring a missing or corrupted file.
+
+    """
+    if self._cache_file is None:
+      return {}
+    try:
+      data = serializer.LoadJson(utils.ReadFile(self._cache_file))
+    except EnvironmentError, err:
+      if err.errno != errno.ENOENT:
+        logging.warning("Can't read KVM capability cache %s: %s",
+                        self._cache_file, err)
+      return {}
+    except ValueError, err:
+      logging.warning("Ignoring corrupted KVM capability cache %s: %s",
+                      self._cache_file, err)
+      return {}
+    if not isinstance(data, dict):
+      return {}
+    return data
+
+  def _WriteFile(self, data):
+    """Persists the entries, logging but otherwise ignoring errors.
+
+    """
+    if self._cache_file is None:
+      return
+    try:
+      utils.WriteFile(self._cache_file, data=serializer.DumpJson(data))
+    except EnvironmentError, err:
+      logging.warning("Can't write KVM capability cache %s: %s",
+                      self._cache_file, err)
+
+  def Get(self, kvm_path, option, fn):
+    """Returns the output of a KVM probe, running it only if not cached.
+
+    @type kvm_path: string
+    @param kvm_path: path to the kvm executable
+    @type option: string
+    @param option: name of the probe
+    @type fn: callable
+    @param fn: function called as C{fn(kvm_path, option)} to run the probe;
+      exceptions it raises are propagated and nothing is cached
+
+    """
+    identity = self._GetIdentity(kvm_path)
+    if identity is None:
+      return fn(kvm_path, option)
+
+    with self._lock:
+      entry = self._entries.get(kvm_path)
+      if entry is None or entry["identity"] != identity:
+        entry = self._ReadFile().get(kvm_path)
+        if not (isinstance(entry, dict) and
+                entry.get("identity") == identity):
+          entry = {"identity": identity, "outputs": {}}
+        self._entries[kvm_path] = entry
+
+      try:
+        return entry["outputs"][option]
+      except KeyError:
+        pass
+
+    output = fn(kvm_path, option)
+
+    with self._lock:
+      # Merge with what other processes may have stored meanwhile
+      data = self._ReadFile()
+      stored = data.get(kvm_path)
+      if not (isinstance(stored, dict) and
+              stored.get("identity") == identity):
+        stored = {"identity": identity, "outputs": {}}
+      current = self._entries.get(kvm_path)
+      if current is not None and current["identity"] == identity:
+        stored["outputs"].update(current["outputs"])
+      stored["outputs"][option] = output
+      self._entries[kvm_path] = stored
+      data[kvm_path] = stored
+      self._WriteFile(data)
+
+    return output
+
+
 class HeadRequest(urllib2.Request):
   def get_method(self):
     return "HEAD"
@@ -429,6 +575,8 @@ class KVMHypervisor(hv_base.BaseHypervisor):
   _CHROOT_QUARANTINE_DIR = _ROOT_DIR + "/chroot-quarantine"
   _DIRS = [_ROOT_DIR, _PIDS_DIR, _UIDS_DIR, _CTRL_DIR, _CONF_DIR, _NICS_DIR,
            _CHROOT_DIR, _CHROOT_QUARANTINE_DIR, _KEYMAP_DIR]
+  # cached output of the kvm binary probes, see L{_GetKVMOutput}
+  _CAPABILITIES_FILE = _ROOT_DIR + "/capabilities.json"
 
   PARAMETERS = {
     constants.HV_KVM_PATH: hv_base.REQ_FILE_CHECK,
@@ -569,6 +717,12 @@ class KVMHypervisor(hv_base.BaseHypervisor):
     re.compile(r'^QEMU (\d+)\.(\d+)(\.(\d+))?.*monitor.*', re.M)
   _INFO_VERSION_CMD = "info version"
 
+  # Seconds after which GetAllInstancesInfo stops waiting for the monitors of
+  # the instances it queries
+  _INSTANCE_INFO_TIMEOUT = 5.0
+  # Maximum number of monitors GetAllInstancesInfo queries at the same time
+  _INSTANCE_INFO_MAX_THREADS = 8
+
   # Slot 0 for Host bridge, Slot 1 for ISA bridge, Slot 2 for VGA controller
   # and the rest up to slot 11 will be used by QEMU implicitly.
   # Ganeti will add disks and NICs from slot 12 onwards.
@@ -610,13 +764,14 @@ class KVMHypervisor(hv_base.BaseHypervisor):
     _KVMOPT_DEVICELIST: (["-device", "?"], True),
   }
 
+  _capabilities = KVMCapabilityCache(_CAPABILITIES_FILE)
+
   def __init__(self):
     hv_base.BaseHypervisor.__init__(self)
     # Let's make sure the directories we need exist, even if the RUN_DIR lives
     # in a tmpfs filesystem or has been otherwise wiped out.
     dirs = [(dname, constants.RUN_DIRS_MODE) for dname in self._DIRS]
     utils.EnsureDirs(dirs)
-    self.qmp = None
 
   @staticmethod
   def VersionsSafeForMigration(src, target):
@@ -825,6 +980,7 @@ class KVMHypervisor(hv_base.BaseHypervisor):
     utils.RemoveFile(pidfile)
     utils.RemoveFile(cls._InstanceMonitor(instance_name))
     utils.RemoveFile(cls._InstanceSerial(instance_name))
+    _qmp_connections.Close(cls._InstanceQmpMonitor(instance_name))
     utils.RemoveFile(cls._InstanceQmpMonitor(instance_name))
     utils.RemoveFile(cls._InstanceKVMRuntime(instance_name))
     utils.RemoveFile(cls._InstanceKeymapFile(instance_name))
@@ -986,59 +1142,169 @@ class KVMHypervisor(hv_base.BaseHypervisor):
   def _ClearUserShutdown(cls, instance_name):
     utils.RemoveFile(cls._InstanceShutdownMonitor(instance_name))
 
-  def GetInstanceInfo(self, instance_name, hvparams=None):
+  def _GetCmdlineInstanceInfo(self, instance_name):
+    """Get instance properties from the KVM command line only.
+
+    @type instance_name: string
+    @param instance_name: the instance name
+    @return: see L{GetInstanceInfo}
+
+    """
+    pid = utils.ReadPidFile(self._InstancePidFile(instance_name))
+    try:
+      (cmd_instance, memory, vcpus) = self._InstancePidInfo(pid)
+    except errors.HypervisorError:
+      cmd_instance = None
+
+    if cmd_instance != instance_name:
+      if self._IsUserShutdown(instance_name):
+        return (instance_name, -1, 0, 0, hv_base.HvInstanceState.SHUTDOWN, 0)
+      else:
+        return None
+
+    return (instance_name, pid, memory, vcpus,
+            hv_base.HvInstanceState.RUNNING, 0)
+
+  def GetInstanceInfo(self, instance_name, hvparams=None, live=True):
     """Get instance properties.
 
     @type instance_name: string
     @param instance_name: the instance name
     @type hvparams: dict of strings
     @param hvparams: hypervisor parameters to be used with this instance
+    @type live: bool
+    @param live: whether to ask the instance's monitor for the current memory
+        and number of vCPUs; if False, only the KVM command line is read
     @rtype: tuple of strings
     @return: (name, id, memory, vcpus, stat, times)
 
     """
-    _, pid, alive = self._InstancePidAlive(instance_name)
-    if not alive:
-      if self._IsUserShutdown(instance_name):
-        return (instance_name, -1, 0, 0, hv_base.HvInstanceState.SHUTDOWN, 0)
-      else:
-        return None
+    info = self._GetCmdlineInstanceInfo(instance_name)
+    if (not live or info is None or
+        not hv_base.HvInstanceState.IsRunning(info[4])):
+      return info
 
-    _, memory, vcpus = self._InstancePidInfo(pid)
-    istat = hv_base.HvInstanceState.RUNNING
-    times = 0
+    (memory, vcpus) = self._QueryInstanceResources(instance_name, info[2],
+                                                   info[3])
+    return info[:2] + (memory, vcpus) + info[4:]
+
+  @classmethod
+  def _QueryInstanceResources(cls, instance_name, memory, vcpus):
+    """Asks the monitor of an instance for its memory and number of vCPUs.
 
+    @type memory: int
+    @param memory: the memory to return if the monitor can't tell
+    @type vcpus: int
+    @param vcpus: the number of vCPUs to return if the monitor can't tell
+    @rtype: tuple
+    @return: (memory, vcpus)
+
+    """
     try:
-      qmp = QmpConnection(self._InstanceQmpMonitor(instance_name))
-      qmp.connect()
-      vcpus = len(qmp.Execute("query-cpus"))
-      # Will fail if ballooning is not enabled, but we can then just resort to
-      # the value above.
-      mem_bytes = qmp.Execute("query-balloon")[qmp.ACTUAL_KEY]
-      memory = mem_bytes / 1048576
+      # Both commands use the same connection
+      with QmpConnectionScope():
+        vcpus = len(cls._CallQmp(instance_name, "query-cpus"))
+        # Will fail if ballooning is not enabled, but we can then just resort
+        # to the value from the command line.
+        mem_bytes = cls._CallQmp(instance_name,
+                                 "query-balloon")[QmpConnection.ACTUAL_KEY]
+        memory = mem_bytes / 1048576
     except errors.HypervisorError:
       pass
 
-    return (instance_name, pid, memory, vcpus, istat, times)
+    return (memory, vcpus)
 
-  def GetAllInstancesInfo(self, hvparams=None):
+  @classmethod
+  def _QueryAllInstanceResources(cls, instances, timeout):
+    """Queries the monitors of several instances concurrently.
+
+    At most L{_INSTANCE_INFO_MAX_THREADS} monitors are queried at the same
+    time. Monitors which haven't answered before the timeout are reported as
+    errors; their queries are left to finish in the background.
+
+    @type instances: dict
+    @param instances: instance name as key, (memory, vcpus) from the command
+        line as value
+    @type timeout: float
+    @param timeout: seconds to wait for all monitors
+    @rtype: tuple of (dict, dict)
+    @return: (memory, vcpus) and error messages, both by instance name; each
+        instance is in exactly one of the two
+
+    """
+    results = {}
+    deadline = time.time() + timeout
+
+    def _Query(name, memory, vcpus):
+      # Queries which didn't even start in time aren't worth running
+      if time.time() < deadline:
+        results[name] = cls._QueryInstanceResources(name, memory, vcpus)
+
+    args = [(name, memory, vcpus)
+            for (name, (memory, vcpus)) in instances.items()]
+    runner = threading.Thread(target=utils.RunParallel,
+                              args=(_Query, args,
+                                    cls._INSTANCE_INFO_MAX_THREADS),
+                              name="kvm-instance-info")
+    # Hung monitors must not keep the process from exiting
+    runner.daemon = True
+    runner.start()
+    runner.join(max(0, deadline - time.time()))
+
+    # Copy the results, as stragglers may still add to them
+    resources = results.copy()
+    failures = dict((name, "The monitor didn't answer within %s seconds" %
+                     timeout)
+                    for name in instances if name not in resources)
+    return (resources, failures)
+
+  def GetAllInstancesInfo(self, hvparams=None, live=True):
     """Get properties of all instances.
 
+    The monitors of the running instances are queried concurrently, see
+    L{_QueryAllInstanceResources}. Instances whose monitors don't answer in
+    time are returned with the memory and vCPUs from their command line, and
+    with the error as an additional seventh element.
+
     @type hvparams: dict of strings
     @param hvparams: hypervisor parameters
-    @return: list of tuples (name, id, memory, vcpus, stat, times)
+    @type live: bool
+    @param live: see L{GetInstanceInfo}
+    @return: list of tuples (name, id, memory, vcpus, stat, times), or
+        (name, id, memory, vcpus, stat, times, error) for the instances
+        whose monitors didn't answer
 
     """
     data = []
     for name in os.listdir(self._PIDS_DIR):
       try:
-        info = self.GetInstanceInfo(name)
+        info = self._GetCmdlineInstanceInfo(name)
       except errors.HypervisorError:
         # Ignore exceptions due to instances being shut down
         continue
       if info:
         data.append(info)
-    return data
+
+    if not live:
+      return data
+
+    running = dict((info[0], (info[2], info[3])) for info in data
+                   if hv_base.HvInstanceState.IsRunning(info[4]))
+    (resources, failures) = \
+      self._QueryAllInstanceResources(running, self._INSTANCE_INFO_TIMEOUT)
+    for (name, msg) in sorted(failures.items()):
+      logging.error("Can't get the memory and vCPUs of instance %s, using"
+                    " the values from its command line: %s", name, msg)
+
+    result = []
+    for info in data:
+      name = info[0]
+      if name in resources:
+        info = info[:2] + resources[name] + info[4:]
+      elif name in failures:
+        info += (failures[name], )
+      result.append(info)
+    return result
 
   def _GenerateKVMBlockDevicesOptions(self, up_hvp, kvm_disks,
                                       kvmhelp, devlist):
@@ -1995,8 +2261,26 @@ class KVMHypervisor(hv_base.BaseHypervisor):
 
     return result
 
+  @classmethod
+  def _CallQmp(cls, instance_name, command, arguments=None):
+    """Invoke a command over a QMP connection to an instance.
+
+    Within a L{QmpConnectionScope}, the connection is kept open for further
+    commands.
+
+    """
+    return _qmp_connections.Execute(cls._InstanceQmpMonitor(instance_name),
+                                    command, arguments)
+
+  @classmethod
+  def _HasQmp(cls, instance_name):
+    """Whether the instance was started with a QMP monitor.
+
+    """
+    return os.path.exists(cls._InstanceQmpMonitor(instance_name))
+
   @_with_qmp
-  def VerifyHotplugSupport(self, instance, action, dev_type):
+  def VerifyHotplugSupport(self, instance, qmp, action, dev_type):
     """Verifies that hotplug is supported.
 
     Hotplug is not supported if:
@@ -2016,10 +2300,10 @@ class KVMHypervisor(hv_base.BaseHypervisor):
 
     if dev_type == constants.HOTPLUG_TARGET_DISK:
       if action == constants.HOTPLUG_ACTION_ADD:
-        self.qmp.CheckDiskHotAddSupport()
+        qmp.CheckDiskHotAddSupport()
     if dev_type == constants.HOTPLUG_TARGET_NIC:
       if action == constants.HOTPLUG_ACTION_ADD:
-        self.qmp.CheckNicHotAddSupport()
+        qmp.CheckNicHotAddSupport()
 
   def HotplugSupported(self, instance):
     """Checks if hotplug is generally supported.
@@ -2097,7 +2381,7 @@ class KVMHypervisor(hv_base.BaseHypervisor):
     return bus_slots
 
   @_with_qmp
-  def _VerifyHotplugCommand(self, _instance, kvm_devid, should_exist):
+  def _VerifyHotplugCommand(self, _instance, qmp, kvm_devid, should_exist):
     """Checks if a previous hotplug command has succeeded.
 
     Depending on the should_exist value, verifies that an entry identified by
@@ -2107,7 +2391,7 @@ class KVMHypervisor(hv_base.BaseHypervisor):
 
     """
     for i in range(5):
-      found = self.qmp.HasDevice(kvm_devid)
+      found = qmp.HasDevice(kvm_devid)
       logging.info("Verifying hotplug command (retry %s): %s", i, found)
       if found and should_exist:
         break
@@ -2126,7 +2410,7 @@ class KVMHypervisor(hv_base.BaseHypervisor):
     logging.info("Device %s has been correctly hot-plugged", kvm_devid)
 
   @_with_qmp
-  def HotAddDevice(self, instance, dev_type, device, extra, seq):
+  def HotAddDevice(self, instance, qmp, dev_type, device, extra, seq):
     """ Helper method to hot-add a new device
 
     It generates the device ID and hvinfo, and invokes the
@@ -2157,7 +2441,7 @@ class KVMHypervisor(hv_base.BaseHypervisor):
       # a drive which keeps a reference to the fd passed via the add-fd QMP
       # command has been created, then the fd gets closed and cannot be used
       # later (e.g., via an drive_add HMP command).
-      self.qmp.HotAddDisk(device, kvm_devid, uri, drive_add_fn)
+      qmp.HotAddDisk(device, kvm_devid, uri, drive_add_fn)
     elif dev_type == constants.HOTPLUG_TARGET_NIC:
       kvmpath = instance.hvparams[constants.HV_KVM_PATH]
       kvmhelp = self._GetKVMOutput(kvmpath, self._KVMOPT_HELP)
@@ -2165,7 +2449,7 @@ class KVMHypervisor(hv_base.BaseHypervisor):
       features, _, _ = self._GetNetworkDeviceFeatures(up_hvp, devlist, kvmhelp)
       (tap, tapfds, vhostfds) = OpenTap(features=features)
       self._ConfigureNIC(instance, seq, device, tap)
-      self.qmp.HotAddNic(device, kvm_devid, tapfds, vhostfds, features)
+      qmp.HotAddNic(device, kvm_devid, tapfds, vhostfds, features)
       utils.WriteFile(self._InstanceNICFile(instance.name, seq), data=tap)
 
     self._VerifyHotplugCommand(instance, kvm_devid, True)
@@ -2176,7 +2460,7 @@ class KVMHypervisor(hv_base.BaseHypervisor):
     self._SaveKVMRuntime(instance, runtime)
 
   @_with_qmp
-  def HotDelDevice(self, instance, dev_type, device, _, seq):
+  def HotDelDevice(self, instance, qmp, dev_type, device, _, seq):
     """ Helper method for hot-del device
 
     It gets device info from runtime file, generates the device name and
@@ -2188,12 +2472,12 @@ class KVMHypervisor(hv_base.BaseHypervisor):
     kvm_device = _RUNTIME_DEVICE[dev_type](entry)
     kvm_devid = _GenerateDeviceKVMId(dev_type, kvm_device)
     if dev_type == constants.HOTPLUG_TARGET_DISK:
-      self.qmp.HotDelDisk(kvm_devid)
+      qmp.HotDelDisk(kvm_devid)
       # drive_del is not implemented yet in qmp
       command = "drive_del %s\n" % kvm_devid
       self._CallMonitorCommand(instance.name, command)
     elif dev_type == constants.HOTPLUG_TARGET_NIC:
-      self.qmp.HotDelNic(kvm_devid)
+      qmp.HotDelNic(kvm_devid)
       utils.RemoveFile(self._InstanceNICFile(instance.name, seq))
     self._VerifyHotplugCommand(instance, kvm_devid, False)
     index = _DEVICE_RUNTIME_INDEX[dev_type]
@@ -2251,6 +2535,15 @@ class KVMHypervisor(hv_base.BaseHypervisor):
     """
     assert option in cls._KVMOPTS_CMDS, "Invalid output option"
 
+    return cls._capabilities.Get(kvm_path, option, cls._RunKVMOutput)
+
+  @classmethod
+  def _RunKVMOutput(cls, kvm_path, option):
+    """Runs kvm to get the output of a given option, bypassing the cache.
+
+    @see: L{_GetKVMOutput}
+
+    """
     optlist, can_fail = cls._KVMOPTS_CMDS[option]
 
     result = utils.RunCmd([kvm_path] + optlist)
@@ -2476,24 +2769,19 @@ class KVMHypervisor(hv_base.BaseHypervisor):
              progress info that can be retrieved from the hypervisor
 
     """
-    info_command = "info migrate"
+    if self._HasQmp(instance.name):
+      query_fn = self._QueryMigrationQmp
+    else:
+      query_fn = self._QueryMigrationMonitor
+
     for _ in range(self._MIGRATION_INFO_MAX_BAD_ANSWERS):
-      result = self._CallMonitorCommand(instance.name, info_command)
-      match = self._MIGRATION_STATUS_RE.search(result.stdout)
-      if not match:
-        if not result.stdout:
-          logging.info("KVM: empty 'info migrate' result")
-        else:
-          logging.warning("KVM: unknown 'info migrate' result: %s",
-                          result.stdout)
-      else:
-        status = match.group(1)
+      (status, transferred, total) = query_fn(instance.name)
+      if status is not None:
         if status in constants.HV_KVM_MIGRATION_VALID_STATUSES:
           migration_status = objects.MigrationStatus(status=status)
-          match = self._MIGRATION_PROGRESS_RE.search(result.stdout)
-          if match:
-            migration_status.transferred_ram = match.group("transferred")
-            migration_status.total_ram = match.group("total")
+          if transferred is not None and total is not None:
+            migration_status.transferred_ram = transferred
+            migration_status.total_ram = total
 
           return migration_status
 
@@ -2503,6 +2791,50 @@ class KVMHypervisor(hv_base.BaseHypervisor):
 
     return objects.MigrationStatus(status=constants.HV_MIGRATION_FAILED)
 
+  def _QueryMigrationQmp(self, instance_name):
+    """Queries the migration status using the QMP query-migrate command.
+
+    @rtype: tuple
+    @return: (status, transferred kbytes, total kbytes), any of them None if
+        not known
+
+    """
+    result = self._CallQmp(instance_name, "query-migrate")
+    status = result.get("status")
+    if status is None:
+      logging.info("KVM: empty 'query-migrate' result")
+      return (None, None, None)
+
+    ram = result.get("ram") or {}
+    transferred = ram.get("transferred")
+    total = ram.get("total")
+    if transferred is None or total is None:
+      return (status, None, None)
+    # Same unit as reported by the "info migrate" monitor command
+    return (status, transferred / 1024, total / 1024)
+
+  def _QueryMigrationMonitor(self, instance_name):
+    """Queries the migration status using the "info migrate" monitor command.
+
+    @see: L{_QueryMigrationQmp}
+
+    """
+    result = self._CallMonitorCommand(instance_name, "info migrate")
+    match = self._MIGRATION_STATUS_RE.search(result.stdout)
+    if not match:
+      if not result.stdout:
+        logging.info("KVM: empty 'info migrate' result")
+      else:
+        logging.warning("KVM: unknown 'info migrate' result: %s",
+                        result.stdout)
+      return (None, None, None)
+
+    match_progress = self._MIGRATION_PROGRESS_RE.search(result.stdout)
+    if not match_progress:
+      return (match.group(1), None, None)
+    return (match.group(1), match_progress.group("transferred"),
+            match_progress.group("total"))
+
   def BalloonInstanceMemory(self, instance, mem):
     """Balloon an instance memory to a certain value.
 
@@ -2512,7 +2844,10 @@ class KVMHypervisor(hv_base.BaseHypervisor):
     @param mem: actual memory size to use for instance runtime
 
     """
-    self._CallMonitorCommand(instance.name, "balloon %d" % mem)
+    if self._HasQmp(instance.name):
+      self._CallQmp(instance.name, "balloon", {"value": mem * 1048576})
+    else:
+      self._CallMonitorCommand(instance.name, "balloon %d" % mem)
 
   def GetNodeInfo(self, hvparams=None):
     """Return information about the node.
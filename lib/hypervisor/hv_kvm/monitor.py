@@ -39,6 +39,7 @@ import errno
 import socket
 import StringIO
 import logging
+import threading
 try:
   import fdsend   # pylint: disable=F0401
 except ImportError:
@@ -371,6 +372,8 @@ class QmpConnection(MonitorSocket):
       raise errors.HypervisorError("Unable to receive data from KVM using the"
                                    " QMP protocol: %s" % err)
 
+    raise errors.HypervisorError("QMP connection closed by KVM")
+
   def _Send(self, message):
     """Encodes and sends a message to KVM using QMP.
 
@@ -786,3 +789,134 @@ class QmpConnection(MonitorSocket):
       # succeeded, the whole hot-add action will fail and the runtime file will
       # not be updated which will make the instance non migrate-able
       logging.info("Removing fdset with id %s failed: %s", fdset, err)
+
+
+class QmpConnectionManager(object):
+  """Reuses QMP connections to instance monitors within a scope.
+
+  Connecting to QMP requires the capabilities negotiation and querying the
+  list of supported commands, which is done once per connection here instead
+  of once per command. As QEMU serves only one QMP client at a time,
+  connections are only kept open while the thread using them is within a
+  L{QmpConnectionScope}, e.g. for the duration of a noded request, and are
+  closed when it leaves the outermost scope. Outside of a scope, every call
+  to L{Run} uses a new connection.
+
+  Within a scope, a connection is replaced when the monitor socket was
+  recreated (i.e. the instance was restarted) and after a failed command.
+
+  """
+  def __init__(self, _connection_cls=QmpConnection, _stat_fn=os.stat):
+    """Initializes this class.
+
+    """
+    self._connection_cls = _connection_cls
+    self._stat_fn = _stat_fn
+
+    # Scope depth and connections of the current thread
+    self._local = threading.local()
+
+  def _GetSocketIdentity(self, monitor_filename):
+    try:
+      st = self._stat_fn(monitor_filename)
+    except EnvironmentError, err:
+      raise errors.HypervisorError("Can't access QMP socket %s: %s" %
+                                   (monitor_filename, err))
+    return (st.st_dev, st.st_ino)
+
+  def _Connect(self, monitor_filename):
+    conn = self._connection_cls(monitor_filename)
+    conn.connect()
+    return conn
+
+  def Run(self, monitor_filename, fn):
+    """Runs a function with a connection to a monitor.
+
+    @type monitor_filename: string
+    @param monitor_filename: path of the QMP socket
+    @type fn: callable
+    @param fn: function called with the connected L{QmpConnection}
+    @return: the return value of C{fn}
+
+    """
+    connections = getattr(self._local, "connections", None)
+
+    if connections is None:
+      # Not within a scope
+      conn = self._Connect(monitor_filename)
+      try:
+        return fn(conn)
+      finally:
+        conn.close()
+
+    identity = self._GetSocketIdentity(monitor_filename)
+
+    (conn_identity, conn) = connections.get(monitor_filename, (None, None))
+    if conn is not None and \
+       (conn_identity != identity or not conn.is_connected()):
+      self.Close(monitor_filename)
+      conn = None
+
+    if conn is None:
+      conn = self._Connect(monitor_filename)
+      connections[monitor_filename] = (identity, conn)
+
+    try:
+      return fn(conn)
+    except QmpCommandNotSupported:
+      raise
+    except errors.HypervisorError:
+      # The state of the connection is unknown, e.g. there might be an
+      # unread response
+      self.Close(monitor_filename)
+      raise
+
+  def Execute(self, monitor_filename, command, arguments=None):
+    """Executes a QMP command over a connection to a monitor.
+
+    @type monitor_filename: string
+    @param monitor_filename: path of the QMP socket
+    @see: L{QmpConnection.Execute}
+
+    """
+    return self.Run(monitor_filename,
+                    lambda conn: conn.Execute(command, arguments))
+
+  def Close(self, monitor_filename):
+    """Closes the current thread's connection to a monitor, if any.
+
+    """
+    connections = getattr(self._local, "connections", None)
+    if connections:
+      (_, conn) = connections.pop(monitor_filename, (None, None))
+      if conn is not None:
+        conn.close()
+
+  def Enter(self):
+    """Keeps connections open until the scope is left.
+
+    See L{QmpConnectionScope}.
+
+    """
+    local = self._local
+    depth = getattr(local, "depth", 0)
+    if depth == 0:
+      local.connections = {}
+    local.depth = depth + 1
+
+  def Exit(self):
+    """Undoes L{Enter}, closing the connections when leaving the outermost
+    scope.
+
+    """
+    local = self._local
+    assert getattr(local, "depth", 0) > 0
+    local.depth -= 1
+    if local.depth == 0:
+      (connections, local.connections) = (local.connections, None)
+      for (_, conn) in connections.values():
+        try:
+          conn.close()
+        except EnvironmentError, err:
+          logging.debug("Closing QMP connection failed: %s", err)
+
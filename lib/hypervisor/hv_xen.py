@@ -36,9 +36,11 @@ import logging
 import errno
 import string # pylint: disable=W0402
 import shutil
+import threading
 import time
 from cStringIO import StringIO
 
+from ganeti import compat
 from ganeti import constants
 from ganeti import errors
 from ganeti import utils
@@ -61,6 +63,190 @@ _FILE_DRIVER_MAP = {
   constants.FD_BLKTAP2: "tap2:tapdisk:aio",
   }
 
+#: Read-only toolstack commands whose output is memoized, see
+#: L{XenQueryCache}
+_XEN_QUERY_COMMANDS = compat.UniqueFrozenset([
+  ("list", ),
+  ("info", ),
+  ])
+
+#: Seconds for which the output of the read-only toolstack commands is
+#: shared between concurrent requests (0 to disable); domains can also change
+#: without any command being run by this process (e.g. when they crash or
+#: are migrated to this node), so sharing is disabled by default
+XEN_QUERY_TTL = 0
+
+
+class XenQueryCache(object):
+  """Memoizes the output of the read-only Xen toolstack commands.
+
+  Within a L{XenQueryScope}, C{list} and C{info} are run at most once per
+  thread, so that e.g. a node verification asking for the instance list,
+  the node information and the hypervisor status only runs each of them
+  once. If a TTL is given, successful outputs are additionally shared
+  between threads for that many seconds (off by default, see
+  L{XEN_QUERY_TTL}). Running any other toolstack command through this cache
+  drops all memoized outputs, as it might change the domains.
+
+  """
+  def __init__(self, ttl=XEN_QUERY_TTL, _time_fn=time.time):
+    """Initializes this class.
+
+    @type ttl: number
+    @param ttl: Seconds for which outputs are shared between threads
+
+    """
+    self._ttl = ttl
+    self._time_fn = _time_fn
+
+    self._lock = threading.Lock()
+
+    # Bumped whenever a command which might change the domains is run
+    self._generation = 0
+
+    # Command as key, tuple of (timestamp, result) as value
+    self._shared = {}
+
+    self._local = threading.local()
+
+  def _GetSnapshot(self):
+    """Returns the per-thread snapshot, dropping it if it's outdated.
+
+    Must be called with the lock held.
+
+    @rtype: dict or None
+    @return: None if no scope is active in the calling thread
+
+    """
+    local = self._local
+    if not getattr(local, "scopes", 0):
+      return None
+    if local.generation != self._generation:
+      local.generation = self._generation
+      local.results = {}
+    return local.results
+
+  def Query(self, cmd, fn):
+    """Runs a read-only command, or returns its memoized output.
+
+    @type cmd: list
+    @param cmd: the command, used as the key
+    @type fn: callable
+    @param fn: function running the command and returning a
+      L{utils.process.RunResult}; failed results are never memoized
+
+    """
+    key = tuple(cmd)
+
+    self._lock.acquire()
+    try:
+      generation = self._generation
+      snapshot = self._GetSnapshot()
+      if snapshot is not None and key in snapshot:
+        return snapshot[key]
+
+      now = self._time_fn()
+      if self._ttl > 0 and key in self._shared:
+        (timestamp, result) = self._shared[key]
+        if 0 <= now - timestamp <= self._ttl:
+          if snapshot is not None:
+            snapshot[key] = result
+          return result
+    finally:
+      self._lock.release()
+
+    result = fn()
+
+    if not result.failed:
+      self._lock.acquire()
+      try:
+        # Don't keep the output if the domains may have changed meanwhile
+        if generation == self._generation:
+          if self._ttl > 0:
+            self._shared[key] = (now, result)
+          snapshot = self._GetSnapshot()
+          if snapshot is not None:
+            snapshot[key] = result
+      finally:
+        self._lock.release()
+
+    return result
+
+  def Run(self, fn):
+    """Runs a command which might change the domains.
+
+    @type fn: callable
+    @param fn: function running the command
+
+    """
+    self.Invalidate()
+    try:
+      return fn()
+    finally:
+      # Also drop outputs of queries which ran concurrently
+      self.Invalidate()
+
+  def Invalidate(self):
+    """Drops all memoized outputs.
+
+    """
+    self._lock.acquire()
+    try:
+      self._generation += 1
+      self._shared.clear()
+    finally:
+      self._lock.release()
+
+  def Enter(self):
+    """Starts a per-thread snapshot, see L{XenQueryScope}.
+
+    """
+    local = self._local
+    if getattr(local, "scopes", 0):
+      local.scopes += 1
+    else:
+      self._lock.acquire()
+      try:
+        local.scopes = 1
+        local.generation = self._generation
+        local.results = {}
+      finally:
+        self._lock.release()
+
+  def Exit(self):
+    """Undoes L{Enter}, dropping the snapshot when leaving the outermost scope.
+
+    """
+    local = self._local
+    assert local.scopes > 0
+    local.scopes -= 1
+    if not local.scopes:
+      local.results = {}
+
+
+_xen_query_cache = XenQueryCache()
+
+
+class XenQueryScope(object):
+  """Shares one output of the read-only toolstack commands within a request.
+
+  To be used with the C{with} statement around read-only requests such as
+  node verification. Must not be used around code polling the state of a
+  domain, unless the state is changed by commands run within the scope.
+
+  """
+  def __init__(self, _cache=None):
+    if _cache is None:
+      _cache = _xen_query_cache
+    self._cache = _cache
+
+  def __enter__(self):
+    self._cache.Enter()
+    return self._cache
+
+  def __exit__(self, exc_type, exc_value, traceback):
+    self._cache.Exit()
+
 
 def _CreateConfigCpus(cpu_mask):
   """Create a CPU config string for Xen's config file.
@@ -522,7 +708,8 @@ class XenHypervisor(hv_base.BaseHypervisor):
     XL_CONFIG_FILE,
     ]
 
-  def __init__(self, _cfgdir=None, _run_cmd_fn=None, _cmd=None):
+  def __init__(self, _cfgdir=None, _run_cmd_fn=None, _cmd=None,
+               _query_cache=None):
     hv_base.BaseHypervisor.__init__(self)
 
     if _cfgdir is None:
@@ -535,6 +722,14 @@ class XenHypervisor(hv_base.BaseHypervisor):
     else:
       self._run_cmd_fn = _run_cmd_fn
 
+    if _query_cache is not None:
+      self._query_cache = _query_cache
+    elif _run_cmd_fn is None:
+      self._query_cache = _xen_query_cache
+    else:
+      # Outputs of a custom command function must not be shared with others
+      self._query_cache = XenQueryCache(ttl=0)
+
     self._cmd = _cmd
 
   @staticmethod
@@ -586,7 +781,12 @@ class XenHypervisor(hv_base.BaseHypervisor):
     cmd.extend([self._GetCommand(hvparams)])
     cmd.extend(args)
 
-    return self._run_cmd_fn(cmd)
+    fn = lambda: self._run_cmd_fn(cmd)
+
+    if timeout is None and tuple(args) in _XEN_QUERY_COMMANDS:
+      return self._query_cache.Query(cmd, fn)
+    else:
+      return self._query_cache.Run(fn)
 
   def _ConfigFileName(self, instance_name):
     """Get the config file name for an instance.
@@ -1028,6 +1228,8 @@ class XenHypervisor(hv_base.BaseHypervisor):
                                     result.output))
 
     def _CheckInstance():
+      # The domain changes without any further command being run
+      self._query_cache.Invalidate()
       new_info = self.GetInstanceInfo(instance.name, hvparams=instance.hvparams)
 
       # check if the domain ID has changed or the run time has decreased
@@ -73,6 +73,9 @@ from ganeti.cmdlib import cluster
 #: Retrieves "id" attribute
 _GetIdAttr = operator.attrgetter("id")
 
+#: How long (in seconds) to collect job file changes before replicating them
+_REPLICATION_WINDOW = 0.2
+
 
 class CancelJob(Exception):
   """Special exception to cancel a job.
@@ -98,6 +101,208 @@ def _CallJqUpdate(runner, names, file_name, content):
   return runner.call_jobqueue_update(names, virt_file_name, content)
 
 
+def _CallJqUpdateMany(runner, names, files):
+  """Updates several job queue files after virtualizing their filenames.
+
+  @type files: list of (string, string)
+  @param files: list of file names and their new contents
+
+  """
+  virt_files = [(vcluster.MakeVirtualPath(file_name), content)
+                for (file_name, content) in files]
+  return runner.call_jobqueue_update_many(names, virt_files)
+
+
+def _ParseJobFile(raw_data):
+  """Parses the contents of a job file.
+
+  The first line of a job file contains the serialized job. It can be
+  followed by log entries appended by L{JobQueue.AppendJobLogUnlocked},
+  one per line and each of the form C{[op_index, log_entry]}, which are
+  merged into the logs of the respective opcodes.
+
+  @type raw_data: string
+  @param raw_data: the contents of the job file
+  @rtype: dict
+  @return: the serialized job, as accepted by L{_QueuedJob.Restore}
+
+  """
+  lines = [line for line in raw_data.splitlines() if line.strip()]
+  if not lines:
+    raise errors.GenericError("Empty job file")
+
+  data = serializer.LoadJson(lines[0])
+  for line in lines[1:]:
+    (op_index, log_entry) = serializer.LoadJson(line)
+    data["ops"][op_index]["log"].append(log_entry)
+
+  return data
+
+
+class _JobFileReplicator(object):
+  """Collects changed job queue files and replicates them in batches.
+
+  Changes are collected for up to C{window} seconds after the first one;
+  only the latest content of each file is sent. L{Flush} can be used as a
+  barrier to replicate all pending changes immediately. Other operations on
+  the replicated files must go through L{Run}, so that they are ordered with
+  the replication of changes.
+
+  """
+  def __init__(self, replicate_fn, window=_REPLICATION_WINDOW,
+               _timer_fn=threading.Timer, _time_fn=time.time):
+    """Initializes this class.
+
+    @type replicate_fn: callable
+    @param replicate_fn: function replicating a list of (file name,
+        content) tuples to the other nodes
+    @type window: number
+    @param window: how long to collect changes before replicating them; if
+        not positive, changes are replicated immediately
+
+    """
+    self._replicate_fn = replicate_fn
+    self._window = window
+    self._timer_fn = _timer_fn
+    self._time_fn = _time_fn
+
+    # Protects the pending changes and the timer
+    self._lock = threading.Lock()
+    # Serializes all operations on the other nodes, so that files are
+    # replicated in the order they were changed (see L{Run})
+    self._flush_lock = threading.Lock()
+    # File name -> (content, time of first pending change)
+    self._pending = {}
+    self._timer = None
+
+    self._batches = 0
+    self._files = 0
+    self._max_batch = 0
+    self._total_latency = 0.0
+    self._max_latency = 0.0
+
+  def Add(self, file_name, data):
+    """Queues a file for replication.
+
+    @type file_name: string
+    @param file_name: the path of the file to be replicated
+    @type data: string
+    @param data: the new contents of the file
+
+    """
+    with self._lock:
+      if file_name in self._pending:
+        queued = self._pending[file_name][1]
+      else:
+        queued = self._time_fn()
+      self._pending[file_name] = (data, queued)
+
+      if self._window > 0 and self._timer is None:
+        self._timer = self._timer_fn(self._window, self._FlushFromTimer)
+        self._timer.daemon = True
+        self._timer.start()
+
+    if self._window <= 0:
+      self.Flush()
+
+  def Flush(self):
+    """Replicates all pending changes and waits for them to finish.
+
+    If replicating fails, the changes are kept for the next attempt and the
+    exception is re-raised.
+
+    """
+    with self._flush_lock:
+      self._FlushUnlocked()
+
+  def Run(self, fn, *args):
+    """Replicates all pending changes, then calls a function.
+
+    Changes made while the function runs are only replicated after it
+    returned.
+
+    @type fn: callable
+    @param fn: function operating on the replicated files on other nodes,
+        e.g. renaming them
+    @return: the return value of C{fn}
+
+    """
+    with self._flush_lock:
+      self._FlushUnlocked()
+      return fn(*args)
+
+  def _FlushFromTimer(self):
+    """Replicates all pending changes once the window expired.
+
+    """
+    try:
+      self.Flush()
+    except Exception: # pylint: disable=W0703
+      logging.exception("Replicating job queue files failed, retrying with"
+                        " the next change")
+
+  def _FlushUnlocked(self):
+    """Replicates all pending changes.
+
+    The caller must hold C{_flush_lock}.
+
+    """
+    with self._lock:
+      pending = self._pending
+      self._pending = {}
+      if self._timer is not None:
+        self._timer.cancel()
+        self._timer = None
+
+    if not pending:
+      return
+
+    files = [(file_name, data)
+             for (file_name, (data, _)) in sorted(pending.items())]
+    start = self._time_fn()
+    try:
+      self._replicate_fn(files)
+    except:
+      # Keep the changes, unless they have been superseded in the meantime
+      with self._lock:
+        for (file_name, value) in pending.items():
+          self._pending.setdefault(file_name, value)
+      raise
+    end = self._time_fn()
+
+    latency = end - min(queued for (_, queued) in pending.values())
+    self._batches += 1
+    self._files += len(files)
+    self._max_batch = max(self._max_batch, len(files))
+    self._total_latency += latency
+    self._max_latency = max(self._max_latency, latency)
+
+    logging.debug("Replicated %d job queue file(s) in %.3f seconds,"
+                  " %.3f seconds after the first change", len(files),
+                  end - start, latency)
+
+  def GetStats(self):
+    """Returns statistics about the replicated batches.
+
+    @rtype: dict
+    @return: number of batches and files, largest batch, average and
+        maximum latency (in seconds) between a change and the end of its
+        replication
+
+    """
+    if self._batches:
+      avg_latency = self._total_latency / self._batches
+    else:
+      avg_latency = 0.0
+    return {
+      "batches": self._batches,
+      "files": self._files,
+      "max_batch": self._max_batch,
+      "avg_latency": avg_latency,
+      "max_latency": self._max_latency,
+      }
+
+
 class _QueuedOpCode(object):
   """Encapsulates an opcode object.
 
@@ -606,8 +811,10 @@ class _OpExecCallbacks(mcpu.OpExecCbBase):
 
     """
     self._job.log_serial += 1
-    self._op.log.append((self._job.log_serial, timestamp, log_type, log_msg))
-    self._queue.UpdateJobUnlocked(self._job, replicate=False)
+    log_entry = (self._job.log_serial, timestamp, log_type, log_msg)
+    self._op.log.append(log_entry)
+    self._queue.AppendJobLogUnlocked(self._job, self._job.ops.index(self._op),
+                                     log_entry)
 
   def Feedback(self, *args):
     """Append a log entry.
@@ -1244,6 +1451,9 @@ class JobQueue(object):
     # Job dependencies
     self.depmgr = _JobDependencyManager(self._GetJobStatusForDependencies)
 
+    # Batched replication of job files
+    self._replicator = _JobFileReplicator(self._ReplicateJobQueueFiles)
+
   def _GetRpc(self, address_list):
     """Gets RPC runner with context.
 
@@ -1315,9 +1525,74 @@ class JobQueue(object):
                     mode=constants.JOB_QUEUE_FILES_PERMS)
 
     if replicate:
-      names, addrs = self._GetNodeIp()
-      result = _CallJqUpdate(self._GetRpc(addrs), names, file_name, data)
-      self._CheckRpcResult(result, self._nodes, "Updating %s" % file_name)
+      self._replicator.Add(file_name, data)
+
+  def _ReplicateJobQueueFiles(self, files):
+    """Replicates job queue files to all nodes.
+
+    Live job files are replicated by luxid, which sends the changes of all
+    running jobs together in a single call per node; if luxid can't be
+    asked to, and for all other files, a single call per node is made from
+    this process.
+
+    @type files: list of (string, string)
+    @param files: list of file names and their new contents
+
+    """
+    (job_ids, others) = self._SplitJobFiles(files)
+    if job_ids:
+      try:
+        luxi.Client(address=pathutils.QUERY_SOCKET).ReplicateJobs(job_ids)
+      except Exception, err: # pylint: disable=W0703
+        logging.warning("Can't have luxid replicate jobs %s, replicating"
+                        " them directly: %s", utils.CommaJoin(job_ids), err)
+        others = files
+
+    if not others:
+      return
+    names, addrs = self._GetNodeIp()
+    if not names:
+      return
+    result = _CallJqUpdateMany(self._GetRpc(addrs), names, others)
+    self._CheckRpcResult(result, self._nodes, "Updating %s" %
+                         utils.CommaJoin(name for (name, _) in others))
+
+  @classmethod
+  def _SplitJobFiles(cls, files):
+    """Separates the live job files from the other files.
+
+    luxid reads the live job files itself when replicating them, so only
+    the job IDs are needed for those.
+
+    @type files: list of (string, string)
+    @param files: list of file names and their new contents
+    @rtype: tuple; (list of int, list of (string, string))
+    @return: the IDs of the live jobs and the other files
+
+    """
+    job_ids = []
+    others = []
+    for (file_name, data) in files:
+      m = constants.JOB_FILE_RE.match(os.path.basename(file_name))
+      if m and file_name == cls._GetJobPath(m.group(1)):
+        job_ids.append(int(m.group(1)))
+      else:
+        others.append((file_name, data))
+    return (job_ids, others)
+
+  def FlushReplication(self):
+    """Replicates all pending job file changes to the other nodes.
+
+    """
+    self._replicator.Flush()
+
+  def GetReplicationStats(self):
+    """Returns statistics about the job file replication.
+
+    See L{_JobFileReplicator.GetStats}.
+
+    """
+    return self._replicator.GetStats()
 
   def _RenameFilesUnlocked(self, rename):
     """Renames a file locally and then replicate the change.
@@ -1329,14 +1604,20 @@ class JobQueue(object):
     @param rename: List containing tuples mapping old to new names
 
     """
-    # Rename them locally
-    for old, new in rename:
-      utils.RenameFile(old, new, mkdir=True)
+    def _Rename():
+      # Rename them locally
+      for old, new in rename:
+        utils.RenameFile(old, new, mkdir=True)
 
-    # ... and on all nodes
-    names, addrs = self._GetNodeIp()
-    result = self._GetRpc(addrs).call_jobqueue_rename(names, rename)
-    self._CheckRpcResult(result, self._nodes, "Renaming files (%r)" % rename)
+      # ... and on all nodes
+      names, addrs = self._GetNodeIp()
+      result = self._GetRpc(addrs).call_jobqueue_rename(names, rename)
+      self._CheckRpcResult(result, self._nodes,
+                           "Renaming files (%r)" % rename)
+
+    # Pending updates must be replicated before the files are renamed, and
+    # later ones only afterwards, so that they can't recreate renamed files
+    self._replicator.Run(_Rename)
 
   @staticmethod
   def _GetJobPath(job_id):
@@ -1492,7 +1773,7 @@ class JobQueue(object):
       writable = not archived
 
     try:
-      data = serializer.LoadJson(raw_data)
+      data = _ParseJobFile(raw_data)
       job = _QueuedJob.Restore(queue, data, writable, archived)
     except Exception, err: # pylint: disable=W0703
       raise errors.JobFileCorrupted(err)
@@ -1605,6 +1886,38 @@ class JobQueue(object):
     logging.debug("Writing job %s to %s", job.id, filename)
     self._UpdateJobQueueFile(filename, data, replicate)
 
+    if replicate and job.CalcStatus() in constants.JOBS_FINALIZED:
+      # Finalized jobs must have been replicated before anyone is told
+      self.FlushReplication()
+
+  def AppendJobLogUnlocked(self, job, op_index, log_entry):
+    """Append a log entry to a job's on disk storage.
+
+    Instead of rewriting the whole job file, the entry is appended to it as
+    a separate line (see L{_ParseJobFile}); the job file is compacted on
+    the next call to L{UpdateJobUnlocked}. The entry is not replicated to
+    the other nodes.
+
+    @type job: L{_QueuedJob}
+    @param job: the job the entry belongs to
+    @type op_index: int
+    @param op_index: the index of the opcode within the job
+    @param log_entry: the log entry, as stored in L{_QueuedOpCode.log}
+
+    """
+    assert job.writable, "Can't update read-only job"
+    assert not job.archived, "Can't update archived job"
+
+    filename = self._GetJobPath(job.id)
+    data = "\n" + serializer.DumpJson([op_index, log_entry])
+    logging.debug("Appending log entry %s to %s", log_entry[0], filename)
+    # The job file must already exist, it is never created here
+    fobj = os.fdopen(os.open(filename, os.O_WRONLY | os.O_APPEND), "a")
+    try:
+      fobj.write(data)
+    finally:
+      fobj.close()
+
   def HasJobBeenFinalized(self, job_id):
     """Checks if a job has been finalized.
 
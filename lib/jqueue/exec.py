@@ -41,6 +41,7 @@ import signal
 import sys
 import time
 
+from ganeti import config
 from ganeti import mcpu
 from ganeti.server import masterd
 from ganeti.rpc import transport
@@ -52,26 +53,38 @@ from ganeti.utils import livelock
 from ganeti.jqueue import _JobProcessor, JobQueue
 
 
+def ReadMasterInfo(trans):
+  """Retrieve job id, lock file name and secret params from the master process
+
+  @type trans: L{transport.FdTransport}
+  @param trans: the transport connected to the master process
+  @rtype: (int, string, json encoding of a list of dicts)
+
+  """
+  logging.debug("Reading job id from the master process")
+  job_id = int(trans.Call(""))
+  logging.debug("Got job id %d", job_id)
+  logging.debug("Reading the livelock name from the master process")
+  livelock_name = trans.Call("")
+  logging.debug("Got livelock %s", livelock_name)
+  logging.debug("Reading secret parameters from the master process")
+  secret_params = trans.Call("")
+  logging.debug("Got secret parameters.")
+  return (job_id, livelock_name, secret_params)
+
+
 def _GetMasterInfo():
   """Retrieve job id, lock file name and secret params from the master process
 
   This also closes standard input/output
 
-  @rtype: (int, string, json encoding of a list of dicts)
+  @rtype: (int, L{livelock.LiveLockName}, json encoding of a list of dicts)
 
   """
   logging.debug("Opening transport over stdin/out")
   with contextlib.closing(transport.FdTransport((0, 1))) as trans:
-    logging.debug("Reading job id from the master process")
-    job_id = int(trans.Call(""))
-    logging.debug("Got job id %d", job_id)
-    logging.debug("Reading the livelock name from the master process")
-    livelock_name = livelock.LiveLockName(trans.Call(""))
-    logging.debug("Got livelock %s", livelock_name)
-    logging.debug("Reading secret parameters from the master process")
-    secret_params = trans.Call("")
-    logging.debug("Got secret parameters.")
-  return (job_id, livelock_name, secret_params)
+    (job_id, livelock_name, secret_params) = ReadMasterInfo(trans)
+  return (job_id, livelock.LiveLockName(livelock_name), secret_params)
 
 
 def RestorePrivateValueWrapping(json):
@@ -91,14 +104,22 @@ def RestorePrivateValueWrapping(json):
   return result
 
 
-def main():
+def RunJob(job_id, livelock_name, secret_params_serialized, debug,
+           config_snapshot=None):
+  """Runs a job until it is finalized.
 
-  debug = int(os.environ["GNT_DEBUG"])
+  @type job_id: int
+  @param job_id: the job to run
+  @param livelock_name: the livelock of the job process
+  @type secret_params_serialized: string
+  @param secret_params_serialized: json encoding of the secret parameters
+  @type debug: int
+  @param debug: whether to enable debug logging
+  @param config_snapshot: a recent configuration to start the job's
+      configuration with, see L{config.SetConfigSnapshot}
 
+  """
   logname = pathutils.GetLogFilename("jobs")
-  utils.SetupLogging(logname, "job-startup", debug=debug)
-
-  (job_id, livelock_name, secret_params_serialized) = _GetMasterInfo()
 
   secret_params = ""
   if secret_params_serialized:
@@ -107,6 +128,8 @@ def main():
 
   utils.SetupLogging(logname, "job-%s" % (job_id,), debug=debug)
 
+  context = None
+  processor = None
   try:
     logging.debug("Preparing the context and the configuration")
     context = masterd.GanetiContext(livelock_name)
@@ -124,7 +147,7 @@ def main():
     def _HupHandler(signum, _frame):
       logging.debug("Received signal %d, old flag was %s, will set to True",
                     signum, mcpu.sighupReceived)
-      mcpu.sighupReceived[0] = True
+      mcpu.NotifyLockChange()
     signal.signal(signal.SIGHUP, _HupHandler)
 
     def _User1Handler(signum, _frame):
@@ -132,6 +155,8 @@ def main():
       prio_change[0] = True
     signal.signal(signal.SIGUSR1, _User1Handler)
 
+    mcpu.SetupSignalWakeup()
+
     job = JobQueue.SafeLoadJobFromDisk(context.jobqueue, job_id, False)
 
     job.SetPid(os.getpid())
@@ -141,7 +166,11 @@ def main():
         if hasattr(job.ops[i].input, "osparams_secret"):
           job.ops[i].input.osparams_secret = secret_params[i]
 
-    execfun = mcpu.Processor(context, job_id, job_id).ExecOpCode
+    if config_snapshot is not None:
+      config.SetConfigSnapshot(config_snapshot)
+
+    processor = mcpu.Processor(context, job_id, job_id)
+    execfun = processor.ExecOpCode
     proc = _JobProcessor(context.jobqueue, execfun, job)
     result = _JobProcessor.DEFER
     while result != _JobProcessor.FINISHED:
@@ -178,10 +207,32 @@ def main():
   except Exception: # pylint: disable=W0703
     logging.exception("Exception when trying to run job %d", job_id)
   finally:
+    if context is not None:
+      try:
+        context.jobqueue.FlushReplication()
+      except Exception: # pylint: disable=W0703
+        logging.exception("Replicating the files of job %d failed", job_id)
+      logging.debug("Job file replication: %s",
+                    context.jobqueue.GetReplicationStats())
+    if processor is not None:
+      logging.info("Lock waits of job %d: %s", job_id,
+                   processor.GetLockStats())
     logging.debug("Job %d finalized", job_id)
     logging.debug("Removing livelock file %s", livelock_name.GetPath())
     os.remove(livelock_name.GetPath())
 
+
+def main():
+
+  debug = int(os.environ["GNT_DEBUG"])
+
+  logname = pathutils.GetLogFilename("jobs")
+  utils.SetupLogging(logname, "job-startup", debug=debug)
+
+  (job_id, livelock_name, secret_params_serialized) = _GetMasterInfo()
+
+  RunJob(job_id, livelock_name, secret_params_serialized, debug)
+
   sys.exit(0)
 
 if __name__ == '__main__':
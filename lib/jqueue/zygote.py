@@ -0,0 +1,205 @@
+#
+#
+
+# Copyright (C) 2015 Google Inc.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+#
+# 1. Redistributions of source code must retain the above copyright notice,
+# this list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright
+# notice, this list of conditions and the following disclaimer in the
+# documentation and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS
+# IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED
+# TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR
+# PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR
+# CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+# EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+# PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR
+# PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF
+# LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
+# NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+"""Pre-forked executor for job processes
+
+Starting a job process from scratch means starting a Python interpreter,
+importing the whole of the opcode machinery and reading the configuration,
+which makes up most of the latency of short jobs. This process does all of
+that once, while idle, and then forks a child for every job luxid wants to
+start.
+
+For each job, luxid connects to the zygote socket and the protocol is:
+
+  - luxid sends the job id;
+  - the child creates and locks its livelock and sends its process id and
+    the livelock file name;
+  - from then on, the conversation is the same as with a job process
+    started by luxid itself (see L{ganeti.jqueue.exec}).
+
+The zygote exits as soon as its parent, luxid, is gone.
+
+"""
+
+import errno
+import importlib
+import logging
+import os
+import random
+import select
+import signal
+import socket
+import sys
+
+from ganeti import config
+from ganeti import constants
+from ganeti import errors
+from ganeti import pathutils
+from ganeti import serializer
+from ganeti import utils
+from ganeti.rpc import transport
+from ganeti.utils import livelock
+from ganeti import wconfd
+
+# Modules only needed by the job processes, imported here so that the forked
+# children don't have to; "exec" is a keyword, hence the indirect import
+# pylint: disable=W0611
+from ganeti import cmdlib
+from ganeti import hypervisor
+from ganeti import mcpu
+from ganeti import rpc
+jqexec = importlib.import_module("ganeti.jqueue.exec")
+
+
+def _Listen(path):
+  """Creates the listening socket of the zygote.
+
+  @type path: string
+  @param path: the path of the Unix socket
+  @rtype: socket.socket
+
+  """
+  utils.RemoveFile(path)
+  sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+  old_umask = os.umask(0077)
+  try:
+    sock.bind(path)
+  finally:
+    os.umask(old_umask)
+  sock.listen(128)
+  utils.SetCloseOnExecFlag(sock.fileno(), True)
+  return sock
+
+
+def _RefreshSnapshot(cfg, snapshot=None):
+  """Re-reads the configuration, if it changed in WConfd.
+
+  @type cfg: L{config.ConfigWriter}
+  @param snapshot: the current snapshot, kept if it is still up to date
+  @return: see L{config.ConfigWriter.GetConfigSnapshot}
+
+  """
+  try:
+    if snapshot is not None and cfg.IsConfigSnapshotCurrent(snapshot):
+      return snapshot
+    cfg.OutDate()
+    return cfg.GetConfigSnapshot()
+  except Exception: # pylint: disable=W0703
+    logging.exception("Can't read the configuration, starting jobs without")
+    return None
+
+
+def _RunChild(conn, snapshot, debug):
+  """Runs a single job in a freshly forked child.
+
+  Never returns.
+
+  @type conn: socket.socket
+  @param conn: the connection to luxid
+  @param snapshot: the configuration to start the job with, as returned by
+    L{config.ConfigWriter.GetConfigSnapshot}
+  @type debug: int
+
+  """
+  job_id = None
+  try:
+    # Children must neither share the zygote's random state nor that of
+    # their siblings
+    random.seed()
+    utils.ResetTempfileModule()
+
+    signal.signal(signal.SIGCHLD, signal.SIG_DFL)
+    fd = conn.fileno()
+    trans = transport.FdTransport((fd, os.dup(fd)))
+    job_id = int(trans.Recv())
+    lock = livelock.LiveLock("job_%06d" % job_id)
+    trans.Send(serializer.DumpJson([os.getpid(), lock.GetPath()]))
+    trans.Recv()
+    (master_job_id, _, secret_params) = jqexec.ReadMasterInfo(trans)
+    trans.Close()
+    conn.close()
+    if master_job_id != job_id:
+      raise errors.ProgrammerError("Job id mismatch, got %s instead of %s" %
+                                   (master_job_id, job_id))
+    jqexec.RunJob(job_id, lock, secret_params, debug,
+                  config_snapshot=snapshot)
+  except Exception: # pylint: disable=W0703
+    logging.exception("Error while running job %s in a forked process",
+                      job_id)
+  finally:
+    os._exit(0) # pylint: disable=W0212
+
+
+def main():
+
+  debug = int(os.environ["GNT_DEBUG"])
+
+  logname = pathutils.GetLogFilename("jobs")
+  utils.SetupLogging(logname, "job-zygote", debug=debug)
+
+  # children are never waited for, luxid watches them through their livelocks
+  signal.signal(signal.SIGCHLD, signal.SIG_IGN)
+
+  parent = os.getppid()
+  sock = _Listen(pathutils.JOB_ZYGOTE_SOCKET)
+  cfg = config.ConfigWriter(wconfd=wconfd.Client())
+  snapshot = _RefreshSnapshot(cfg)
+  logging.info("Job zygote ready, listening on %s",
+               pathutils.JOB_ZYGOTE_SOCKET)
+
+  try:
+    while os.getppid() == parent:
+      try:
+        (readable, _, _) = \
+          select.select([sock], [], [],
+                        constants.LUXID_JOB_ZYGOTE_REFRESH_INTERVAL)
+      except select.error, err:
+        if err.args[0] == errno.EINTR:
+          continue
+        raise
+
+      if not readable:
+        snapshot = _RefreshSnapshot(cfg, snapshot)
+        continue
+
+      (conn, _) = sock.accept()
+      pid = os.fork()
+      if pid == 0:
+        sock.close()
+        _RunChild(conn, snapshot, debug)
+      conn.close()
+  finally:
+    utils.RemoveFile(pathutils.JOB_ZYGOTE_SOCKET)
+
+  logging.info("Luxid is gone, job zygote exiting")
+  sys.exit(0)
+
+if __name__ == '__main__':
+  main()
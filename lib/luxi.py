@@ -75,6 +75,7 @@ REQ_QUERY_CLUSTER_INFO = constants.LUXI_REQ_QUERY_CLUSTER_INFO
 REQ_QUERY_TAGS = constants.LUXI_REQ_QUERY_TAGS
 REQ_SET_DRAIN_FLAG = constants.LUXI_REQ_SET_DRAIN_FLAG
 REQ_SET_WATCHER_PAUSE = constants.LUXI_REQ_SET_WATCHER_PAUSE
+REQ_REPLICATE_JOBS = constants.LUXI_REQ_REPLICATE_JOBS
 REQ_ALL = constants.LUXI_REQ_ALL
 
 DEF_RWTO = constants.LUXI_DEF_RWTO
@@ -112,6 +113,9 @@ class Client(cl.AbstractClient):
   def SetWatcherPause(self, until):
     return self.CallMethod(REQ_SET_WATCHER_PAUSE, (until, ))
 
+  def ReplicateJobs(self, job_ids):
+    return self.CallMethod(REQ_REPLICATE_JOBS, (job_ids, ))
+
   def PickupJob(self, job):
     return self.CallMethod(REQ_PICKUP_JOB, (job,))
 
@@ -38,8 +38,12 @@ are two kinds of classes defined:
 """
 
 import sys
+import errno
 import logging
+import os
 import random
+import select
+import signal
 import time
 import itertools
 import traceback
@@ -57,8 +61,16 @@ from ganeti import wconfd
 
 
 sighupReceived = [False]
+sighupTimestamp = [None]
 lusExecuting = [0]
 
+#: Read end of the pipe signals are written to, see L{SetupSignalWakeup}
+_signal_wakeup_fd = [None]
+
+#: Interval in which WConfD is asked about pending lock requests in case a
+#: notification gets lost
+_LOCK_POLL_INTERVAL = 5.0
+
 _OP_PREFIX = "Op"
 _LU_PREFIX = "LU"
 
@@ -69,6 +81,64 @@ class LockAcquireTimeout(Exception):
   """
 
 
+def NotifyLockChange():
+  """Records that WConfD notified this process about a change in the locks.
+
+  To be called from the handler of C{SIGHUP}, which WConfD sends once a lock
+  this process is waiting for might have become available.
+
+  """
+  if not sighupReceived[0]:
+    sighupTimestamp[0] = time.time()
+  sighupReceived[0] = True
+
+
+def SetupSignalWakeup():
+  """Makes waiting for locks return as soon as a signal arrives.
+
+  Must be called from the main thread, before any signal is expected to
+  interrupt a wait for locks.
+
+  """
+  (rfd, wfd) = os.pipe()
+  for fd in (rfd, wfd):
+    utils.SetNonblockFlag(fd, True)
+    utils.SetCloseOnExecFlag(fd, True)
+  signal.set_wakeup_fd(wfd)
+  _signal_wakeup_fd[0] = rfd
+
+
+def _WaitForSignal(timeout):
+  """Waits until a signal arrives or the timeout expires.
+
+  Without L{SetupSignalWakeup}, this just sleeps for the timeout; a signal
+  arriving in the meantime interrupts the sleep, but one arriving right
+  before it doesn't.
+
+  @type timeout: float
+  @param timeout: the maximum time to wait, in seconds
+
+  """
+  rfd = _signal_wakeup_fd[0]
+  if rfd is None:
+    time.sleep(timeout)
+    return
+
+  try:
+    select.select([rfd], [], [], timeout)
+  except select.error, err:
+    if err.args[0] != errno.EINTR:
+      raise
+
+  # Discard the signals written so far, the handlers have run already
+  try:
+    while os.read(rfd, 4096):
+      pass
+  except OSError, err:
+    if err.errno != errno.EAGAIN:
+      raise
+
+
 def _CalculateLockAttemptTimeouts():
   """Calculate timeouts for lock attempts.
 
@@ -309,6 +379,23 @@ class Processor(object):
     self._enable_locks = enable_locks
     self.wconfd = wconfd # Indirection to allow testing
     self._wconfdcontext = context.GetWConfdContext(ec_id)
+    self._lock_stats = {
+      "waits": 0,
+      "wait_time": 0.0,
+      "notified": 0,
+      "polled": 0,
+      "grant_latency": 0.0,
+      "max_grant_latency": 0.0,
+      }
+
+  def _WConfdClient(self):
+    """Returns the WConfD client for lock requests.
+
+    The client is shared within the job process, so that its connection is
+    kept across the many requests done while acquiring locks.
+
+    """
+    return self.wconfd.GetSharedClient()
 
   def _CheckLocksEnabled(self):
     """Checks if locking is enabled.
@@ -319,6 +406,76 @@ class Processor(object):
     if not self._enable_locks:
       raise errors.ProgrammerError("Attempted to use disabled locks")
 
+  def GetLockStats(self):
+    """Returns statistics about waiting for locks.
+
+    The grant latency is the time between WConfD notifying this process and
+    the process resuming, for those waits that ended by a notification.
+
+    @rtype: dict
+
+    """
+    stats = self._lock_stats.copy()
+    if stats["notified"]:
+      stats["avg_grant_latency"] = stats["grant_latency"] / stats["notified"]
+    else:
+      stats["avg_grant_latency"] = 0.0
+    return stats
+
+  def _WaitForLocks(self, timeout):
+    """Waits for the pending lock request to be granted.
+
+    WConfD is asked whether the request is still pending whenever it
+    signals this process, and every L{_LOCK_POLL_INTERVAL} seconds in case
+    a notification got lost.
+
+    @type timeout: None or float
+    @param timeout: the maximum time to wait, None to wait until the request
+        is granted
+    @rtype: bool
+    @return: whether the request is still pending
+
+    """
+    start = time.time()
+    if timeout is None:
+      deadline = None
+    else:
+      deadline = start + timeout
+    next_poll = start + _LOCK_POLL_INTERVAL
+    self._lock_stats["waits"] += 1
+
+    try:
+      while True:
+        now = time.time()
+        notified = sighupReceived[0]
+        if notified or now >= next_poll or \
+           (deadline is not None and now >= deadline):
+          notified_at = sighupTimestamp[0]
+          sighupReceived[0] = False
+          if not self._WConfdClient().HasPendingRequest(self._wconfdcontext):
+            if notified:
+              latency = time.time() - notified_at
+              self._lock_stats["notified"] += 1
+              self._lock_stats["grant_latency"] += latency
+              self._lock_stats["max_grant_latency"] = \
+                max(self._lock_stats["max_grant_latency"], latency)
+              logging.debug("Locks granted, resumed %.3fs after the"
+                            " notification", latency)
+            else:
+              self._lock_stats["polled"] += 1
+              logging.debug("Locks granted without a notification")
+            return False
+          if deadline is not None and now >= deadline:
+            return True
+          next_poll = now + _LOCK_POLL_INTERVAL
+
+        wait = next_poll - now
+        if deadline is not None:
+          wait = min(wait, deadline - now)
+        _WaitForSignal(max(wait, 0))
+    finally:
+      self._lock_stats["wait_time"] += time.time() - start
+
   def _RequestAndWait(self, request, timeout):
     """Request locks from WConfD and wait for them to be granted.
 
@@ -347,27 +504,12 @@ class Processor(object):
     sighupReceived[0] = False
 
     # Request locks
-    self.wconfd.Client().UpdateLocksWaiting(self._wconfdcontext, priority,
+    self._WConfdClient().UpdateLocksWaiting(self._wconfdcontext, priority,
                                             request)
-    pending = self.wconfd.Client().HasPendingRequest(self._wconfdcontext)
+    pending = self._WConfdClient().HasPendingRequest(self._wconfdcontext)
 
     if pending:
-      def _HasPending():
-        if sighupReceived[0]:
-          return self.wconfd.Client().HasPendingRequest(self._wconfdcontext)
-        else:
-          return True
-
-      pending = utils.SimpleRetry(False, _HasPending, 0.05, timeout)
-
-      signal = sighupReceived[0]
-
-      if pending:
-        pending = self.wconfd.Client().HasPendingRequest(self._wconfdcontext)
-
-      if pending and signal:
-        logging.warning("Ignoring unexpected SIGHUP")
-      sighupReceived[0] = False
+      pending = self._WaitForLocks(timeout)
 
     logging.debug("Finished trying. Pending: %s", pending)
     if pending:
@@ -453,20 +595,18 @@ class Processor(object):
       ## acquire the locks one by one (in lock order).
       for r in request:
         logging.debug("Definite request %s for %s", r, self._wconfdcontext)
-        self.wconfd.Client().UpdateLocksWaiting(self._wconfdcontext, priority,
+        sighupReceived[0] = False
+        self._WConfdClient().UpdateLocksWaiting(self._wconfdcontext, priority,
                                                 [r])
-        while True:
-          pending = self.wconfd.Client().HasPendingRequest(self._wconfdcontext)
-          if not pending:
-            break
-          time.sleep(10.0 * random.random())
+        if self._WConfdClient().HasPendingRequest(self._wconfdcontext):
+          self._WaitForLocks(None)
 
     elif opportunistic:
       logging.debug("For %ss trying to opportunistically acquire"
                     "  at least %d of %s for %s.",
                     timeout, opportunistic_count, locks, self._wconfdcontext)
       locks = utils.SimpleRetry(
-        lambda l: l != [], self.wconfd.Client().GuardedOpportunisticLockUnion,
+        lambda l: l != [], self._WConfdClient().GuardedOpportunisticLockUnion,
         2.0, timeout, args=[opportunistic_count, self._wconfdcontext, request])
       logging.debug("Managed to get the following locks: %s", locks)
       if locks == []:
@@ -549,7 +689,7 @@ class Processor(object):
       if pending:
         self._RequestAndWait(pending, calc_timeout())
         lu.cfg.OutDate()
-        lu.wconfdlocks = self.wconfd.Client().ListLocks(self._wconfdcontext)
+        lu.wconfdlocks = self._WConfdClient().ListLocks(self._wconfdcontext)
         pending = []
 
       logging.debug("Finished acquiring locks")
@@ -593,7 +733,7 @@ class Processor(object):
     if dont_collate and pending:
       self._RequestAndWait(pending, calc_timeout())
       lu.cfg.OutDate()
-      lu.wconfdlocks = self.wconfd.Client().ListLocks(self._wconfdcontext)
+      lu.wconfdlocks = self._WConfdClient().ListLocks(self._wconfdcontext)
       pending = []
 
     if adding_locks and opportunistic:
@@ -635,12 +775,12 @@ class Processor(object):
           if pending:
             self._RequestAndWait(pending, calc_timeout())
             lu.cfg.OutDate()
-            lu.wconfdlocks = self.wconfd.Client().ListLocks(self._wconfdcontext)
+            lu.wconfdlocks = self._WConfdClient().ListLocks(self._wconfdcontext)
             pending = []
           self._AcquireLocks(level, needed_locks, share, opportunistic,
                              timeout,
                              opportunistic_count=opportunistic_count)
-          lu.wconfdlocks = self.wconfd.Client().ListLocks(self._wconfdcontext)
+          lu.wconfdlocks = self._WConfdClient().ListLocks(self._wconfdcontext)
 
         result = self._LockAndExecLU(lu, level + 1, calc_timeout,
                                      pending=pending)
@@ -648,7 +788,7 @@ class Processor(object):
         levelname = locking.LEVEL_NAMES[level]
         logging.debug("Freeing locks at level %s for %s",
                       levelname, self._wconfdcontext)
-        self.wconfd.Client().FreeLocksLevel(self._wconfdcontext, levelname)
+        self._WConfdClient().FreeLocksLevel(self._wconfdcontext, levelname)
     else:
       result = self._LockAndExecLU(lu, level + 1, calc_timeout, pending=pending)
 
@@ -694,7 +834,7 @@ class Processor(object):
 
       lu = lu_class(self, op, self.cfg, self.rpc,
                     self._wconfdcontext, self.wconfd)
-      lu.wconfdlocks = self.wconfd.Client().ListLocks(self._wconfdcontext)
+      lu.wconfdlocks = self._WConfdClient().ListLocks(self._wconfdcontext)
       _CheckSecretParameters(op)
       lu.ExpandNames()
       assert lu.needed_locks is not None, "needed_locks not set by LU"
@@ -706,7 +846,7 @@ class Processor(object):
         if self._ec_id:
           self.cfg.DropECReservations(self._ec_id)
     finally:
-      self.wconfd.Client().FreeLocksLevel(
+      self._WConfdClient().FreeLocksLevel(
         self._wconfdcontext, locking.LEVEL_NAMES[locking.LEVEL_CLUSTER])
       self._cbs = None
 
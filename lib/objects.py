@@ -49,6 +49,7 @@ import re
 import copy
 import logging
 import time
+import types
 from cStringIO import StringIO
 
 from ganeti import errors
@@ -191,6 +192,193 @@ def MakeEmptyIPolicy():
   return {}
 
 
+#: Regular expression for slot names usable in generated code
+_SLOT_NAME_RE = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*$")
+
+#: Generated functions for converting config objects to and from
+#: dictionaries, indexed by class
+_CODECS = {}
+
+
+def _BuildEncoder(slots):
+  """Generates a function converting an object's slots to a dictionary.
+
+  The generated function is equivalent to looping over all slots and adding
+  those not set to C{None} to the result, but doesn't need to look up the
+  slot names or iterate over them at runtime.
+
+  @type slots: list of strings
+  @param slots: Slot names
+  @rtype: callable
+
+  """
+  lines = ["def encode(obj):", "  result = {}"]
+
+  for name in utils.UniqueSequence(slots):
+    assert _SLOT_NAME_RE.match(name), "Invalid slot name %r" % name
+    lines.extend([
+      "  value = obj.%s" % name,
+      "  if value is not None:",
+      "    result[%r] = value" % name,
+      ])
+
+  lines.append("  return result")
+
+  namespace = {}
+  exec "\n".join(lines) in namespace # pylint: disable=W0122
+
+  return namespace["encode"]
+
+
+def _LookupClassAttr(cls, name):
+  """Looks up an attribute in the dictionaries of a class and its parents.
+
+  Unlike C{getattr}, this returns descriptors themselves.
+
+  """
+  for parent in cls.__mro__:
+    try:
+      return parent.__dict__[name]
+    except KeyError:
+      pass
+
+  return None
+
+
+def _GetSlotSetters(cls, slots):
+  """Returns the functions setting the slots of a class' objects directly.
+
+  @type cls: class
+  @param cls: Class of the objects
+  @type slots: list of strings
+  @param slots: Slot names
+  @rtype: dict or None
+  @return: slot setters indexed by slot name, or C{None} if the class has
+    its own constructor or attributes shadowing slots (e.g. properties)
+
+  """
+  if (_LookupClassAttr(cls, "__init__") is not
+      outils.ValidatedSlots.__dict__["__init__"]):
+    return None
+
+  setters = {}
+  for name in slots:
+    descr = _LookupClassAttr(cls, name)
+    if not isinstance(descr, types.MemberDescriptorType):
+      return None
+    setters[name] = descr.__set__
+
+  return setters
+
+
+def _BuildDecoder(cls, setters):
+  """Builds a function creating an object from a dictionary.
+
+  The slot values are set directly through the slot descriptors. Classes
+  for which no setters are available are created through the constructor
+  instead.
+
+  @type cls: class
+  @param cls: Class of created objects
+  @type setters: dict or None
+  @param setters: Slot setters as returned by L{_GetSlotSetters}
+  @rtype: callable
+
+  """
+  if setters is None:
+    def decode(val):
+      return cls(**dict([(str(k), v) # pylint: disable=W0142
+                         for k, v in val.iteritems()]))
+
+    return decode
+
+  new_fn = cls.__new__
+
+  def decode(val):
+    obj = new_fn(cls)
+    for (key, value) in val.iteritems():
+      try:
+        set_fn = setters[key]
+      except KeyError:
+        raise TypeError("Object %s doesn't support the parameter '%s'" %
+                        (cls.__name__, key))
+      set_fn(obj, value)
+    return obj
+
+  return decode
+
+
+def _BuildCopier(cls, slots, setters):
+  """Generates a function copying an object without an intermediate dict.
+
+  This is only possible for classes using the generic L{ConfigObject.ToDict}
+  and L{ConfigObject.FromDict}, for which a round trip through a dictionary
+  merely copies the references to the slot values. The generated function
+  does the same, without building the dictionary.
+
+  @type cls: class
+  @param cls: Class of copied objects
+  @type slots: list of strings
+  @param slots: Slot names
+  @type setters: dict or None
+  @param setters: Slot setters as returned by L{_GetSlotSetters}
+  @rtype: callable or None
+  @return: copy function, or C{None} if objects of the class must be copied
+    through their dictionary representation
+
+  """
+  if (setters is None or
+      _LookupClassAttr(cls, "ToDict") is not
+      ConfigObject.__dict__["ToDict"] or
+      _LookupClassAttr(cls, "FromDict") is not
+      ConfigObject.__dict__["FromDict"]):
+    return None
+
+  namespace = {
+    "new_fn": cls.__new__,
+    "cls": cls,
+    }
+  lines = ["def copy(obj):", "  new = new_fn(cls)"]
+
+  for (idx, name) in enumerate(utils.UniqueSequence(slots)):
+    assert _SLOT_NAME_RE.match(name), "Invalid slot name %r" % name
+    namespace["set_%d" % idx] = setters[name]
+    lines.extend([
+      "  value = obj.%s" % name,
+      "  if value is not None:",
+      "    set_%d(new, value)" % idx,
+      ])
+
+  lines.append("  return new")
+
+  exec "\n".join(lines) in namespace # pylint: disable=W0122
+
+  return namespace["copy"]
+
+
+def _GetCodec(cls):
+  """Returns the functions converting objects of a class to and from dicts.
+
+  The functions are built on first use and cached per class.
+
+  @rtype: tuple; (callable, callable, callable or None)
+  @return: Encoder, decoder and copy function, see L{_BuildCopier}
+
+  """
+  try:
+    return _CODECS[cls]
+  except KeyError:
+    pass
+
+  slots = cls.GetAllSlots()
+  setters = _GetSlotSetters(cls, slots)
+  codec = (_BuildEncoder(slots), _BuildDecoder(cls, setters),
+           _BuildCopier(cls, slots, setters))
+  _CODECS[cls] = codec
+
+  return codec
+
+
 class ConfigObject(outils.ValidatedSlots):
   """A generic config object.
 
@@ -207,13 +395,13 @@ class ConfigObject(outils.ValidatedSlots):
   __slots__ = []
 
   def __getattr__(self, name):
-    if name not in self.GetAllSlots():
+    if name not in self.GetAllSlotsSet():
       raise AttributeError("Invalid object attribute %s.%s" %
                            (type(self).__name__, name))
     return None
 
   def __setstate__(self, state):
-    slots = self.GetAllSlots()
+    slots = self.GetAllSlotsSet()
     for name in state:
       if name in slots:
         setattr(self, name, state[name])
@@ -252,12 +440,7 @@ class ConfigObject(outils.ValidatedSlots):
                           will be replaced with None.
 
     """
-    result = {}
-    for name in self.GetAllSlots():
-      value = getattr(self, name, None)
-      if value is not None:
-        result[name] = value
-    return result
+    return _GetCodec(self.__class__)[0](self)
 
   __getstate__ = ToDict
 
@@ -277,14 +460,20 @@ class ConfigObject(outils.ValidatedSlots):
     if not isinstance(val, dict):
       raise errors.ConfigurationError("Invalid object passed to FromDict:"
                                       " expected dict, got %s" % type(val))
-    val_str = dict([(str(k), v) for k, v in val.iteritems()])
-    obj = cls(**val_str) # pylint: disable=W0142
-    return obj
+    return _GetCodec(cls)[1](val)
 
   def Copy(self):
     """Makes a deep copy of the current object and its children.
 
+    Objects of classes without custom conversion to and from dictionaries
+    are copied directly, which is equivalent to but cheaper than the round
+    trip through L{ToDict} and L{FromDict}.
+
     """
+    copy_fn = _GetCodec(self.__class__)[2]
+    if copy_fn is not None:
+      return copy_fn(self)
+
     dict_form = self.ToDict()
     clone_obj = self.__class__.FromDict(dict_form)
     return clone_obj
@@ -81,7 +81,7 @@ class ValidatedSlots(object):
     __slots__ attribute for this class.
 
     """
-    slots = self.GetAllSlots()
+    slots = self.GetAllSlotsSet()
     for (key, value) in kwargs.items():
       if key not in slots:
         raise TypeError("Object %s doesn't support the parameter '%s'" %
@@ -89,14 +89,52 @@ class ValidatedSlots(object):
       setattr(self, key, value)
 
   @classmethod
-  def GetAllSlots(cls):
-    """Compute the list of all declared slots for a class.
+  def _GetSlotsCache(cls):
+    """Returns the cached slot list and set of a class.
+
+    The slots of a class don't change after its creation, so they are only
+    computed once per class. The cache is stored in the class' own
+    dictionary so that it's not inherited by subclasses.
+
+    @rtype: tuple; (list, frozenset)
 
     """
+    try:
+      return cls.__dict__["_slots_cache"]
+    except KeyError:
+      pass
+
     slots = []
     for parent in cls.__mro__:
       slots.extend(getattr(parent, "__slots__", []))
-    return slots
+
+    cache = (slots, frozenset(slots))
+    cls._slots_cache = cache
+
+    return cache
+
+  @classmethod
+  def GetAllSlots(cls):
+    """Compute the list of all declared slots for a class.
+
+    The returned list is shared and must not be modified.
+
+    """
+    return cls._GetSlotsCache()[0]
+
+  @classmethod
+  def GetAllSlotsSet(cls):
+    """Returns the names of all declared slots of a class as a set.
+
+    @rtype: frozenset
+
+    """
+    # Inlined lookup of the cache, as this is used by L{objects.ConfigObject}
+    # for every access to an unset slot
+    try:
+      return cls.__dict__["_slots_cache"][1]
+    except KeyError:
+      return cls._GetSlotsCache()[1]
 
   def Validate(self):
     """Validates the slots.
@@ -127,7 +165,7 @@ def ContainerToDicts(container):
 
   """
   if isinstance(container, dict):
-    ret = dict([(k, v.ToDict()) for k, v in container.items()])
+    ret = dict([(k, v.ToDict()) for k, v in container.iteritems()])
   elif isinstance(container, _SEQUENCE_TYPES):
     ret = [elem.ToDict() for elem in container]
   else:
@@ -158,7 +196,7 @@ def ContainerFromDicts(source, c_type, e_type):
     source = c_type()
 
   if c_type is dict:
-    ret = dict([(k, e_type.FromDict(v)) for k, v in source.items()])
+    ret = dict([(k, e_type.FromDict(v)) for k, v in source.iteritems()])
   elif c_type in _SEQUENCE_TYPES:
     ret = c_type(map(e_type.FromDict, source))
   else:
@@ -163,6 +163,8 @@ QUERY_SOCKET = SOCKET_DIR + "/ganeti-query"
 WCONFD_SOCKET = SOCKET_DIR + "/ganeti-wconfd"
 #: Metad socket
 METAD_SOCKET = SOCKET_DIR + "/ganeti-metad"
+#: Socket of the pre-forked job executor
+JOB_ZYGOTE_SOCKET = SOCKET_DIR + "/ganeti-job-zygote"
 
 LOG_OS_DIR = LOG_DIR + "/os"
 LOG_ES_DIR = LOG_DIR + "/extstorage"
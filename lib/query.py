@@ -332,25 +332,41 @@ class _FilterHints(object):
       self._NeedAllNames()
 
 
-def _WrapLogicOp(op_fn, sentences, ctx, item):
-  """Wrapper for logic operator functions.
+class _FilterCode(object):
+  """Collects the values referenced by the source code of a compiled filter.
 
   """
-  return op_fn(fn(ctx, item) for fn in sentences)
+  def __init__(self):
+    """Initializes this class.
 
+    """
+    #: Values by name, used as globals when compiling the filter
+    self.namespace = {}
 
-def _WrapUnaryOp(op_fn, inner, ctx, item):
-  """Wrapper for unary operator functions.
+    self._names = {}
 
-  """
-  return op_fn(inner(ctx, item))
+  def Ref(self, value):
+    """Returns the name under which a value can be used in a filter's code.
 
+    Equal values (or, if they can't be hashed, identical objects) share the
+    same name.
 
-def _WrapBinaryOp(op_fn, retrieval_fn, value, ctx, item):
-  """Wrapper for binary operator functions.
+    @rtype: string
 
-  """
-  return op_fn(retrieval_fn(ctx, item), value)
+    """
+    try:
+      key = (value.__class__, value)
+      hash(key)
+    except TypeError:
+      key = id(value)
+
+    name = self._names.get(key, None)
+    if name is None:
+      name = "_v%s" % len(self._names)
+      self._names[key] = name
+      self.namespace[name] = value
+
+    return name
 
 
 def _WrapNot(fn, lhs, rhs):
@@ -360,6 +376,57 @@ def _WrapNot(fn, lhs, rhs):
   return not fn(lhs, rhs)
 
 
+def _NegateOp(fn):
+  """Returns a function negating the result of a binary operator function.
+
+  """
+  if fn is operator.eq:
+    return operator.ne
+
+  return compat.partial(_WrapNot, fn)
+
+
+def _PrepareHostnames(names):
+  """Compiles a regular expression matching hostnames.
+
+  The expression matches the same names as L{utils.MatchNameComponent} does
+  for any of the given (possibly abbreviated) names.
+
+  @type names: list of strings
+
+  """
+  return re.compile(r"^(?:%s)(\..*)?$" %
+                    "|".join(re.escape(name.upper()) for name in names),
+                    re.IGNORECASE)
+
+
+def _PrepareHostname(name):
+  """Prepares a hostname for comparison by L{_MatchHostname}.
+
+  """
+  return _PrepareHostnames([name])
+
+
+def _MatchHostname(lhs, rhs):
+  """Checks whether a hostname matches a compiled regular expression.
+
+  @param rhs: Return value of L{_PrepareHostnames}
+  @return: The hostname if it matches, C{None} otherwise
+
+  """
+  if rhs.match(lhs):
+    return lhs
+
+  return None
+
+
+def _SearchRegex(lhs, rhs):
+  """Searches a value using a compiled regular expression.
+
+  """
+  return rhs.search(lhs)
+
+
 def _PrepareRegex(pattern):
   """Compiles a regular expression.
 
@@ -403,17 +470,36 @@ def _MakeComparisonChecks(fn):
 class _FilterCompilerHelper(object):
   """Converts a query filter to a callable usable for filtering.
 
+  The filter is first converted to an expression tree. While doing so,
+  nested logic operators of the same kind are merged, constant results are
+  folded and duplicate conditions removed. Equality checks on the same field
+  combined using L{qlang.OP_OR} are merged into a set lookup or, for
+  hostnames, a single regular expression. Values needing preparation (e.g.
+  regular expressions) are prepared only once per filter. The tree is then
+  compiled into a single function, leaving short-circuit evaluation to
+  Python's C{and} and C{or} operators.
+
   """
   # String statement has no effect, pylint: disable=W0105
 
   #: How deep filters can be nested
   _LEVELS_MAX = 10
 
+  #: Maximum number of operands compiled into a single expression (compiling
+  #: very long expressions is slow)
+  _CHUNK_SIZE = 100
+
   # Unique identifiers for operator groups
   (_OPTYPE_LOGIC,
    _OPTYPE_UNARY,
    _OPTYPE_BINARY) = range(1, 4)
 
+  # Unique identifiers for expression tree nodes
+  (_EXPR_CONST,
+   _EXPR_LOGIC,
+   _EXPR_NOT,
+   _EXPR_LEAF) = range(1, 5)
+
   """Functions for equality checks depending on field flags.
 
   List of tuples containing flags and a callable receiving the left- and
@@ -425,10 +511,7 @@ class _FilterCompilerHelper(object):
 
   """
   _EQUALITY_CHECKS = [
-    (QFF_HOSTNAME,
-     lambda lhs, rhs: utils.MatchNameComponent(rhs, [lhs],
-                                               case_sensitive=False),
-     None),
+    (QFF_HOSTNAME, _MatchHostname, _PrepareHostname),
     (QFF_SPLIT_TIMESTAMP, _MakeSplitTimestampComparison(operator.eq),
      _PrepareSplitTimestamp),
     (None, operator.eq, None),
@@ -439,7 +522,7 @@ class _FilterCompilerHelper(object):
   Operator as key (C{qlang.OP_*}), value a tuple of operator group
   (C{_OPTYPE_*}) and a group-specific value:
 
-    - C{_OPTYPE_LOGIC}: Callable taking any number of arguments; used by
+    - C{_OPTYPE_LOGIC}: Python operator combining the operands; used by
       L{_HandleLogicOp}
     - C{_OPTYPE_UNARY}: Always C{None}; details handled by L{_HandleUnaryOp}
     - C{_OPTYPE_BINARY}: Callable taking exactly two parameters, the left- and
@@ -448,8 +531,8 @@ class _FilterCompilerHelper(object):
   """
   _OPS = {
     # Logic operators
-    qlang.OP_OR: (_OPTYPE_LOGIC, compat.any),
-    qlang.OP_AND: (_OPTYPE_LOGIC, compat.all),
+    qlang.OP_OR: (_OPTYPE_LOGIC, "or"),
+    qlang.OP_AND: (_OPTYPE_LOGIC, "and"),
 
     # Unary operators
     qlang.OP_NOT: (_OPTYPE_UNARY, None),
@@ -459,20 +542,47 @@ class _FilterCompilerHelper(object):
     qlang.OP_EQUAL: (_OPTYPE_BINARY, _EQUALITY_CHECKS),
     qlang.OP_EQUAL_LEGACY: (_OPTYPE_BINARY, _EQUALITY_CHECKS),
     qlang.OP_NOT_EQUAL:
-      (_OPTYPE_BINARY, [(flags, compat.partial(_WrapNot, fn), valprepfn)
+      (_OPTYPE_BINARY, [(flags, _NegateOp(fn), valprepfn)
                         for (flags, fn, valprepfn) in _EQUALITY_CHECKS]),
     qlang.OP_LT: (_OPTYPE_BINARY, _MakeComparisonChecks(operator.lt)),
     qlang.OP_LE: (_OPTYPE_BINARY, _MakeComparisonChecks(operator.le)),
     qlang.OP_GT: (_OPTYPE_BINARY, _MakeComparisonChecks(operator.gt)),
     qlang.OP_GE: (_OPTYPE_BINARY, _MakeComparisonChecks(operator.ge)),
     qlang.OP_REGEXP: (_OPTYPE_BINARY, [
-      (None, lambda lhs, rhs: rhs.search(lhs), _PrepareRegex),
+      (None, _SearchRegex, _PrepareRegex),
       ]),
     qlang.OP_CONTAINS: (_OPTYPE_BINARY, [
       (None, operator.contains, None),
       ]),
     }
 
+  #: Source code templates for operator functions which can be inlined
+  _INLINE_OPS = {
+    operator.eq: "%(lhs)s == %(rhs)s",
+    operator.ne: "%(lhs)s != %(rhs)s",
+    operator.lt: "%(lhs)s < %(rhs)s",
+    operator.le: "%(lhs)s <= %(rhs)s",
+    operator.gt: "%(lhs)s > %(rhs)s",
+    operator.ge: "%(lhs)s >= %(rhs)s",
+    operator.contains: "%(rhs)s in %(lhs)s",
+    _SearchRegex: "%(rhs)s.search(%(lhs)s)",
+    }
+
+  #: Functions for equality checks which can be merged if combined using
+  #: L{qlang.OP_OR}, with the function preparing the values checked for
+  _MERGEABLE_OPS = {
+    operator.eq: frozenset,
+    _MatchHostname: _PrepareHostnames,
+    }
+
+  #: Field types whose values can be looked up in a set
+  _HASHABLE_KINDS = compat.UniqueFrozenset([
+    QFT_TEXT,
+    QFT_BOOL,
+    QFT_NUMBER,
+    QFT_UNIT,
+    ])
+
   def __init__(self, fields):
     """Initializes this class.
 
@@ -482,6 +592,8 @@ class _FilterCompilerHelper(object):
     self._fields = fields
     self._hints = None
     self._op_handler = None
+    self._code = None
+    self._prepared = None
 
   def __call__(self, hints, qfilter):
     """Converts a query filter into a callable function.
@@ -504,13 +616,58 @@ class _FilterCompilerHelper(object):
         (self._HandleBinaryOp, getattr(hints, "NoteBinaryOp", None)),
       }
 
+    self._code = _FilterCode()
+    self._prepared = {}
     try:
-      filter_fn = self._Compile(qfilter, 0)
+      filter_fn = self._BuildFunction(self._Compile(qfilter, 0))
     finally:
       self._op_handler = None
+      self._code = None
+      self._prepared = None
 
     return filter_fn
 
+  def _BuildFunction(self, expr):
+    """Compiles an expression tree into a function.
+
+    """
+    source = "lambda ctx, item: bool(%s)" % self._Render(expr)
+
+    # pylint: disable=W0123
+    return eval(compile(source, "<query filter>", "eval"),
+                self._code.namespace)
+
+  def _Render(self, expr):
+    """Converts an expression tree into Python source code.
+
+    """
+    kind = expr[0]
+
+    if kind == self._EXPR_CONST:
+      return repr(expr[1])
+    elif kind == self._EXPR_LEAF:
+      if expr[1] is None:
+        return self._RenderLookup(expr[2])
+      return expr[1]
+    elif kind == self._EXPR_NOT:
+      return "(not %s)" % self._Render(expr[1])
+    elif kind == self._EXPR_LOGIC:
+      (_, keyword, children) = expr
+
+      while len(children) > self._CHUNK_SIZE:
+        chunks = [children[idx:idx + self._CHUNK_SIZE]
+                  for idx in range(0, len(children), self._CHUNK_SIZE)]
+        children = [(self._EXPR_LEAF, "%s(ctx, item)" %
+                     self._code.Ref(self._BuildFunction((kind, keyword,
+                                                         chunk))),
+                     None)
+                    for chunk in chunks]
+
+      return "(%s)" % (" %s " % keyword).join(self._Render(child)
+                                              for child in children)
+
+    raise errors.ProgrammerError("Unknown expression kind %s" % kind)
+
   def _Compile(self, qfilter, level):
     """Inner function for converting filters.
 
@@ -557,8 +714,8 @@ class _FilterCompilerHelper(object):
     @param level: Current depth
     @type op: string
     @param op: Operator
-    @type op_fn: callable
-    @param op_fn: Function implementing operator
+    @type op_fn: string
+    @param op_fn: Python operator implementing operator
     @type operands: list
     @param operands: List of operands
 
@@ -566,8 +723,77 @@ class _FilterCompilerHelper(object):
     if hints_fn:
       hints_fn(op)
 
-    return compat.partial(_WrapLogicOp, op_fn,
-                          [self._Compile(op, level + 1) for op in operands])
+    # Result if no operand decides on its own
+    default = (op == qlang.OP_AND)
+
+    children = []
+    seen = set()
+
+    for expr in [self._Compile(operand, level + 1) for operand in operands]:
+      if expr[0] == self._EXPR_LOGIC and expr[1] == op_fn:
+        # Merge nested operator of the same kind
+        nested = expr[2]
+      else:
+        nested = [expr]
+
+      for child in nested:
+        if child[0] == self._EXPR_CONST:
+          if child[1] != default:
+            return child
+        elif child[0] != self._EXPR_LEAF:
+          children.append(child)
+        elif (child[1] or child[2]) not in seen:
+          # Identical conditions are only evaluated once
+          seen.add(child[1] or child[2])
+          children.append(child)
+
+    if op == qlang.OP_OR:
+      children = self._MergeEqualityChecks(children)
+
+    if not children:
+      return (self._EXPR_CONST, default)
+
+    if len(children) == 1:
+      return children[0]
+
+    return (self._EXPR_LOGIC, op_fn, children)
+
+  def _MergeEqualityChecks(self, children):
+    """Combines equality checks on the same field.
+
+    @type children: list
+    @param children: Expressions combined using L{qlang.OP_OR}
+
+    """
+    is_lookup = lambda expr: (expr[0] == self._EXPR_LEAF and
+                              expr[2] is not None)
+
+    values = {}
+
+    for child in filter(is_lookup, children):
+      (retrieval_fn, fn, child_values) = child[2]
+      values.setdefault((retrieval_fn, fn), []).append(child_values)
+
+    result = []
+
+    for child in children:
+      if is_lookup(child):
+        (retrieval_fn, fn, _) = child[2]
+        fn_values = values.pop((retrieval_fn, fn), None)
+
+        if fn_values is None:
+          # Already merged
+          continue
+
+        if len(fn_values) > 1:
+          merged = tuple(utils.UniqueSequence(value
+                                              for child_values in fn_values
+                                              for value in child_values))
+          child = (self._EXPR_LEAF, None, (retrieval_fn, fn, merged))
+
+      result.append(child)
+
+    return result
 
   def _HandleUnaryOp(self, hints_fn, level, op, op_fn, operands):
     """Handles unary operators.
@@ -596,18 +822,23 @@ class _FilterCompilerHelper(object):
       if hints_fn:
         hints_fn(op, datakind)
 
-      op_fn = operator.truth
-      arg = retrieval_fn
+      return (self._EXPR_LEAF,
+              "%s(ctx, item)" % self._code.Ref(retrieval_fn), None)
+
     elif op == qlang.OP_NOT:
       if hints_fn:
         hints_fn(op, None)
 
-      op_fn = operator.not_
-      arg = self._Compile(operands[0], level + 1)
-    else:
-      raise errors.ProgrammerError("Can't handle operator '%s'" % op)
+      expr = self._Compile(operands[0], level + 1)
+
+      if expr[0] == self._EXPR_CONST:
+        return (self._EXPR_CONST, not expr[1])
+      elif expr[0] == self._EXPR_NOT:
+        return expr[1]
+      else:
+        return (self._EXPR_NOT, expr)
 
-    return compat.partial(_WrapUnaryOp, op_fn, arg)
+    raise errors.ProgrammerError("Can't handle operator '%s'" % op)
 
   def _HandleBinaryOp(self, hints_fn, level, op, op_data, operands):
     """Handles binary operators.
@@ -648,15 +879,84 @@ class _FilterCompilerHelper(object):
 
     for (fn_flags, fn, valprepfn) in op_data:
       if fn_flags is None or fn_flags & field_flags:
-        # Prepare value if necessary (e.g. compile regular expression)
-        if valprepfn:
-          value = valprepfn(value)
-
-        return compat.partial(_WrapBinaryOp, fn, retrieval_fn, value)
+        return self._MakeLeaf(fdef, retrieval_fn, fn, valprepfn, value)
 
     raise errors.ProgrammerError("Unable to find operator implementation"
                                  " (op '%s', flags %s)" % (op, field_flags))
 
+  def _PrepareValue(self, valprepfn, value):
+    """Prepares a value for comparison, reusing earlier results.
+
+    """
+    try:
+      key = (valprepfn, value.__class__, value)
+      return self._prepared[key]
+    except TypeError:
+      # Unhashable value
+      return valprepfn(value)
+    except KeyError:
+      result = self._prepared[key] = valprepfn(value)
+      return result
+
+  def _MakeLeaf(self, fdef, retrieval_fn, fn, valprepfn, value):
+    """Builds the expression for a binary operator.
+
+    @type fdef: L{objects.QueryFieldDefinition}
+    @param fdef: Field definition
+    @type retrieval_fn: callable
+    @param retrieval_fn: Field retrieval function
+    @type fn: callable
+    @param fn: Function implementing operator
+    @type valprepfn: callable or None
+    @param valprepfn: Function preparing the right-hand side
+    @param value: Right-hand side of the operator
+
+    """
+    if fn in self._MERGEABLE_OPS and fdef.kind in self._HASHABLE_KINDS:
+      try:
+        hash(value)
+      except TypeError:
+        pass
+      else:
+        # Code is generated once it is known whether the check can be merged
+        # with others (see L{_MergeEqualityChecks})
+        return (self._EXPR_LEAF, None, (retrieval_fn, fn, (value, )))
+
+    # Prepare value if necessary (e.g. compile regular expression)
+    if valprepfn:
+      value = self._PrepareValue(valprepfn, value)
+
+    args = {
+      "lhs": "%s(ctx, item)" % self._code.Ref(retrieval_fn),
+      "rhs": self._code.Ref(value),
+      }
+
+    template = self._INLINE_OPS.get(fn, None)
+    if template is None:
+      source = "%s(%%(lhs)s, %%(rhs)s)" % self._code.Ref(fn)
+    else:
+      source = "(%s)" % template
+
+    return (self._EXPR_LEAF, source % args, None)
+
+  def _RenderLookup(self, lookup):
+    """Generates the code for equality checks on a field.
+
+    @type lookup: tuple
+    @param lookup: Field retrieval function, function implementing the check
+      and the values checked for
+
+    """
+    (retrieval_fn, fn, values) = lookup
+
+    lhs = "%s(ctx, item)" % self._code.Ref(retrieval_fn)
+    rhs = self._code.Ref(self._PrepareValue(self._MERGEABLE_OPS[fn], values))
+
+    if fn is operator.eq:
+      return "(%s in %s)" % (lhs, rhs)
+
+    return "%s(%s, %s)" % (self._code.Ref(fn), lhs, rhs)
+
 
 def _CompileFilter(fields, hints, qfilter):
   """Converts a query filter into a callable function.
@@ -36,6 +36,7 @@
 
 # C0103: Invalid name, since the R_* names are not conforming
 
+import bisect
 import logging
 
 from ganeti import luxi
@@ -128,6 +129,41 @@ def BuildUriList(ids, uri_format, uri_fields=("name", "uri")):
   return map(_MapId, ids)
 
 
+def SelectPage(keys, cursor, limit):
+  """Selects one page of item keys for a paginated list request.
+
+  Pagination is based on the item keys instead of their position, so that
+  items added or removed between two requests don't shift the following
+  pages. The continuation token for the next page is the last key of the
+  current page. Keys are sorted like L{utils.NiceSort} does, equal sort keys
+  are ordered by the keys themselves.
+
+  Example::
+      >>> SelectPage(["node10", "node2", "node9", "node1"], "node1", 2)
+      ['node2', 'node9']
+
+  @type keys: list
+  @param keys: Keys of all items (e.g. names or job IDs)
+  @param cursor: Key after which the page starts, C{None} for the first page
+  @type limit: int or None
+  @param limit: Maximum number of keys to return, C{None} for all
+  @rtype: list
+  @return: Sorted list of keys
+
+  """
+  sort_key = lambda key: (utils.NiceSortKey(key), key)
+
+  keys = sorted(keys, key=sort_key)
+
+  if cursor is not None:
+    keys = keys[bisect.bisect_right(map(sort_key, keys), sort_key(cursor)):]
+
+  if limit is not None:
+    keys = keys[:limit]
+
+  return keys
+
+
 def MapFields(names, data):
   """Maps two lists into one dictionary.
 
@@ -394,6 +430,32 @@ class ResourceBase(object):
     """
     return bool(self._checkIntVariable("force"))
 
+  def getPagination(self, cursor_fn=str):
+    """Returns the pagination parameters of a list request.
+
+    @type cursor_fn: callable
+    @param cursor_fn: Function converting the cursor to the key type
+    @rtype: tuple; (int or None, key or None)
+    @return: Maximum number of items and key of the last item of the previous
+      page
+
+    """
+    if "limit" in self.queryargs:
+      limit = self._checkIntVariable("limit")
+      if limit < 1:
+        raise http.HttpBadRequest("Invalid value for the 'limit' parameter")
+    else:
+      limit = None
+
+    cursor = self._checkStringVariable("cursor")
+    if cursor is not None:
+      try:
+        cursor = cursor_fn(cursor)
+      except (ValueError, TypeError):
+        raise http.HttpBadRequest("Invalid value for the 'cursor' parameter")
+
+    return (limit, cursor)
+
   def dryRun(self):
     """Check if the request specifies dry-run mode.
 
@@ -110,12 +110,18 @@ JOB_STATUS_WAITLOCK = JOB_STATUS_WAITING
 _REQ_DATA_VERSION_FIELD = "__version__"
 _QPARAM_DRY_RUN = "dry-run"
 _QPARAM_FORCE = "force"
+_QPARAM_LIMIT = "limit"
+_QPARAM_CURSOR = "cursor"
+
+#: Default number of items per request when iterating over list resources
+_DEFAULT_PAGE_SIZE = 500
 
 # Feature strings
 INST_CREATE_REQV1 = "instance-create-reqv1"
 INST_REINSTALL_REQV1 = "instance-reinstall-reqv1"
 NODE_MIGRATE_REQV1 = "node-migrate-reqv1"
 NODE_EVAC_RES1 = "node-evac-res1"
+LIST_PAGINATION = "list-pagination"
 
 # Old feature constant names in case they're references by users of this module
 _INST_CREATE_REQV1 = INST_CREATE_REQV1
@@ -581,6 +587,54 @@ class GanetiRapiClient(object): # pylint: disable=R0904
 
     return response_content
 
+  def _IterPages(self, path, query, key, page_size):
+    """Iterates over the items of a paginated list resource.
+
+    Items are requested in pages of at most C{page_size} items, each page
+    continuing after the last item of the previous one. If the server lacks
+    the L{LIST_PAGINATION} feature, all items are requested at once.
+
+    @type path: string
+    @param path: HTTP URL path
+    @type query: list of two-tuples
+    @param query: Query arguments
+    @type key: string
+    @param key: Name of the field identifying an item
+    @type page_size: int
+    @param page_size: Maximum number of items per request
+
+    """
+    if page_size < 1:
+      raise Error("Page size must be positive")
+
+    if LIST_PAGINATION not in self.GetFeatures():
+      for item in self._SendRequest(HTTP_GET, path, query, None):
+        yield item
+      return
+
+    cursor = None
+
+    while True:
+      page_query = query + [(_QPARAM_LIMIT, page_size)]
+      _AppendIf(page_query, cursor is not None, (_QPARAM_CURSOR, cursor))
+
+      items = self._SendRequest(HTTP_GET, path, page_query, None)
+
+      for item in items:
+        yield item
+
+      # A longer page means the server ignored the limit and returned all
+      # items
+      if len(items) != page_size:
+        break
+
+      next_cursor = items[-1][key]
+      if next_cursor == cursor:
+        raise Error("Cursor for '%s' did not advance beyond '%s'" %
+                    (path, cursor))
+
+      cursor = next_cursor
+
   def GetVersion(self):
     """Gets the Remote API version running on the cluster.
 
@@ -748,6 +802,36 @@ class GanetiRapiClient(object): # pylint: disable=R0904
     else:
       return [i["id"] for i in instances]
 
+  def IterInstances(self, bulk=False, page_size=_DEFAULT_PAGE_SIZE,
+                    reason=None):
+    """Iterates over the instances on the cluster.
+
+    Like L{GetInstances}, but retrieves the instances in pages of limited
+    size instead of a single response.
+
+    @type bulk: bool
+    @param bulk: whether to return all information about all instances
+    @type page_size: int
+    @param page_size: maximum number of instances per request
+    @type reason: string
+    @param reason: the reason for executing this operation
+
+    @rtype: iterator of dict or str
+    @return: if bulk is True, info about the instances, else instance names
+
+    """
+    query = []
+    _AppendIf(query, bulk, ("bulk", 1))
+    _AppendReason(query, reason)
+
+    if bulk:
+      return self._IterPages("/%s/instances" % GANETI_RAPI_VERSION, query,
+                             "name", page_size)
+    else:
+      return (i["id"]
+              for i in self._IterPages("/%s/instances" % GANETI_RAPI_VERSION,
+                                       query, "id", page_size))
+
   def GetInstance(self, instance, reason=None):
     """Gets information about an instance.
 
@@ -1474,6 +1558,32 @@ class GanetiRapiClient(object): # pylint: disable=R0904
                                          "/%s/jobs" % GANETI_RAPI_VERSION,
                                          None, None)]
 
+  def IterJobs(self, bulk=False, page_size=_DEFAULT_PAGE_SIZE):
+    """Iterates over the jobs of the cluster.
+
+    Like L{GetJobs}, but retrieves the jobs in pages of limited size instead
+    of a single response.
+
+    @type bulk: bool
+    @param bulk: Whether to return detailed information about jobs.
+    @type page_size: int
+    @param page_size: Maximum number of jobs per request
+    @rtype: iterator of int or dict
+    @return: Job IDs or, if bulk parameter was true, dicts with detailed
+             information about the jobs
+
+    """
+    query = []
+    _AppendIf(query, bulk, ("bulk", 1))
+
+    jobs = self._IterPages("/%s/jobs" % GANETI_RAPI_VERSION, query, "id",
+                           page_size)
+
+    if bulk:
+      return jobs
+    else:
+      return (int(j["id"]) for j in jobs)
+
   def GetJobStatus(self, job_id):
     """Gets the status of a job.
 
@@ -1587,6 +1697,36 @@ class GanetiRapiClient(object): # pylint: disable=R0904
     else:
       return [n["id"] for n in nodes]
 
+  def IterNodes(self, bulk=False, page_size=_DEFAULT_PAGE_SIZE, reason=None):
+    """Iterates over the nodes in the cluster.
+
+    Like L{GetNodes}, but retrieves the nodes in pages of limited size
+    instead of a single response.
+
+    @type bulk: bool
+    @param bulk: whether to return all information about all nodes
+    @type page_size: int
+    @param page_size: maximum number of nodes per request
+    @type reason: string
+    @param reason: the reason for executing this operation
+
+    @rtype: iterator of dict or str
+    @return: if bulk is true, info about nodes in the cluster,
+        else node names
+
+    """
+    query = []
+    _AppendIf(query, bulk, ("bulk", 1))
+    _AppendReason(query, reason)
+
+    if bulk:
+      return self._IterPages("/%s/nodes" % GANETI_RAPI_VERSION, query,
+                             "name", page_size)
+    else:
+      return (n["id"]
+              for n in self._IterPages("/%s/nodes" % GANETI_RAPI_VERSION,
+                                       query, "id", page_size))
+
   def GetNode(self, node, reason=None):
     """Gets information about a node.
 
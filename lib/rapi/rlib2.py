@@ -72,6 +72,7 @@ from ganeti import cli
 from ganeti import rapi
 from ganeti import ht
 from ganeti import compat
+from ganeti import errors
 from ganeti.rapi import baserlib
 
 
@@ -173,16 +174,24 @@ _NODE_MIGRATE_REQV1 = "node-migrate-reqv1"
 # Feature string for node evacuation with LU-generated jobs
 _NODE_EVAC_RES1 = "node-evac-res1"
 
+# Feature string for paginated list resources
+_LIST_PAGINATION = "list-pagination"
+
 ALL_FEATURES = compat.UniqueFrozenset([
   _INST_CREATE_REQV1,
   _INST_REINSTALL_REQV1,
   _NODE_MIGRATE_REQV1,
   _NODE_EVAC_RES1,
+  _LIST_PAGINATION,
   ])
 
 # Timeout for /2/jobs/[job_id]/wait. Gives job up to 10 seconds to change.
 _WFJC_TIMEOUT = 10
 
+# How often a page of a list resource is selected before giving up if its
+# items keep being removed
+_QUERY_PAGE_ATTEMPTS = 3
+
 
 # FIXME: For compatibility we update the beparams/memory field. Needs to be
 #        removed in Ganeti 2.8
@@ -199,6 +208,56 @@ def _UpdateBeparams(inst):
   return inst
 
 
+def _QueryPage(query_fn, key_field, fields, limit, cursor):
+  """Queries the items of one page of a list resource.
+
+  Only the keys of all items are retrieved first, the requested fields are
+  then queried for the items on the selected page only. The query daemon
+  fails the second query if one of the items was removed in the meantime, in
+  which case the page is selected again.
+
+  @type query_fn: callable
+  @param query_fn: Query function taking a list of keys (empty for all
+    items) and a list of fields
+  @type key_field: string
+  @param key_field: Name of the field identifying an item
+  @type fields: list of strings
+  @param fields: Fields to return, must contain C{key_field}
+  @type limit: int or None
+  @param limit: Maximum number of items
+  @param cursor: Key of the last item on the previous page
+  @rtype: list of lists
+  @return: Query result rows, sorted by key
+
+  """
+  if limit is None and cursor is None:
+    return query_fn([], fields)
+
+  idx = fields.index(key_field)
+  attempt = 0
+
+  while True:
+    keys = baserlib.SelectPage(map(compat.fst, query_fn([], [key_field])),
+                               cursor, limit)
+
+    if not keys or fields == [key_field]:
+      return [[key] for key in keys]
+
+    try:
+      result = query_fn(keys, fields)
+    except errors.OpPrereqError, err:
+      attempt += 1
+      if (len(err.args) == 2 and err.args[1] == errors.ECODE_NOENT and
+          attempt < _QUERY_PAGE_ATTEMPTS):
+        # An item on the page was removed, select the page again
+        continue
+      raise
+
+    rows = dict((row[idx], row) for row in result)
+
+    return [rows[key] for key in keys]
+
+
 class R_root(baserlib.ResourceBase):
   """/ resource.
 
@@ -443,12 +502,15 @@ class R_2_jobs(baserlib.ResourceBase):
 
     """
     client = self.GetClient()
+    (limit, cursor) = self.getPagination(cursor_fn=int)
+    query_fn = lambda ids, fields: client.QueryJobs(ids or None, fields)
 
     if self.useBulk():
-      bulkdata = client.QueryJobs(None, J_FIELDS_BULK)
+      bulkdata = _QueryPage(query_fn, "id", J_FIELDS_BULK, limit, cursor)
       return baserlib.MapBulkFields(bulkdata, J_FIELDS_BULK)
     else:
-      jobdata = map(compat.fst, client.QueryJobs(None, ["id"]))
+      jobdata = map(compat.fst, _QueryPage(query_fn, "id", ["id"],
+                                           limit, cursor))
       return baserlib.BuildUriList(jobdata, "/2/jobs/%s",
                                    uri_fields=("id", "uri"))
 
@@ -544,12 +606,14 @@ class R_2_nodes(baserlib.OpcodeResource):
 
     """
     client = self.GetClient()
+    (limit, cursor) = self.getPagination()
+    query_fn = lambda names, fields: client.QueryNodes(names, fields, False)
 
     if self.useBulk():
-      bulkdata = client.QueryNodes([], N_FIELDS, False)
+      bulkdata = _QueryPage(query_fn, "name", N_FIELDS, limit, cursor)
       return baserlib.MapBulkFields(bulkdata, N_FIELDS)
     else:
-      nodesdata = client.QueryNodes([], ["name"], False)
+      nodesdata = _QueryPage(query_fn, "name", ["name"], limit, cursor)
       nodeslist = [row[0] for row in nodesdata]
       return baserlib.BuildUriList(nodeslist, "/2/nodes/%s",
                                    uri_fields=("id", "uri"))
@@ -823,12 +887,14 @@ class R_2_networks(baserlib.OpcodeResource):
 
     """
     client = self.GetClient()
+    (limit, cursor) = self.getPagination()
+    query_fn = lambda names, fields: client.QueryNetworks(names, fields, False)
 
     if self.useBulk():
-      bulkdata = client.QueryNetworks([], NET_FIELDS, False)
+      bulkdata = _QueryPage(query_fn, "name", NET_FIELDS, limit, cursor)
       return baserlib.MapBulkFields(bulkdata, NET_FIELDS)
     else:
-      data = client.QueryNetworks([], ["name"], False)
+      data = _QueryPage(query_fn, "name", ["name"], limit, cursor)
       networknames = [row[0] for row in data]
       return baserlib.BuildUriList(networknames, "/2/networks/%s",
                                    uri_fields=("name", "uri"))
@@ -939,12 +1005,14 @@ class R_2_groups(baserlib.OpcodeResource):
 
     """
     client = self.GetClient()
+    (limit, cursor) = self.getPagination()
+    query_fn = lambda names, fields: client.QueryGroups(names, fields, False)
 
     if self.useBulk():
-      bulkdata = client.QueryGroups([], G_FIELDS, False)
+      bulkdata = _QueryPage(query_fn, "name", G_FIELDS, limit, cursor)
       return baserlib.MapBulkFields(bulkdata, G_FIELDS)
     else:
-      data = client.QueryGroups([], ["name"], False)
+      data = _QueryPage(query_fn, "name", ["name"], limit, cursor)
       groupnames = [row[0] for row in data]
       return baserlib.BuildUriList(groupnames, "/2/groups/%s",
                                    uri_fields=("name", "uri"))
@@ -1074,11 +1142,15 @@ class R_2_instances(baserlib.OpcodeResource):
     client = self.GetClient()
 
     use_locking = self.useLocking()
+    (limit, cursor) = self.getPagination()
+    query_fn = lambda names, fields: client.QueryInstances(names, fields,
+                                                           use_locking)
+
     if self.useBulk():
-      bulkdata = client.QueryInstances([], I_FIELDS, use_locking)
+      bulkdata = _QueryPage(query_fn, "name", I_FIELDS, limit, cursor)
       return map(_UpdateBeparams, baserlib.MapBulkFields(bulkdata, I_FIELDS))
     else:
-      instancesdata = client.QueryInstances([], ["name"], use_locking)
+      instancesdata = _QueryPage(query_fn, "name", ["name"], limit, cursor)
       instanceslist = [row[0] for row in instancesdata]
       return baserlib.BuildUriList(instanceslist, "/2/instances/%s",
                                    uri_fields=("id", "uri"))
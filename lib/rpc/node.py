@@ -76,6 +76,10 @@ _RPC_CLIENT_HEADERS = [
 #: Special value to describe an offline host
 _OFFLINE = object()
 
+#: Per-process pool of reusable cURL objects as (PID, pool), see
+#: L{_GetCurlPool}
+_CURL_POOL = (None, None)
+
 
 def Init():
   """Initializes the module-global HTTP client manager.
@@ -102,9 +106,33 @@ def Shutdown():
   running.
 
   """
+  global _CURL_POOL # pylint: disable=W0603
+  (pid, pool) = _CURL_POOL
+  if pool is not None and pid == os.getpid():
+    pool.Close()
+  _CURL_POOL = (None, None)
+
   pycurl.global_cleanup()
 
 
+def _GetCurlPool():
+  """Returns the per-process pool of cURL objects.
+
+  The pool is created on first use. A forked child must not reuse the
+  connections of its parent, hence a new pool is created if the process ID
+  changed.
+
+  @rtype: L{http.client.CurlPool}
+
+  """
+  global _CURL_POOL # pylint: disable=W0603
+  (pid, pool) = _CURL_POOL
+  if pool is None or pid != os.getpid():
+    pool = http.client.CurlPool()
+    _CURL_POOL = (os.getpid(), pool)
+  return pool
+
+
 def _ConfigRpcCurl(curl):
   noded_cert = pathutils.NODED_CERT_FILE
   noded_client_cert = pathutils.NODED_CLIENT_CERT_FILE
@@ -164,6 +192,18 @@ def _Compress(_, data):
           base64.b64encode(zlib.compress(data, 3)))
 
 
+def _CompressFiles(_, files):
+  """Compresses the contents of several files for transport over RPC.
+
+  @type files: list of (str, str)
+  @param files: list of file names and their contents
+  @rtype: list
+  @return: list of file names and their encoded contents
+
+  """
+  return [(name, _Compress(None, data)) for (name, data) in files]
+
+
 class RpcResult(object):
   """RPC Result class.
 
@@ -456,7 +496,9 @@ class _RpcProcessor:
       "Missing RPC read timeout for procedure '%s'" % procedure
 
     if _req_process_fn is None:
-      _req_process_fn = http.client.ProcessRequests
+      # Reuse connections to nodes across calls
+      _req_process_fn = compat.partial(http.client.ProcessRequests,
+                                       curl_pool=_GetCurlPool())
 
     (results, requests) = \
       self._PrepareRequests(self._resolver(nodes, resolver_opts), self._port,
@@ -784,6 +826,7 @@ _ENCODERS = {
   rpc_defs.ED_OBJECT_DICT: _ObjectToDict,
   rpc_defs.ED_OBJECT_DICT_LIST: _ObjectListToDict,
   rpc_defs.ED_COMPRESS: _Compress,
+  rpc_defs.ED_COMPRESS_FILES: _CompressFiles,
   rpc_defs.ED_FINALIZE_EXPORT_DISKS: _PrepareFinalizeExportDisks,
   rpc_defs.ED_BLOCKDEV_RENAME: _EncodeBlockdevRename,
   }
@@ -51,6 +51,82 @@ from ganeti.rpc import errors
 DEF_CTMO = constants.LUXI_DEF_CTMO
 DEF_RWTO = constants.LUXI_DEF_RWTO
 
+#: Initial and maximum size of a single read
+_MIN_READ_SIZE = 4096
+_MAX_READ_SIZE = 1024 * 1024
+
+
+class MessageBuffer(object):
+  """Splits a stream of data into messages terminated by a separator.
+
+  Data is accumulated in a single growing buffer and only newly received
+  data is searched for the terminator, so receiving a message takes time
+  linear in its size, regardless of how many reads it is split over. The
+  suggested read size grows while reads fill it, so that large messages
+  need only a few system calls.
+
+  """
+  def __init__(self, eom=constants.LUXI_EOM):
+    """Initializes this class.
+
+    @type eom: string
+    @param eom: the message terminator
+
+    """
+    self._eom = eom
+    self._buffer = bytearray()
+    self._msgs = collections.deque()
+    self.read_size = _MIN_READ_SIZE
+
+  def Feed(self, data):
+    """Adds received data, splitting off all complete messages.
+
+    @type data: string
+    @param data: the data as returned by a single read
+
+    """
+    eom = self._eom
+    buf = self._buffer
+    size = len(data)
+
+    if len(eom) > 1 and buf:
+      # the terminator may be split between reads
+      keep = len(eom) - 1
+      data = str(buf[-keep:]) + data
+      del buf[-keep:]
+
+    start = 0
+    pos = data.find(eom)
+    if pos != -1:
+      # complete the message pending in the buffer
+      buf.extend(buffer(data, 0, pos))
+      self._msgs.append(str(buf))
+      del buf[:]
+      start = pos + len(eom)
+      pos = data.find(eom, start)
+      while pos != -1:
+        self._msgs.append(data[start:pos])
+        start = pos + len(eom)
+        pos = data.find(eom, start)
+    buf.extend(buffer(data, start))
+
+    if size >= self.read_size:
+      self.read_size = min(2 * self.read_size, _MAX_READ_SIZE)
+    elif not buf:
+      self.read_size = _MIN_READ_SIZE
+
+  def HasMessages(self):
+    """Returns whether there is a complete message.
+
+    """
+    return bool(self._msgs)
+
+  def PopMessage(self):
+    """Returns and removes the oldest complete message.
+
+    """
+    return self._msgs.popleft()
+
 
 class Transport:
   """Low-level transport class.
@@ -93,8 +169,7 @@ class Transport:
       self._ctimeout, self._rwtimeout = timeouts
 
     self.socket = None
-    self._buffer = ""
-    self._msgs = collections.deque()
+    self._msgbuf = MessageBuffer()
 
     try:
       self.socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
@@ -176,12 +251,12 @@ class Transport:
     """
     self._CheckSocket()
     etime = time.time() + self._rwtimeout
-    while not self._msgs:
+    while not self._msgbuf.HasMessages():
       if time.time() > etime:
         raise errors.TimeoutError("Extended receive timeout")
       while True:
         try:
-          data = self.socket.recv(4096)
+          data = self.socket.recv(self._msgbuf.read_size)
         except socket.timeout, err:
           raise errors.TimeoutError("Receive timeout: %s" % str(err))
         except socket.error, err:
@@ -191,10 +266,8 @@ class Transport:
         break
       if not data:
         raise errors.ConnectionClosedError("Connection closed while reading")
-      new_msgs = (self._buffer + data).split(constants.LUXI_EOM)
-      self._buffer = new_msgs.pop()
-      self._msgs.extend(new_msgs)
-    return self._msgs.popleft()
+      self._msgbuf.Feed(data)
+    return self._msgbuf.PopMessage()
 
   def Call(self, msg):
     """Send a message and wait for the response.
@@ -266,8 +339,7 @@ class FdTransport:
     self._rstream = io.open(fds[0], 'rb', 0)
     self._wstream = io.open(fds[1], 'wb', 0)
 
-    self._buffer = ""
-    self._msgs = collections.deque()
+    self._msgbuf = MessageBuffer()
 
   def _CheckSocket(self):
     """Make sure we are connected.
@@ -297,14 +369,12 @@ class FdTransport:
 
     """
     self._CheckSocket()
-    while not self._msgs:
-      data = self._rstream.read(4096)
+    while not self._msgbuf.HasMessages():
+      data = self._rstream.read(self._msgbuf.read_size)
       if not data:
         raise errors.ConnectionClosedError("Connection closed while reading")
-      new_msgs = (self._buffer + data).split(constants.LUXI_EOM)
-      self._buffer = new_msgs.pop()
-      self._msgs.extend(new_msgs)
-    return self._msgs.popleft()
+      self._msgbuf.Feed(data)
+    return self._msgbuf.PopMessage()
 
   def Call(self, msg):
     """Send a message and wait for the response.
@@ -82,7 +82,8 @@ ACCEPT_OFFLINE_NODE = object()
  ED_MULTI_DISKS_DICT_DP,
  ED_SINGLE_DISK_DICT_DP,
  ED_NIC_DICT,
- ED_DEVICE_DICT) = range(1, 17)
+ ED_DEVICE_DICT,
+ ED_COMPRESS_FILES) = range(1, 18)
 
 
 def _Prepare(calls):
@@ -649,6 +650,9 @@ CALLS = {
       ("file_name", None, None),
       ("content", ED_COMPRESS, None),
       ], None, None, "Update job queue file"),
+    ("jobqueue_update_many", MULTI, None, constants.RPC_TMO_URGENT, [
+      ("files", ED_COMPRESS_FILES, "List of file names and contents"),
+      ], None, None, "Update several job queue files"),
     ("jobqueue_purge", SINGLE, None, constants.RPC_TMO_NORMAL, [], None, None,
      "Purge job queue"),
     ("jobqueue_rename", MULTI, None, constants.RPC_TMO_URGENT, [
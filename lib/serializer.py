@@ -54,7 +54,7 @@ from ganeti import constants
 _RE_EOLSP = re.compile("[ \t]+$", re.MULTILINE)
 
 
-def DumpJson(data, private_encoder=None):
+def DumpJson(data, private_encoder=None, sort_keys=False):
   """Serialize a given object.
 
   @param data: the data to serialize
@@ -62,12 +62,16 @@ def DumpJson(data, private_encoder=None):
   @param private_encoder: specify L{serializer.EncodeWithPrivateFields} if you
                           require the produced JSON to also contain private
                           parameters. Otherwise, they will encode to null.
+  @type sort_keys: bool
+  @param sort_keys: whether to output dictionaries sorted by key, so that
+                    equal data always results in the same string
 
   """
   if private_encoder is None:
     # Do not leak private fields by default.
     private_encoder = EncodeWithoutPrivateFields
-  encoded = simplejson.dumps(data, default=private_encoder)
+  encoded = simplejson.dumps(data, default=private_encoder,
+                             sort_keys=sort_keys)
 
   txt = _RE_EOLSP.sub("", encoded)
   if not txt.endswith("\n"):
@@ -55,6 +55,9 @@ from ganeti import daemon
 from ganeti import http
 from ganeti import utils
 from ganeti.storage import container
+from ganeti.storage.bdev import LvInventoryScope
+from ganeti.hypervisor.hv_xen import XenQueryScope
+from ganeti.hypervisor.hv_kvm import QmpConnectionScope
 from ganeti import serializer
 from ganeti import netutils
 from ganeti import pathutils
@@ -116,6 +119,20 @@ def _RequireJobQueueLock(fn):
   return wrapper
 
 
+def _SharedHypervisorQueries(fn):
+  """Decorator for read-only functions querying the hypervisor.
+
+  The Xen toolstack is then asked at most once for the instance list and
+  the node information during the request.
+
+  """
+  def wrapper(*args, **kwargs):
+    with XenQueryScope():
+      return fn(*args, **kwargs)
+
+  return wrapper
+
+
 def _DecodeImportExportIO(ieio, ieioargs):
   """Decodes import/export I/O information.
 
@@ -188,7 +205,11 @@ class NodeRequestHandler(http.server.HttpServerHandler):
       raise http.HttpNotFound()
 
     try:
-      result = (True, method(serializer.LoadJson(req.request_body)))
+      # Disk trees walked by the request share one snapshot of the LVs, and
+      # QMP connections are kept open until the request is done
+      with LvInventoryScope():
+        with QmpConnectionScope():
+          result = (True, method(serializer.LoadJson(req.request_body)))
 
     except backend.RPCFail, err:
       # our custom failure exception; str(err) works fine if the
@@ -752,6 +773,7 @@ class NodeRequestHandler(http.server.HttpServerHandler):
     return backend.InstanceBalloonMemory(instance, memory)
 
   @staticmethod
+  @_SharedHypervisorQueries
   def perspective_instance_info(params):
     """Query instance information.
 
@@ -768,6 +790,7 @@ class NodeRequestHandler(http.server.HttpServerHandler):
     return backend.GetInstanceMigratable(instance)
 
   @staticmethod
+  @_SharedHypervisorQueries
   def perspective_all_instances_info(params):
     """Query information about all instances.
 
@@ -783,6 +806,7 @@ class NodeRequestHandler(http.server.HttpServerHandler):
     return backend.GetInstanceConsoleInfo(params)
 
   @staticmethod
+  @_SharedHypervisorQueries
   def perspective_instance_list(params):
     """Query the list of running instances.
 
@@ -800,6 +824,7 @@ class NodeRequestHandler(http.server.HttpServerHandler):
     return netutils.IPAddress.Own(params[0])
 
   @staticmethod
+  @_SharedHypervisorQueries
   def perspective_node_info(params):
     """Query node information.
 
@@ -817,6 +842,7 @@ class NodeRequestHandler(http.server.HttpServerHandler):
     return True
 
   @staticmethod
+  @_SharedHypervisorQueries
   def perspective_node_verify(params):
     """Run a verify sequence on this node.
 
@@ -1203,6 +1229,15 @@ class NodeRequestHandler(http.server.HttpServerHandler):
     (file_name, content) = params
     return backend.JobQueueUpdate(file_name, content)
 
+  @staticmethod
+  @_RequireJobQueueLock
+  def perspective_jobqueue_update_many(params):
+    """Update several job queue files.
+
+    """
+    (files, ) = params
+    return backend.JobQueueUpdateMany(files)
+
   @staticmethod
   @_RequireJobQueueLock
   def perspective_jobqueue_purge(params):
@@ -1439,7 +1474,11 @@ def PrepNoded(options, _):
     http.server.HttpServer(mainloop, options.bind_address, options.port,
                            handler, ssl_params=ssl_params, ssl_verify_peer=True,
                            request_executor_class=request_executor_class,
-                           ssl_verify_callback=SSLVerifyPeer)
+                           ssl_verify_callback=SSLVerifyPeer,
+                           prefork_workers=options.prefork_workers,
+                           worker_max_requests=options.prefork_max_requests,
+                           worker_max_memory_growth=
+                             options.prefork_max_memory_growth)
   server.Start()
 
   return (mainloop, server)
@@ -1468,6 +1507,7 @@ def Main():
   parser.add_option("--no-mlock", dest="mlock",
                     help="Do not mlock the node memory in ram",
                     default=True, action="store_false")
+  http.server.AddPreforkOptions(parser)
 
   daemon.GenericMain(constants.NODED, parser, CheckNoded, PrepNoded, ExecNoded,
                      default_ssl_cert=pathutils.NODED_CERT_FILE,
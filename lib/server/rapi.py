@@ -55,6 +55,22 @@ import ganeti.http.auth   # pylint: disable=W0611
 import ganeti.http.server
 
 
+def _AcceptsContentType(headers, content_type):
+  """Checks whether a client explicitly accepts a content type.
+
+  @param headers: Request headers
+  @type content_type: string
+  @param content_type: Media type, e.g. C{application/json}
+
+  """
+  accept = headers.get(http.HTTP_ACCEPT)
+  if not accept:
+    return False
+
+  return content_type.lower() in [value.split(";", 1)[0].strip().lower()
+                                  for value in accept.split(",")]
+
+
 class RemoteApiRequestContext(object):
   """Data structure for Remote API requests.
 
@@ -193,6 +209,15 @@ class RemoteApiHandler(http.auth.HttpServerRequestAuthentication,
     except rpcerr.ProtocolError, err:
       raise http.HttpBadGateway(str(err))
 
+    if (isinstance(result, list) and
+        _AcceptsContentType(req.request_headers, http.HTTP_APP_NDJSON)):
+      # Newline-delimited JSON, one document per list item. The response is
+      # still built and sent as a whole, but clients can parse it item by
+      # item.
+      req.resp_headers[http.HTTP_CONTENT_TYPE] = http.HTTP_APP_NDJSON
+
+      return "".join(map(serializer.DumpJson, result))
+
     req.resp_headers[http.HTTP_CONTENT_TYPE] = http.HTTP_APP_JSON
 
     return serializer.DumpJson(result)
@@ -234,7 +259,11 @@ def PrepRapi(options, _):
   server = \
     http.server.HttpServer(mainloop, options.bind_address, options.port,
                            handler,
-                           ssl_params=options.ssl_params, ssl_verify_peer=False)
+                           ssl_params=options.ssl_params, ssl_verify_peer=False,
+                           prefork_workers=options.prefork_workers,
+                           worker_max_requests=options.prefork_max_requests,
+                           worker_max_memory_growth=
+                             options.prefork_max_memory_growth)
   server.Start()
 
   return (mainloop, server)
@@ -270,6 +299,7 @@ def Main():
                     default=False, action="store_true",
                     help=("Enable RAPI authentication and authorization via"
                           " PAM"))
+  http.server.AddPreforkOptions(parser)
 
   daemon.GenericMain(constants.RAPI, parser, CheckRapi, PrepRapi, ExecRapi,
                      default_ssl_cert=pathutils.RAPI_CERT_FILE,
@@ -869,11 +869,37 @@ class SshRunner:
     """
     return utils.RunCmd(self.BuildCmd(*args, **kwargs))
 
-  def CopyFileToNode(self, node, port, filename):
+  def BuildCopyCmd(self, node, port, filename, source=None):
+    """Build an scp command to copy a file to another node.
+
+    @param node: node in the cluster
+    @param port: the SSH port of the node
+    @param filename: absolute pathname of the file
+    @param source: the node the command is run on, if not the local one
+
+    @return: the scp call copying the file to the same path on the node
+
+    """
+    command = [constants.SCP, "-p"]
+    command.extend(self._BuildSshOptions(True, False, True, True, port=port))
+    if source is None:
+      command.append(filename)
+    else:
+      command.append(vcluster.ExchangeNodeRoot(source, filename))
+    if netutils.IP6Address.IsValid(node):
+      node = netutils.FormatAddress((node, None))
+
+    command.append("%s:%s" % (node, vcluster.ExchangeNodeRoot(node, filename)))
+
+    return command
+
+  def CopyFileToNode(self, node, port, filename, timeout=None):
     """Copy a file to another node with scp.
 
     @param node: node in the cluster
     @param filename: absolute pathname of a local file
+    @param timeout: if not None, the time in seconds after which the copy is
+        aborted
 
     @rtype: boolean
     @return: the success of the operation
@@ -887,15 +913,9 @@ class SshRunner:
       logging.error("File %s does not exist", filename)
       return False
 
-    command = [constants.SCP, "-p"]
-    command.extend(self._BuildSshOptions(True, False, True, True, port=port))
-    command.append(filename)
-    if netutils.IP6Address.IsValid(node):
-      node = netutils.FormatAddress((node, None))
-
-    command.append("%s:%s" % (node, vcluster.ExchangeNodeRoot(node, filename)))
+    command = self.BuildCopyCmd(node, port, filename)
 
-    result = utils.RunCmd(command)
+    result = utils.RunCmd(command, timeout=timeout)
 
     if result.failed:
       logging.error("Copy to node %s failed (%s) error '%s',"
@@ -1010,7 +1030,7 @@ def _EnsureCorrectGanetiVersion(cmd):
 def RunSshCmdWithStdin(cluster_name, node, basecmd, port, data,
                        debug=False, verbose=False, use_cluster_key=False,
                        ask_key=False, strict_host_check=False,
-                       ensure_version=False):
+                       ensure_version=False, timeout=None):
   """Runs a command on a remote machine via SSH and provides input in stdin.
 
   @type cluster_name: string
@@ -1032,6 +1052,10 @@ def RunSshCmdWithStdin(cluster_name, node, basecmd, port, data,
   @param ask_key: See L{ssh.SshRunner.BuildCmd}
   @type strict_host_check: bool
   @param strict_host_check: See L{ssh.SshRunner.BuildCmd}
+  @type timeout: int
+  @param timeout: if not None, the number of seconds after which the command
+    is killed; this is reported like any other failure
+  @raise errors.OpExecError: if the command failed or timed out
 
   """
   cmd = [basecmd]
@@ -1065,7 +1089,8 @@ def RunSshCmdWithStdin(cluster_name, node, basecmd, port, data,
     tempfh.write(serializer.DumpJson(data))
     tempfh.seek(0)
 
-    result = utils.RunCmd(scmd, interactive=True, input_fd=tempfh)
+    result = utils.RunCmd(scmd, interactive=True, input_fd=tempfh,
+                          timeout=timeout)
   finally:
     tempfh.close()
 
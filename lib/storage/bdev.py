@@ -37,6 +37,8 @@ import stat
 import os
 import logging
 import math
+import threading
+import time
 
 from ganeti import utils
 from ganeti import errors
@@ -69,6 +71,176 @@ def _CheckResult(result):
                     result.cmd, result.fail_reason, result.output)
 
 
+#: Number of seconds a snapshot of the LVM inventory is reused outside of a
+#: L{LvInventoryScope}
+LV_INVENTORY_TTL = 2.0
+
+_LV_INVENTORY_SEP = "|"
+
+
+class LvInventory(object):
+  """Snapshot of the logical volumes on this node.
+
+  A single C{lvs} call covering all volume groups is used to look up the
+  attributes of any number of logical volumes, instead of running C{lvs}
+  once per volume. Snapshots are dropped whenever a logical volume is
+  changed through this module. The process-wide snapshot expires after
+  L{LV_INVENTORY_TTL} seconds, while a thread inside a L{LvInventoryScope}
+  uses its own snapshot until it leaves the scope.
+
+  """
+  def __init__(self, ttl=LV_INVENTORY_TTL, _run_cmd=utils.RunCmd,
+               _time_fn=time.time):
+    """Initializes this class.
+
+    @type ttl: number
+    @param ttl: Seconds after which the snapshot is refreshed
+
+    """
+    self._ttl = ttl
+    self._run_cmd = _run_cmd
+    self._time_fn = _time_fn
+
+    # Noded can handle several requests at the same time
+    self._lock = threading.Lock()
+
+    # dev_path as key, list of lvs output lines (without the VG and LV
+    # names) as value
+    self._lvs = None
+    self._timestamp = None
+
+    # Incremented by every invalidation, so that snapshots kept by scopes
+    # in other threads are dropped as well
+    self._generation = 0
+
+    # Scope depth and snapshot of the current thread
+    self._local = threading.local()
+
+  def _LoadUnlocked(self):
+    """Runs C{lvs} for all volume groups and indexes the output.
+
+    @rtype: dict
+    @return: the new snapshot, empty if C{lvs} failed
+
+    """
+    result = self._run_cmd(["lvs", "--noheadings",
+                            "--separator=%s" % _LV_INVENTORY_SEP,
+                            "--units=k", "--nosuffix",
+                            "-ovg_name,lv_name,lv_attr,lv_kernel_major,"
+                            "lv_kernel_minor,vg_extent_size,stripes,devices"])
+    if result.failed:
+      logging.warning("Can't list logical volumes: %s, %s",
+                      result.fail_reason, result.output)
+      return {}
+
+    lvs = {}
+    for line in result.stdout.splitlines():
+      elems = line.strip().split(_LV_INVENTORY_SEP, 2)
+      if len(elems) != 3:
+        continue
+      (vg_name, lv_name, info) = elems
+      lvs.setdefault(utils.PathJoin("/dev", vg_name, lv_name), []).append(info)
+
+    return lvs
+
+  def _GetSnapshotUnlocked(self):
+    """Returns an up-to-date snapshot for the current thread.
+
+    @rtype: dict
+
+    """
+    local = self._local
+    scoped = getattr(local, "depth", 0) > 0
+
+    if (scoped and local.lvs is not None and
+        local.generation == self._generation):
+      return local.lvs
+
+    now = self._time_fn()
+    if self._lvs is None or now - self._timestamp > self._ttl:
+      self._lvs = self._LoadUnlocked()
+      self._timestamp = now
+
+    if scoped:
+      local.lvs = self._lvs
+      local.generation = self._generation
+
+    return self._lvs
+
+  def Lookup(self, dev_path):
+    """Returns the C{lvs} output lines for a logical volume.
+
+    @type dev_path: string
+    @param dev_path: Device path of the logical volume
+    @rtype: list or None
+    @return: the lines describing the volume's segments, or None if the
+        volume is not part of the snapshot (or C{lvs} failed)
+
+    """
+    self._lock.acquire()
+    try:
+      return self._GetSnapshotUnlocked().get(dev_path, None)
+    finally:
+      self._lock.release()
+
+  def Invalidate(self):
+    """Drops the current snapshots, including those of active scopes.
+
+    """
+    self._lock.acquire()
+    try:
+      self._lvs = None
+      self._generation += 1
+    finally:
+      self._lock.release()
+
+  def Enter(self):
+    """Keeps the snapshot used by the current thread from expiring.
+
+    See L{LvInventoryScope}.
+
+    """
+    local = self._local
+    depth = getattr(local, "depth", 0)
+    if depth == 0:
+      local.lvs = None
+      local.generation = None
+    local.depth = depth + 1
+
+  def Exit(self):
+    """Undoes L{Enter}.
+
+    """
+    local = self._local
+    assert getattr(local, "depth", 0) > 0
+    local.depth -= 1
+    if local.depth == 0:
+      local.lvs = None
+
+
+_lv_inventory = LvInventory()
+
+
+class LvInventoryScope(object):
+  """Reuses the LVM inventory snapshot for the duration of a request.
+
+  To be used with the C{with} statement around code looking up many
+  logical volumes, such as an RPC request walking the disks of instances.
+
+  """
+  def __init__(self, _inventory=None):
+    if _inventory is None:
+      _inventory = _lv_inventory
+    self._inventory = _inventory
+
+  def __enter__(self):
+    self._inventory.Enter()
+    return self._inventory
+
+  def __exit__(self, exc_type, exc_value, traceback):
+    self._inventory.Exit()
+
+
 class LogicalVolume(base.BlockDev):
   """Logical Volume block device.
 
@@ -215,6 +387,7 @@ class LogicalVolume(base.BlockDev):
       result = utils.RunCmd(cmd + ["-i%d" % stripes_arg] + [vg_name] + pvlist)
       if not result.failed:
         break
+    _lv_inventory.Invalidate()
     if result.failed:
       base.ThrowError("LV create failed (%s): %s",
                       result.fail_reason, result.output)
@@ -415,6 +588,7 @@ class LogicalVolume(base.BlockDev):
       return
     result = utils.RunCmd(["lvremove", "-f", "%s/%s" %
                            (self._vg_name, self._lv_name)])
+    _lv_inventory.Invalidate()
     if result.failed:
       base.ThrowError("Can't lvremove: %s - %s",
                       result.fail_reason, result.output)
@@ -431,6 +605,7 @@ class LogicalVolume(base.BlockDev):
                                    " volume groups (from %s to to %s)" %
                                    (self._vg_name, new_vg))
     result = utils.RunCmd(["lvrename", new_vg, self._lv_name, new_name])
+    _lv_inventory.Invalidate()
     if result.failed:
       base.ThrowError("Failed to rename the logical volume: %s", result.output)
     self._lv_name = new_name
@@ -501,7 +676,13 @@ class LogicalVolume(base.BlockDev):
     # only the last entry, which is the one we're interested in; note
     # that with LVM2 anyway the 'stripes' value must be constant
     # across segments, so this is a no-op actually
-    out = result.stdout.splitlines()
+    return cls._ParseLvInfoLines(result.stdout.splitlines(), sep)
+
+  @classmethod
+  def _ParseLvInfoLines(cls, out, sep):
+    """Combine the lvs output lines of all segments of one LV.
+
+    """
     if not out: # totally empty result? splitlines() returns at least
                 # one line for any non-empty string
       base.ThrowError("Can't parse LVS output, no lines? Got '%s'", str(out))
@@ -522,8 +703,14 @@ class LogicalVolume(base.BlockDev):
     """
     self.attached = False
     try:
-      (status, major, minor, pe_size, stripes, pv_names) = \
-        self._GetLvInfo(self.dev_path)
+      lines = _lv_inventory.Lookup(self.dev_path)
+      if lines is None:
+        # Not known (yet), ask LVM about this volume only
+        (status, major, minor, pe_size, stripes, pv_names) = \
+          self._GetLvInfo(self.dev_path)
+      else:
+        (status, major, minor, pe_size, stripes, pv_names) = \
+          self._ParseLvInfoLines(lines, _LV_INVENTORY_SEP)
     except errors.BlockDeviceError:
       return False
 
@@ -546,6 +733,7 @@ class LogicalVolume(base.BlockDev):
 
     """
     result = utils.RunCmd(["lvchange", "-ay", self.dev_path])
+    _lv_inventory.Invalidate()
     if result.failed:
       base.ThrowError("Can't activate lv %s: %s", self.dev_path, result.output)
 
@@ -636,8 +824,10 @@ class LogicalVolume(base.BlockDev):
       base.ThrowError("Not enough free space: required %s,"
                       " available %s", snap_size, free_size)
 
-    _CheckResult(utils.RunCmd(["lvcreate", "-L%dm" % snap_size, "-s",
-                               "-n%s" % snap_name, self.dev_path]))
+    result = utils.RunCmd(["lvcreate", "-L%dm" % snap_size, "-s",
+                           "-n%s" % snap_name, self.dev_path])
+    _lv_inventory.Invalidate()
+    _CheckResult(result)
 
     return (self._vg_name, snap_name)
 
@@ -726,6 +916,8 @@ class LogicalVolume(base.BlockDev):
       result = utils.RunCmd(cmd + ["--alloc", alloc_policy, self.dev_path] +
                             pvlist)
       if not result.failed:
+        if not dryrun:
+          _lv_inventory.Invalidate()
         return
     base.ThrowError("Can't grow LV %s: %s", self.dev_path, result.output)
 
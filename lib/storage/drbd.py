@@ -32,6 +32,7 @@
 
 import errno
 import logging
+import threading
 import time
 
 from ganeti import constants
@@ -50,6 +51,115 @@ from ganeti.storage import drbd_cmdgen
 _DEVICE_READ_SIZE = 128 * 1024
 
 
+class _DRBD8State(threading.local):
+  """Snapshot of the DRBD state, shared by the devices used in a request.
+
+  Outside of a L{DRBD8StateScope}, /proc/drbd and `drbdsetup show` are read
+  every time they're needed. Within a scope, /proc/drbd is read only once
+  and, where drbdsetup supports it, the configuration of all minors is
+  retrieved with a single `drbdsetup show` call. The snapshot is per thread
+  and dropped when the outermost scope is left.
+
+  """
+  def __init__(self):
+    threading.local.__init__(self)
+    self.scopes = 0
+    self._proc_info = None
+    self._show_info = {}
+    self._show_all_tried = False
+    self._show_all_loaded = False
+
+  def Clear(self):
+    """Drops the snapshot.
+
+    """
+    self._proc_info = None
+    self._show_info = {}
+    self._show_all_tried = False
+    self._show_all_loaded = False
+
+  def GetProcInfo(self):
+    """Returns the parsed contents of /proc/drbd.
+
+    @rtype: L{DRBD8Info}
+
+    """
+    if not self.scopes:
+      return DRBD8Info.CreateFromFile()
+
+    if self._proc_info is None:
+      self._proc_info = DRBD8Info.CreateFromFile()
+    return self._proc_info
+
+  def _LoadAllShowInfo(self, show_info_cls, cmd_gen):
+    """Runs `drbdsetup show` once for all minors, if supported.
+
+    """
+    self._show_all_tried = True
+
+    cmd = cmd_gen.GenShowAllCmd()
+    if cmd is None:
+      return
+
+    result = utils.RunCmd(cmd)
+    if result.failed:
+      logging.warning("Can't display the drbd config of all minors: %s - %s",
+                      result.fail_reason, result.output)
+      return
+
+    self._show_info = show_info_cls.GetDevInfoPerMinor(result.stdout)
+    self._show_all_loaded = True
+
+  def GetShowInfo(self, minor, show_info_cls, cmd_gen):
+    """Returns the cached `drbdsetup show` information for a minor.
+
+    @rtype: dict or None
+    @return: the information as described in
+        L{drbd_info.BaseShowInfo.GetDevInfo}, or None if it has to be
+        retrieved for this minor alone
+
+    """
+    if not self.scopes:
+      return None
+
+    if not self._show_all_tried:
+      self._LoadAllShowInfo(show_info_cls, cmd_gen)
+
+    if minor in self._show_info:
+      return self._show_info[minor]
+    elif self._show_all_loaded:
+      # The minor isn't configured
+      return {}
+    else:
+      return None
+
+  def SetShowInfo(self, minor, info):
+    """Stores the `drbdsetup show` information retrieved for a single minor.
+
+    """
+    if self.scopes:
+      self._show_info[minor] = info
+
+
+_state = _DRBD8State()
+
+
+class DRBD8StateScope(object):
+  """Shares one snapshot of the DRBD state for the duration of a request.
+
+  To be used with the C{with} statement around code only querying DRBD
+  devices, as the snapshot is not updated when devices are changed.
+
+  """
+  def __enter__(self):
+    _state.scopes += 1
+
+  def __exit__(self, exc_type, exc_value, traceback):
+    _state.scopes -= 1
+    if not _state.scopes:
+      _state.Clear()
+
+
 class DRBD8(object):
   """Various methods to deals with the DRBD system as a whole.
 
@@ -92,7 +202,7 @@ class DRBD8(object):
     @return: a L{DRBD8Info} instance containing the current /proc/drbd info
 
     """
-    return DRBD8Info.CreateFromFile()
+    return _state.GetProcInfo()
 
   @staticmethod
   def GetUsedDevs():
@@ -315,7 +425,11 @@ class DRBD8Dev(base.BlockDev):
     @rtype: dict as described in L{drbd_info.BaseShowInfo.GetDevInfo}
 
     """
-    return self._show_info_cls.GetDevInfo(self._GetShowData(minor))
+    info = _state.GetShowInfo(minor, self._show_info_cls, self._cmd_gen)
+    if info is None:
+      info = self._show_info_cls.GetDevInfo(self._GetShowData(minor))
+      _state.SetShowInfo(minor, info)
+    return info
 
   def _MatchesLocal(self, info):
     """Test if our local config matches with an existing device.
@@ -50,6 +50,15 @@ class BaseDRBDCmdGenerator(object):
   def GenShowCmd(self, minor):
     raise NotImplementedError
 
+  def GenShowAllCmd(self):
+    """Returns the command showing the configuration of all minors.
+
+    @rtype: list or None
+    @return: the command, or None if drbdsetup can only show single minors
+
+    """
+    raise NotImplementedError
+
   def GenInitMetaCmd(self, minor, meta_dev):
     raise NotImplementedError
 
@@ -111,6 +120,9 @@ class DRBD83CmdGenerator(BaseDRBDCmdGenerator):
   def GenShowCmd(self, minor):
     return ["drbdsetup", self._DevPath(minor), "show"]
 
+  def GenShowAllCmd(self):
+    return None
+
   def GenInitMetaCmd(self, minor, meta_dev):
     return ["drbdmeta", "--force", self._DevPath(minor),
             "v08", meta_dev, "0", "create-md"]
@@ -313,6 +325,9 @@ class DRBD84CmdGenerator(BaseDRBDCmdGenerator):
   def GenShowCmd(self, minor):
     return ["drbdsetup", "show", minor]
 
+  def GenShowAllCmd(self):
+    return ["drbdsetup", "show", "all"]
+
   def GenInitMetaCmd(self, minor, meta_dev):
     return ["drbdmeta", "--force", self._DevPath(minor),
             "v08", meta_dev, "flex-external", "create-md"]
@@ -31,7 +31,6 @@
 """DRBD information parsing utilities"""
 
 import errno
-import pyparsing as pyp
 import re
 
 from ganeti import constants
@@ -295,50 +294,35 @@ class DRBD8Info(object):
     return DRBD8Info.CreateFromLines(lines)
 
 
+class _ShowSection(list):
+  """A section of the `drbdsetup show` output.
+
+  Like a statement, this is a list whose first element is the section's name,
+  followed by its contents (statements and nested sections). The remaining
+  words before the opening brace (e.g. the index in "volume 0") are kept in
+  C{args}.
+
+  """
+  def __init__(self, name, args):
+    list.__init__(self, [name])
+    self.args = args
+
+
 class BaseShowInfo(object):
   """Base class for parsing the `drbdsetup show` output.
 
-  Holds various common pyparsing expressions which are used by subclasses. Also
-  provides caching of the constructed parser.
+  The output is parsed in a single pass by a hand-written parser into nested
+  lists: statements become C{[keyword, value, ...]} and sections become
+  L{_ShowSection}s. Addresses are converted to C{[host, port]}, and device
+  minors, port numbers and bracketed numbers (like the meta device index) to
+  integers.
 
   """
-  _PARSE_SHOW = None
-
-  # pyparsing setup
-  _lbrace = pyp.Literal("{").suppress()
-  _rbrace = pyp.Literal("}").suppress()
-  _lbracket = pyp.Literal("[").suppress()
-  _rbracket = pyp.Literal("]").suppress()
-  _semi = pyp.Literal(";").suppress()
-  _colon = pyp.Literal(":").suppress()
-  # this also converts the value to an int
-  _number = pyp.Word(pyp.nums).setParseAction(lambda s, l, t: int(t[0]))
-
-  _comment = pyp.Literal("#") + pyp.Optional(pyp.restOfLine)
-  _defa = pyp.Literal("_is_default").suppress()
-  _dbl_quote = pyp.Literal('"').suppress()
-
-  _keyword = pyp.Word(pyp.alphanums + "-")
-
-  # value types
-  _value = pyp.Word(pyp.alphanums + "_-/.:")
-  _quoted = _dbl_quote + pyp.CharsNotIn('"') + _dbl_quote
-  _ipv4_addr = (pyp.Optional(pyp.Literal("ipv4")).suppress() +
-                pyp.Word(pyp.nums + ".") + _colon + _number)
-  _ipv6_addr = (pyp.Optional(pyp.Literal("ipv6")).suppress() +
-                pyp.Optional(_lbracket) + pyp.Word(pyp.hexnums + ":") +
-                pyp.Optional(_rbracket) + _colon + _number)
-  # meta device, extended syntax
-  _meta_value = ((_value ^ _quoted) + _lbracket + _number + _rbracket)
-  # device name, extended syntax
-  _device_value = pyp.Literal("minor").suppress() + _number
-
-  # a statement
-  _stmt = (~_rbrace + _keyword + ~_lbrace +
-           pyp.Optional(_ipv4_addr ^ _ipv6_addr ^ _value ^ _quoted ^
-                        _meta_value ^ _device_value) +
-           pyp.Optional(_defa) + _semi +
-           pyp.Optional(pyp.restOfLine).suppress())
+  _TOKEN_RE = re.compile(r"""(\s+|#[^\n]*)|"([^"]*)"|([{}\[\];])|"""
+                         r"""([^\s{}\[\];"#]+)""")
+
+  # Address families which can precede an address
+  _ADDRESS_FAMILIES = compat.UniqueFrozenset(["ipv4", "ipv6", "ssocks", "sdp"])
 
   @classmethod
   def GetDevInfo(cls, show_data):
@@ -360,51 +344,132 @@ class BaseShowInfo(object):
     if not show_data:
       return {}
 
-    try:
-      # run pyparse
-      results = (cls._GetShowParser()).parseString(show_data)
-    except pyp.ParseException, err:
-      base.ThrowError("Can't parse drbdsetup show output: %s", str(err))
+    return cls._TransformParseResult(cls._GetDeviceSections(
+      cls._ParseShow(show_data)))
 
-    return cls._TransformParseResult(results)
+  @classmethod
+  def _GetDeviceSections(cls, parse_result):
+    """Returns the part of the parsed output describing one device.
+
+    """
+    return parse_result
 
   @classmethod
   def _TransformParseResult(cls, parse_result):
     raise NotImplementedError
 
   @classmethod
-  def _GetShowParser(cls):
-    """Return a parser for `drbd show` output.
+  def _Tokenize(cls, show_data):
+    """Splits the `drbdsetup show` output into tokens.
 
-    This will either create or return an already-created parser for the
-    output of the command `drbd show`.
+    Whitespace and comments are skipped.
 
-    """
-    if cls._PARSE_SHOW is None:
-      cls._PARSE_SHOW = cls._ConstructShowParser()
+    @return: generator of (kind, value) tuples, where kind is one of "quoted",
+        "punct" or "word"
 
-    return cls._PARSE_SHOW
+    """
+    pos = 0
+    end = len(show_data)
+    while pos < end:
+      m = cls._TOKEN_RE.match(show_data, pos)
+      if not m:
+        base.ThrowError("Can't parse drbdsetup show output: unexpected"
+                        " character at offset %d", pos)
+      pos = m.end()
+      (blank, quoted, punct, word) = m.groups()
+      if blank is not None:
+        continue
+      elif quoted is not None:
+        yield ("quoted", quoted)
+      elif punct is not None:
+        yield ("punct", punct)
+      else:
+        yield ("word", word)
 
   @classmethod
-  def _ConstructShowParser(cls):
-    raise NotImplementedError
+  def _MakeStatement(cls, words):
+    """Builds a statement from its (kind, value, bracketed) words.
 
+    """
+    (kind, keyword, _) = words[0]
+    if kind != "word":
+      base.ThrowError("Can't parse drbdsetup show output: invalid keyword"
+                      " '%s'", keyword)
+
+    values = [(kind, value, bracketed)
+              for (kind, value, bracketed) in words[1:]
+              if not (kind == "word" and value == "_is_default")]
+
+    if keyword == "address" and values:
+      if values[0][1] in cls._ADDRESS_FAMILIES:
+        values = values[1:]
+      address = "".join(value for (_, value, _) in values)
+      (host, _, port) = address.rpartition(":")
+      if not (host and port.isdigit()):
+        base.ThrowError("Can't parse drbdsetup show output: invalid address"
+                        " '%s'", address)
+      return [keyword, host, int(port)]
+
+    if (len(values) == 2 and values[0][:2] == ("word", "minor") and
+        values[1][1].isdigit()):
+      return [keyword, int(values[1][1])]
+
+    result = [keyword]
+    for (kind, value, bracketed) in values:
+      if bracketed and kind == "word" and value.isdigit():
+        result.append(int(value))
+      else:
+        result.append(value)
+    return result
 
-class DRBD83ShowInfo(BaseShowInfo):
   @classmethod
-  def _ConstructShowParser(cls):
-    # an entire section
-    section_name = pyp.Word(pyp.alphas + "_")
-    section = section_name + \
-              cls._lbrace + \
-              pyp.ZeroOrMore(pyp.Group(cls._stmt)) + \
-              cls._rbrace
+  def _ParseShow(cls, show_data):
+    """Parses the `drbdsetup show` output.
 
-    bnf = pyp.ZeroOrMore(pyp.Group(section ^ cls._stmt))
-    bnf.ignore(cls._comment)
+    @rtype: list
+    @return: the top-level statements and sections
+
+    """
+    result = []
+    stack = [result]
+    words = []
+    bracketed = False
+
+    for (kind, value) in cls._Tokenize(show_data):
+      if kind != "punct":
+        words.append((kind, value, bracketed))
+      elif value == "{":
+        if not words or words[0][0] != "word" or bracketed:
+          base.ThrowError("Can't parse drbdsetup show output: section"
+                          " without a name")
+        section = _ShowSection(words[0][1], [w[1] for w in words[1:]])
+        stack[-1].append(section)
+        stack.append(section)
+        words = []
+      elif value == "}":
+        if words or len(stack) == 1:
+          base.ThrowError("Can't parse drbdsetup show output: unexpected"
+                          " closing brace")
+        stack.pop()
+      elif value == ";":
+        if not words or bracketed:
+          base.ThrowError("Can't parse drbdsetup show output: unexpected"
+                          " semicolon")
+        stack[-1].append(cls._MakeStatement(words))
+        words = []
+      elif value == "[":
+        bracketed = True
+      else:
+        bracketed = False
+
+    if words or len(stack) != 1:
+      base.ThrowError("Can't parse drbdsetup show output: unexpected end of"
+                      " data")
+
+    return result
 
-    return bnf
 
+class DRBD83ShowInfo(BaseShowInfo):
   @classmethod
   def _TransformParseResult(cls, parse_result):
     retval = {}
@@ -428,27 +493,50 @@ class DRBD83ShowInfo(BaseShowInfo):
 
 class DRBD84ShowInfo(BaseShowInfo):
   @classmethod
-  def _ConstructShowParser(cls):
-    # an entire section (sections can be nested in DRBD 8.4, and there exist
-    # sections like "volume 0")
-    section_name = pyp.Word(pyp.alphas + "_") + \
-                   pyp.Optional(pyp.Word(pyp.nums)).suppress() # skip volume idx
-    section = pyp.Forward()
-    # pylint: disable=W0106
-    section << (section_name +
-                cls._lbrace +
-                pyp.ZeroOrMore(pyp.Group(cls._stmt ^ section)) +
-                cls._rbrace)
-
-    resource_name = pyp.Word(pyp.alphanums + "_-.")
-    resource = (pyp.Literal("resource") + resource_name).suppress() + \
-               cls._lbrace + \
-               pyp.ZeroOrMore(pyp.Group(section)) + \
-               cls._rbrace
-
-    resource.ignore(cls._comment)
-
-    return resource
+  def _GetDeviceSections(cls, parse_result):
+    if not parse_result or not isinstance(parse_result[0], _ShowSection) or \
+        parse_result[0][0] != "resource":
+      base.ThrowError("Can't parse drbdsetup show output: expected a"
+                      " resource section")
+    return parse_result[0][1:]
+
+  @classmethod
+  def GetDevInfoPerMinor(cls, show_data):
+    """Parse details about all DRBD minors.
+
+    This takes the output of `drbdsetup show all`, which describes every
+    configured resource.
+
+    @rtype: dict
+    @return: minor as key, dict as returned by L{GetDevInfo} as value
+
+    """
+    if not show_data:
+      return {}
+
+    result = {}
+    for resource in cls._ParseShow(show_data):
+      if not isinstance(resource, _ShowSection) or resource[0] != "resource":
+        base.ThrowError("Can't parse drbdsetup show output: expected a"
+                        " resource section")
+      minor = cls._GetMinor(resource[1:])
+      if minor is not None:
+        result[minor] = cls._TransformParseResult(resource[1:])
+    return result
+
+  @staticmethod
+  def _GetMinor(sections):
+    for section in sections:
+      if section[0] != "_this_host":
+        continue
+      for vol in section[1:]:
+        if vol[0] != "volume" or not isinstance(vol, _ShowSection):
+          continue
+        for entry in vol[1:]:
+          if entry[0] == "device" and len(entry) == 2 and \
+              isinstance(entry[1], int):
+            return entry[1]
+    return None
 
   @classmethod
   def _TransformVolumeSection(cls, vol_content, retval):
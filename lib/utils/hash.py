@@ -33,8 +33,19 @@
 
 import os
 import hmac
+import logging
+import stat
+import threading
+import time
 
 from ganeti import compat
+from ganeti.utils import io as utils_io
+
+
+#: Files changed less than this number of seconds before being hashed are
+#: not cached, as further changes within the timestamp granularity of the
+#: filesystem might not be visible in their stat information
+_FINGERPRINT_RACY_WINDOW = 2.0
 
 
 def Sha1Hmac(key, text, salt=None):
@@ -119,3 +130,123 @@ def FingerprintFiles(files):
       ret[filename] = cksum
 
   return ret
+
+
+def _GetFingerprintKey(st):
+  """Returns the stat information identifying a file version.
+
+  """
+  return (st.st_dev, st.st_ino, st.st_size, st.st_mtime, st.st_ctime)
+
+
+class FingerprintCache(object):
+  """Fingerprints files, skipping the ones unchanged since the last time.
+
+  Digests are persisted in a file, keyed by the path and the device, inode,
+  size, modification and change time of each file, so that unchanged files
+  needn't be read again by later calls, even from other processes. Files
+  changed shortly before being hashed are not cached, see
+  L{_FINGERPRINT_RACY_WINDOW}.
+
+  """
+  def __init__(self, cache_file, _stat_fn=os.stat, _time_fn=time.time):
+    """Initializes this class.
+
+    @type cache_file: string
+    @param cache_file: file in which to persist the digests
+
+    """
+    self._cache_file = cache_file
+    self._stat_fn = _stat_fn
+    self._time_fn = _time_fn
+    self._lock = threading.Lock()
+
+  def _Load(self):
+    """Reads the persisted digests, ignoring invalid entries.
+
+    @rtype: dict
+    @return: filename as key, tuple of (key, digest) as value
+
+    """
+    try:
+      data = utils_io.ReadFile(self._cache_file)
+    except EnvironmentError:
+      return {}
+
+    entries = {}
+    for line in data.splitlines():
+      parts = line.split(" ", 6)
+      if len(parts) != 7:
+        continue
+      (digest, dev, ino, size, mtime, ctime, filename) = parts
+      try:
+        key = (int(dev), int(ino), int(size), float(mtime), float(ctime))
+      except ValueError:
+        continue
+      entries[filename] = (key, digest)
+
+    return entries
+
+  def _Save(self, entries):
+    """Persists the digests, logging but otherwise ignoring errors.
+
+    """
+    data = "".join("%s %d %d %d %r %r %s\n" % ((digest, ) + key + (filename, ))
+                   for (filename, (key, digest)) in sorted(entries.items()))
+    try:
+      utils_io.WriteFile(self._cache_file, data=data, mode=0600)
+    except EnvironmentError, err:
+      logging.warning("Can't write fingerprint cache %s: %s",
+                      self._cache_file, err)
+
+  def FingerprintFiles(self, files):
+    """Computes fingerprints for a list of files.
+
+    @type files: list
+    @param files: the list of filename to fingerprint
+    @rtype: tuple of (dict, int)
+    @return: a dictionary filename: fingerprint, holding only existing
+        files (see L{FingerprintFiles}), and the number of fingerprints
+        taken from the cache
+
+    """
+    self._lock.acquire()
+    try:
+      cached = self._Load()
+      entries = {}
+      ret = {}
+      hits = 0
+
+      for filename in files:
+        try:
+          st = self._stat_fn(filename)
+        except EnvironmentError:
+          continue
+        if not stat.S_ISREG(st.st_mode):
+          continue
+
+        key = _GetFingerprintKey(st)
+        entry = cached.get(filename)
+        if entry is not None and entry[0] == key:
+          hits += 1
+          cksum = entry[1]
+        else:
+          cksum = _FingerprintFile(filename)
+          if not cksum:
+            continue
+
+        ret[filename] = cksum
+
+        # Don't trust the stat information of a recently changed file
+        if ("\n" not in filename and
+            self._time_fn() - max(st.st_mtime, st.st_ctime) >
+            _FINGERPRINT_RACY_WINDOW):
+          entries[filename] = (key, cksum)
+
+      # Entries of files which weren't asked for are dropped
+      if entries != cached:
+        self._Save(entries)
+
+      return (ret, hits)
+    finally:
+      self._lock.release()
@@ -0,0 +1,95 @@
+#
+#
+
+# Copyright (C) 2026 Google Inc.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+#
+# 1. Redistributions of source code must retain the above copyright notice,
+# this list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright
+# notice, this list of conditions and the following disclaimer in the
+# documentation and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS
+# IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED
+# TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR
+# PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR
+# CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+# EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+# PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR
+# PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF
+# LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
+# NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+"""Utility functions for running function calls in parallel.
+
+"""
+
+
+import sys
+import threading
+
+
+def RunParallel(fn, args_list, max_threads):
+  """Calls a function once per set of arguments, using several threads.
+
+  At most C{max_threads} calls run at the same time. If any call raises an
+  exception, the exception of the first failed call in the order of
+  C{args_list} is re-raised once all calls are done.
+
+  @type fn: callable
+  @param fn: the function to call
+  @type args_list: list of tuples
+  @param args_list: the positional arguments of each call
+  @type max_threads: int
+  @param max_threads: maximum number of threads to use
+  @rtype: list
+  @return: the return values of the calls, in the order of C{args_list}
+
+  """
+  args_list = list(args_list)
+  count = len(args_list)
+
+  if count <= 1 or max_threads <= 1:
+    return [fn(*args) for args in args_list]
+
+  results = [None] * count
+  failures = [None] * count
+  pending = iter(range(count))
+  lock = threading.Lock()
+
+  def _Worker():
+    while True:
+      lock.acquire()
+      try:
+        idx = next(pending, None)
+      finally:
+        lock.release()
+
+      if idx is None:
+        break
+
+      try:
+        results[idx] = fn(*args_list[idx])
+      except: # pylint: disable=W0702
+        failures[idx] = sys.exc_info()
+
+  threads = [threading.Thread(target=_Worker)
+             for _ in range(min(count, max_threads))]
+  for thread in threads:
+    thread.setDaemon(True)
+    thread.start()
+  for thread in threads:
+    thread.join()
+
+  for exc_info in failures:
+    if exc_info is not None:
+      raise exc_info[0], exc_info[1], exc_info[2]
+
+  return results
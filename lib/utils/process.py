@@ -157,7 +157,7 @@ def _BuildCmdEnvironment(env, reset):
 
 def RunCmd(cmd, env=None, output=None, cwd="/", reset_env=False,
            interactive=False, timeout=None, noclose_fds=None,
-           input_fd=None, postfork_fn=None):
+           input_fd=None, postfork_fn=None, line_fn=None):
   """Execute a (shell) command.
 
   The command should not read from its standard input, as it will be
@@ -190,6 +190,10 @@ def RunCmd(cmd, env=None, output=None, cwd="/", reset_env=False,
   @param input_fd: File descriptor for process' standard input
   @type postfork_fn: Callable receiving PID as parameter
   @param postfork_fn: Callback run after fork but before timeout
+  @type line_fn: Callable receiving a string as parameter
+  @param line_fn: Callback run for every line of output (standard output or
+                  error, without the line terminator) as soon as it has been
+                  read; the output is also returned in the result as usual
   @rtype: L{RunResult}
   @return: RunResult instance
   @raise errors.ProgrammerError: if we call this when forks are disabled
@@ -202,6 +206,10 @@ def RunCmd(cmd, env=None, output=None, cwd="/", reset_env=False,
     raise errors.ProgrammerError("Parameters 'output' and 'interactive' can"
                                  " not be provided at the same time")
 
+  if line_fn and (output or interactive):
+    raise errors.ProgrammerError("Parameter 'line_fn' can not be used together"
+                                 " with 'output' or 'interactive'")
+
   if not (output is None or input_fd is None):
     # The current logic in "_RunCmdFile", which is used when output is defined,
     # does not support input files (not hard to implement, though)
@@ -228,7 +236,8 @@ def RunCmd(cmd, env=None, output=None, cwd="/", reset_env=False,
       out, err, status, timeout_action = _RunCmdPipe(cmd, cmd_env, shell, cwd,
                                                      interactive, timeout,
                                                      noclose_fds, input_fd,
-                                                     postfork_fn=postfork_fn)
+                                                     postfork_fn=postfork_fn,
+                                                     line_fn=line_fn)
     else:
       if postfork_fn:
         raise errors.ProgrammerError("postfork_fn is not supported if output"
@@ -508,7 +517,7 @@ def _WaitForProcess(child, timeout):
 
 
 def _RunCmdPipe(cmd, env, via_shell, cwd, interactive, timeout, noclose_fds,
-                input_fd, postfork_fn=None,
+                input_fd, postfork_fn=None, line_fn=None,
                 _linger_timeout=constants.CHILD_LINGER_TIMEOUT):
   """Run a command and return its output.
 
@@ -532,6 +541,8 @@ def _RunCmdPipe(cmd, env, via_shell, cwd, interactive, timeout, noclose_fds,
   @param input_fd: File descriptor for process' standard input
   @type postfork_fn: Callable receiving PID as parameter
   @param postfork_fn: Function run after fork but before timeout
+  @type line_fn: Callable receiving a string as parameter
+  @param line_fn: Function run for every complete line of output
   @rtype: tuple
   @return: (out, err, status)
 
@@ -603,6 +614,8 @@ def _RunCmdPipe(cmd, env, via_shell, cwd, interactive, timeout, noclose_fds,
       }
     for fd in fdmap:
       utils_wrapper.SetNonblockFlag(fd, True)
+    # Incomplete last line of each stream, only used with line_fn
+    partial = dict((fd, "") for fd in fdmap)
 
     while fdmap:
       if poll_timeout:
@@ -633,11 +646,21 @@ def _RunCmdPipe(cmd, env, via_shell, cwd, interactive, timeout, noclose_fds,
             del fdmap[fd]
             continue
           fdmap[fd][0].write(data)
+          if line_fn:
+            lines = (partial[fd] + data).split("\n")
+            partial[fd] = lines.pop()
+            for line in lines:
+              line_fn(line)
         if (event & select.POLLNVAL or event & select.POLLHUP or
             event & select.POLLERR):
           poller.unregister(fd)
           del fdmap[fd]
 
+    if line_fn:
+      for line in partial.values():
+        if line:
+          line_fn(line)
+
   if timeout is not None:
     assert callable(poll_timeout)
 
@@ -33,7 +33,9 @@
 """
 
 import logging
+import os
 import random
+import threading
 import time
 
 import ganeti.rpc.client as cl
@@ -74,3 +76,54 @@ class Client(cl.AbstractStubClient, stub.ClientRpcStub):
           raise
         logging.debug("Will retry")
         time.sleep(try_no * 10 + 10 * random.random())
+
+
+class _SharedClient(Client):
+  """A WConfD client to be shared by all threads of a process.
+
+  The underlying transport can't interleave requests, so calls are
+  serialized.
+
+  """
+  def __init__(self, *args, **kwargs):
+    Client.__init__(self, *args, **kwargs)
+    self._lock = threading.Lock()
+
+  def _SendMethodCall(self, data):
+    self._lock.acquire()
+    try:
+      return Client._SendMethodCall(self, data)
+    finally:
+      self._lock.release()
+
+
+_shared_clients = {}
+_shared_clients_lock = threading.Lock()
+
+
+def GetSharedClient(allow_non_master=None):
+  """Returns a WConfD client kept open for the lifetime of the process.
+
+  Creating a L{Client} means connecting to WConfD, possibly after several
+  retries; callers doing many short requests, such as job processes waiting
+  for locks, should use this client instead. A lost connection is
+  re-established on the next call. A forked child gets its own client.
+
+  @type allow_non_master: bool
+  @param allow_non_master: skip checks for the master node on errors
+  @rtype: L{Client}
+
+  """
+  key = (os.getpid(), bool(allow_non_master))
+  _shared_clients_lock.acquire()
+  try:
+    client = _shared_clients.get(key)
+    if client is None:
+      # clients inherited from a parent process share its connections
+      for old_key in [k for k in _shared_clients if k[0] != key[0]]:
+        del _shared_clients[old_key]
+      client = _SharedClient(allow_non_master=allow_non_master)
+      _shared_clients[key] = client
+    return client
+  finally:
+    _shared_clients_lock.release()
@@ -3331,6 +3331,9 @@ nvExclusivepvs = "exclusive-pvs"
 nvFilelist :: String
 nvFilelist = "filelist"
 
+nvFilelistCacheHits :: String
+nvFilelistCacheHits = "filelist-cache-hits"
+
 nvAcceptedStoragePaths :: String
 nvAcceptedStoragePaths = "allowed-file-storage-paths"
 
@@ -3382,6 +3385,9 @@ nvPvlist = "pvlist"
 nvTime :: String
 nvTime = "time"
 
+nvTimings :: String
+nvTimings = "timings"
+
 nvUserscripts :: String
 nvUserscripts = "user-scripts"
 
@@ -4407,6 +4413,21 @@ luxidRetryForkCount = 5
 luxidRetryForkStepUS :: Int
 luxidRetryForkStepUS = 500000
 
+-- | The interval (in seconds) in which an idle pre-forked job executor
+-- refreshes its copy of the configuration.
+luxidJobZygoteRefreshInterval :: Int
+luxidJobZygoteRefreshInterval = 5
+
+-- | The timeout (in seconds) for connecting to the pre-forked job executor.
+luxidJobZygoteConnectTimeout :: Int
+luxidJobZygoteConnectTimeout = 5
+
+-- | The time period (in /us/) for which luxid collects job files to be
+-- replicated to the master candidates, before sending them together in a
+-- single RPC per node.
+luxidJobReplicationWindowUS :: Int
+luxidJobReplicationWindowUS = 100000
+
 -- * Luxid job death testing
 
 -- | The number of attempts to prove that a job is dead after sending it a
@@ -5180,6 +5201,9 @@ luxiReqSetDrainFlag = "SetDrainFlag"
 luxiReqSetWatcherPause :: String
 luxiReqSetWatcherPause = "SetWatcherPause"
 
+luxiReqReplicateJobs :: String
+luxiReqReplicateJobs = "ReplicateJobs"
+
 luxiReqAll :: FrozenSet String
 luxiReqAll =
   ConstantUtils.mkSet
@@ -5208,6 +5232,7 @@ luxiReqAll =
   , luxiReqQueryFilters
   , luxiReqReplaceFilter
   , luxiReqDeleteFilter
+  , luxiReqReplicateJobs
   ]
 
 luxiDefCtmo :: Int
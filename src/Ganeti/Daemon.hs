@@ -50,6 +50,7 @@ module Ganeti.Daemon
   , oForceNode
   , oNoVoting
   , oYesDoIt
+  , oJobZygote
   , parseArgs
   , parseAddress
   , cleanupSocket
@@ -115,6 +116,7 @@ data DaemonOptions = DaemonOptions
   , optForceNode    :: Bool           -- ^ Ignore node checks
   , optNoVoting     :: Bool           -- ^ skip voting for master
   , optYesDoIt      :: Bool           -- ^ force dangerous options
+  , optJobZygote    :: Bool           -- ^ start jobs through an executor
   }
 
 -- | Default values for the command line options.
@@ -132,6 +134,7 @@ defaultOptions  = DaemonOptions
   , optForceNode    = False
   , optNoVoting     = False
   , optYesDoIt      = False
+  , optJobZygote    = False
   }
 
 instance StandardOptions DaemonOptions where
@@ -225,6 +228,13 @@ oYesDoIt =
    "Force a dangerous operation",
    OptComplNone)
 
+oJobZygote :: OptType
+oJobZygote =
+  (Option "" ["job-zygote"]
+   (NoArg (\ opts -> Ok opts { optJobZygote = True }))
+   "Start jobs through a pre-forked job executor (experimental)",
+   OptComplNone)
+
 -- | Generic options.
 genericOpts :: [OptType]
 genericOpts = [ oShowHelp
@@ -112,16 +112,20 @@ data JQStatus = JQStatus
   , jqConfig :: IORef (Result ConfigData)
   , jqLivelock :: Livelock
   , jqForkLock :: Lock
+  , jqReplicator :: JobReplicator
+  , jqUseZygote :: Bool
   }
 
 
-emptyJQStatus :: IORef (Result ConfigData) -> IO JQStatus
-emptyJQStatus config = do
+emptyJQStatus :: IORef (Result ConfigData) -> Bool -> IO JQStatus
+emptyJQStatus config useZygote = do
   jqJ <- newIORef Queue { qEnqueued = [], qRunning = [], qManipulated = [] }
   (_, livelock) <- mkLivelockFile C.luxiLivelockPrefix
   forkLock <- newLock
+  replicator <- newJobReplicator
   return JQStatus { jqJobs = jqJ, jqConfig = config, jqLivelock = livelock
-                  , jqForkLock = forkLock }
+                  , jqForkLock = forkLock, jqReplicator = replicator
+                  , jqUseZygote = useZygote }
 
 -- | Apply a function on the running jobs.
 onRunningJobs :: ([JobWithStat] -> [JobWithStat]) -> Queue -> Queue
@@ -429,7 +433,8 @@ scheduleSomeJobs qstate = do
       mapM_ (attachWatcher qstate) chosen
 
       -- Start the jobs.
-      result <- JQ.startJobs (jqLivelock qstate) (jqForkLock qstate) jobs
+      result <- JQ.startJobs (jqLivelock qstate) (jqForkLock qstate)
+                  (jqUseZygote qstate) jobs
       let badWith (x, Bad y) = Just (x, y)
           badWith _          = Nothing
       let failed = mapMaybe badWith $ zip chosen result
@@ -68,6 +68,14 @@ module Ganeti.JQueue
     , writeJobToDisk
     , replicateManyJobs
     , writeAndReplicateJob
+    , ReplicationStats(..)
+    , emptyReplicationStats
+    , addReplicationBatch
+    , showReplicationStats
+    , JobReplicator
+    , newJobReplicator
+    , getReplicationStats
+    , replicateJobsCoalesced
     , isQueueOpen
     , startJobs
     , cancelJob
@@ -86,8 +94,9 @@ import Prelude ()
 import Ganeti.Prelude hiding (id, log)
 
 import Control.Applicative (liftA2, (<|>))
-import Control.Arrow (first, second)
-import Control.Concurrent (forkIO, threadDelay)
+import Control.Arrow (first, second, (&&&))
+import Control.Concurrent ( forkIO, threadDelay, MVar, newMVar, newEmptyMVar
+                          , modifyMVar, putMVar, takeMVar)
 import Control.Exception
 import Control.Lens (over)
 import Control.Monad ( filterM
@@ -102,9 +111,13 @@ import Control.Monad ( filterM
 import Control.Monad.IO.Class
 import Control.Monad.Trans (lift)
 import Control.Monad.Trans.Maybe
+import Data.Char (isSpace)
+import Data.IORef
 import Data.List (stripPrefix, sortBy, isPrefixOf)
+import qualified Data.Map as M
 import Data.Maybe
 import Data.Ord (comparing)
+import qualified Data.Set as S
 -- workaround what seems to be a bug in ghc 7.4's TH shadowing code
 import System.Directory
 import System.FilePath
@@ -131,7 +144,8 @@ import Ganeti.OpCodes.Lens (metaParamsL, opReasonL)
 import Ganeti.Path
 import Ganeti.Query.Exec as Exec
 import Ganeti.Rpc (executeRpcCall, ERpcError, logRpcErrors,
-                   RpcCallJobqueueUpdate(..), RpcCallJobqueueRename(..))
+                   RpcCallJobqueueUpdate(..), RpcCallJobqueueUpdateMany(..),
+                   RpcCallJobqueueRename(..))
 import Ganeti.Runtime (GanetiDaemon(..), GanetiGroup(..), MiscGroup(..))
 import Ganeti.Types
 import Ganeti.Utils
@@ -453,6 +467,23 @@ readJobDataFromDisk rootdir archived jid = do
 noSuchJob :: Result (QueuedJob, Bool)
 noSuchJob = Bad "Can't load job file"
 
+-- | Parses the contents of a job file. The first line holds the job
+-- itself. It may be followed by log entries appended by the job process,
+-- one per line, of the form @[op_index, log_entry]@; they are added to the
+-- logs of the respective opcodes.
+parseJobFile :: String -> Text.JSON.Result QueuedJob
+parseJobFile str =
+  case filter (not . all isSpace) $ lines str of
+    [] -> Text.JSON.Error "Empty job file"
+    jobline : entries -> do
+      job <- Text.JSON.decode jobline
+      logs <- mapM Text.JSON.decode entries
+        :: Text.JSON.Result [(Int, (Int, Timestamp, ELogType, JSValue))]
+      let byOp = M.fromListWith (flip (++)) [ (idx, [e]) | (idx, e) <- logs ]
+          addLog idx op =
+            op { qoLog = qoLog op ++ M.findWithDefault [] idx byOp }
+      return job { qjOps = zipWith addLog [0..] (qjOps job) }
+
 -- | Loads a job from disk.
 loadJobFromDisk :: FilePath -> Bool -> JobId -> IO (Result (QueuedJob, Bool))
 loadJobFromDisk rootdir archived jid = do
@@ -464,7 +495,7 @@ loadJobFromDisk rootdir archived jid = do
              Nothing -> noSuchJob
              Just (str, arch) ->
                liftM (\qj -> (qj, arch)) .
-               fromJResult "Parsing job file" $ Text.JSON.decode str
+               fromJResult "Parsing job file" $ parseJobFile str
 
 -- | Write a job to disk.
 writeJobToDisk :: FilePath -> QueuedJob -> IO (Result ())
@@ -486,10 +517,25 @@ replicateJob rootdir mastercandidates job = do
   _ <- logRpcErrors result
   return result
 
--- | Replicate many jobs to all master candidates.
+-- | Replicate job files to all master candidates, in a single RPC per node.
+replicateJobFiles :: [Node] -> [(FilePath, String)]
+                  -> IO [(Node, ERpcError ())]
+replicateJobFiles mastercandidates files = do
+  files' <- mapM (\(filename, content) ->
+                   liftM (flip (,) content) $ makeVirtualPath filename) files
+  callresult <- executeRpcCall mastercandidates
+                  $ RpcCallJobqueueUpdateMany files'
+  let result = map (second (() <$)) callresult
+  _ <- logRpcErrors result
+  return result
+
+-- | Replicate many jobs to all master candidates, in a single RPC per node.
 replicateManyJobs :: FilePath -> [Node] -> [QueuedJob] -> IO ()
-replicateManyJobs rootdir mastercandidates =
-  mapM_ (replicateJob rootdir mastercandidates)
+replicateManyJobs _ _ [] = return ()
+replicateManyJobs rootdir mastercandidates jobs =
+  void . replicateJobFiles mastercandidates
+    $ map (liveJobFile rootdir . qjId &&& Text.JSON.encode . Text.JSON.showJSON)
+          jobs
 
 -- | Writes a job to a file and replicates it to master candidates.
 writeAndReplicateJob :: (FromString e)
@@ -499,6 +545,146 @@ writeAndReplicateJob cfg rootdir job = do
   mkResultT $ writeJobToDisk rootdir job
   liftIO $ replicateJob rootdir (Config.getMasterCandidates cfg) job
 
+-- * Coalesced replication of job files
+
+-- | Statistics about the batches of job files sent by a 'JobReplicator'.
+data ReplicationStats = ReplicationStats
+  { rsBatches      :: Int     -- ^ number of batches sent
+  , rsFiles        :: Int     -- ^ number of files sent
+  , rsMaxBatch     :: Int     -- ^ number of files in the largest batch
+  , rsTotalLatency :: Integer -- ^ sum of the latencies, in /us/
+  , rsMaxLatency   :: Integer -- ^ largest latency, in /us/
+  } deriving (Eq, Show)
+
+-- | The statistics before any batch has been sent.
+emptyReplicationStats :: ReplicationStats
+emptyReplicationStats = ReplicationStats 0 0 0 0 0
+
+-- | Account for a batch of the given number of files, sent the given
+-- time (in /us/) after the first of them was requested.
+addReplicationBatch :: Int -> Integer -> ReplicationStats -> ReplicationStats
+addReplicationBatch size latency stats =
+  stats { rsBatches = rsBatches stats + 1
+        , rsFiles = rsFiles stats + size
+        , rsMaxBatch = max size $ rsMaxBatch stats
+        , rsTotalLatency = rsTotalLatency stats + latency
+        , rsMaxLatency = max latency $ rsMaxLatency stats
+        }
+
+-- | Serialize the statistics as returned for the @job_replication@ value
+-- of 'QueryConfigValues', with the latencies in seconds.
+showReplicationStats :: ReplicationStats -> JSValue
+showReplicationStats stats =
+  let seconds us = fromIntegral us / 1000000 :: Double
+      avgLatency
+        | rsBatches stats == 0 = 0
+        | otherwise = seconds (rsTotalLatency stats)
+                        / fromIntegral (rsBatches stats)
+  in Text.JSON.makeObj
+       [ ("batches", Text.JSON.showJSON $ rsBatches stats)
+       , ("files", Text.JSON.showJSON $ rsFiles stats)
+       , ("max_batch", Text.JSON.showJSON $ rsMaxBatch stats)
+       , ("avg_latency", Text.JSON.showJSON avgLatency)
+       , ("max_latency", Text.JSON.showJSON . seconds $ rsMaxLatency stats)
+       ]
+
+-- | Job files waiting to be replicated together.
+data PendingReplication = PendingReplication
+  { prJobs    :: S.Set JobId        -- ^ the jobs whose files are to be sent
+  , prNodes   :: [Node]             -- ^ the master candidates to send to
+  , prWaiters :: [MVar (Result ())] -- ^ the callers waiting for the batch
+  , prStart   :: Integer            -- ^ time (in /us/) of the first request
+  }
+
+-- | Collects the job files that the job processes and luxid want to have
+-- replicated, and sends those requested within a short window in a single
+-- RPC per node; see 'replicateJobsCoalesced'.
+data JobReplicator = JobReplicator
+  { jrPending  :: MVar (Maybe PendingReplication) -- ^ the next batch
+  , jrSendLock :: Lock -- ^ held while sending, so batches stay in order
+  , jrStats    :: IORef ReplicationStats -- ^ statistics of sent batches
+  }
+
+-- | Create a 'JobReplicator' without any pending files.
+newJobReplicator :: IO JobReplicator
+newJobReplicator =
+  JobReplicator <$> newMVar Nothing <*> newLock
+                <*> newIORef emptyReplicationStats
+
+-- | Get the statistics of the batches sent so far.
+getReplicationStats :: JobReplicator -> IO ReplicationStats
+getReplicationStats = readIORef . jrStats
+
+-- | Replicate the files of the given jobs to the given master candidates,
+-- and wait until this is done. All files requested within
+-- 'C.luxidJobReplicationWindowUS' of the first pending request are sent
+-- together, with their contents at that time, in a single RPC per node.
+-- As with 'replicateJob', failures on individual nodes are only logged.
+replicateJobsCoalesced :: JobReplicator -> [Node] -> [JobId]
+                       -> IO (Result ())
+replicateJobsCoalesced _ _ [] = return $ Ok ()
+replicateJobsCoalesced jr mastercandidates jids = do
+  done <- newEmptyMVar
+  now <- getCurrentTimeUSec
+  let add Nothing =
+        ( Just PendingReplication { prJobs = S.fromList jids
+                                  , prNodes = mastercandidates
+                                  , prWaiters = [done]
+                                  , prStart = now
+                                  }
+        , True )
+      add (Just pending) =
+        ( Just pending { prJobs = S.union (prJobs pending) (S.fromList jids)
+                       , prNodes = mastercandidates
+                       , prWaiters = done : prWaiters pending
+                       }
+        , False )
+  isNew <- modifyMVar (jrPending jr) (return . add)
+  when isNew . void . forkIO $ do
+    threadDelay C.luxidJobReplicationWindowUS
+    sendPendingReplication jr
+  takeMVar done
+
+-- | Read a live job file to replicate it. Returns 'Nothing' if the file
+-- can't be read, e.g., because the job has been archived in the meantime.
+readJobFileForReplication :: FilePath -> JobId
+                          -> IO (Maybe (FilePath, String))
+readJobFileForReplication rootdir jid = do
+  let filename = liveJobFile rootdir jid
+  let readForced = do
+        str <- readFile filename
+        _ <- evaluate $ length str
+        return str
+  content <- tryAndLogIOError readForced
+               ("Failed to read " ++ filename ++ " for replication") Ok
+  return . genericResult (const Nothing) (Just . (,) filename) $ content
+
+-- | Send the pending batch of a 'JobReplicator', if any, and hand the
+-- result to all callers waiting for it.
+sendPendingReplication :: JobReplicator -> IO ()
+sendPendingReplication jr = withLock (jrSendLock jr) $ do
+  batch <- modifyMVar (jrPending jr) $ \pending -> return (Nothing, pending)
+  case batch of
+    Nothing -> return ()
+    Just pending -> do
+      result <- try $ do
+        qdir <- queueDir
+        files <- liftM catMaybes . mapM (readJobFileForReplication qdir)
+                   . S.toList $ prJobs pending
+        _ <- replicateJobFiles (prNodes pending) files
+        end <- getCurrentTimeUSec
+        let latency = end - prStart pending
+        atomicModifyIORef (jrStats jr)
+          $ \stats -> (addReplicationBatch (length files) latency stats, ())
+        logDebug $ "Replicated " ++ show (length files) ++ " job file(s) in"
+                   ++ " one batch, " ++ show latency ++ "us after the first"
+                   ++ " request"
+      let result' = case result of
+            Left e -> Bad $ "Replicating job files failed: "
+                            ++ show (e :: SomeException)
+            Right () -> Ok ()
+      mapM_ (`putMVar` result') $ prWaiters pending
+
 -- | Read the job serial number from disk.
 readSerialFromDisk :: IO (Result JobId)
 readSerialFromDisk = do
@@ -550,15 +736,16 @@ isQueueOpen = liftM not (jobQueueDrainFile >>= doesFileExist)
 -- | Start enqueued jobs by executing the Python code.
 startJobs :: Livelock -- ^ Luxi's livelock path
           -> Lock -- ^ lock for forking new processes
+          -> Bool -- ^ whether to use the pre-forked job executor
           -> [QueuedJob] -- ^ the list of jobs to start
           -> IO [ErrorResult QueuedJob]
-startJobs luxiLivelock forkLock jobs = do
+startJobs luxiLivelock forkLock useZygote jobs = do
   qdir <- queueDir
   let updateJob job llfile =
         void . mkResultT . writeJobToDisk qdir
           $ job { qjLivelock = Just llfile }
   let runJob job = withLock forkLock $ do
-        (llfile, _) <- Exec.forkJobProcess job luxiLivelock
+        (llfile, _) <- Exec.forkJobProcess useZygote job luxiLivelock
                                            (updateJob job)
         return $ job { qjLivelock = Just llfile }
   mapM (runResultT . runJob) jobs
@@ -191,6 +191,9 @@ $(genLuxiOp "LuxiOp"
      [ optionalNullSerField
          $ timeAsDoubleField "duration" ]
     )
+  , (luxiReqReplicateJobs,
+     [ simpleField "jobs" [t| [JobId] |] ]
+    )
   ])
 
 $(makeJSONInstance ''LuxiReq)
@@ -340,6 +343,9 @@ decodeLuxiCall method args = do
                 [x] <- fromJVal args
                 liftM unTimeAsDoubleJSON $ fromJVal x
               return $ SetWatcherPause duration
+    ReqReplicateJobs -> do
+              [jids] <- fromJVal args
+              return $ ReplicateJobs jids
 
 -- | Generic luxi method call
 callMethod :: LuxiOp -> Client -> IO (ErrorResult JSValue)
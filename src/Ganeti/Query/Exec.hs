@@ -23,6 +23,12 @@ The protocol works as follows (MP = master process, FP = forked process):
 
 * Both MP and FP close the communication channel.
 
+If the pre-forked job executor (see @lib/jqueue/zygote.py@) is running, MP
+connects to it instead of forking, sends it the job ID and receives the
+process ID and the lock file name of the executor's freshly forked child.
+The rest of the protocol is the same, starting at the MP updating the lock
+file name. If the executor can't be reached, MP falls back to forking.
+
  -}
 
 {-
@@ -61,6 +67,7 @@ module Ganeti.Query.Exec
   ( isForkSupported
   , forkJobProcess
   , forkPostHooksProcess
+  , startJobZygote
   ) where
 
 import Prelude ()
@@ -68,7 +75,7 @@ import Ganeti.Prelude
 
 import Control.Concurrent (rtsSupportsBoundThreads)
 import Control.Concurrent.Lifted (threadDelay)
-import Control.Exception (finally)
+import Control.Exception (finally, onException)
 import Control.Monad
 import Control.Monad.Error.Class (MonadError(..))
 import qualified Data.Map as M
@@ -131,6 +138,30 @@ rethrowAnnotateIOError desc =
   modifyIOError (\e -> annotateIOError e desc Nothing Nothing)
 
 
+-- | The environment of the Python processes started by luxid.
+pythonEnvironment :: IO [(String, String)]
+pythonEnvironment = do
+  use_debug <- isDebugMode
+  (M.toList
+   . M.insert "GNT_DEBUG" (if use_debug then "1" else "0")
+   . M.insert "PYTHONPATH" AC.versionedsharedir
+   . M.fromList)
+    `liftM` getEnvironment
+
+-- | Starts the pre-forked job executor. The executor exits by itself as
+-- soon as the calling process is gone. If it fails to start or dies, jobs
+-- are started by 'forkJobProcess' directly.
+startJobZygote :: IO ()
+startJobZygote = do
+  env <- pythonEnvironment
+  execPy <- P.jqueueZygotePy
+  logInfo $ "Starting the job executor " ++ execPy
+  void . forkProcess . withErrorLogAt CRITICAL "job executor" $ do
+    fds <- filter (> 2) <$> toErrorBase listOpenFds
+    mapM_ (tryIOError . closeFd) fds
+    () <- executeFile AC.pythonPath True [execPy] (Just env)
+    failError $ "Failed to execute " ++ AC.pythonPath ++ " " ++ execPy
+
 -- | Code that is executed in a @fork@-ed process. Performs communication with
 -- the parent process by calling commFn and then runs pyExecIO python
 -- executable.
@@ -177,16 +208,12 @@ runProcess jid s pyExecIO commFn = withErrorLogAt CRITICAL (show jid) $
     -- using the same protocol. We pass the job id as the first argument
     -- to the process. While the process never uses it, it's very convenient
     -- when listing job processes.
-    use_debug <- isDebugMode
-    env <- (M.insert "GNT_DEBUG" (if use_debug then "1" else "0")
-            . M.insert "PYTHONPATH" AC.versionedsharedir
-            . M.fromList)
-           `liftM` getEnvironment
+    env <- pythonEnvironment
     execPy <- pyExecIO
     logLater $ "Executing " ++ AC.pythonPath ++ " " ++ execPy
                ++ " with PYTHONPATH=" ++ AC.versionedsharedir
     () <- executeFile AC.pythonPath True [execPy, show (fromJobId jid)]
-                      (Just $ M.toList env)
+                      (Just env)
 
     failError $ "Failed to execute " ++ AC.pythonPath ++ " " ++ execPy
 
@@ -281,20 +308,30 @@ forkProcessCatchErrors runFn logFn commFn = do
 -- | Forks the job process and starts processing of the given job.
 -- Returns the livelock of the job and its process ID.
 forkJobProcess :: (FromString e, Show e)
-               => QueuedJob -- ^ a job to process
+               => Bool      -- ^ whether to use the pre-forked job executor
+               -> QueuedJob -- ^ a job to process
                -> FilePath  -- ^ the daemons own livelock file
                -> (FilePath -> ResultT e IO ())
                   -- ^ a callback function to update the livelock file
                   -- and process id in the job file
                -> ResultT e IO (FilePath, ProcessID)
-forkJobProcess job luxiLivelock update = do
+forkJobProcess useZygote job luxiLivelock update = do
 
   logDebug $ "Setting the lockfile temporarily to " ++ luxiLivelock
              ++ " for job " ++ jidStr
   update luxiLivelock
 
-  ForkJob ret <- forkProcessCatchErrors (childMain . qjId $ job) logDebugJob
-                                        parentMain
+  zygote <- if useZygote
+              then liftIO zygoteStart
+              else return Nothing
+  ForkJob ret <- case zygote of
+    Just (pid, master, lockfile) -> do
+      logDebugJob pid "Started by the job executor"
+      ResultT . execWriterLogT . runResultT
+        . flip catchError (\e -> zygoteAbort pid master >> throwError e)
+        $ finishStart pid master lockfile
+    Nothing ->
+      forkProcessCatchErrors (childMain . qjId $ job) logDebugJob parentMain
   return ret
   where
     -- Retrieve secret parameters if present
@@ -306,14 +343,21 @@ forkJobProcess job luxiLivelock update = do
     -- | Code performing communication with the child process. First, receive
     -- the livelock, then send necessary parameters to the python child.
     parentMain pid master = do
+      let msg = "Getting the lockfile of the client"
+      logDebugJob pid msg
+      lockfile <- liftIO . rethrowAnnotateIOError (jobLogPrefix pid ++ msg)
+                    $ recvMsg master
+      finishStart pid master lockfile
+
+    -- | Code performing the communication with the child process once
+    -- its livelock is known, regardless of how the child was started.
+    finishStart pid master lockfile = do
       let annotatedIO msg k = do
             logDebugJob pid msg
             liftIO $ rethrowAnnotateIOError (jobLogPrefix pid ++ msg) k
       let recv msg = annotatedIO msg (recvMsg master)
           send msg x = annotatedIO msg (sendMsg master x)
 
-      lockfile <- recv "Getting the lockfile of the client"
-
       logDebugJob pid ("Setting the lockfile to the final " ++ lockfile)
       toErrorBase $ update lockfile
       send "Confirming the client it can start" ""
@@ -329,6 +373,40 @@ forkJobProcess job luxiLivelock update = do
       liftIO $ closeClient master
       return $ ForkJob (lockfile, pid)
 
+    -- | Asks the pre-forked job executor to start the job. Returns the
+    -- process id and the livelock of the started process, together with
+    -- the connection to it. Any failure up to this point leaves the job
+    -- untouched, so we can fall back to forking the process ourselves.
+    zygoteStart :: IO (Maybe (ProcessID, Client, FilePath))
+    zygoteStart = do
+      path <- P.jobZygoteSocket
+      r <- tryIOError $ do
+        master <- connectClient connectConfig
+                                C.luxidJobZygoteConnectTimeout path
+        flip onException (closeClient master) $ do
+          sendMsg master jidStr
+          reply <- recvMsg master
+          case decodeStrict reply of
+            Ok (pid, lockfile) ->
+              return (fromIntegral (pid :: Int), master, lockfile)
+            Error e -> ioError . userError
+                         $ "Invalid reply from the job executor: " ++ e
+      case r of
+        Left e -> do
+          logDebug $ "Can't start job " ++ jidStr ++ " through the job"
+                     ++ " executor, forking a new process: " ++ show e
+          return Nothing
+        Right x -> return $ Just x
+
+    -- | Cleans up after a failed start through the job executor. The
+    -- process isn't our child, so it can't be waited for; it is asked to
+    -- terminate instead.
+    zygoteAbort pid master = do
+      logDebugJob pid "Closing the connection to the job process"
+      liftIO . void . tryIOError $ closeClient master
+      logDebugJob pid "Terminating the job process"
+      liftIO . void . tryIOError $ signalProcess sigTERM pid
+
     -- | Code performing communication with the parent process. During
     -- communication the livelock is created, locked and sent back
     -- to the parent.
@@ -391,7 +391,7 @@ handleCall _ _ cfg (QueryNetworks names fields lock) =
   handleClassicQuery cfg (Qlang.ItemTypeOpCode Qlang.QRNetwork)
     (map Left names) fields lock
 
-handleCall _ _ cfg (QueryConfigValues fields) = do
+handleCall _ qstat cfg (QueryConfigValues fields) = do
   let clusterProperty fn = showJSON . fn . configCluster $ cfg
   let params = [ ("cluster_name", return $ clusterProperty clusterClusterName)
                , ("watcher_pause", liftM (maybe JSNull showJSON)
@@ -403,6 +403,9 @@ handleCall _ _ cfg (QueryConfigValues fields) = do
                   return $ clusterProperty clusterModifySshSetup)
                , ("ssh_key_type", return $ clusterProperty clusterSshKeyType)
                , ("ssh_key_bits", return $ clusterProperty clusterSshKeyBits)
+               , ("job_replication", liftM showReplicationStats
+                                       . getReplicationStats
+                                       $ jqReplicator qstat)
                ] :: [(String, IO JSValue)]
   let answer = map (fromMaybe (return JSNull) . flip lookup params) fields
   answerEval <- sequence answer
@@ -477,6 +480,11 @@ handleCall _ _ cfg (SetWatcherPause time) = do
   _ <- executeRpcCall mcs $ RpcCallSetWatcherPause time
   return . Ok . maybe JSNull showJSON $ fmap TimeAsDoubleJSON time
 
+handleCall _ qstat cfg (ReplicateJobs jids) = do
+  let mcs = Config.getMasterCandidates cfg
+  result <- replicateJobsCoalesced (jqReplicator qstat) mcs jids
+  return $ genericResult (Bad . GenericError) (const $ Ok JSNull) result
+
 handleCall _ _ cfg (SetDrainFlag value) = do
   let mcs = Config.getMasterCandidates cfg
   fpath <- jobQueueDrainFile
@@ -634,7 +642,7 @@ checkMain = handleMasterVerificationOptions
 
 -- | Prepare function for luxid.
 prepMain :: PrepFn () PrepResult
-prepMain _ _ = do
+prepMain opts _ = do
   Exec.isForkSupported
     >>= flip exitUnless "The daemon must be compiled without -threaded"
 
@@ -643,7 +651,7 @@ prepMain _ _ = do
   s <- describeError "binding to the Luxi socket"
          Nothing (Just socket_path) $ getLuxiServer True socket_path
   cref <- newIORef (Bad "Configuration not yet loaded")
-  jq <- emptyJQStatus cref
+  jq <- emptyJQStatus cref $ optJobZygote opts
   return (s, cref, jq)
 
 -- | Main function.
@@ -668,6 +676,8 @@ main _ _ (server, cref, jq) = do
 
   _ <- P.installHandler P.sigCHLD P.Ignore Nothing
 
+  when (jqUseZygote jq) Exec.startJobZygote
+
   _ <- forkIO . void $ activateMasterIP
 
   initJQScheduler jq
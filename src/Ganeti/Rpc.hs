@@ -98,6 +98,7 @@ module Ganeti.Rpc
   , RpcResultExportList(..)
 
   , RpcCallJobqueueUpdate(..)
+  , RpcCallJobqueueUpdateMany(..)
   , RpcCallJobqueueRename(..)
   , RpcCallSetWatcherPause(..)
   , RpcCallSetDrainFlag(..)
@@ -389,6 +390,7 @@ $(buildObject "InstanceInfo" "instInfo"
   , simpleField "state"  [t| InstanceState |]
   , simpleField "vcpus"  [t| Int |]
   , simpleField "time"   [t| Int |]
+  , optionalField $ simpleField "error" [t| String |]
   ])
 
 -- This is optional here because the result may be empty if instance is
@@ -676,6 +678,28 @@ instance Rpc RpcCallJobqueueUpdate RpcResultJobQueueUpdate where
       _ -> Left $ JsonDecodeError
            ("Expected JSNull, got " ++ show (pp_value res))
 
+-- | Update several job queue files
+
+$(buildObject "RpcCallJobqueueUpdateMany" "rpcCallJobqueueUpdateMany"
+  [ simpleField "files" [t| [(String, String)] |]
+  ])
+
+$(buildObject "RpcResultJobQueueUpdateMany" "rpcResultJobQueueUpdateMany" [])
+
+instance RpcCall RpcCallJobqueueUpdateMany where
+  rpcCallName _          = "jobqueue_update_many"
+  rpcCallTimeout _       = rpcTimeoutToRaw Urgent
+  rpcCallAcceptOffline _ = False
+  rpcCallData _ call     = J.encode
+    [ map (second toCompressed) $ rpcCallJobqueueUpdateManyFiles call ]
+
+instance Rpc RpcCallJobqueueUpdateMany RpcResultJobQueueUpdateMany where
+  rpcResultFill _ res =
+    case res of
+      J.JSNull ->  Right RpcResultJobQueueUpdateMany
+      _ -> Left $ JsonDecodeError
+           ("Expected JSNull, got " ++ show (pp_value res))
+
 -- | Rename a file in the job queue
 
 $(buildObject "RpcCallJobqueueRename" "rpcCallJobqueueRename"
@@ -44,12 +44,13 @@ module Ganeti.WConfd.Core where
 import Control.Arrow ((&&&))
 import Control.Concurrent (myThreadId)
 import Control.Lens.Setter (set)
-import Control.Monad (liftM, unless)
+import Control.Monad (foldM, liftM, unless)
 import qualified Data.Map as M
 import qualified Data.Set as S
 import Language.Haskell.TH (Name)
 import System.Posix.Process (getProcessID)
 import qualified System.Random as Rand
+import qualified Text.JSON as JSON
 
 import Ganeti.BasicTypes
 import qualified Ganeti.Constants as C
@@ -62,6 +63,7 @@ import Ganeti.Locking.Locks ( GanetiLocks(ConfigLock, BGL)
                             , ClientType(ClientOther), ClientId(..) )
 import qualified Ganeti.Locking.Waiting as LW
 import Ganeti.Objects ( ConfigData, DRBDSecret, LogicalVolume, Ip4Address
+                      , configSerial
                       , configMaintenance, maintRoundDelay, maintJobs
                       , maintBalance, maintBalanceThreshold, maintEvacuated
                       , Incident, maintIncidents
@@ -96,6 +98,19 @@ checkConfigLock cid state = do
 readConfig :: WConfdMonad ConfigData
 readConfig = CW.readConfig
 
+-- | Return the configuration, unless its serial number is the given one.
+-- This allows clients that still hold a copy of the configuration to
+-- avoid transferring and parsing it again, if it is unchanged.
+sinceSerial :: Int -> ConfigData -> J.MaybeForJSON ConfigData
+sinceSerial serial cdata
+  | configSerial cdata == serial = J.MaybeForJSON Nothing
+  | otherwise                    = J.MaybeForJSON (Just cdata)
+
+-- | Read the configuration, if it has changed since the given serial
+-- number. Returns 'Nothing', if it is unchanged.
+readConfigSince :: Int -> WConfdMonad (J.MaybeForJSON ConfigData)
+readConfigSince serial = liftM (sinceSerial serial) CW.readConfig
+
 -- | Write the configuration, checking that an exclusive lock is held.
 -- If not, the call fails.
 writeConfig :: ClientId -> ConfigData -> WConfdMonad ()
@@ -139,6 +154,21 @@ lockConfig cid shared = do
         []  -> liftM Just CW.readConfig
         _   -> return Nothing
 
+-- | Like 'lockConfig', but only return the configuration if its serial
+-- number differs from the given one. The first component of the result
+-- tells whether the lock was acquired; the second one is the configuration,
+-- or 'Nothing' if it is unchanged (or the lock wasn't acquired).
+lockConfigSince
+    :: ClientId
+    -> Bool -- ^ set to 'True' if the lock should be shared
+    -> Int -- ^ serial number of the configuration the client holds
+    -> WConfdMonad (Bool, J.MaybeForJSON ConfigData)
+lockConfigSince cid shared serial = do
+  res <- lockConfig cid shared
+  return $ case J.unMaybeForJSON res of
+    Nothing    -> (False, J.MaybeForJSON Nothing)
+    Just cdata -> (True, sinceSerial serial cdata)
+
 -- | Release the config lock, if the client currently holds it.
 unlockConfig
   :: ClientId -> WConfdMonad ()
@@ -160,6 +190,69 @@ writeConfigAndUnlock cid cdata = do
                    ++ " the config lock"
       return False
 
+-- | Apply a partial update of the configuration, as sent by
+-- 'writeConfigDeltaAndUnlock', to a configuration.
+--
+-- The update is a JSON object whose members replace the top-level members
+-- of the configuration. For the object containers (instances, nodes, node
+-- groups, networks and disks) only the given entries are replaced, and
+-- a @null@ entry removes the object. The member @base_serial_no@ must
+-- match the serial number of the configuration the update is applied to.
+applyConfigDelta :: JSON.JSValue -> ConfigData -> JSON.Result ConfigData
+applyConfigDelta (JSON.JSObject delta) cdata = do
+  let members = JSON.fromJSObject delta
+      containers = ["instances", "nodes", "nodegroups", "networks", "disks"]
+      replace key value = ((key, value) :) . filter ((/= key) . fst)
+      patchContainer changes current =
+        let changed = S.fromList $ map fst changes
+        in filter ((`S.notMember` changed) . fst) current
+           ++ filter ((/= JSON.JSNull) . snd) changes
+      apply cfg (key, value)
+        | key == "base_serial_no" = return cfg
+        | key `elem` containers =
+            case (lookup key cfg, value) of
+              (Just (JSON.JSObject current), JSON.JSObject changes) ->
+                return $ replace key
+                  (JSON.JSObject . JSON.toJSObject $
+                     patchContainer (JSON.fromJSObject changes)
+                                    (JSON.fromJSObject current)) cfg
+              _ -> JSON.Error $ "Invalid update of " ++ key
+        | otherwise = return $ replace key value cfg
+  baseSerial <- maybe (JSON.Error "Missing base_serial_no") JSON.readJSON
+                  $ lookup "base_serial_no" members
+  unless (baseSerial == configSerial cdata) . JSON.Error $
+    "Configuration serial number changed from " ++ show baseSerial
+    ++ " to " ++ show (configSerial cdata)
+  current <- case JSON.showJSON cdata of
+               JSON.JSObject obj -> return $ JSON.fromJSObject obj
+               _ -> JSON.Error "Configuration is not a JSON object"
+  patched <- foldM apply current members
+  JSON.readJSON . JSON.JSObject $ JSON.toJSObject patched
+applyConfigDelta _ _ = JSON.Error "Configuration update is not a JSON object"
+
+-- | Apply a partial update of the configuration, if the config lock is held
+-- exclusively, and release the config lock. If the caller does not have
+-- the config lock, return False. If the update can't be applied, the
+-- configuration is left unchanged, the lock is kept and an error is
+-- returned, so that the caller can fall back to 'writeConfigAndUnlock'.
+writeConfigDeltaAndUnlock :: ClientId -> JSON.JSValue -> WConfdMonad Bool
+writeConfigDeltaAndUnlock cid delta = do
+  la <- readLockAllocation
+  if L.holdsLock cid ConfigLock L.OwnExclusive la
+    then do
+      cdata <- CW.readConfig
+      case applyConfigDelta delta cdata of
+        JSON.Ok cdata' -> do
+          CW.writeConfig cdata'
+          unlockConfig cid
+          return True
+        JSON.Error msg ->
+          failError $ "Can't apply configuration update: " ++ msg
+    else do
+      logWarning $ show cid ++ " tried writeConfigDeltaAndUnlock without"
+                   ++ " owning the config lock"
+      return False
+
 -- | Force the distribution of configuration without actually modifying it.
 -- It is not necessary to hold a lock for this operation.
 flushConfig :: WConfdMonad ()
@@ -418,11 +511,14 @@ exportedFunctions = [ 'echo
                     , 'prepareClusterDestruction
                     -- config
                     , 'readConfig
+                    , 'readConfigSince
                     , 'writeConfig
                     , 'verifyConfig
                     , 'lockConfig
+                    , 'lockConfigSince
                     , 'unlockConfig
                     , 'writeConfigAndUnlock
+                    , 'writeConfigDeltaAndUnlock
                     , 'flushConfig
                     , 'flushConfigGroup
                     , 'maintenanceRoundDelay
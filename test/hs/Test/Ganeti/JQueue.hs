@@ -273,6 +273,21 @@ prop_extractOpSummary meta i =
           jsinval = showJSON i
           invalid = "INVALID_OP"
 
+-- | Tests that 'addReplicationBatch' accounts for all batches.
+prop_addReplicationBatch :: [(NonNegative Int, NonNegative Integer)]
+                         -> Property
+prop_addReplicationBatch batches =
+  let sizes = map (getNonNegative . fst) batches
+      latencies = map (getNonNegative . snd) batches
+      stats = foldl (flip $ uncurry addReplicationBatch) emptyReplicationStats
+                $ zip sizes latencies
+  in conjoin [ rsBatches stats ==? length batches
+             , rsFiles stats ==? sum sizes
+             , rsMaxBatch stats ==? maximum (0 : sizes)
+             , rsTotalLatency stats ==? sum latencies
+             , rsMaxLatency stats ==? maximum (0 : latencies)
+             ]
+
 testSuite "JQueue"
             [ 'case_JobPriorityDef
             , 'prop_JobPriority
@@ -284,4 +299,5 @@ testSuite "JQueue"
             , 'prop_DetermineDirs
             , 'prop_InputOpCode
             , 'prop_extractOpSummary
+            , 'prop_addReplicationBatch
             ]
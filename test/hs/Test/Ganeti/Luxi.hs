@@ -109,6 +109,7 @@ instance Arbitrary Luxi.LuxiOp where
                                    arbitrary
       Luxi.ReqSetDrainFlag -> Luxi.SetDrainFlag <$> arbitrary
       Luxi.ReqSetWatcherPause -> Luxi.SetWatcherPause <$> arbitrary
+      Luxi.ReqReplicateJobs -> Luxi.ReplicateJobs <$> arbitrary
 
 -- | Simple check that encoding/decoding of LuxiOp works.
 prop_CallEncoding :: Luxi.LuxiOp -> Property
@@ -69,7 +69,7 @@ createInstance name pnodeUuid adminState adminStateSource =
 
 -- | A fake InstanceInfo to be used to check values.
 fakeInstanceInfo :: InstanceInfo
-fakeInstanceInfo = InstanceInfo 0 InstanceStateRunning 0 0
+fakeInstanceInfo = InstanceInfo 0 InstanceStateRunning 0 0 Nothing
 
 -- | Erroneous node response - the exact error does not matter.
 responseError :: String -> (String, ERpcError a)
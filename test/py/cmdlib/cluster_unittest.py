@@ -1436,6 +1436,31 @@ class TestLUClusterVerifyGroupVerifyNodeTime(TestLUClusterVerifyGroupMethods):
     self.mcpu.assertLogIsEmpty()
 
 
+class TestLUClusterVerifyGroupVerifyNodeTimings(
+        TestLUClusterVerifyGroupMethods):
+  @withLockedLU
+  def testMissingTimings(self, lu):
+    for ndata in [{}, {constants.NV_TIMINGS: "invalid"}]:
+      lu._VerifyNodeTimings(self.master, ndata)
+    self.mcpu.assertLogIsEmpty()
+
+  @withLockedLU
+  def testFastSections(self, lu):
+    lu._VerifyNodeTimings(self.master, {
+      constants.NV_TIMINGS: {"nodelist": 1.5, "drbd": 0.1},
+      })
+    self.mcpu.assertLogIsEmpty()
+
+  @withLockedLU
+  def testSlowSections(self, lu):
+    lu._VerifyNodeTimings(self.master, {
+      constants.NV_TIMINGS: {"nodelist": 12.5, "node-net-test": 31.0,
+                             "drbd": 0.1},
+      })
+    self.mcpu.assertLogContainsRegex(r"node-net-test \(31.0s\), nodelist"
+                                     r" \(12.5s\)")
+
+
 class TestLUClusterVerifyGroupUpdateVerifyNodeLVM(
         TestLUClusterVerifyGroupMethods):
   def setUp(self):
@@ -96,3 +96,6 @@ class WConfdMock(object):
 
   def Client(self):
     return MockClient(self)
+
+  def GetSharedClient(self):
+    return self.Client()
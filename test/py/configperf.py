@@ -0,0 +1,198 @@
+#!/usr/bin/python
+#
+
+# Copyright (C) 2015 Google Inc.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+#
+# 1. Redistributions of source code must retain the above copyright notice,
+# this list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright
+# notice, this list of conditions and the following disclaimer in the
+# documentation and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS
+# IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED
+# TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR
+# PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR
+# CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+# EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+# PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR
+# PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF
+# LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
+# NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+"""Script for testing the performance of loading and storing the config"""
+
+import optparse
+import random
+import time
+
+from ganeti import errors
+from ganeti import objects
+from ganeti import outils
+from ganeti import serializer
+
+from testutils.config_mock import ConfigMock
+
+
+def ParseOptions():
+  """Parses the command line options.
+
+  In case of command line errors, it will show the usage and exit the
+  program.
+
+  @return: the options in a tuple
+
+  """
+  parser = optparse.OptionParser()
+  parser.add_option("-n", dest="counts", default="1000,10000",
+                    help="Comma-separated numbers of instances"
+                    " (default: %default)", metavar="NUMS")
+  parser.add_option("--nodes", dest="node_count", default=40, type="int",
+                    help="Number of nodes (default: %default)", metavar="NUM")
+  parser.add_option("-r", dest="repeat", default=3, type="int",
+                    help="Number of runs per operation", metavar="NUM")
+
+  (opts, args) = parser.parse_args()
+
+  if opts.repeat < 1:
+    parser.error("Number of runs must be at least 1")
+
+  if opts.node_count < 1:
+    parser.error("Number of nodes must be at least 1")
+
+  try:
+    opts.counts = [int(i) for i in opts.counts.split(",")]
+  except ValueError, err:
+    parser.error("Invalid number of instances: %s" % err)
+
+  return (opts, args)
+
+
+def _LegacyGetAllSlots(cls):
+  slots = []
+  for parent in cls.__mro__:
+    slots.extend(getattr(parent, "__slots__", []))
+  return slots
+
+
+def _LegacyToDict(self, _with_private=False):
+  result = {}
+  for name in self.GetAllSlots():
+    value = getattr(self, name, None)
+    if value is not None:
+      result[name] = value
+  return result
+
+
+def _LegacyFromDict(cls, val):
+  if not isinstance(val, dict):
+    raise errors.ConfigurationError("Invalid object passed to FromDict:"
+                                    " expected dict, got %s" % type(val))
+  val_str = dict([(str(k), v) for k, v in val.iteritems()])
+  return cls(**val_str) # pylint: disable=W0142
+
+
+class _LegacyCodec(object):
+  """Makes config objects use the slot handling of previous versions.
+
+  Slots are computed for every call and every attribute is looked up by
+  name, the way L{objects.ConfigObject} used to convert objects.
+
+  """
+  _REPLACEMENTS = [
+    (outils.ValidatedSlots, "GetAllSlots", classmethod(_LegacyGetAllSlots)),
+    (outils.ValidatedSlots, "GetAllSlotsSet", classmethod(_LegacyGetAllSlots)),
+    (objects.ConfigObject, "ToDict", _LegacyToDict),
+    (objects.ConfigObject, "FromDict", classmethod(_LegacyFromDict)),
+    ]
+
+  def __init__(self):
+    self._saved = None
+
+  def __enter__(self):
+    self._saved = [(cls, name, cls.__dict__[name])
+                   for (cls, name, _) in self._REPLACEMENTS]
+
+    for (cls, name, value) in self._REPLACEMENTS:
+      setattr(cls, name, value)
+
+  def __exit__(self, *_):
+    for (cls, name, value) in self._saved:
+      setattr(cls, name, value)
+
+
+def _BuildConfig(count, opts):
+  """Builds a serialized configuration with the given number of instances.
+
+  Every instance has a plain disk and a NIC.
+
+  @rtype: string
+
+  """
+  rnd = random.Random(count)
+
+  cfg = ConfigMock()
+  nodes = [cfg.AddNewNode() for _ in range(opts.node_count)]
+
+  for _ in range(count):
+    cfg.AddNewInstance(primary_node=rnd.choice(nodes))
+
+  return serializer.DumpJson(cfg._ConfigData().ToDict()) # pylint: disable=W0212
+
+
+def _Measure(text, opts):
+  """Measures the time needed to load, store and copy a configuration.
+
+  @return: tuple of the best load, store and copy time in seconds and the
+    stored configuration
+
+  """
+  load = []
+  store = []
+  copy = []
+
+  for _ in range(opts.repeat):
+    start = time.time()
+    data = objects.ConfigData.FromDict(serializer.LoadJson(text))
+    load.append(time.time() - start)
+
+    start = time.time()
+    result = serializer.DumpJson(data.ToDict())
+    store.append(time.time() - start)
+
+    start = time.time()
+    data.Copy()
+    copy.append(time.time() - start)
+
+  return (min(load), min(store), min(copy), result)
+
+
+def main():
+  (opts, _) = ParseOptions()
+
+  print ("%8s %-6s %14s %14s %8s" %
+         ("Count", "Op", "Old (ms)", "New (ms)", "Speedup"))
+  for count in opts.counts:
+    text = _BuildConfig(count, opts)
+
+    with _LegacyCodec():
+      old = _Measure(text, opts)
+    new = _Measure(text, opts)
+    assert serializer.LoadJson(old[-1]) == serializer.LoadJson(new[-1])
+
+    for (idx, name) in enumerate(["load", "store", "copy"]):
+      print ("%8d %-6s %14.2f %14.2f %7.1fx" %
+             (count, name, 1000.0 * old[idx], 1000.0 * new[idx],
+              old[idx] / max(new[idx], 1e-9)))
+
+
+if __name__ == "__main__":
+  main()
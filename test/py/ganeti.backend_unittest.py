@@ -42,6 +42,7 @@ import testutils_ssh
 import unittest
 
 from ganeti import backend
+from ganeti import compat
 from ganeti import constants
 from ganeti import errors
 from ganeti import hypervisor
@@ -155,6 +156,31 @@ class TestNodeVerify(testutils.GanetiTestCase):
     self.failIf(result[constants.NV_MASTERIP],
                 "Result from netutils.TcpPing corrupted")
 
+  @testutils.patch_object(netutils.Hostname, "GetSysName")
+  @testutils.patch_object(netutils, "TcpPing")
+  def testNodeNetTest(self, tcp_ping, get_sys_name):
+    get_sys_name.return_value = "node1"
+    unreachable = frozenset(["192.0.2.3", "198.51.100.2"])
+    tcp_ping.side_effect = lambda ip, port, source=None: ip not in unreachable
+    nodes = [("node%d" % i, "192.0.2.%d" % i, "198.51.100.%d" % i)
+             for i in range(1, 5)]
+    result = backend.VerifyNode({constants.NV_NODENETTEST: nodes,
+                                 constants.NV_TIMINGS: None}, None, {})
+    self.assertEqual(result[constants.NV_NODENETTEST], {
+      "node2": "failure using the secondary interface(s)",
+      "node3": "failure using the primary interface(s)",
+      })
+    self.assertEqual(tcp_ping.call_count, 8)
+    timings = result[constants.NV_TIMINGS]
+    self.assertTrue("node-net-test" in timings)
+    self.assertTrue(compat.all(timing >= 0 for timing in timings.values()))
+
+  @testutils.patch_object(netutils.Hostname, "GetSysName")
+  def testNoTimings(self, get_sys_name):
+    get_sys_name.return_value = "node1"
+    result = backend.VerifyNode({}, None, {})
+    self.assertFalse(constants.NV_TIMINGS in result)
+
   def testVerifyHvparams(self):
     test_hvparams = {constants.HV_XEN_CMD: constants.XEN_CMD_XL}
     test_what = {constants.NV_HVPARAMS: \
@@ -673,6 +699,39 @@ class TestGetInstanceList(unittest.TestCase):
     self._test_hv.ListInstances.assert_called_with(hvparams=fake_hvparams)
 
 
+class TestGetAllInstancesInfo(unittest.TestCase):
+
+  def setUp(self):
+    self._test_hv = mock.Mock()
+    self._test_hv.GetAllInstancesInfo.return_value = [
+      ("inst1", 100, 256, 2, hypervisor.hv_base.HvInstanceState.RUNNING, 0),
+      ("inst2", 101, 128, 1, hypervisor.hv_base.HvInstanceState.RUNNING, 0,
+       "The monitor didn't answer"),
+      ]
+
+  def test(self):
+    with mock.patch("ganeti.hypervisor.GetHypervisor",
+                    return_value=self._test_hv):
+      result = backend.GetAllInstancesInfo([constants.HT_KVM],
+                                           {constants.HT_KVM: {}})
+
+    self.assertEqual(result, {
+      "inst1": {
+        "memory": 256,
+        "vcpus": 2,
+        "state": hypervisor.hv_base.HvInstanceState.RUNNING,
+        "time": 0,
+        },
+      "inst2": {
+        "memory": 128,
+        "vcpus": 1,
+        "state": hypervisor.hv_base.HvInstanceState.RUNNING,
+        "time": 0,
+        "error": "The monitor didn't answer",
+        },
+      })
+
+
 class TestInstanceConsoleInfo(unittest.TestCase):
 
   def setUp(self):
@@ -938,6 +997,76 @@ class TestSpaceReportingConstants(unittest.TestCase):
       self.assertEqual(None, backend._STORAGE_TYPE_INFO_FN[storage_type])
 
 
+class TestRunSshUpdates(unittest.TestCase):
+
+  def setUp(self):
+    self.calls = []
+
+  def _Update(self, node, failures=0, exc=errors.OpExecError):
+    def fn():
+      self.calls.append(node)
+      if self.calls.count(node) <= failures:
+        raise exc("Update of node %s failed" % node)
+    return fn
+
+  def testEmpty(self):
+    self.assertEqual(backend._RunSshUpdates([]), {})
+
+  def testSuccess(self):
+    nodes = ["node%d" % i for i in range(10)]
+    updates = [(node, self._Update(node), 3) for node in nodes]
+    self.assertEqual(backend._RunSshUpdates(updates, max_parallel=4), {})
+    self.assertEqual(sorted(self.calls), sorted(nodes))
+
+  def testRetryDoesNotBlockOtherNodes(self):
+    updates = [
+      ("node1", self._Update("node1", failures=1), 3),
+      ("node2", self._Update("node2"), 3),
+      ("node3", self._Update("node3"), 3),
+      ]
+    self.assertEqual(backend._RunSshUpdates(updates, max_parallel=1,
+                                            backoff=0.05), {})
+    self.assertEqual(self.calls, ["node1", "node2", "node3", "node1"])
+
+  def testGiveUp(self):
+    updates = [
+      ("node1", self._Update("node1", failures=10), 3),
+      ("node2", self._Update("node2", failures=10), 1),
+      ("node3", self._Update("node3", failures=2), 3),
+      ]
+    failures = backend._RunSshUpdates(updates, backoff=0.01)
+    self.assertEqual(sorted(failures.keys()), ["node1", "node2"])
+    self.assertEqual(failures["node1"][0], 3)
+    self.assertTrue(isinstance(failures["node1"][1], errors.OpExecError))
+    self.assertEqual(failures["node2"][0], 1)
+    self.assertEqual(self.calls.count("node1"), 3)
+    self.assertEqual(self.calls.count("node3"), 3)
+
+  def testDeadline(self):
+    updates = [("node1", self._Update("node1", failures=10), 3)]
+    failures = backend._RunSshUpdates(updates, backoff=5, timeout=1)
+    self.assertEqual(failures["node1"][0], 1)
+    self.assertEqual(self.calls, ["node1"])
+
+  def testOtherException(self):
+    updates = [
+      ("node1", self._Update("node1", failures=1, exc=errors.ProgrammerError),
+       3),
+      ("node2", self._Update("node2"), 3),
+      ]
+    self.assertRaises(errors.ProgrammerError, backend._RunSshUpdates,
+                      updates, max_parallel=1)
+    self.assertEqual(self.calls, ["node1"])
+
+  def testAttemptTimeout(self):
+    run_cmd_fn = mock.Mock()
+    fn = backend._SshUpdateFn(run_cmd_fn, "cluster", "node1", 22, {}, False,
+                              False)
+    fn()
+    self.assertEqual(run_cmd_fn.call_args[1]["timeout"],
+                     backend._SSH_UPDATE_ATTEMPT_TIMEOUT)
+
+
 class TestAddRemoveGenerateNodeSshKey(testutils.GanetiTestCase):
 
   _CLUSTER_NAME = "mycluster"
@@ -1002,6 +1131,11 @@ class TestAddRemoveGenerateNodeSshKey(testutils.GanetiTestCase):
     self._time_sleep_mock = \
         self._time_sleep_patcher.start()
 
+    # Retry failed SSH key file updates right away
+    self._ssh_update_backoff_patcher = testutils \
+        .patch_object(backend, "_SSH_UPDATE_BACKOFF", 0)
+    self._ssh_update_backoff_patcher.start()
+
     self.noded_cert_file = testutils.TestDataFilename("cert1.pem")
 
     self._SetupTestData()
@@ -1015,6 +1149,7 @@ class TestAddRemoveGenerateNodeSshKey(testutils.GanetiTestCase):
     self._ssh_query_pub_key_file_patcher.stop()
     self._ssh_replace_name_by_uuid_patcher.stop()
     self._time_sleep_patcher.stop()
+    self._ssh_update_backoff_patcher.stop()
     self._TearDownTestData()
 
   def _SetupTestData(self, number_of_nodes=15, number_of_pot_mcs=5,
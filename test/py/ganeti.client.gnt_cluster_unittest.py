@@ -472,5 +472,133 @@ class TestBuildGanetiPubKeys(testutils.GanetiTestCase):
     self.assertFalse("Pink Bunny" in self.pub_key_filename)
 
 
+class TestCopyFileToNodes(unittest.TestCase):
+  def setUp(self):
+    self.copies = []
+    self.nodes = ["node%d" % i for i in range(1, 6)]
+
+  def _Copy(self, source, node, fail=frozenset()):
+    self.copies.append((source, node))
+    return (source, node) not in fail
+
+  def testNoNodes(self):
+    self.assertEqual(gnt_cluster._CopyFileToNodes(self._Copy, [], set(), 4),
+                     [])
+    self.assertEqual(self.copies, [])
+
+  def testFromMaster(self):
+    fail = frozenset([(None, "node2"), (None, "node4")])
+    failed = gnt_cluster._CopyFileToNodes(
+      compat.partial(self._Copy, fail=fail), self.nodes, set(), 3)
+    self.assertEqual(failed, ["node2", "node4"])
+    self.assertEqual(sorted(self.copies),
+                     [(None, node) for node in self.nodes])
+
+  def testRelays(self):
+    failed = gnt_cluster._CopyFileToNodes(self._Copy, self.nodes,
+                                          set(["node1", "node2"]), 1)
+    self.assertEqual(failed, [])
+    self.assertEqual(self.copies, [
+      (None, "node1"),
+      ("node1", "node2"),
+      ("node1", "node3"),
+      ("node1", "node4"),
+      ("node1", "node5"),
+      ])
+
+  def testRelaysInParallel(self):
+    failed = gnt_cluster._CopyFileToNodes(self._Copy, self.nodes,
+                                          set(self.nodes), 4)
+    self.assertEqual(failed, [])
+    self.assertEqual(sorted(node for (_, node) in self.copies), self.nodes)
+    self.assertEqual(self.copies[0], (None, "node1"))
+
+  def testRelayFailure(self):
+    fail = frozenset([("node1", "node3"), (None, "node4"), ("node1", "node4")])
+    failed = gnt_cluster._CopyFileToNodes(
+      compat.partial(self._Copy, fail=fail), self.nodes, set(["node1"]), 1)
+    self.assertEqual(failed, ["node4"])
+    self.assertEqual(self.copies, [
+      (None, "node1"),
+      ("node1", "node2"),
+      ("node1", "node3"),
+      ("node1", "node4"),
+      ("node1", "node5"),
+      (None, "node3"),
+      (None, "node4"),
+      ])
+
+
+class _FakeRunResult(object):
+  def __init__(self, output, exit_code):
+    self.output = output
+    self.failed = exit_code != 0
+    if self.failed:
+      self.fail_reason = "exited with exit code %s" % exit_code
+    else:
+      self.fail_reason = None
+
+
+class TestRunClusterCommandParallel(unittest.TestCase):
+  def setUp(self):
+    self.exit_codes = {
+      "node1": 0,
+      "node2": 1,
+      "master": 0,
+      }
+    self.started = []
+
+  def _Run(self, name, line_fn):
+    self.started.append(name)
+    output = "%s line 1\n%s line 2" % (name, name)
+    if line_fn:
+      for line in output.splitlines():
+        line_fn(line)
+    return _FakeRunResult(output, self.exit_codes[name])
+
+  @mock.patch("ganeti.client.gnt_cluster.ToStdout")
+  def testStreaming(self, to_stdout):
+    failed = gnt_cluster._RunClusterCommandParallel(
+      self._Run, ["node1", "node2", "master"], "master", 4, False)
+    self.assertEqual(failed, [("node2", "exited with exit code 1")])
+    self.assertEqual(self.started[-1], "master")
+    lines = [args[1:] for (args, _) in to_stdout.call_args_list]
+    self.assertEqual(len(lines), 6)
+    self.assertTrue(("master", "master line 2") in lines)
+
+  @mock.patch("ganeti.client.gnt_cluster.ToStdout")
+  def testFailureOnly(self, to_stdout):
+    failed = gnt_cluster._RunClusterCommandParallel(
+      self._Run, ["node1", "node2", "master"], "master", 2, True)
+    self.assertEqual(failed, [("node2", "exited with exit code 1")])
+    lines = [args[1:] for (args, _) in to_stdout.call_args_list]
+    self.assertEqual(lines, [("node2", "node2 line 1"),
+                             ("node2", "node2 line 2")])
+
+  @mock.patch("ganeti.client.gnt_cluster.ToStdout")
+  def testNoNodes(self, to_stdout):
+    self.assertEqual(
+      gnt_cluster._RunClusterCommandParallel(self._Run, [], "master", 4,
+                                             False), [])
+    self.assertFalse(to_stdout.called)
+
+  @mock.patch("ganeti.client.gnt_cluster.ToStdout")
+  def testMasterByName(self, to_stdout):
+    self.exit_codes["node3"] = 2
+    failed = gnt_cluster._RunClusterCommandParallel(
+      self._Run, ["master", "node2", "node3"], "master", 4, True)
+    self.assertEqual(self.started[-1], "master")
+    self.assertEqual(failed, [("node2", "exited with exit code 1"),
+                              ("node3", "exited with exit code 2")])
+
+    # Without the master node, the last node is not special
+    self.started = []
+    self.exit_codes["node3"] = 0
+    failed = gnt_cluster._RunClusterCommandParallel(
+      self._Run, ["node1", "node2", "node3"], "master", 1, True)
+    self.assertEqual(self.started, ["node1", "node2", "node3"])
+    self.assertEqual(failed, [("node2", "exited with exit code 1")])
+
+
 if __name__ == "__main__":
   testutils.GanetiTestProgram()
@@ -622,6 +622,138 @@ class TestConfigRunner(unittest.TestCase):
     cfg.RemoveNodeFromCandidateCerts(node_uuid, warn_fn=None)
     self.assertEqual(0, len(cfg.GetCandidateCerts()))
 
+  def testConfigDelta(self):
+    cfg = self._get_object()
+    node_uuid = cfg.GetMasterNode()
+
+    with cfg.GetConfigManager():
+      self.assertEqual(cfg._GetConfigDelta(), None)
+
+      # Offline configurations are always written as a whole
+      cfg.SetVGName("myvg")
+      self.assertEqual(cfg._GetConfigDelta(), None)
+
+      base_serial = cfg._ConfigData().serial_no
+      cfg._base_serial = base_serial
+      cfg.AddNodeToCandidateCerts(node_uuid, "foobar",
+                                  warn_fn=None, info_fn=None)
+      cfg._MarkDirty("nodes", node_uuid)
+      cfg._MarkDirty("nodes", "removed-uuid")
+      delta = cfg._GetConfigDelta()
+      self.assertEqual(delta["base_serial_no"], base_serial)
+      self.assertEqual(delta["cluster"]["volume_group_name"], "myvg")
+      self.assertEqual(delta["cluster"]["candidate_certs"],
+                       {node_uuid: "foobar"})
+      self.assertEqual(delta["nodes"]["removed-uuid"], None)
+      self.assertEqual(delta["nodes"][node_uuid]["uuid"], node_uuid)
+      self.assertFalse("instances" in delta)
+
+      cfg._RequireFullWrite()
+      self.assertEqual(cfg._GetConfigDelta(), None)
+
+    # Modifications are forgotten when the lock is acquired again
+    with cfg.GetConfigManager():
+      cfg._base_serial = cfg._ConfigData().serial_no
+      self.assertEqual(cfg._GetConfigDelta(), None)
+
+  def testUnwrittenChangesDropped(self):
+    data = serializer.Load(utils.ReadFile(self.cfg_file))
+
+    def _ReadSince(serial):
+      if serial == data["serial_no"]:
+        return None
+      return serializer.Load(serializer.DumpJson(data))
+
+    wconfd = mock.Mock()
+    wconfd.ReadConfigSince.side_effect = _ReadSince
+    wconfd.LockConfigSince.side_effect = \
+      lambda _ctx, _shared, serial: (True, _ReadSince(serial))
+    cfg = config.ConfigWriter(cfg_file=self.cfg_file,
+                              _getents=_StubGetEntResolver,
+                              wconfd=wconfd, wconfdcontext="ctx")
+
+    # Modify an object without writing the configuration, e.g. in an LU
+    # which fails before committing its changes
+    node = cfg.GetNodeInfo(cfg.GetNodeList()[0])
+    node.offline = not node.offline
+
+    def _FailedUpdate():
+      with cfg.GetConfigManager():
+        node.drained = True
+        raise errors.OpExecError("Failed")
+
+    self.assertRaises(errors.OpExecError, _FailedUpdate)
+    self.assertEqual(wconfd.UnlockConfig.call_count, 1)
+    self.assertFalse(wconfd.WriteConfig.called)
+    self.assertFalse(wconfd.WriteConfigAndUnlock.called)
+
+    # The next lock holder must not see the changes, so the configuration
+    # is transferred again even though it is unchanged
+    cfg.OutDate()
+    with cfg.GetConfigManager():
+      fresh = cfg._UnlockedGetNodeInfo(node.uuid)
+    self.assertEqual(wconfd.LockConfigSince.call_args[0][2], -1)
+    self.assertFalse(fresh is node)
+    self.assertNotEqual(fresh.offline, node.offline)
+    self.assertFalse(fresh.drained)
+
+    cfg.OutDate()
+    self.assertNotEqual(cfg.GetNodeInfo(node.uuid).offline, node.offline)
+    wconfd.ReadConfigSince.assert_called_with(-1)
+
+  def testConfigSnapshot(self):
+    data = serializer.Load(utils.ReadFile(self.cfg_file))
+
+    def _ReadSince(serial):
+      if serial == data["serial_no"]:
+        return None
+      return serializer.Load(serializer.DumpJson(data))
+
+    def _NewConfig():
+      wconfd = mock.Mock()
+      wconfd.ReadConfigSince.side_effect = _ReadSince
+      cfg = config.ConfigWriter(cfg_file=self.cfg_file,
+                                _getents=_StubGetEntResolver,
+                                wconfd=wconfd, wconfdcontext="ctx")
+      return (cfg, wconfd)
+
+    (cfg, wconfd) = _NewConfig()
+    snapshot = cfg.GetConfigSnapshot()
+    snapshot_data = cfg._ConfigData()
+    self.assertTrue(cfg.IsConfigSnapshotCurrent(snapshot))
+    wconfd.ReadConfigSince.assert_called_with(data["serial_no"])
+
+    # The next ConfigWriter starts with the snapshot
+    config.SetConfigSnapshot(snapshot)
+    (cfg, wconfd) = _NewConfig()
+    cfg.GetClusterName()
+    wconfd.ReadConfigSince.assert_called_with(data["serial_no"])
+    self.assertTrue(cfg._ConfigData() is snapshot_data)
+
+    # Its objects are used only once
+    cfg.OutDate()
+    cfg.GetClusterName()
+    wconfd.ReadConfigSince.assert_called_with(-1)
+    self.assertFalse(cfg._ConfigData() is snapshot_data)
+    self.assertEqual(cfg._ConfigData(), snapshot_data)
+
+    # .. and only by the next ConfigWriter
+    (cfg, wconfd) = _NewConfig()
+    cfg.GetClusterName()
+    wconfd.ReadConfigSince.assert_called_with(-1)
+    self.assertFalse(cfg._ConfigData() is snapshot_data)
+
+    data["serial_no"] += 1
+    self.assertFalse(cfg.IsConfigSnapshotCurrent(snapshot))
+
+    # A snapshot which isn't current anymore isn't used
+    config.SetConfigSnapshot(snapshot)
+    (cfg, wconfd) = _NewConfig()
+    cfg.GetClusterName()
+    wconfd.ReadConfigSince.assert_called_with(data["serial_no"] - 1)
+    self.assertFalse(cfg._ConfigData() is snapshot_data)
+    self.assertEqual(cfg._ConfigData().serial_no, data["serial_no"])
+
   def testAttachDetachDisks(self):
     """Test if the attach/detach wrappers work properly.
 
@@ -32,6 +32,10 @@
 
 
 import os
+import re
+import errno
+import signal
+import socket
 import unittest
 import time
 import tempfile
@@ -346,6 +350,193 @@ class TestReadPasswordFile(unittest.TestCase):
     self.assertEqual(users["user2"].options, ["write", "read"])
 
 
+class _EchoHandler(http.server.HttpServerHandler):
+  def HandleRequest(self, req):
+    if req.request_path == "/fail":
+      raise http.HttpNotFound()
+    return req.request_body
+
+
+class _FakeMessageReader:
+  def __init__(self, peer_will_close):
+    self.peer_will_close = peer_will_close
+
+
+class TestResponderKeepAlive(unittest.TestCase):
+  def _Respond(self, path, body, keep_alive, peer_will_close):
+    msg = http.HttpMessage()
+    msg.start_line = http.HttpClientToServerStartLine("POST", path,
+                                                      http.HTTP_1_1)
+    msg.headers = {
+      http.HTTP_HOST: "localhost",
+      }
+    msg.body = body
+    reader = _FakeMessageReader(peer_will_close)
+    responder = http.server.HttpResponder(_EchoHandler())
+    (_, _, _, response) = responder(lambda: (msg, reader),
+                                    keep_alive=keep_alive)
+    return response
+
+  def testDefault(self):
+    response = self._Respond("/", "data", False, False)
+    self.assertEqual(response.start_line.code, http.HTTP_OK)
+    self.assertEqual(response.headers[http.HTTP_CONNECTION], "close")
+    self.assertFalse(http.HTTP_CONTENT_LENGTH in response.headers)
+
+  def testKeepAlive(self):
+    for body in ["", "data", "x" * 1000]:
+      response = self._Respond("/", body, True, False)
+      self.assertEqual(response.headers[http.HTTP_CONNECTION], "keep-alive")
+      self.assertEqual(response.headers[http.HTTP_CONTENT_LENGTH], len(body))
+
+  def testPeerWillClose(self):
+    response = self._Respond("/", "data", True, True)
+    self.assertEqual(response.headers[http.HTTP_CONNECTION], "close")
+
+  def testError(self):
+    response = self._Respond("/fail", "data", True, False)
+    self.assertEqual(response.start_line.code, http.HttpNotFound.code)
+    self.assertEqual(response.headers[http.HTTP_CONNECTION], "close")
+
+
+class _FakeServer:
+  using_ssl = False
+
+
+def _FormatRequest(path, body):
+  return ("POST %s HTTP/1.1\r\nHost: localhost\r\nContent-Length: %s\r\n"
+          "\r\n%s" % (path, len(body), body))
+
+
+class TestRequestExecutorKeepAlive(unittest.TestCase):
+  def _Serve(self, data):
+    """Sends requests over a persistent connection.
+
+    @return: Executor (or exception) and data sent back to the client
+
+    """
+    (server_sock, client_sock) = socket.socketpair()
+    try:
+      client_sock.sendall(data)
+      client_sock.shutdown(socket.SHUT_WR)
+
+      try:
+        result = http.server.HttpServerRequestExecutor(_FakeServer(),
+                                                       _EchoHandler(),
+                                                       server_sock,
+                                                       ("192.0.2.1", 1234),
+                                                       keep_alive=True)
+      except http.HttpError, err:
+        result = err
+
+      response = ""
+      while True:
+        data = client_sock.recv(4096)
+        if not data:
+          break
+        response += data
+    finally:
+      server_sock.close()
+      client_sock.close()
+
+    return (result, response)
+
+  @staticmethod
+  def _GetCodes(response):
+    return [int(code) for code in
+            re.findall(r"HTTP/\d\.\d (\d+) ", response)]
+
+  def testPipelined(self):
+    (executor, response) = self._Serve(_FormatRequest("/", "first") +
+                                       _FormatRequest("/", "second"))
+    self.assertEqual(executor.requests_handled, 2)
+    self.assertEqual(self._GetCodes(response), [http.HTTP_OK, http.HTTP_OK])
+    self.assertTrue(response.index("first") < response.index("second"))
+
+  def testMalformedSecondRequest(self):
+    (executor, response) = self._Serve(_FormatRequest("/", "first") +
+                                       "BOGUS\r\n\r\n" +
+                                       _FormatRequest("/", "third"))
+    self.assertEqual(executor.requests_handled, 2)
+    self.assertEqual(self._GetCodes(response),
+                     [http.HTTP_OK, http.HttpBadRequest.code])
+    self.assertFalse("third" in response)
+
+  def testTruncatedSecondRequest(self):
+    (err, response) = self._Serve(_FormatRequest("/", "first") +
+                                  "POST / HTTP/1.1\r\nHost: localhost\r\n")
+    self.assertTrue(isinstance(err, http.HttpError))
+    self.assertFalse(isinstance(err, http.HttpNoMessage))
+    self.assertEqual(self._GetCodes(response), [http.HTTP_OK])
+
+  def testNoRequest(self):
+    (err, response) = self._Serve("")
+    self.assertTrue(isinstance(err, http.HttpNoMessage))
+    self.assertEqual(response, "")
+
+
+class _FakeListeningSocket:
+  def __init__(self, connections):
+    self._connections = list(connections)
+
+  def accept(self):
+    conn = self._connections.pop(0)
+    if isinstance(conn, Exception):
+      raise conn
+    return (conn, ("192.0.2.1", 1234))
+
+
+class _FakeRequestExecutor:
+  def __init__(self, server, handler, sock, client_addr, keep_alive=False):
+    assert keep_alive
+    if sock is None:
+      raise http.HttpError("Failed")
+    self.requests_handled = sock
+
+
+class TestRunWorker(unittest.TestCase):
+  def setUp(self):
+    self._signals = [(signum, signal.getsignal(signum))
+                     for signum in [signal.SIGTERM, signal.SIGINT,
+                                    signal.SIGCHLD]]
+    self._get_max_rss = http.server._GetMaxRss
+
+  def tearDown(self):
+    for (signum, handler) in self._signals:
+      signal.signal(signum, handler)
+    http.server._GetMaxRss = self._get_max_rss
+
+  @staticmethod
+  def _MakeServer(connections, max_requests=None, max_memory_growth=None):
+    server = http.server.HttpServer.__new__(http.server.HttpServer)
+    server.socket = _FakeListeningSocket(connections)
+    server.handler = None
+    server.request_executor = _FakeRequestExecutor
+    server._worker_max_requests = max_requests
+    server._worker_max_memory_growth = max_memory_growth
+    return server
+
+  def testMaxRequests(self):
+    interrupted = socket.error(errno.EINTR, "Interrupted")
+    server = self._MakeServer([2, interrupted, None, 1, 5], max_requests=4)
+    server._RunWorker()
+    # Requests on persistent connections are counted, failed connections
+    # count as one request
+    self.assertEqual(server.socket._connections, [5])
+
+  def testMemoryGrowth(self):
+    usage = [1000, 1500, 3000, 3000]
+    http.server._GetMaxRss = lambda: usage.pop(0)
+    server = self._MakeServer([1, 1, 1], max_memory_growth=1)
+    server._RunWorker()
+    self.assertEqual(server.socket._connections, [1])
+    self.assertEqual(usage, [])
+
+  def testAcceptError(self):
+    server = self._MakeServer([socket.error(errno.EBADF, "Bad")])
+    self.assertRaises(socket.error, server._RunWorker)
+
+
 class TestClientRequest(unittest.TestCase):
   def testRepr(self):
     cr = http.client.HttpClientRequest("localhost", 1234, "GET", "/version",
@@ -772,5 +963,162 @@ class TestProcessRequests(unittest.TestCase):
                       _curl_multi=NotImplemented, _curl_process=NotImplemented)
 
 
+class _FakePooledCurl(_FakeCurl):
+  def __init__(self):
+    _FakeCurl.__init__(self)
+    self.closed = False
+    self.resets = 0
+
+  def reset(self):
+    self.opts = {}
+    self.resets += 1
+
+  def close(self):
+    assert not self.closed, "Closed more than once"
+    self.closed = True
+
+
+class TestCurlPool(unittest.TestCase):
+  def setUp(self):
+    self.now = 1000.0
+    self.pool = http.client.CurlPool(max_idle=2, idle_timeout=30,
+                                     _curl=_FakePooledCurl,
+                                     _time_fn=lambda: self.now)
+
+  def testReuse(self):
+    curl = self.pool.Get("192.0.2.1", 1811)
+    self.assertEqual(self.pool.GetStats()["misses"], 1)
+    self.pool.Release("192.0.2.1", 1811, curl)
+    self.assertEqual(self.pool.GetStats()["idle"], 1)
+
+    # Different port
+    other = self.pool.Get("192.0.2.1", 1812)
+    self.assertNotEqual(other, curl)
+
+    self.assertEqual(self.pool.Get("192.0.2.1", 1811), curl)
+    self.assertEqual(curl.resets, 1)
+    self.assertFalse(curl.closed)
+    self.assertEqual(self.pool.GetStats(), {
+      "hits": 1,
+      "misses": 2,
+      "evictions": 0,
+      "idle": 0,
+      })
+
+  def testNotReusable(self):
+    curl = self.pool.Get("192.0.2.1", 1811)
+    self.pool.Release("192.0.2.1", 1811, curl, reusable=False)
+    self.assertTrue(curl.closed)
+    self.assertEqual(self.pool.GetStats()["idle"], 0)
+    self.assertNotEqual(self.pool.Get("192.0.2.1", 1811), curl)
+
+  def testMaxIdle(self):
+    handles = [self.pool.Get("192.0.2.1", 1811) for _ in range(3)]
+    for curl in handles:
+      self.pool.Release("192.0.2.1", 1811, curl)
+    self.assertEqual(self.pool.GetStats()["idle"], 2)
+    self.assertEqual(self.pool.GetStats()["evictions"], 1)
+    self.assertTrue(handles[2].closed)
+
+  def testIdleTimeout(self):
+    curl = self.pool.Get("192.0.2.1", 1811)
+    self.pool.Release("192.0.2.1", 1811, curl)
+    self.now += 31
+    self.assertNotEqual(self.pool.Get("192.0.2.1", 1811), curl)
+    self.assertTrue(curl.closed)
+    self.assertEqual(self.pool.GetStats()["evictions"], 1)
+
+  def testClose(self):
+    handles = [self.pool.Get("192.0.2.%s" % i, 1811) for i in range(5)]
+    for (i, curl) in enumerate(handles):
+      self.pool.Release("192.0.2.%s" % i, 1811, curl)
+    self.pool.Close()
+    self.assertTrue(compat.all(curl.closed for curl in handles))
+    self.assertEqual(self.pool.GetStats()["idle"], 0)
+
+  def testLockInfo(self):
+    self.pool.Release("192.0.2.1", 1811, self.pool.Get("192.0.2.1", 1811))
+    self.pool.Get("192.0.2.1", 1811)
+    self.assertEqual(self.pool.GetLockInfo(None), [
+      ("rpc-pool", "hits=1 misses=1 evictions=0 idle=0", None, None),
+      ])
+
+
+class _FakePooledCurlMulti(object):
+  def __init__(self):
+    self.closed = False
+
+  def close(self):
+    assert not self.closed, "Closed more than once"
+    self.closed = True
+
+
+class TestProcessRequestsWithPool(unittest.TestCase):
+  def test(self):
+    pool = http.client.CurlPool(_curl=_FakePooledCurl,
+                                _curl_multi=_FakePooledCurlMulti)
+    handles = []
+    multis = []
+
+    def _ProcessRequests(multi, curls):
+      multis.append(multi)
+      for curl in curls:
+        handles.append(curl)
+        opts = curl.opts
+        self.assertTrue(opts[pycurl.FORBID_REUSE] is False)
+        if hasattr(pycurl, "SSL_SESSIONID_CACHE"):
+          self.assertTrue(opts[pycurl.SSL_SESSIONID_CACHE])
+        curl.info = {
+          pycurl.RESPONSE_CODE: http.HTTP_OK,
+          }
+        # Prepare for reset
+        opts.pop(pycurl.POSTFIELDS)
+        opts.pop(pycurl.WRITEFUNCTION)
+        if opts[pycurl.URL].endswith("/fail"):
+          yield (curl, "test error")
+        else:
+          yield (curl, None)
+
+    for _ in range(3):
+      requests = [
+        http.client.HttpClientRequest("192.0.2.1", 1811, "POST", "/ok"),
+        http.client.HttpClientRequest("192.0.2.2", 1811, "POST", "/fail"),
+        ]
+      http.client.ProcessRequests(requests, curl_pool=pool,
+                                  _curl=NotImplemented, _curl_multi=list,
+                                  _curl_process=_ProcessRequests)
+      self.assertTrue(requests[0].success)
+      self.assertFalse(requests[1].success)
+
+    # Only the handle for the successful request is reused
+    self.assertEqual(len(set(handles)), 4)
+    self.assertEqual(pool.GetStats(), {
+      "hits": 2,
+      "misses": 4,
+      "evictions": 0,
+      "idle": 1,
+      })
+
+    # The same multi object, and with it the connection cache, is used for
+    # all calls
+    self.assertEqual(len(multis), 3)
+    self.assertEqual(len(set(multis)), 1)
+    self.assertTrue(isinstance(multis[0], _FakePooledCurlMulti))
+
+    pool.Close()
+    self.assertTrue(multis[0].closed)
+
+  def testConcurrentMulti(self):
+    pool = http.client.CurlPool(_curl=_FakePooledCurl,
+                                _curl_multi=_FakePooledCurlMulti)
+    first = pool.GetMulti()
+    # Used by another thread at the same time
+    second = pool.GetMulti()
+    self.assertNotEqual(first, second)
+    pool.ReleaseMulti(first)
+    pool.ReleaseMulti(second)
+    self.assertTrue(pool.GetMulti() in (first, second))
+
+
 if __name__ == "__main__":
   testutils.GanetiTestProgram()
@@ -30,13 +30,16 @@
 
 """Script for testing the hypervisor.hv_kvm module"""
 
+import errno
 import threading
 import tempfile
 import unittest
+import shutil
 import socket
 import os
 import struct
 import re
+import time
 
 from ganeti import serializer
 from ganeti import constants
@@ -46,6 +49,7 @@ from ganeti import errors
 from ganeti import utils
 from ganeti import pathutils
 
+from ganeti.hypervisor import hv_base
 from ganeti.hypervisor import hv_kvm
 import ganeti.hypervisor.hv_kvm.netdev as netdev
 import ganeti.hypervisor.hv_kvm.monitor as monitor
@@ -152,7 +156,7 @@ class TestQmpMessage(testutils.GanetiTestCase):
       "execute": "command",
       "arguments": ["a", "b", "c"],
       }
-    message = hv_kvm.QmpMessage(test_data)
+    message = monitor.QmpMessage(test_data)
 
     for k, v in test_data.items():
       self.assertEqual(message[k], v)
@@ -161,7 +165,7 @@ class TestQmpMessage(testutils.GanetiTestCase):
     self.assertEqual(len(serialized.splitlines()), 1,
                      msg="Got multi-line message")
 
-    rebuilt_message = hv_kvm.QmpMessage.BuildFromJsonString(serialized)
+    rebuilt_message = monitor.QmpMessage.BuildFromJsonString(serialized)
     self.assertEqual(rebuilt_message, message)
     self.assertEqual(len(rebuilt_message), len(test_data))
 
@@ -171,7 +175,7 @@ class TestQmpMessage(testutils.GanetiTestCase):
       toDelete: "command",
       "arguments": ["a", "b", "c"],
       }
-    message = hv_kvm.QmpMessage(test_data)
+    message = monitor.QmpMessage(test_data)
 
     oldLen = len(message)
     del(message[toDelete])
@@ -223,7 +227,7 @@ class TestQmp(testutils.GanetiTestCase):
       response = qmp_connection.Execute(request["execute"],
                                         request["arguments"])
       self.assertEqual(response, expected_response)
-      msg = hv_kvm.QmpMessage({"return": expected_response})
+      msg = monitor.QmpMessage({"return": expected_response})
       self.assertEqual(len(str(msg).splitlines()), 1,
                        msg="Got multi-line message")
 
@@ -246,6 +250,151 @@ class TestQmp(testutils.GanetiTestCase):
         self.assertEqual(response, expected_response)
 
 
+class _FakeQmpConnection(object):
+  instances = []
+
+  def __init__(self, filename):
+    self.filename = filename
+    self.connected = False
+    self.closed = False
+    self.commands = []
+    self.fail = False
+    _FakeQmpConnection.instances.append(self)
+
+  def connect(self):
+    self.connected = True
+
+  def is_connected(self):
+    return self.connected
+
+  def close(self):
+    self.connected = False
+    self.closed = True
+
+  def Execute(self, command, arguments=None):
+    if self.fail:
+      raise errors.HypervisorError("broken")
+    if command == "unsupported":
+      raise monitor.QmpCommandNotSupported("unsupported")
+    self.commands.append((command, arguments))
+    return {"command": command}
+
+
+class _FakeStat(object):
+  def __init__(self, inode, mtime=0.0, size=0):
+    self.st_dev = 1
+    self.st_ino = inode
+    self.st_mtime = mtime
+    self.st_size = size
+
+
+class TestQmpConnectionManager(unittest.TestCase):
+  def setUp(self):
+    _FakeQmpConnection.instances = []
+    self.inodes = {"a.qmp": 10, "b.qmp": 20}
+    self.mgr = monitor.QmpConnectionManager(_connection_cls=_FakeQmpConnection,
+                                            _stat_fn=self._Stat)
+
+  def _Stat(self, filename):
+    if filename not in self.inodes:
+      raise OSError(errno.ENOENT, "No such file")
+    return _FakeStat(self.inodes[filename])
+
+  def _Scope(self):
+    return hv_kvm.QmpConnectionScope(_manager=self.mgr)
+
+  def testNoScope(self):
+    for _ in range(2):
+      self.assertEqual(self.mgr.Execute("a.qmp", "query-cpus"),
+                       {"command": "query-cpus"})
+    self.assertEqual(len(_FakeQmpConnection.instances), 2)
+    self.assertTrue(compat.all(conn.closed
+                               for conn in _FakeQmpConnection.instances))
+
+  def testReuse(self):
+    with self._Scope():
+      for _ in range(3):
+        self.assertEqual(self.mgr.Execute("a.qmp", "query-cpus"),
+                         {"command": "query-cpus"})
+      with self._Scope():
+        self.mgr.Execute("b.qmp", "query-cpus")
+        self.mgr.Execute("a.qmp", "query-cpus")
+      self.assertEqual(len(_FakeQmpConnection.instances), 2)
+      self.assertFalse(compat.any(conn.closed
+                                  for conn in _FakeQmpConnection.instances))
+    self.assertEqual(len(_FakeQmpConnection.instances[0].commands), 4)
+
+    # Leaving the outermost scope closes all connections
+    self.assertTrue(compat.all(conn.closed
+                               for conn in _FakeQmpConnection.instances))
+
+  def testOtherThread(self):
+    entered = threading.Event()
+    done = threading.Event()
+
+    def _Request():
+      with self._Scope():
+        self.mgr.Execute("a.qmp", "query-cpus")
+        entered.set()
+        done.wait()
+
+    thread = threading.Thread(target=_Request)
+    thread.start()
+    try:
+      entered.wait()
+      # Connections are not shared with other threads' scopes
+      self.mgr.Execute("a.qmp", "query-cpus")
+      self.assertEqual(len(_FakeQmpConnection.instances), 2)
+      self.assertTrue(_FakeQmpConnection.instances[1].closed)
+      self.assertFalse(_FakeQmpConnection.instances[0].closed)
+    finally:
+      done.set()
+      thread.join()
+
+    self.assertTrue(_FakeQmpConnection.instances[0].closed)
+
+  def testRecreatedSocket(self):
+    with self._Scope():
+      self.mgr.Execute("a.qmp", "query-cpus")
+      self.inodes["a.qmp"] = 11
+      self.mgr.Execute("a.qmp", "query-cpus")
+      (old, new) = _FakeQmpConnection.instances
+      self.assertTrue(old.closed)
+      self.assertFalse(new.closed)
+
+  def testMissingSocket(self):
+    with self._Scope():
+      self.assertRaises(errors.HypervisorError, self.mgr.Execute,
+                        "missing.qmp", "query-cpus")
+    self.assertEqual(_FakeQmpConnection.instances, [])
+
+  def testErrors(self):
+    with self._Scope():
+      self.mgr.Execute("a.qmp", "query-cpus")
+      conn = _FakeQmpConnection.instances[0]
+
+      # Unsupported commands don't affect the connection
+      self.assertRaises(monitor.QmpCommandNotSupported, self.mgr.Execute,
+                        "a.qmp", "unsupported")
+      self.assertFalse(conn.closed)
+
+      conn.fail = True
+      self.assertRaises(errors.HypervisorError, self.mgr.Execute,
+                        "a.qmp", "query-cpus")
+      self.assertTrue(conn.closed)
+
+      self.mgr.Execute("a.qmp", "query-cpus")
+      self.assertEqual(len(_FakeQmpConnection.instances), 2)
+
+  def testClose(self):
+    with self._Scope():
+      self.mgr.Execute("a.qmp", "query-cpus")
+      self.mgr.Close("a.qmp")
+      self.mgr.Close("b.qmp")
+      self.assertTrue(_FakeQmpConnection.instances[0].closed)
+    self.mgr.Close("a.qmp")
+
+
 class TestConsole(unittest.TestCase):
   def MakeConsole(self, instance, node, group, hvparams):
     cons = hv_kvm.KVMHypervisor.GetInstanceConsole(instance, node, group,
@@ -347,6 +496,93 @@ class TestVersionChecking(testutils.GanetiTestCase):
         self.ParseTestData("kvm_0.9.1_help.txt"), ("0.9.1", 0, 9, 1))
 
 
+class TestKVMCapabilityCache(unittest.TestCase):
+  def setUp(self):
+    self.tmpdir = tempfile.mkdtemp()
+    self.cache_file = utils.PathJoin(self.tmpdir, "capabilities.json")
+    self.binaries = {"/usr/bin/kvm": _FakeStat(10, mtime=1.5, size=100)}
+    self.calls = []
+
+  def tearDown(self):
+    shutil.rmtree(self.tmpdir)
+
+  def _Stat(self, filename):
+    if filename not in self.binaries:
+      raise OSError(errno.ENOENT, "No such file")
+    return self.binaries[filename]
+
+  def _Probe(self, kvm_path, option):
+    self.calls.append((kvm_path, option))
+    return "%s output %d" % (option, len(self.calls))
+
+  def _NewCache(self):
+    return hv_kvm.KVMCapabilityCache(self.cache_file, _stat_fn=self._Stat)
+
+  def testCachedInMemory(self):
+    cache = self._NewCache()
+    self.assertEqual(cache.Get("/usr/bin/kvm", "help", self._Probe),
+                     "help output 1")
+    self.assertEqual(cache.Get("/usr/bin/kvm", "help", self._Probe),
+                     "help output 1")
+    self.assertEqual(cache.Get("/usr/bin/kvm", "mlist", self._Probe),
+                     "mlist output 2")
+    self.assertEqual(self.calls, [("/usr/bin/kvm", "help"),
+                                  ("/usr/bin/kvm", "mlist")])
+
+  def testSharedThroughFile(self):
+    self._NewCache().Get("/usr/bin/kvm", "help", self._Probe)
+    self._NewCache().Get("/usr/bin/kvm", "mlist", self._Probe)
+    cache = self._NewCache()
+    self.assertEqual(cache.Get("/usr/bin/kvm", "help", self._Probe),
+                     "help output 1")
+    self.assertEqual(cache.Get("/usr/bin/kvm", "mlist", self._Probe),
+                     "mlist output 2")
+    self.assertEqual(len(self.calls), 2)
+
+  def testBinaryChanged(self):
+    cache = self._NewCache()
+    cache.Get("/usr/bin/kvm", "help", self._Probe)
+    self.binaries["/usr/bin/kvm"] = _FakeStat(11, mtime=2.5, size=100)
+    self.assertEqual(cache.Get("/usr/bin/kvm", "help", self._Probe),
+                     "help output 2")
+    self.assertEqual(self._NewCache().Get("/usr/bin/kvm", "help",
+                                          self._Probe),
+                     "help output 2")
+    self.assertEqual(len(self.calls), 2)
+
+  def testMissingBinary(self):
+    cache = self._NewCache()
+    cache.Get("/usr/bin/qemu", "help", self._Probe)
+    cache.Get("/usr/bin/qemu", "help", self._Probe)
+    self.assertEqual(len(self.calls), 2)
+    self.assertFalse(os.path.exists(self.cache_file))
+
+  def testFailureNotCached(self):
+    def _Fail(kvm_path, option):
+      raise errors.HypervisorError("Unable to get KVM output")
+    cache = self._NewCache()
+    self.assertRaises(errors.HypervisorError, cache.Get,
+                      "/usr/bin/kvm", "help", _Fail)
+    self.assertEqual(cache.Get("/usr/bin/kvm", "help", self._Probe),
+                     "help output 1")
+
+  def testCorruptedFile(self):
+    utils.WriteFile(self.cache_file, data="{not json")
+    cache = self._NewCache()
+    self.assertEqual(cache.Get("/usr/bin/kvm", "help", self._Probe),
+                     "help output 1")
+    self.assertEqual(self._NewCache().Get("/usr/bin/kvm", "help",
+                                          self._Probe),
+                     "help output 1")
+
+  def testMemoryOnly(self):
+    cache = hv_kvm.KVMCapabilityCache(None, _stat_fn=self._Stat)
+    cache.Get("/usr/bin/kvm", "help", self._Probe)
+    cache.Get("/usr/bin/kvm", "help", self._Probe)
+    self.assertEqual(len(self.calls), 1)
+    self.assertFalse(os.path.exists(self.cache_file))
+
+
 class TestSpiceParameterList(unittest.TestCase):
   def setUp(self):
     self.defaults = constants.HVC_DEFAULTS[constants.HT_KVM]
@@ -548,6 +784,90 @@ class TestGetRuntimeInfo(unittest.TestCase):
     self.assertTrue(devinfo.hvinfo["addr"] == "0xa")
 
 
+class TestGetAllInstancesInfo(testutils.GanetiTestCase):
+  def setUp(self):
+    super(TestGetAllInstancesInfo, self).setUp()
+    kvm_class = "ganeti.hypervisor.hv_kvm.KVMHypervisor"
+    self.MockOut(mock.patch("ganeti.utils.EnsureDirs"))
+    self.MockOut(mock.patch("os.listdir",
+                            return_value=["inst1", "inst2", "inst3"]))
+    self.MockOut(mock.patch(kvm_class + "._INSTANCE_INFO_TIMEOUT", 0.5))
+    self.MockOut(mock.patch(kvm_class + "._INSTANCE_INFO_MAX_THREADS", 2))
+    self.MockOut("info", mock.patch(kvm_class + "._GetCmdlineInstanceInfo",
+                                    side_effect=self._GetInstanceInfo))
+    self.MockOut("query", mock.patch(kvm_class + "._QueryInstanceResources",
+                                     side_effect=self._QueryResources))
+    self.hung = threading.Event()
+    self.lock = threading.Lock()
+    self.active = 0
+    self.max_active = 0
+
+  def tearDown(self):
+    self.hung.set()
+    super(TestGetAllInstancesInfo, self).tearDown()
+
+  @staticmethod
+  def _GetInstanceInfo(name):
+    if name == "inst3":
+      return (name, -1, 0, 0, hv_base.HvInstanceState.SHUTDOWN, 0)
+    return (name, 100, 128, 1, hv_base.HvInstanceState.RUNNING, 0)
+
+  def _QueryResources(self, name, memory, vcpus):
+    with self.lock:
+      self.active += 1
+      self.max_active = max(self.max_active, self.active)
+    try:
+      if name == "inst2":
+        self.hung.wait(10)
+      else:
+        time.sleep(0.01)
+      return (memory * 2, vcpus * 2)
+    finally:
+      with self.lock:
+        self.active -= 1
+
+  def testLive(self):
+    result = hv_kvm.KVMHypervisor().GetAllInstancesInfo()
+    self.assertEqual(result, [
+      ("inst1", 100, 256, 2, hv_base.HvInstanceState.RUNNING, 0),
+      # The monitor didn't answer in time
+      ("inst2", 100, 128, 1, hv_base.HvInstanceState.RUNNING, 0,
+       "The monitor didn't answer within 0.5 seconds"),
+      ("inst3", -1, 0, 0, hv_base.HvInstanceState.SHUTDOWN, 0),
+      ])
+    self.assertEqual(self.mocks["query"].call_count, 2)
+
+  def testCmdlineOnly(self):
+    result = hv_kvm.KVMHypervisor().GetAllInstancesInfo(live=False)
+    self.assertEqual(result, [
+      ("inst1", 100, 128, 1, hv_base.HvInstanceState.RUNNING, 0),
+      ("inst2", 100, 128, 1, hv_base.HvInstanceState.RUNNING, 0),
+      ("inst3", -1, 0, 0, hv_base.HvInstanceState.SHUTDOWN, 0),
+      ])
+    self.assertFalse(self.mocks["query"].called)
+
+  def testInstanceCmdlineOnly(self):
+    hv = hv_kvm.KVMHypervisor()
+    self.assertEqual(hv.GetInstanceInfo("inst1", live=False),
+                     ("inst1", 100, 128, 1,
+                      hv_base.HvInstanceState.RUNNING, 0))
+    self.assertFalse(self.mocks["query"].called)
+    self.assertEqual(hv.GetInstanceInfo("inst1"),
+                     ("inst1", 100, 256, 2,
+                      hv_base.HvInstanceState.RUNNING, 0))
+
+  def testStragglers(self):
+    instances = dict(("inst%s" % i, (128, 1)) for i in range(1, 7))
+    (resources, failures) = \
+      hv_kvm.KVMHypervisor._QueryAllInstanceResources(instances, 0.5)
+    self.assertEqual(sorted(failures.keys()), ["inst2"])
+    self.assertEqual(resources, dict((name, (256, 2))
+                                     for name in instances
+                                     if name != "inst2"))
+    self.assertEqual(self.mocks["query"].call_count, len(instances))
+    self.assertEqual(self.max_active, 2)
+
+
 class PostfixMatcher(object):
   def __init__(self, string):
     self.string = string
@@ -576,6 +896,8 @@ class TestKvmRuntime(testutils.GanetiTestCase):
                                          return_value=('file', -1, False)))
     self.MockOut(mock.patch(kvm_class + '._ExecuteCpuAffinity'))
     self.MockOut(mock.patch(kvm_class + '._CallMonitorCommand'))
+    self.MockOut(mock.patch(kvm_class + '._capabilities',
+                            hv_kvm.KVMCapabilityCache(None)))
 
     self.cfg = ConfigMock()
     params = constants.HVC_DEFAULTS[constants.HT_KVM].copy()
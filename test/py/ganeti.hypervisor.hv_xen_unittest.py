@@ -36,6 +36,7 @@ import tempfile
 import shutil
 import random
 import os
+import threading
 import mock
 
 from ganeti import constants
@@ -509,6 +510,108 @@ class TestXenHypervisorListInstances(unittest.TestCase):
     mock_run_cmd.assert_called_with([expected_xen_cmd, self.XEN_LIST])
 
 
+class TestXenQueryCache(unittest.TestCase):
+  def setUp(self):
+    self.now = 100.0
+    self.cache = hv_xen.XenQueryCache(ttl=1.0, _time_fn=lambda: self.now)
+    self.calls = []
+
+  def _Run(self, cmd, exit_code=constants.EXIT_SUCCESS):
+    def fn():
+      self.calls.append(cmd)
+      return utils.RunResult(exit_code, None, "%s %d" % (cmd, len(self.calls)),
+                             "", None, NotImplemented, NotImplemented)
+    return fn
+
+  def _Query(self, cmd, **kwargs):
+    return self.cache.Query([cmd], self._Run(cmd, **kwargs)).stdout
+
+  def testSharedForTtl(self):
+    self.assertEqual(self._Query("list"), "list 1")
+    self.assertEqual(self._Query("info"), "info 2")
+    self.now += 1.0
+    self.assertEqual(self._Query("list"), "list 1")
+    self.now += 0.5
+    self.assertEqual(self._Query("list"), "list 3")
+
+  def testNoTtl(self):
+    self.cache = hv_xen.XenQueryCache(ttl=0, _time_fn=lambda: self.now)
+    self.assertEqual(self._Query("list"), "list 1")
+    self.assertEqual(self._Query("list"), "list 2")
+
+  def testNotSharedByDefault(self):
+    self.cache = hv_xen.XenQueryCache(_time_fn=lambda: self.now)
+    self.assertEqual(self._Query("list"), "list 1")
+    self.assertEqual(self._Query("list"), "list 2")
+    with hv_xen.XenQueryScope(_cache=self.cache):
+      self.assertEqual(self._Query("list"), "list 3")
+      self.assertEqual(self._Query("list"), "list 3")
+
+  def testScope(self):
+    with hv_xen.XenQueryScope(_cache=self.cache):
+      self.assertEqual(self._Query("list"), "list 1")
+      self.now += 10
+      with hv_xen.XenQueryScope(_cache=self.cache):
+        self.assertEqual(self._Query("list"), "list 1")
+      self.assertEqual(self._Query("list"), "list 1")
+    self.assertEqual(self._Query("list"), "list 2")
+
+  def testScopePerThread(self):
+    result = []
+    def _QueryInThread():
+      result.append(self._Query("list"))
+
+    with hv_xen.XenQueryScope(_cache=self.cache):
+      self.assertEqual(self._Query("list"), "list 1")
+      self.now += 10
+      thread = threading.Thread(target=_QueryInThread)
+      thread.start()
+      thread.join()
+      self.assertEqual(self._Query("list"), "list 1")
+
+    self.assertEqual(result, ["list 2"])
+
+  def testFailureNotMemoized(self):
+    with hv_xen.XenQueryScope(_cache=self.cache):
+      self.assertEqual(self._Query("list", exit_code=constants.EXIT_FAILURE),
+                       "list 1")
+      self.assertEqual(self._Query("list"), "list 2")
+      self.assertEqual(self._Query("list"), "list 2")
+
+  def testRunInvalidates(self):
+    with hv_xen.XenQueryScope(_cache=self.cache):
+      self.assertEqual(self._Query("list"), "list 1")
+      self.assertEqual(self.cache.Run(self._Run("destroy")).stdout,
+                       "destroy 2")
+      self.assertEqual(self._Query("list"), "list 3")
+      self.assertEqual(self._Query("list"), "list 3")
+    self.assertEqual(self._Query("list"), "list 3")
+
+  def testHypervisorQueries(self):
+    hvparams = {constants.HV_XEN_CMD: constants.XEN_CMD_XL}
+    data = {
+      "list": testutils.ReadTestData("xen-xm-list-4.0.1-four-instances.txt"),
+      "info": testutils.ReadTestData("xen-xm-info-4.0.1.txt"),
+      }
+
+    def _RunCmd(cmd):
+      self.calls.append(cmd)
+      return utils.RunResult(constants.EXIT_SUCCESS, None, data[cmd[-1]], "",
+                             None, NotImplemented, NotImplemented)
+
+    hv = hv_xen.XenHypervisor(_cfgdir=NotImplemented, _run_cmd_fn=_RunCmd,
+                              _query_cache=hv_xen.XenQueryCache(ttl=0))
+    with hv_xen.XenQueryScope(_cache=hv._query_cache):
+      self.assertEqual(len(hv.ListInstances(hvparams=hvparams)), 3)
+      self.assertEqual(len(hv.GetAllInstancesInfo(hvparams=hvparams)), 3)
+      self.assertTrue(hv.GetNodeInfo(hvparams=hvparams))
+      self.assertEqual(hv.GetInstanceInfo("server01.example.com",
+                                          hvparams=hvparams)[0],
+                       "server01.example.com")
+
+    self.assertEqual(self.calls, [["xl", "list"], ["xl", "info"]])
+
+
 class TestXenHypervisorCheckToolstack(unittest.TestCase):
 
   def setUp(self):
@@ -0,0 +1,249 @@
+#!/usr/bin/python
+#
+
+# Copyright (C) 2015 Google Inc.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+#
+# 1. Redistributions of source code must retain the above copyright notice,
+# this list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright
+# notice, this list of conditions and the following disclaimer in the
+# documentation and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS
+# IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED
+# TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR
+# PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR
+# CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+# EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+# PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR
+# PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF
+# LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
+# NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+"""Script for testing ganeti.jqueue.zygote"""
+
+import os
+import shutil
+import socket
+import stat
+import tempfile
+import threading
+import unittest
+
+import mock
+
+from ganeti import errors
+from ganeti import serializer
+from ganeti.jqueue import zygote
+from ganeti.rpc import transport
+
+import testutils
+
+
+class _FakeLuxid(threading.Thread):
+  """Plays the part of luxid when starting a job through the zygote.
+
+  """
+  def __init__(self, sock, job_id, master_job_id=None):
+    threading.Thread.__init__(self)
+    self.daemon = True
+    self._sock = sock
+    self._job_id = job_id
+    if master_job_id is None:
+      master_job_id = job_id
+    self._master_job_id = master_job_id
+    self.reply = None
+    self.error = None
+
+  def run(self):
+    fd = self._sock.fileno()
+    trans = transport.FdTransport((os.dup(fd), os.dup(fd)))
+    try:
+      trans.Send(str(self._job_id))
+      self.reply = serializer.LoadJson(trans.Recv())
+      trans.Send("")
+      for value in [str(self._master_job_id), self.reply[1], "secret"]:
+        trans.Recv()
+        trans.Send(value)
+    except Exception, err: # pylint: disable=W0703
+      self.error = err
+    finally:
+      trans.Close()
+
+
+class TestRunChild(unittest.TestCase):
+  def setUp(self):
+    (self.luxid_sock, self.child_sock) = \
+      socket.socketpair(socket.AF_UNIX, socket.SOCK_STREAM)
+
+    self.lock = mock.Mock()
+    self.lock.GetPath.return_value = "/run/livelocks/job_000017"
+
+    patchers = [
+      mock.patch("os._exit"),
+      mock.patch("signal.signal"),
+      mock.patch("random.seed"),
+      mock.patch("ganeti.utils.ResetTempfileModule"),
+      mock.patch("ganeti.utils.livelock.LiveLock", return_value=self.lock),
+      mock.patch.object(zygote.jqexec, "RunJob"),
+      ]
+    (self.exit_fn, _, self.seed_fn, self.reset_tempfile_fn, self.livelock_cls,
+     self.run_job_fn) = [p.start() for p in patchers]
+    for patcher in patchers:
+      self.addCleanup(patcher.stop)
+
+  def tearDown(self):
+    self.luxid_sock.close()
+
+  def _Run(self, job_id, master_job_id=None):
+    luxid = _FakeLuxid(self.luxid_sock, job_id, master_job_id=master_job_id)
+    luxid.start()
+    zygote._RunChild(self.child_sock, "snapshot", 1)
+    luxid.join(10)
+    self.assertFalse(luxid.isAlive())
+    self.assertEqual(luxid.error, None)
+    return luxid.reply
+
+  def testHandshake(self):
+    reply = self._Run(17)
+
+    self.assertEqual(reply, [os.getpid(), "/run/livelocks/job_000017"])
+    self.livelock_cls.assert_called_once_with("job_000017")
+    self.run_job_fn.assert_called_once_with(17, self.lock, "secret", 1,
+                                            config_snapshot="snapshot")
+    self.exit_fn.assert_called_once_with(0)
+
+  def testReseed(self):
+    self._Run(17)
+
+    self.seed_fn.assert_called_once_with()
+    self.reset_tempfile_fn.assert_called_once_with()
+
+  def testJobIdMismatch(self):
+    self._Run(17, master_job_id=18)
+
+    self.assertFalse(self.run_job_fn.called)
+    self.exit_fn.assert_called_once_with(0)
+
+  def testConnectionClosed(self):
+    self.luxid_sock.close()
+
+    zygote._RunChild(self.child_sock, None, 0)
+
+    self.assertFalse(self.livelock_cls.called)
+    self.assertFalse(self.run_job_fn.called)
+    self.exit_fn.assert_called_once_with(0)
+
+
+class TestRefreshSnapshot(unittest.TestCase):
+  def setUp(self):
+    self.cfg = mock.Mock()
+    self.cfg.GetConfigSnapshot.return_value = "new"
+
+  def testInitial(self):
+    self.assertEqual(zygote._RefreshSnapshot(self.cfg), "new")
+    self.assertFalse(self.cfg.IsConfigSnapshotCurrent.called)
+
+  def testCurrent(self):
+    self.cfg.IsConfigSnapshotCurrent.return_value = True
+    self.assertEqual(zygote._RefreshSnapshot(self.cfg, "old"), "old")
+    self.assertFalse(self.cfg.OutDate.called)
+
+  def testOutdated(self):
+    self.cfg.IsConfigSnapshotCurrent.return_value = False
+    self.assertEqual(zygote._RefreshSnapshot(self.cfg, "old"), "new")
+    self.cfg.OutDate.assert_called_once_with()
+
+  def testError(self):
+    self.cfg.IsConfigSnapshotCurrent.side_effect = \
+      errors.ConfigurationError("WConfd is gone")
+    self.assertEqual(zygote._RefreshSnapshot(self.cfg, "old"), None)
+
+
+class TestListen(unittest.TestCase):
+  def setUp(self):
+    self.tmpdir = tempfile.mkdtemp()
+    self.path = os.path.join(self.tmpdir, "zygote")
+
+  def tearDown(self):
+    shutil.rmtree(self.tmpdir)
+
+  def test(self):
+    # A socket left behind by a previous zygote is replaced
+    open(self.path, "w").close()
+
+    sock = zygote._Listen(self.path)
+    try:
+      mode = os.stat(self.path).st_mode
+      self.assertTrue(stat.S_ISSOCK(mode))
+      self.assertEqual(stat.S_IMODE(mode) & 0077, 0)
+
+      client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+      client.connect(self.path)
+      (conn, _) = sock.accept()
+      conn.close()
+      client.close()
+    finally:
+      sock.close()
+
+
+class TestMain(unittest.TestCase):
+  def setUp(self):
+    self.sock = mock.Mock()
+    self.conn = mock.Mock()
+    self.sock.accept.return_value = (self.conn, None)
+
+    patchers = [
+      mock.patch.dict(os.environ, {"GNT_DEBUG": "0"}),
+      mock.patch("ganeti.utils.SetupLogging"),
+      mock.patch("ganeti.utils.RemoveFile"),
+      mock.patch("signal.signal"),
+      mock.patch("ganeti.config.ConfigWriter"),
+      mock.patch("ganeti.wconfd.Client"),
+      mock.patch.object(zygote, "_Listen", return_value=self.sock),
+      mock.patch.object(zygote, "_RefreshSnapshot", return_value="snapshot"),
+      mock.patch.object(zygote, "_RunChild"),
+      # luxid is gone after two iterations of the loop
+      mock.patch("os.getppid", side_effect=[1, 1, 1, 2]),
+      # A connection, then an idle interval
+      mock.patch("select.select",
+                 side_effect=[([self.sock], [], []), ([], [], [])]),
+      mock.patch("os.fork"),
+      ]
+    mocks = [p.start() for p in patchers]
+    (self.refresh_fn, self.run_child_fn) = mocks[7:9]
+    self.fork_fn = mocks[-1]
+    for patcher in patchers:
+      self.addCleanup(patcher.stop)
+
+  def testParent(self):
+    self.fork_fn.return_value = 1234
+
+    self.assertRaises(SystemExit, zygote.main)
+
+    self.fork_fn.assert_called_once_with()
+    self.conn.close.assert_called_once_with()
+    self.assertFalse(self.run_child_fn.called)
+    self.assertFalse(self.sock.close.called)
+    # Once at startup, once in the idle interval
+    self.assertEqual(self.refresh_fn.call_count, 2)
+
+  def testChild(self):
+    self.fork_fn.return_value = 0
+
+    self.assertRaises(SystemExit, zygote.main)
+
+    self.sock.close.assert_called_once_with()
+    self.run_child_fn.assert_called_once_with(self.conn, "snapshot", 0)
+
+
+if __name__ == "__main__":
+  testutils.GanetiTestProgram()
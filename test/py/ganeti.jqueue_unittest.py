@@ -39,6 +39,7 @@ import errno
 import itertools
 import random
 import operator
+import mock
 
 try:
   # pylint: disable=E0611
@@ -51,9 +52,11 @@ from ganeti import utils
 from ganeti import errors
 from ganeti import jqueue
 from ganeti import opcodes
+from ganeti import pathutils
 from ganeti import compat
 from ganeti import mcpu
 from ganeti import query
+from ganeti import serializer
 from ganeti import workerpool
 
 import testutils
@@ -103,6 +106,186 @@ class TestEncodeOpError(unittest.TestCase):
     self.assertRaises(errors.OpExecError, errors.MaybeRaise, encerr)
 
 
+class _FakeTimer:
+  def __init__(self, interval, fn):
+    self.interval = interval
+    self.fn = fn
+    self.daemon = False
+    self.started = False
+    self.cancelled = False
+
+  def start(self):
+    self.started = True
+
+  def cancel(self):
+    self.cancelled = True
+
+
+class TestJobFileReplicator(unittest.TestCase):
+  def setUp(self):
+    self.batches = []
+    self.timers = []
+
+  def _Replicate(self, files):
+    self.batches.append(files)
+
+  def _NewTimer(self, interval, fn):
+    timer = _FakeTimer(interval, fn)
+    self.timers.append(timer)
+    return timer
+
+  def testCoalesce(self):
+    repl = jqueue._JobFileReplicator(self._Replicate, window=1.5,
+                                     _timer_fn=self._NewTimer)
+    repl.Add("/queue/job-1", "a")
+    repl.Add("/queue/job-2", "b")
+    repl.Add("/queue/job-1", "c")
+    self.assertEqual(self.batches, [])
+    self.assertEqual(len(self.timers), 1)
+    self.assertTrue(self.timers[0].started)
+    self.assertTrue(self.timers[0].daemon)
+    self.assertEqual(self.timers[0].interval, 1.5)
+
+    # Timer expires
+    self.timers[0].fn()
+    self.assertEqual(self.batches,
+                     [[("/queue/job-1", "c"), ("/queue/job-2", "b")]])
+
+    # Nothing pending
+    repl.Flush()
+    self.assertEqual(len(self.batches), 1)
+
+    stats = repl.GetStats()
+    self.assertEqual(stats["batches"], 1)
+    self.assertEqual(stats["files"], 2)
+    self.assertEqual(stats["max_batch"], 2)
+
+  def testBarrier(self):
+    repl = jqueue._JobFileReplicator(self._Replicate, window=10,
+                                     _timer_fn=self._NewTimer)
+    repl.Add("/queue/job-1", "a")
+    repl.Flush()
+    self.assertEqual(self.batches, [[("/queue/job-1", "a")]])
+    self.assertTrue(self.timers[0].cancelled)
+
+    # A new change starts a new timer
+    repl.Add("/queue/job-1", "b")
+    self.assertEqual(len(self.timers), 2)
+    self.assertFalse(self.timers[1].cancelled)
+
+  def testNoWindow(self):
+    repl = jqueue._JobFileReplicator(self._Replicate, window=0,
+                                     _timer_fn=self._NewTimer)
+    repl.Add("/queue/job-1", "a")
+    repl.Add("/queue/job-1", "b")
+    self.assertEqual(self.batches,
+                     [[("/queue/job-1", "a")], [("/queue/job-1", "b")]])
+    self.assertFalse(self.timers)
+
+  def testRun(self):
+    repl = jqueue._JobFileReplicator(self._Replicate, window=10,
+                                     _timer_fn=self._NewTimer)
+    repl.Add("/queue/job-1", "a")
+
+    def _Rename(new_name):
+      self.batches.append(("rename", new_name))
+      # Changes made meanwhile must wait
+      repl.Add("/queue/job-2", "b")
+      self.assertEqual(len(self.batches), 2)
+      return new_name
+
+    self.assertEqual(repl.Run(_Rename, "/queue/archive/job-1"),
+                     "/queue/archive/job-1")
+    self.assertEqual(self.batches, [
+      [("/queue/job-1", "a")],
+      ("rename", "/queue/archive/job-1"),
+      ])
+
+    # The timer of the change made during the rename
+    self.timers[-1].fn()
+    self.assertEqual(self.batches[2:], [[("/queue/job-2", "b")]])
+
+  def testFailure(self):
+    fail = [True]
+
+    def _Replicate(files):
+      if fail[0]:
+        raise errors.GenericError("Replication failed")
+      self.batches.append(files)
+
+    repl = jqueue._JobFileReplicator(_Replicate, window=10,
+                                     _timer_fn=self._NewTimer)
+    repl.Add("/queue/job-1", "a")
+    repl.Add("/queue/job-2", "b")
+
+    # Failures when the timer expires are only logged
+    self.timers[0].fn()
+    self.assertEqual(self.batches, [])
+
+    # Newer changes replace the ones kept after the failure
+    repl.Add("/queue/job-1", "c")
+    self.assertEqual(len(self.timers), 2)
+
+    self.assertRaises(errors.GenericError, repl.Flush)
+    self.assertEqual(self.batches, [])
+
+    fail[0] = False
+    repl.Flush()
+    self.assertEqual(self.batches,
+                     [[("/queue/job-1", "c"), ("/queue/job-2", "b")]])
+    self.assertEqual(repl.GetStats()["batches"], 1)
+
+
+class TestReplicateJobQueueFiles(unittest.TestCase):
+  def setUp(self):
+    self.queue = jqueue.JobQueue.__new__(jqueue.JobQueue)
+    self.queue._nodes = {"node2": "192.0.2.2"}
+    self.queue._GetNodeIp = lambda: (["node2"], ["192.0.2.2"])
+    self.queue._GetRpc = lambda addrs: None
+    self.queue._CheckRpcResult = lambda result, nodes, failmsg: None
+
+    self.job1 = utils.PathJoin(pathutils.QUEUE_DIR, "job-1")
+    self.job2 = utils.PathJoin(pathutils.QUEUE_DIR, "job-2")
+    self.archived = utils.PathJoin(pathutils.JOB_QUEUE_ARCHIVE_DIR, "0",
+                                   "job-3")
+    self.serial = pathutils.JOB_QUEUE_SERIAL_FILE
+
+  @mock.patch("ganeti.jqueue._CallJqUpdateMany")
+  @mock.patch("ganeti.luxi.Client")
+  def testJobsViaLuxid(self, client, update_many):
+    self.queue._ReplicateJobQueueFiles([
+      (self.job1, "a"),
+      (self.serial, "17"),
+      (self.job2, "b"),
+      (self.archived, "c"),
+      ])
+
+    client.return_value.ReplicateJobs.assert_called_once_with([1, 2])
+    update_many.assert_called_once_with(None, ["node2"], [
+      (self.serial, "17"),
+      (self.archived, "c"),
+      ])
+
+  @mock.patch("ganeti.jqueue._CallJqUpdateMany")
+  @mock.patch("ganeti.luxi.Client")
+  def testOnlyJobs(self, client, update_many):
+    self.queue._ReplicateJobQueueFiles([(self.job1, "a")])
+
+    client.return_value.ReplicateJobs.assert_called_once_with([1])
+    self.assertFalse(update_many.called)
+
+  @mock.patch("ganeti.jqueue._CallJqUpdateMany")
+  @mock.patch("ganeti.luxi.Client")
+  def testLuxidFailure(self, client, update_many):
+    client.return_value.ReplicateJobs.side_effect = \
+      errors.ProgrammerError("luxid is down")
+    files = [(self.job1, "a"), (self.serial, "17")]
+
+    self.queue._ReplicateJobQueueFiles(files)
+
+    update_many.assert_called_once_with(None, ["node2"], files)
+
+
 class TestQueuedOpCode(unittest.TestCase):
   def testDefaults(self):
     def _Check(op):
@@ -169,6 +352,28 @@ class TestQueuedJob(unittest.TestCase):
     _Check(job2)
     self.assertEqual(job1.Serialize(), job2.Serialize())
 
+  def testParseJobFileWithLog(self):
+    job = jqueue._QueuedJob(None, 8471, [opcodes.OpTestDelay(),
+                                         opcodes.OpTestDelay()], True)
+    raw_data = serializer.DumpJson(job.Serialize())
+    self.assertEqual(jqueue._ParseJobFile(raw_data), job.Serialize())
+
+    entries = [
+      (0, (1, (1360000000, 0), constants.ELOG_MESSAGE, "first")),
+      (1, (2, (1360000001, 0), constants.ELOG_MESSAGE, "second")),
+      (1, (3, (1360000002, 0), constants.ELOG_MESSAGE, "third")),
+      ]
+    for (op_index, log_entry) in entries:
+      raw_data += "\n" + serializer.DumpJson([op_index, log_entry])
+
+    newjob = jqueue._QueuedJob.Restore(None, jqueue._ParseJobFile(raw_data),
+                                       True, False)
+    self.assertEqual(newjob.log_serial, 3)
+    self.assertEqual([entry[3] for entry in newjob.ops[0].log], ["first"])
+    self.assertEqual([entry[3] for entry in newjob.ops[1].log],
+                     ["second", "third"])
+    self.assertEqual(len(newjob.GetLogEntries(1)), 2)
+
   def testWritable(self):
     job = jqueue._QueuedJob(None, 1, [opcodes.OpTestDelay()], False)
     self.assertFalse(job.writable)
@@ -535,6 +740,9 @@ class _FakeQueueForProc:
   def UpdateJobUnlocked(self, job, replicate=True):
     self._updates.append((job, bool(replicate)))
 
+  def AppendJobLogUnlocked(self, job, op_index, log_entry):
+    self._updates.append((job, op_index, log_entry))
+
   def SubmitManyJobs(self, jobs):
     job_ids = [self._submit_count.next() for _ in jobs]
     self._submitted.extend(zip(job_ids, jobs))
@@ -1041,8 +1249,11 @@ class TestJobProcessor(unittest.TestCase, _JobProcessorTestUtils):
           cbs.Feedback(log_type, msg)
         else:
           cbs.Feedback(msg)
-        # Check for job update without replication
-        self.assertEqual(queue.GetNextUpdate(), (job, False))
+        # Check for log entry being appended
+        (upd_job, op_index, log_entry) = queue.GetNextUpdate()
+        self.assertEqual(upd_job, job)
+        self.assertTrue(job.ops[op_index].input is op)
+        self.assertEqual(job.ops[op_index].log[-1], log_entry)
         self.assertRaises(IndexError, queue.GetNextUpdate)
 
     opexec = _FakeExecOpCodeForProc(queue, _BeforeStart, _AfterStart)
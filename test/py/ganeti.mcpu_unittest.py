@@ -214,5 +214,81 @@ class TestSecretParams(unittest.TestCase):
     self.assertRaises(errors.OpPrereqError, mcpu._CheckSecretParameters, op)
 
 
+class _FakeLockContext(object):
+  def GetConfig(self, _):
+    return None
+
+  def GetRpc(self, _):
+    return None
+
+  def GetWConfdContext(self, ec_id):
+    return (ec_id, "/tmp/livelock", 1)
+
+
+class _FakeWConfd(object):
+  def __init__(self, pending):
+    self._pending = pending
+    self.calls = 0
+
+  def GetSharedClient(self):
+    return self
+
+  def HasPendingRequest(self, _):
+    self.calls += 1
+    return self._pending.pop(0)
+
+
+class TestWaitForLocks(unittest.TestCase):
+  def setUp(self):
+    self._orig_wait = mcpu._WaitForSignal
+    self._orig_interval = mcpu._LOCK_POLL_INTERVAL
+    self.waits = []
+    mcpu._WaitForSignal = self.waits.append
+    mcpu.sighupReceived[0] = False
+
+  def tearDown(self):
+    mcpu._WaitForSignal = self._orig_wait
+    mcpu._LOCK_POLL_INTERVAL = self._orig_interval
+    mcpu.sighupReceived[0] = False
+
+  def _GetProcessor(self, pending):
+    proc = mcpu.Processor(_FakeLockContext(), 1)
+    proc.wconfd = _FakeWConfd(pending)
+    return proc
+
+  def testNotification(self):
+    proc = self._GetProcessor([False])
+
+    def _Wait(timeout):
+      self.waits.append(timeout)
+      mcpu.NotifyLockChange()
+    mcpu._WaitForSignal = _Wait
+
+    self.assertFalse(proc._WaitForLocks(None))
+    self.assertEqual(len(self.waits), 1)
+    self.assertEqual(proc.wconfd.calls, 1)
+    self.assertFalse(mcpu.sighupReceived[0])
+    stats = proc.GetLockStats()
+    self.assertEqual(stats["waits"], 1)
+    self.assertEqual(stats["notified"], 1)
+    self.assertEqual(stats["polled"], 0)
+
+  def testTimeout(self):
+    proc = self._GetProcessor([True])
+    self.assertTrue(proc._WaitForLocks(0))
+    self.assertEqual(proc.wconfd.calls, 1)
+    self.assertEqual(self.waits, [])
+
+  def testLostNotification(self):
+    mcpu._LOCK_POLL_INTERVAL = 0
+    proc = self._GetProcessor([True, True, False])
+    self.assertFalse(proc._WaitForLocks(None))
+    self.assertEqual(proc.wconfd.calls, 3)
+    self.assertEqual(len(self.waits), 2)
+    stats = proc.GetLockStats()
+    self.assertEqual(stats["notified"], 0)
+    self.assertEqual(stats["polled"], 1)
+
+
 if __name__ == "__main__":
   testutils.GanetiTestProgram()
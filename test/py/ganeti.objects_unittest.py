@@ -61,6 +61,92 @@ class TestDictState(unittest.TestCase):
     o2 = SimpleObject.FromDict(o1.ToDict())
     self.assertEquals(o1.ToDict(), {"a": 2, "b": 5})
 
+  def testFromDict(self):
+    o1 = SimpleObject.FromDict({u"a": 1, "b": None})
+    self.assertEqual(o1.a, 1)
+    self.assertTrue(o1.b is None)
+    self.assertEqual(o1.ToDict(), {"a": 1})
+    self.assertEqual(o1, SimpleObject(a=1))
+
+    self.assertEqual(SimpleObject.FromDict({}).ToDict(), {})
+    self.assertRaises(TypeError, SimpleObject.FromDict, {"c": 1})
+    self.assertRaises(errors.ConfigurationError, SimpleObject.FromDict, [])
+
+  def testSubclass(self):
+    class _Sub(SimpleObject):
+      __slots__ = ["c", "a"]
+
+    o1 = _Sub.FromDict({"a": 1, "c": 3})
+    self.assertEqual(o1.ToDict(), {"a": 1, "c": 3})
+    self.assertTrue(o1.b is None)
+    self.assertRaises(TypeError, SimpleObject.FromDict, {"c": 3})
+    self.assertRaises(AttributeError, getattr, SimpleObject(), "c")
+
+  def testCustomConstructor(self):
+    class _WithInit(SimpleObject):
+      __slots__ = []
+
+      def __init__(self, **kwargs):
+        SimpleObject.__init__(self, **kwargs)
+        if self.b is None:
+          self.b = "default"
+
+    self.assertEqual(_WithInit.FromDict({"a": 1}).ToDict(),
+                     {"a": 1, "b": "default"})
+
+  def testProperty(self):
+    class _WithProperty(SimpleObject):
+      __slots__ = []
+
+      @property
+      def b(self):
+        return "fixed"
+
+    self.assertEqual(_WithProperty.FromDict({"a": 1}).ToDict(),
+                     {"a": 1, "b": "fixed"})
+    self.assertRaises(AttributeError, _WithProperty.FromDict, {"b": 2})
+
+  def testCopy(self):
+    params = {"x": 1}
+    o1 = SimpleObject(a=params)
+    o2 = o1.Copy()
+    self.assertFalse(o1 is o2)
+    self.assertEqual(o1, o2)
+    self.assertTrue(o2.a is params)
+    self.assertTrue(o2.b is None)
+    o2.b = 2
+    self.assertTrue(o1.b is None)
+
+  def testCopyCustomConversion(self):
+    class _Converted(SimpleObject):
+      __slots__ = []
+
+      def ToDict(self, _with_private=False):
+        result = super(_Converted, self).ToDict(_with_private=_with_private)
+        result["a"] = list(result["a"])
+        return result
+
+      @classmethod
+      def FromDict(cls, val):
+        obj = super(_Converted, cls).FromDict(val)
+        obj.a = tuple(obj.a)
+        return obj
+
+    o1 = _Converted(a=(1, 2))
+    o2 = o1.Copy()
+    self.assertEqual(o2.a, (1, 2))
+    self.assertEqual(o2.ToDict(), {"a": [1, 2]})
+
+  def testCopyNic(self):
+    nicparams = {constants.NIC_MODE: constants.NIC_MODE_BRIDGED}
+    nic = objects.NIC(mac="aa:00:00:00:00:01", ip="192.0.2.1",
+                      nicparams=nicparams)
+    nic2 = nic.Copy()
+    self.assertTrue(isinstance(nic2, objects.NIC))
+    self.assertEqual(nic2.ToDict(), nic.ToDict())
+    nic2.ip = None
+    self.assertEqual(nic.ip, "192.0.2.1")
+
 
 class TestClusterObject(unittest.TestCase):
   """Tests done on a L{objects.Cluster}"""
@@ -56,6 +56,32 @@ class TestAutoSlot(unittest.TestCase):
     self.assertEqual(slotted.__slots__, AutoSlotted.SLOTS)
 
 
+class _Slotted(outils.ValidatedSlots):
+  __slots__ = ["foo", "bar"]
+
+
+class _SlottedChild(_Slotted):
+  __slots__ = ["baz"]
+
+
+class TestValidatedSlots(unittest.TestCase):
+  def testGetAllSlots(self):
+    self.assertEqual(_Slotted.GetAllSlots(), ["foo", "bar"])
+    self.assertEqual(_SlottedChild.GetAllSlots(), ["baz", "foo", "bar"])
+    self.assertEqual(_Slotted.GetAllSlots(), ["foo", "bar"])
+    self.assertTrue(_Slotted.GetAllSlots() is _Slotted.GetAllSlots())
+
+  def testGetAllSlotsSet(self):
+    self.assertEqual(_SlottedChild.GetAllSlotsSet(),
+                     frozenset(["foo", "bar", "baz"]))
+    self.assertEqual(_Slotted.GetAllSlotsSet(), frozenset(["foo", "bar"]))
+
+  def testConstructor(self):
+    obj = _SlottedChild(foo=1, baz=3)
+    self.assertEqual((obj.foo, obj.baz), (1, 3))
+    self.assertRaises(TypeError, _Slotted, baz=3)
+
+
 class TestContainerToDicts(unittest.TestCase):
   def testUnknownType(self):
     for value in [None, 19410, "xyz"]:
@@ -33,6 +33,7 @@
 import re
 import unittest
 import random
+import operator
 import uuid as uuid_module
 
 from ganeti import constants
@@ -40,6 +41,7 @@ from ganeti import utils
 from ganeti import compat
 from ganeti import errors
 from ganeti import query
+from ganeti import qlang
 from ganeti import objects
 from ganeti import cmdlib
 
@@ -1409,6 +1411,159 @@ class TestQueryFilter(unittest.TestCase):
         self.assertTrue(callable(query._CompileFilter(fielddefs, None,
                                                       qfilter)))
 
+  def testCompileFilterFolding(self):
+    calls = []
+
+    def _GetName(ctx, item):
+      calls.append(item["name"])
+      return item["name"]
+
+    fielddefs = query._PrepareFieldList([
+      (query._MakeField("name", "Name", constants.QFT_TEXT, "Name"),
+       None, 0, _GetName),
+      ], [])
+
+    for (qfilter, expected) in [
+      (["|"], False),
+      (["&"], True),
+      (["!", ["|"]], True),
+      (["!", ["!", ["&"]]], True),
+      (["|", ["&"], ["=", "name", "a"]], True),
+      (["&", ["|"], ["=", "name", "a"]], False),
+      (["&", ["&"], ["|", ["|"], ["&"]]], True),
+      ]:
+      filter_fn = query._CompileFilter(fielddefs, None, qfilter)
+      self.assertEqual(filter_fn(None, { "name": "a", }), expected)
+      self.assertEqual(filter_fn(None, { "name": "b", }), expected)
+      self.assertFalse(calls)
+
+    # Equality checks on the same field are merged into a single lookup
+    filter_fn = query._CompileFilter(fielddefs, None,
+      ["|", ["=", "name", "a"], ["|", ["=", "name", "b"],
+                                 ["=", "name", "c"]],
+       ["=", "name", "d"]])
+    for (name, expected) in [("a", True), ("c", True), ("e", False)]:
+      self.assertEqual(filter_fn(None, { "name": name, }), expected)
+    self.assertEqual(calls, ["a", "c", "e"])
+
+    # Duplicate conditions are only evaluated once
+    del calls[:]
+    filter_fn = query._CompileFilter(fielddefs, None,
+      ["&", ["=~", "name", "^x"], ["&", ["=~", "name", "^x"]],
+       ["!", ["!", ["=~", "name", "^x"]]]])
+    self.assertTrue(filter_fn(None, { "name": "xyz", }))
+    self.assertFalse(filter_fn(None, { "name": "abc", }))
+    self.assertEqual(calls, ["xyz", "abc"])
+
+  def testCompileFilterRandom(self):
+    fielddefs = query._PrepareFieldList([
+      (query._MakeField("name", "Name", constants.QFT_TEXT, "Name"),
+       None, 0, lambda ctx, item: item["name"]),
+      (query._MakeField("num", "Num", constants.QFT_NUMBER, "Number"),
+       None, 0, lambda ctx, item: item["num"]),
+      (query._MakeField("flag", "Flag", constants.QFT_BOOL, "Flag"),
+       None, 0, lambda ctx, item: item["flag"]),
+      (query._MakeField("tags", "Tags", constants.QFT_OTHER, "Tags"),
+       None, 0, lambda ctx, item: item["tags"]),
+      (query._MakeField("host", "Host", constants.QFT_TEXT, "Host"),
+       None, query.QFF_HOSTNAME, lambda ctx, item: item["host"]),
+      ], [])
+
+    binops = {
+      "=": operator.eq,
+      "!=": operator.ne,
+      "<": operator.lt,
+      ">=": operator.ge,
+      }
+
+    def _Eval(qfilter, item):
+      op = qfilter[0]
+      if op == "|":
+        return compat.any(_Eval(i, item) for i in qfilter[1:])
+      elif op == "&":
+        return compat.all(_Eval(i, item) for i in qfilter[1:])
+      elif op == "!":
+        return not _Eval(qfilter[1], item)
+      elif op == "?":
+        return bool(item[qfilter[1]])
+      elif op == "=~":
+        return bool(re.search(qfilter[2], item[qfilter[1]]))
+      elif op == "=[]":
+        return qfilter[2] in item[qfilter[1]]
+      elif qfilter[1] == "host":
+        result = bool(utils.MatchNameComponent(qfilter[2], [item["host"]],
+                                               case_sensitive=False))
+        return result == (op == "=")
+      else:
+        return binops[op](item[qfilter[1]], qfilter[2])
+
+    def _GenFilter(rnd, level):
+      kind = rnd.randint(0, 3)
+      if level < 3 and kind == 0:
+        return ([rnd.choice(["|", "&"])] +
+                [_GenFilter(rnd, level + 1)
+                 for _ in range(rnd.randint(0, 4))])
+      elif level < 3 and kind == 1:
+        return ["!", _GenFilter(rnd, level + 1)]
+      else:
+        return rnd.choice([
+          ["=", "name", "n%s" % rnd.randint(0, 5)],
+          ["!=", "name", "n%s" % rnd.randint(0, 5)],
+          ["=~", "name", rnd.choice(["^n[0-2]$", "3", "^x"])],
+          [rnd.choice(binops.keys()), "num", rnd.randint(0, 5)],
+          ["=", "flag", rnd.choice([False, True])],
+          ["?", rnd.choice(["flag", "num", "tags"])],
+          ["=[]", "tags", "t%s" % rnd.randint(0, 2)],
+          [rnd.choice(["=", "!="]), "host",
+           rnd.choice(["n1", "N1.example", "n2", "n1.example.net", ""])],
+          ])
+
+    rnd = random.Random(9184)
+
+    data = [{
+      "name": "n%s" % rnd.randint(0, 5),
+      "num": rnd.randint(0, 5),
+      "flag": rnd.choice([False, True]),
+      "tags": ["t%s" % i for i in range(rnd.randint(0, 2))],
+      "host": rnd.choice(["n1.example.com", "N1.Example.net", "n2", "n12",
+                          ".example.com", ""]),
+      } for _ in range(20)]
+
+    for _ in range(200):
+      qfilter = _GenFilter(rnd, 0)
+      filter_fn = query._CompileFilter(fielddefs, None, qfilter)
+      for item in data:
+        self.assertEqual(filter_fn(None, item), _Eval(qfilter, item),
+                         msg="Filter %r, item %r" % (qfilter, item))
+
+  def testCompileFilterLong(self):
+    fielddefs = query._PrepareFieldList([
+      (query._MakeField("name", "Name", constants.QFT_TEXT, "Name"),
+       None, query.QFF_HOSTNAME, lambda ctx, item: item),
+      (query._MakeField("num", "Num", constants.QFT_NUMBER, "Number"),
+       None, 0, lambda ctx, item: len(item)),
+      ], [])
+
+    names = ["node%s" % i for i in range(500)]
+
+    # Hostname checks are merged into a single regular expression
+    filter_fn = query._CompileFilter(fielddefs, None,
+                                     qlang.MakeSimpleFilter("name", names))
+    for name in names[0], names[250], names[-1]:
+      self.assertTrue(filter_fn(None, "%s.example.com" % name))
+      self.assertTrue(filter_fn(None, name.upper()))
+    for name in ["node500.example.com", "node1x.example.com", "xnode1", ""]:
+      self.assertFalse(filter_fn(None, name))
+
+    # Conditions which can't be merged are compiled in chunks
+    count = query._FilterCompilerHelper._CHUNK_SIZE ** 2 + 17
+    filter_fn = query._CompileFilter(fielddefs, None,
+                                     ["&"] + [["!", ["=", "num", i]]
+                                              for i in range(count)])
+    self.assertFalse(filter_fn(None, "x" * (count - 1)))
+    self.assertFalse(filter_fn(None, "x" * 11))
+    self.assertTrue(filter_fn(None, "x" * count))
+
   def testQueryInputOrder(self):
     fielddefs = query._PrepareFieldList([
       (query._MakeField("pnode", "PNode", constants.QFT_TEXT, "Primary"),
@@ -169,5 +169,74 @@ class TestOpcodeResource(unittest.TestCase):
           self.assertFalse(hasattr(obj, attr))
 
 
+class TestSelectPage(unittest.TestCase):
+  def testAll(self):
+    self.assertEqual(baserlib.SelectPage([], None, None), [])
+    self.assertEqual(baserlib.SelectPage(["c", "a", "b"], None, None),
+                     ["a", "b", "c"])
+
+  def testLimit(self):
+    keys = ["node%s" % i for i in range(20)]
+    self.assertEqual(baserlib.SelectPage(keys, None, 3),
+                     ["node0", "node1", "node2"])
+    self.assertEqual(baserlib.SelectPage(keys, None, 100), keys)
+
+  def testNiceSort(self):
+    keys = ["node10", "node2", "node01", "node1", "node9"]
+    self.assertEqual(baserlib.SelectPage(keys, None, None),
+                     ["node01", "node1", "node2", "node9", "node10"])
+    self.assertEqual(baserlib.SelectPage(keys, "node01", 2),
+                     ["node1", "node2"])
+    self.assertEqual(baserlib.SelectPage(keys, "node9", 2), ["node10"])
+
+  def testCursor(self):
+    keys = [5, 1, 3, 9, 7]
+    self.assertEqual(baserlib.SelectPage(keys, 3, None), [5, 7, 9])
+    self.assertEqual(baserlib.SelectPage(keys, 3, 2), [5, 7])
+    self.assertEqual(baserlib.SelectPage(keys, 9, 2), [])
+
+    # Cursor pointing to a removed item
+    self.assertEqual(baserlib.SelectPage(keys, 4, 1), [5])
+    self.assertEqual(baserlib.SelectPage(keys, 0, 1), [1])
+
+  def testAllPages(self):
+    keys = ["inst%s.example.com" % i for i in range(103)]
+
+    for limit in [1, 2, 10, 50, 103, 200]:
+      result = []
+      cursor = None
+      while True:
+        page = baserlib.SelectPage(keys, cursor, limit)
+        self.assertTrue(len(page) <= limit)
+        result.extend(page)
+        if len(page) < limit:
+          break
+        cursor = page[-1]
+
+      self.assertEqual(result, keys)
+
+
+class TestPagination(unittest.TestCase):
+  def test(self):
+    obj = baserlib.ResourceBase(None, {}, None)
+    self.assertEqual(obj.getPagination(), (None, None))
+
+    obj = baserlib.ResourceBase(None, {"limit": ["10"], "cursor": ["foo"]},
+                                None)
+    self.assertEqual(obj.getPagination(), (10, "foo"))
+
+    obj = baserlib.ResourceBase(None, {"cursor": ["123"]}, None)
+    self.assertEqual(obj.getPagination(cursor_fn=int), (None, 123))
+
+  def testInvalid(self):
+    for queryargs in [{"limit": ["0"]}, {"limit": ["-1"]},
+                      {"limit": ["x"]}]:
+      obj = baserlib.ResourceBase(None, queryargs, None)
+      self.assertRaises(http.HttpBadRequest, obj.getPagination)
+
+    obj = baserlib.ResourceBase(None, {"cursor": ["x"]}, None)
+    self.assertRaises(http.HttpBadRequest, obj.getPagination, cursor_fn=int)
+
+
 if __name__ == "__main__":
   testutils.GanetiTestProgram()
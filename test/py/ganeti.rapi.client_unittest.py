@@ -145,6 +145,7 @@ class TestConstants(unittest.TestCase):
     self.assertEqual(client.NODE_MIGRATE_REQV1, rlib2._NODE_MIGRATE_REQV1)
     self.assertEqual(client._NODE_EVAC_RES1, rlib2._NODE_EVAC_RES1)
     self.assertEqual(client.NODE_EVAC_RES1, rlib2._NODE_EVAC_RES1)
+    self.assertEqual(client.LIST_PAGINATION, rlib2._LIST_PAGINATION)
 
     # Error codes
     self.assertEqual(client.ECODE_RESOLVER, errors.ECODE_RESOLVER)
@@ -496,6 +497,59 @@ class GanetiRapiClientTests(testutils.GanetiTestCase):
     self.assertHandler(rlib2.R_2_instances)
     self.assertBulk()
 
+  def testIterInstances(self):
+    self.rapi.AddResponse(serializer.DumpJson([client.LIST_PAGINATION]))
+    self.rapi.AddResponse('[{"id": "inst1", "uri": "/2/instances/inst1"},'
+                          ' {"id": "inst2", "uri": "/2/instances/inst2"}]')
+    self.rapi.AddResponse('[{"id": "inst3", "uri": "/2/instances/inst3"}]')
+    self.assertEqual(["inst1", "inst2", "inst3"],
+                     list(self.client.IterInstances(page_size=2)))
+    self.assertHandler(rlib2.R_2_instances)
+    self.assertQuery("limit", ["2"])
+    self.assertQuery("cursor", ["inst2"])
+    self.assertEqual(self.rapi.CountPending(), 0)
+
+    self.rapi.AddResponse(serializer.DumpJson([client.LIST_PAGINATION]))
+    self.rapi.AddResponse('[{"name": "inst1"}, {"name": "inst2"}]')
+    self.rapi.AddResponse("[]")
+    self.assertEqual([{"name": "inst1"}, {"name": "inst2"}],
+                     list(self.client.IterInstances(bulk=True, page_size=2)))
+    self.assertHandler(rlib2.R_2_instances)
+    self.assertBulk()
+    self.assertQuery("cursor", ["inst2"])
+    self.assertEqual(self.rapi.CountPending(), 0)
+
+    self.assertRaises(client.Error, list,
+                      self.client.IterInstances(page_size=0))
+
+  def testIterInstancesNoPagination(self):
+    self.rapi.AddResponse("[]")
+    self.rapi.AddResponse('[{"id": "inst1"}, {"id": "inst2"}, {"id": "inst3"}]')
+    self.assertEqual(["inst1", "inst2", "inst3"],
+                     list(self.client.IterInstances(page_size=2)))
+    self.assertHandler(rlib2.R_2_instances)
+    self.assertQuery("limit", None)
+    self.assertQuery("cursor", None)
+    self.assertEqual(self.rapi.CountPending(), 0)
+
+  def testIterInstancesLimitIgnored(self):
+    self.rapi.AddResponse(serializer.DumpJson([client.LIST_PAGINATION]))
+    self.rapi.AddResponse('[{"id": "inst1"}, {"id": "inst2"}, {"id": "inst3"}]')
+    self.assertEqual(["inst1", "inst2", "inst3"],
+                     list(self.client.IterInstances(page_size=2)))
+    self.assertQuery("cursor", None)
+    self.assertEqual(self.rapi.CountPending(), 0)
+
+  def testIterInstancesCursorNotAdvancing(self):
+    self.rapi.AddResponse(serializer.DumpJson([client.LIST_PAGINATION]))
+    self.rapi.AddResponse('[{"id": "inst1"}]')
+    self.rapi.AddResponse('[{"id": "inst1"}]')
+    self.rapi.AddResponse('[{"id": "inst1"}]')
+    self.assertRaises(client.Error, list,
+                      self.client.IterInstances(page_size=1))
+    self.assertQuery("cursor", ["inst1"])
+    self.assertEqual(self.rapi.CountPending(), 1)
+
   def testGetInstance(self):
     self.rapi.AddResponse("[]")
     self.assertEqual([], self.client.GetInstance("instance"))
@@ -866,6 +920,24 @@ class GanetiRapiClientTests(testutils.GanetiTestCase):
     self.assertHandler(rlib2.R_2_jobs)
     self.assertBulk()
 
+  def testIterJobs(self):
+    self.rapi.AddResponse(serializer.DumpJson([client.LIST_PAGINATION]))
+    self.rapi.AddResponse('[ { "id": "123", "uri": "\\/2\\/jobs\\/123" },'
+                          '  { "id": "124", "uri": "\\/2\\/jobs\\/124" } ]')
+    self.assertEqual([123, 124], list(self.client.IterJobs(page_size=5)))
+    self.assertHandler(rlib2.R_2_jobs)
+    self.assertQuery("limit", ["5"])
+    self.assertQuery("cursor", None)
+
+    self.rapi.AddResponse(serializer.DumpJson([client.LIST_PAGINATION]))
+    self.rapi.AddResponse('[ { "id": 123 }, { "id": 124 } ]')
+    self.rapi.AddResponse('[ { "id": 125 } ]')
+    self.assertEqual([{"id": 123}, {"id": 124}, {"id": 125}],
+                     list(self.client.IterJobs(bulk=True, page_size=2)))
+    self.assertHandler(rlib2.R_2_jobs)
+    self.assertBulk()
+    self.assertQuery("cursor", ["124"])
+
   def testGetJobStatus(self):
     self.rapi.AddResponse("{\"foo\": \"bar\"}")
     self.assertEqual({"foo": "bar"}, self.client.GetJobStatus(1234))
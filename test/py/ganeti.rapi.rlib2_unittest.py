@@ -1454,6 +1454,159 @@ class TestClusterInfo(unittest.TestCase):
     self.assertEqual(result, cl.cluster_info)
 
 
+class _PaginationClient:
+  INSTANCES = ["inst%02d.example.com" % i for i in range(25)]
+  JOBS = range(1, 40)
+
+  def __init__(self, address=None):
+    self.queries = []
+
+  @staticmethod
+  def _MakeRows(keys, fields, key_field):
+    rows = []
+    for key in keys:
+      row = []
+      for field in fields:
+        if field == key_field:
+          row.append(key)
+        elif field == "beparams":
+          row.append({constants.BE_MAXMEM: 128})
+        else:
+          row.append(None)
+      rows.append(row)
+    # Don't rely on the order of returned rows
+    rows.reverse()
+    return rows
+
+  def QueryInstances(self, names, fields, use_locking):
+    self.queries.append((names, fields))
+    if not names:
+      names = self.INSTANCES
+    return self._MakeRows(names, fields, "name")
+
+  def QueryJobs(self, job_ids, fields):
+    self.queries.append((job_ids, fields))
+    if job_ids is None:
+      job_ids = self.JOBS
+    return self._MakeRows(job_ids, fields, "id")
+
+
+class _RemovingPaginationClient(_PaginationClient):
+  """Removes the first instance each time all names have been listed.
+
+  """
+  REMOVALS = 1
+
+  def __init__(self, address=None):
+    _PaginationClient.__init__(self, address=address)
+    self._instances = list(self.INSTANCES)
+    self._removals = self.REMOVALS
+
+  def QueryInstances(self, names, fields, use_locking):
+    self.queries.append((names, fields))
+
+    if not names:
+      result = self._MakeRows(self._instances, fields, "name")
+      if self._removals > 0:
+        self._removals -= 1
+        self._instances.pop(0)
+      return result
+
+    missing = sorted(set(names) - set(self._instances))
+    if missing:
+      # Like the query daemon, fail the whole query
+      raise errors.OpPrereqError("Instance name %s not found" % missing[0],
+                                 errors.ECODE_NOENT)
+
+    return self._MakeRows(names, fields, "name")
+
+
+class TestListPagination(unittest.TestCase):
+  def _Get(self, cls, queryargs, client_cls=_PaginationClient):
+    clfactory = _FakeClientFactory(client_cls)
+    handler = _CreateHandler(cls, [], queryargs, None, clfactory)
+    result = handler.GET()
+    cl = clfactory.GetNextClient()
+    self.assertRaises(IndexError, clfactory.GetNextClient)
+    return (result, cl.queries)
+
+  def testInstancesNoPagination(self):
+    (result, queries) = self._Get(rlib2.R_2_instances, {"bulk": ["1"]})
+    self.assertEqual(len(result), len(_PaginationClient.INSTANCES))
+    self.assertEqual(queries, [([], rlib2.I_FIELDS)])
+
+  def testInstancesBulk(self):
+    names = _PaginationClient.INSTANCES
+
+    (result, queries) = self._Get(rlib2.R_2_instances,
+                                  {"bulk": ["1"], "limit": ["10"]})
+    self.assertEqual([i["name"] for i in result], names[:10])
+    self.assertEqual(result[0]["beparams"][constants.BE_MEMORY], 128)
+    self.assertEqual(queries, [([], ["name"]), (names[:10], rlib2.I_FIELDS)])
+
+    (result, queries) = self._Get(rlib2.R_2_instances,
+                                  {"bulk": ["1"], "limit": ["10"],
+                                   "cursor": [names[19]]})
+    self.assertEqual([i["name"] for i in result], names[20:])
+
+    (result, queries) = self._Get(rlib2.R_2_instances,
+                                  {"bulk": ["1"], "limit": ["10"],
+                                   "cursor": [names[-1]]})
+    self.assertEqual(result, [])
+    self.assertEqual(queries, [([], ["name"])])
+
+  def testInstancesNames(self):
+    names = _PaginationClient.INSTANCES
+
+    (result, queries) = self._Get(rlib2.R_2_instances,
+                                  {"limit": ["5"], "cursor": [names[2]]})
+    self.assertEqual([i["id"] for i in result], names[3:8])
+    self.assertEqual(queries, [([], ["name"])])
+
+  def testInstanceRemoved(self):
+    names = _PaginationClient.INSTANCES
+
+    (result, queries) = self._Get(rlib2.R_2_instances,
+                                  {"bulk": ["1"], "limit": ["5"]},
+                                  client_cls=_RemovingPaginationClient)
+    self.assertEqual([i["name"] for i in result], names[1:6])
+    self.assertEqual(queries, [
+      ([], ["name"]),
+      (names[:5], rlib2.I_FIELDS),
+      ([], ["name"]),
+      (names[1:6], rlib2.I_FIELDS),
+      ])
+
+  def testInstancesKeepBeingRemoved(self):
+    class _Client(_RemovingPaginationClient):
+      REMOVALS = rlib2._QUERY_PAGE_ATTEMPTS
+
+    clfactory = _FakeClientFactory(_Client)
+    handler = _CreateHandler(rlib2.R_2_instances, [],
+                             {"bulk": ["1"], "limit": ["5"]}, None, clfactory)
+    self.assertRaises(errors.OpPrereqError, handler.GET)
+    self.assertEqual(len(clfactory.GetNextClient().queries),
+                     2 * rlib2._QUERY_PAGE_ATTEMPTS)
+
+  def testJobs(self):
+    (result, _) = self._Get(rlib2.R_2_jobs, {"limit": ["10"]})
+    self.assertEqual([i["id"] for i in result], range(1, 11))
+
+    # Job IDs are compared as numbers
+    (result, queries) = self._Get(rlib2.R_2_jobs,
+                                  {"bulk": ["1"], "limit": ["10"],
+                                   "cursor": ["9"]})
+    self.assertEqual([i["id"] for i in result], range(10, 20))
+    self.assertEqual(queries, [(None, ["id"]),
+                               (range(10, 20), rlib2.J_FIELDS_BULK)])
+
+  def testInvalid(self):
+    for queryargs in [{"limit": ["0"]}, {"cursor": ["abc"]}]:
+      handler = _CreateHandler(rlib2.R_2_jobs, [], queryargs, None,
+                               _FakeClientFactory(_PaginationClient))
+      self.assertRaises(http.HttpBadRequest, handler.GET)
+
+
 class TestInstancesMultiAlloc(unittest.TestCase):
   def testInstanceUpdate(self):
     clfactory = _FakeClientFactory(_FakeClient)
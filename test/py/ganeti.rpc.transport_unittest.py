@@ -0,0 +1,109 @@
+#!/usr/bin/python
+#
+
+# Copyright (C) 2015 Google Inc.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+#
+# 1. Redistributions of source code must retain the above copyright notice,
+# this list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright
+# notice, this list of conditions and the following disclaimer in the
+# documentation and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS
+# IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED
+# TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR
+# PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR
+# CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+# EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+# PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR
+# PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF
+# LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
+# NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+"""Script for unittesting the RPC transport module"""
+
+
+import os
+import unittest
+
+from ganeti import constants
+from ganeti.rpc import errors
+from ganeti.rpc import transport
+
+import testutils
+
+
+class TestMessageBuffer(unittest.TestCase):
+  def _Split(self, data, chunk, **kwargs):
+    msgbuf = transport.MessageBuffer(**kwargs)
+    result = []
+    for i in range(0, len(data), chunk):
+      msgbuf.Feed(data[i:i + chunk])
+      while msgbuf.HasMessages():
+        result.append(msgbuf.PopMessage())
+    return result
+
+  def test(self):
+    msgs = ["", "a", "hello world", "x" * 10000, "", "end"]
+    data = "".join(msg + constants.LUXI_EOM for msg in msgs)
+    for chunk in [1, 2, 3, 7, 100, 4096, len(data)]:
+      self.assertEqual(self._Split(data, chunk), msgs)
+
+  def testLongTerminator(self):
+    msgs = ["", "a", "hello\r world\n", "x" * 10000, "", "\r", "end"]
+    data = "".join(msg + "\r\n" for msg in msgs)
+    for chunk in [1, 2, 3, 7, 100, 4096, len(data)]:
+      self.assertEqual(self._Split(data, chunk, eom="\r\n"), msgs)
+
+  def testIncomplete(self):
+    msgbuf = transport.MessageBuffer()
+    msgbuf.Feed("foo")
+    self.assertFalse(msgbuf.HasMessages())
+    msgbuf.Feed("bar" + constants.LUXI_EOM + "baz")
+    self.assertTrue(msgbuf.HasMessages())
+    self.assertEqual(msgbuf.PopMessage(), "foobar")
+    self.assertFalse(msgbuf.HasMessages())
+    msgbuf.Feed(constants.LUXI_EOM)
+    self.assertEqual(msgbuf.PopMessage(), "baz")
+
+  def testReadSize(self):
+    msgbuf = transport.MessageBuffer()
+    initial = msgbuf.read_size
+    total = 0
+    for _ in range(100):
+      size = msgbuf.read_size
+      msgbuf.Feed("x" * size)
+      total += size
+      if total == initial:
+        self.assertEqual(msgbuf.read_size, 2 * initial)
+    self.assertEqual(msgbuf.read_size, transport._MAX_READ_SIZE)
+    msgbuf.Feed(constants.LUXI_EOM)
+    self.assertEqual(msgbuf.read_size, initial)
+    self.assertEqual(len(msgbuf.PopMessage()), total)
+
+
+class TestFdTransport(unittest.TestCase):
+  def test(self):
+    # messages must fit into the pipe buffer, as there is only one thread
+    (rfd, wfd) = os.pipe()
+    trans = transport.FdTransport((rfd, wfd))
+    try:
+      for msg in ["", "short", "x" * 30000]:
+        trans.Send(msg)
+        self.assertEqual(trans.Recv(), msg)
+      self.assertRaises(errors.ProtocolError, trans.Send,
+                        "a" + constants.LUXI_EOM + "b")
+    finally:
+      trans.Close()
+
+
+if __name__ == "__main__":
+  testutils.GanetiTestProgram()
@@ -82,6 +82,14 @@ class TestSerializer(testutils.GanetiTestCase):
   def testJson(self):
     self._TestSerializer(serializer.DumpJson, serializer.LoadJson)
 
+  def testJsonSortKeys(self):
+    first = dict((i, i) for i in range(100))
+    second = dict((i, i) for i in reversed(range(100)))
+    self.assertEqual(serializer.DumpJson(first, sort_keys=True),
+                     serializer.DumpJson(second, sort_keys=True))
+    self.assertEqual(serializer.DumpJson({"b": 1, "a": 2}, sort_keys=True),
+                     "{\"a\": 2, \"b\": 1}\n")
+
   def testSignedJson(self):
     self._TestSigned(serializer.DumpSignedJson, serializer.LoadSignedJson)
 
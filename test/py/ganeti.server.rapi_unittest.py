@@ -267,6 +267,48 @@ class TestRemoteApiHandler(unittest.TestCase):
         else:
           self.assertEqual(code, http.HttpNotImplemented.code)
 
+  def testNdjson(self):
+    rm = rapi.testutils._RapiMock(BasicAuthenticator(NotImplemented),
+                                  _FakeLuxiClientForJobs)
+
+    for accept in [http.HTTP_APP_NDJSON,
+                   "%s, %s;q=0.5" % (http.HTTP_APP_NDJSON.upper(),
+                                     http.HTTP_APP_JSON)]:
+      headers = rapi.testutils._FormatHeaders([
+        "%s: %s" % (http.HTTP_ACCEPT, accept),
+        ])
+
+      (code, resp_headers, resp_body) = \
+        rm.FetchResponse("/2/jobs", http.HTTP_GET,
+                         http.ParseHeaders(StringIO(headers)), None)
+
+      self.assertEqual(code, http.HTTP_OK)
+      self.assertEqual(resp_headers[http.HTTP_CONTENT_TYPE],
+                       http.HTTP_APP_NDJSON)
+      self.assertTrue(resp_body.endswith("\n"))
+      self.assertEqual(map(serializer.LoadJson, resp_body.splitlines()), [
+        {"id": 1, "uri": "/2/jobs/1"},
+        {"id": 2, "uri": "/2/jobs/2"},
+        ])
+
+    # Non-list results are always sent as JSON
+    (code, resp_headers, resp_body) = \
+      rm.FetchResponse("/version", http.HTTP_GET,
+                       http.ParseHeaders(StringIO(headers)), None)
+    self.assertEqual(code, http.HTTP_OK)
+    self.assertEqual(resp_headers[http.HTTP_CONTENT_TYPE], http.HTTP_APP_JSON)
+    self.assertEqual(serializer.LoadJson(resp_body), constants.RAPI_VERSION)
+
+
+class _FakeLuxiClientForJobs:
+  def __init__(self, *args, **kwargs):
+    pass
+
+  def QueryJobs(self, job_ids, fields):
+    assert job_ids is None
+    assert fields == ["id"]
+    return [[2], [1]]
+
 
 class _FakeLuxiClientForQuery:
   def __init__(self, *args, **kwargs):
@@ -35,6 +35,8 @@ import tempfile
 import unittest
 import shutil
 
+import mock
+
 import testutils
 import mocks
 
@@ -521,6 +523,36 @@ class TestDetermineKeyBits(testutils.GanetiTestCase):
       self.assertEquals(b, ssh.DetermineKeyBits("rsa", b, None, None))
 
 
+class TestRunSshCmdWithStdin(unittest.TestCase):
+  def setUp(self):
+    self.result = mock.Mock(failed=False, cmd="ssh node1 ssh_update",
+                            fail_reason=None)
+    patchers = [
+      mock.patch.object(ssh, "SshRunner"),
+      mock.patch("ganeti.utils.RunCmd", return_value=self.result),
+      ]
+    (_, self.run_cmd_fn) = [p.start() for p in patchers]
+    for patcher in patchers:
+      self.addCleanup(patcher.stop)
+
+  def _Run(self, **kwargs):
+    ssh.RunSshCmdWithStdin("cluster", "node1", "ssh_update", 22,
+                           {"data": 1}, **kwargs)
+
+  def testNoTimeout(self):
+    self._Run()
+    self.assertEqual(self.run_cmd_fn.call_args[1]["timeout"], None)
+
+  def testTimeout(self):
+    self._Run(timeout=60)
+    self.assertEqual(self.run_cmd_fn.call_args[1]["timeout"], 60)
+
+  def testTimedOut(self):
+    self.result.failed = True
+    self.result.fail_reason = "terminated after timeout of 60 seconds"
+    self.assertRaises(errors.OpExecError, self._Run, timeout=60)
+
+
 class TestManageLocalSshPubKeys(testutils.GanetiTestCase):
   """Test class for several methods handling local SSH keys.
 
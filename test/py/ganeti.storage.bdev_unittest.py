@@ -33,6 +33,7 @@
 
 import os
 import random
+import threading
 import unittest
 
 from ganeti import compat
@@ -234,6 +235,133 @@ class TestExclusiveStoragePvs(unittest.TestCase):
             self.assertTrue(len(epvs) == num_req or pvi.free != pvi.size)
 
 
+class TestLvInventory(unittest.TestCase):
+  """Tests for bdev.LvInventory."""
+  def setUp(self):
+    self.now = 100.0
+    self.calls = []
+    self.extra = []
+
+  def _RunCmd(self, cmd):
+    self.calls.append(cmd)
+    stdout = "\n".join([
+      "  xenvg|disk0|-wi-ao|253|3|4096.00|2|/dev/sda(20),/dev/sdb(50)",
+      "  xenvg|disk1|-wi-ao|253|4|4096.00|1|/dev/sda(0)",
+      "  xenvg|disk1|-wi-ao|253|4|4096.00|1|/dev/sdb(70)",
+      "  othervg|root|-wi-ao|253|0|4096.00|1|/dev/sdc(0)",
+      ] + self.extra)
+    return utils.RunResult(0, None, stdout, "", cmd,
+                           utils.process._TIMEOUT_NONE, 5)
+
+  def _GetInventory(self):
+    return bdev.LvInventory(ttl=2.0, _run_cmd=self._RunCmd,
+                            _time_fn=lambda: self.now)
+
+  def testLookup(self):
+    inv = self._GetInventory()
+    self.assertEqual(inv.Lookup("/dev/xenvg/disk0"),
+                     ["-wi-ao|253|3|4096.00|2|/dev/sda(20),/dev/sdb(50)"])
+    self.assertEqual(len(inv.Lookup("/dev/xenvg/disk1")), 2)
+    self.assertEqual(len(inv.Lookup("/dev/othervg/root")), 1)
+    self.assertTrue(inv.Lookup("/dev/xenvg/missing") is None)
+    self.assertEqual(len(self.calls), 1)
+
+    # The lines can be parsed like the output of a single-volume query
+    info = bdev.LogicalVolume._ParseLvInfoLines(
+      inv.Lookup("/dev/xenvg/disk1"), "|")
+    self.assertEqual(info, ("-wi-ao", 253, 4, 4096, 1,
+                            set(["/dev/sda", "/dev/sdb"])))
+
+  def testExpiry(self):
+    inv = self._GetInventory()
+    inv.Lookup("/dev/xenvg/disk0")
+    self.now += 1
+    inv.Lookup("/dev/xenvg/disk0")
+    self.assertEqual(len(self.calls), 1)
+    self.now += 5
+    inv.Lookup("/dev/xenvg/disk0")
+    self.assertEqual(len(self.calls), 2)
+
+  def testScope(self):
+    inv = self._GetInventory()
+    with bdev.LvInventoryScope(_inventory=inv):
+      inv.Lookup("/dev/xenvg/disk0")
+      self.now += 60
+      inv.Lookup("/dev/xenvg/disk0")
+      self.assertEqual(len(self.calls), 1)
+      inv.Invalidate()
+      inv.Lookup("/dev/xenvg/disk0")
+      self.assertEqual(len(self.calls), 2)
+    self.now += 60
+    inv.Lookup("/dev/xenvg/disk0")
+    self.assertEqual(len(self.calls), 3)
+
+  def testScopeInOtherThread(self):
+    inv = self._GetInventory()
+    entered = threading.Event()
+    done = threading.Event()
+    result = []
+
+    def _Request():
+      with bdev.LvInventoryScope(_inventory=inv):
+        result.append(inv.Lookup("/dev/xenvg/disk0"))
+        entered.set()
+        done.wait()
+        # The scope's snapshot is kept until the scope is left
+        result.append(inv.Lookup("/dev/xenvg/new"))
+
+    thread = threading.Thread(target=_Request)
+    thread.start()
+    try:
+      entered.wait()
+      self.assertTrue(inv.Lookup("/dev/xenvg/new") is None)
+
+      # Created by another process while the other thread's scope is open
+      self.extra.append("  xenvg|new|-wi-a-|253|5|4096.00|1|/dev/sda(90)")
+      self.now += 5
+      self.assertEqual(inv.Lookup("/dev/xenvg/new"),
+                       ["-wi-a-|253|5|4096.00|1|/dev/sda(90)"])
+      self.assertEqual(len(self.calls), 2)
+    finally:
+      done.set()
+      thread.join()
+
+    self.assertTrue(result[0] is not None)
+    self.assertTrue(result[1] is None)
+
+  def testInvalidateOtherThread(self):
+    inv = self._GetInventory()
+    entered = threading.Event()
+    invalidated = threading.Event()
+    result = []
+
+    def _Request():
+      with bdev.LvInventoryScope(_inventory=inv):
+        inv.Lookup("/dev/xenvg/disk0")
+        entered.set()
+        invalidated.wait()
+        result.append(inv.Lookup("/dev/xenvg/new"))
+
+    thread = threading.Thread(target=_Request)
+    thread.start()
+    try:
+      entered.wait()
+      # A volume created by this process drops the snapshots of all scopes
+      self.extra.append("  xenvg|new|-wi-a-|253|5|4096.00|1|/dev/sda(90)")
+      inv.Invalidate()
+    finally:
+      invalidated.set()
+      thread.join()
+
+    self.assertEqual(result, [["-wi-a-|253|5|4096.00|1|/dev/sda(90)"]])
+    self.assertEqual(len(self.calls), 2)
+
+  def testFailure(self):
+    inv = bdev.LvInventory(_run_cmd=TestLogicalVolume._FakeRunCmd(False, ""),
+                           _time_fn=lambda: self.now)
+    self.assertTrue(inv.Lookup("/dev/xenvg/disk0") is None)
+
+
 class TestLogicalVolume(unittest.TestCase):
   """Tests for bdev.LogicalVolume."""
   def testParseLvInfoLine(self):
@@ -36,6 +36,7 @@ import os
 from ganeti import constants
 from ganeti import errors
 from ganeti import serializer
+from ganeti import utils
 from ganeti.storage import drbd
 from ganeti.storage import drbd_info
 from ganeti.storage import drbd_cmdgen
@@ -131,13 +132,35 @@ class TestDRBD8Runner(testutils.GanetiTestCase):
       )
     return retval
 
-  def testParser83Creation(self):
-    """Test drbdsetup show parser creation"""
-    drbd_info.DRBD83ShowInfo._GetShowParser()
+  def testParserErrors(self):
+    """Test drbdsetup show parser on broken data"""
+    for data in [
+      "disk {",
+      "}",
+      "protocol C",
+      "_this_host { address ipv4 192.0.2.1; }",
+      "{ }",
+      "meta-disk \"/dev/xenvg/test.meta\" [ 0 ;",
+      ]:
+      self.assertRaises(errors.BlockDeviceError,
+                        drbd_info.DRBD83ShowInfo.GetDevInfo, data)
+
+    self.assertRaises(errors.BlockDeviceError,
+                      drbd_info.DRBD84ShowInfo.GetDevInfo, "protocol C;")
 
-  def testParser84Creation(self):
-    """Test drbdsetup show parser creation"""
-    drbd_info.DRBD84ShowInfo._GetShowParser()
+  def testParser84AllMinors(self):
+    """Test drbdsetup show parser for all minors with version 8.4"""
+    data = testutils.ReadTestData("bdev-drbd-8.4.txt")
+    other = data.replace("resource0", "resource3") \
+                .replace("minor 0", "minor 3") \
+                .replace("test.data", "other.data")
+    result = drbd_info.DRBD84ShowInfo.GetDevInfoPerMinor(data + other)
+    self.assertEqual(sorted(result.keys()), [0, 3])
+    self.assertEqual(result[0], drbd_info.DRBD84ShowInfo.GetDevInfo(data))
+    self.failUnless(self._has_disk(result[3], "/dev/xenvg/other.data",
+                                   "/dev/xenvg/test.meta"),
+                    "Wrong local disk info")
+    self.assertEqual(drbd_info.DRBD84ShowInfo.GetDevInfoPerMinor(""), {})
 
   def testParser80(self):
     """Test drbdsetup show parser for disk and network version 8.0"""
@@ -481,5 +504,50 @@ class TestDRBD8Construction(testutils.GanetiTestCase):
     self.assertTrue(isinstance(inst._cmd_gen, drbd_cmdgen.DRBD84CmdGenerator))
 
 
+class TestDRBD8StateScope(testutils.GanetiTestCase):
+  def setUp(self):
+    testutils.GanetiTestCase.setUp(self)
+    self.proc84_info = \
+      drbd_info.DRBD8Info.CreateFromFile(
+        filename=testutils.TestDataFilename("proc_drbd84.txt"))
+
+  @testutils.patch_object(drbd_info.DRBD8Info, "CreateFromFile")
+  def testProcInfo(self, mock_create_from_file):
+    mock_create_from_file.return_value = self.proc84_info
+
+    drbd.DRBD8.GetProcInfo()
+    drbd.DRBD8.GetProcInfo()
+    self.assertEqual(mock_create_from_file.call_count, 2)
+
+    with drbd.DRBD8StateScope():
+      for _ in range(3):
+        self.assertEqual(drbd.DRBD8.GetProcInfo(), self.proc84_info)
+        drbd.DRBD8.GetUsedDevs()
+    self.assertEqual(mock_create_from_file.call_count, 3)
+
+    # The snapshot is gone after leaving the scope
+    drbd.DRBD8.GetProcInfo()
+    self.assertEqual(mock_create_from_file.call_count, 4)
+
+  @testutils.patch_object(drbd.utils, "RunCmd")
+  def testShowInfo(self, mock_run_cmd):
+    data = testutils.ReadTestData("bdev-drbd-8.4.txt")
+    mock_run_cmd.return_value = \
+      utils.RunResult(0, None, data, "", "drbdsetup show all",
+                      utils.process._TIMEOUT_NONE, 5)
+    cmd_gen = drbd_cmdgen.DRBD84CmdGenerator(self.proc84_info.GetVersion())
+    show_info_cls = drbd_info.DRBD84ShowInfo
+
+    self.assertTrue(drbd._state.GetShowInfo(0, show_info_cls, cmd_gen) is None)
+    self.assertFalse(mock_run_cmd.called)
+
+    with drbd.DRBD8StateScope():
+      self.assertEqual(drbd._state.GetShowInfo(0, show_info_cls, cmd_gen),
+                       show_info_cls.GetDevInfo(data))
+      # Minors missing from the output are not configured
+      self.assertEqual(drbd._state.GetShowInfo(1, show_info_cls, cmd_gen), {})
+    self.assertEqual(mock_run_cmd.call_count, 1)
+
+
 if __name__ == "__main__":
   testutils.GanetiTestProgram()
@@ -34,6 +34,8 @@ import unittest
 import random
 import operator
 import tempfile
+import shutil
+import os
 
 from ganeti import constants
 from ganeti import utils
@@ -118,5 +120,76 @@ class TestFingerprintFiles(unittest.TestCase):
     self.assertEqual(utils.FingerprintFiles(self.results.keys()), self.results)
 
 
+class TestFingerprintCache(unittest.TestCase):
+  def setUp(self):
+    self.tmpdir = tempfile.mkdtemp()
+    self.cache_file = utils.PathJoin(self.tmpdir, "cache")
+    self.file1 = utils.PathJoin(self.tmpdir, "file one")
+    self.file2 = utils.PathJoin(self.tmpdir, "file2")
+    utils.WriteFile(self.file1, data="")
+    utils.WriteFile(self.file2, data="Hello World\n")
+    self.results = {
+      self.file1: "da39a3ee5e6b4b0d3255bfef95601890afd80709",
+      self.file2: "648a6a6ffffdaa0badb23b8baf90b6168dd16b3a",
+      }
+    self.now = os.stat(self.file2).st_ctime + 60
+    self.hashed = []
+
+  def tearDown(self):
+    shutil.rmtree(self.tmpdir)
+
+  def _NewCache(self):
+    return utils.FingerprintCache(self.cache_file, _time_fn=lambda: self.now)
+
+  def _FingerprintFiles(self, files):
+    real_fn = utils.hash._FingerprintFile
+    def _FingerprintFile(filename):
+      self.hashed.append(filename)
+      return real_fn(filename)
+    utils.hash._FingerprintFile = _FingerprintFile
+    try:
+      return self._NewCache().FingerprintFiles(files)
+    finally:
+      utils.hash._FingerprintFile = real_fn
+
+  def testCached(self):
+    files = [self.file1, self.file2, "/no/such/file", self.tmpdir]
+    self.assertEqual(self._FingerprintFiles(files), (self.results, 0))
+    self.assertEqual(self._FingerprintFiles(files), (self.results, 2))
+    self.assertEqual(sorted(self.hashed), [self.file1, self.file2])
+
+  def testChangedFile(self):
+    files = [self.file1, self.file2]
+    self._FingerprintFiles(files)
+    utils.WriteFile(self.file2, data="Hello Ganeti\n")
+    self.now = os.stat(self.file2).st_ctime + 60
+    (result, hits) = self._FingerprintFiles(files)
+    self.assertEqual(hits, 1)
+    self.assertEqual(result[self.file2],
+                     utils.hash._FingerprintFile(self.file2))
+    self.assertEqual(self.hashed, [self.file1, self.file2, self.file2])
+
+  def testRecentlyChanged(self):
+    self.now = os.stat(self.file2).st_ctime + 1
+    self.assertEqual(self._FingerprintFiles([self.file2]), (
+      {self.file2: self.results[self.file2]}, 0))
+    self.assertEqual(self._FingerprintFiles([self.file2]), (
+      {self.file2: self.results[self.file2]}, 0))
+    self.assertEqual(len(self.hashed), 2)
+
+  def testUnrequestedDropped(self):
+    self._FingerprintFiles([self.file1, self.file2])
+    self._FingerprintFiles([self.file2])
+    self.assertEqual(self._FingerprintFiles([self.file1, self.file2]),
+                     (self.results, 1))
+
+  def testInvalidCacheFile(self):
+    utils.WriteFile(self.cache_file, data="garbage\nmore garbage a b c d e\n")
+    self.assertEqual(self._FingerprintFiles([self.file1, self.file2]),
+                     (self.results, 0))
+    self.assertEqual(self._FingerprintFiles([self.file1, self.file2]),
+                     (self.results, 2))
+
+
 if __name__ == "__main__":
   testutils.GanetiTestProgram()
@@ -0,0 +1,94 @@
+#!/usr/bin/python
+#
+
+# Copyright (C) 2026 Google Inc.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+#
+# 1. Redistributions of source code must retain the above copyright notice,
+# this list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright
+# notice, this list of conditions and the following disclaimer in the
+# documentation and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS
+# IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED
+# TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR
+# PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR
+# CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+# EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+# PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR
+# PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF
+# LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
+# NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+
+"""Script for testing ganeti.utils.parallel"""
+
+import threading
+import time
+import unittest
+
+from ganeti import utils
+
+import testutils
+
+
+class TestRunParallel(unittest.TestCase):
+  def testEmpty(self):
+    self.assertEqual(utils.RunParallel(NotImplemented, [], 4), [])
+
+  def testOrder(self):
+    def _Fn(value, delay):
+      time.sleep(delay)
+      return value * 2
+    args = [(i, 0.001 * (10 - i)) for i in range(10)]
+    self.assertEqual(utils.RunParallel(_Fn, args, 4),
+                     [i * 2 for i in range(10)])
+
+  def testSingleThread(self):
+    threads = []
+    def _Fn(value):
+      threads.append(threading.currentThread())
+      return value
+    self.assertEqual(utils.RunParallel(_Fn, [(1, ), (2, ), (3, )], 1),
+                     [1, 2, 3])
+    self.assertEqual(set(threads), set([threading.currentThread()]))
+
+  def testBounded(self):
+    lock = threading.Lock()
+    running = [0]
+    peak = [0]
+    def _Fn():
+      with lock:
+        running[0] += 1
+        peak[0] = max(peak[0], running[0])
+      time.sleep(0.01)
+      with lock:
+        running[0] -= 1
+    utils.RunParallel(_Fn, [()] * 12, 3)
+    self.assertTrue(1 < peak[0] <= 3)
+
+  def testException(self):
+    done = []
+    def _Fn(value):
+      if value in (2, 4):
+        raise ValueError(value)
+      done.append(value)
+    try:
+      utils.RunParallel(_Fn, [(i, ) for i in range(6)], 3)
+    except ValueError, err:
+      self.assertEqual(err.args, (2, ))
+    else:
+      self.fail("Exception was not raised")
+    self.assertEqual(sorted(done), [0, 1, 3, 5])
+
+
+if __name__ == "__main__":
+  testutils.GanetiTestProgram()
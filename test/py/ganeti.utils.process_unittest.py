@@ -262,6 +262,21 @@ class TestRunCmd(testutils.GanetiTestCase):
     self.assertEqual(result.output, "")
     self.assertFileContent(self.fname, expected)
 
+  def testLineFn(self):
+    """Test passing output lines to a callback"""
+    lines = []
+    cmd = "echo one; echo two 1>&2; echo; echo -n three"
+    result = utils.RunCmd(["/bin/sh", "-c", cmd], line_fn=lines.append)
+    self.assertEqual(result.stdout, "one\n\nthree")
+    self.assertEqual(result.stderr, "two\n")
+    self.assertEqual(sorted(lines), sorted(["one", "two", "", "three"]))
+
+  def testLineFnConflicts(self):
+    self.assertRaises(errors.ProgrammerError, utils.RunCmd, "true",
+                      output=self.fname, line_fn=NotImplemented)
+    self.assertRaises(errors.ProgrammerError, utils.RunCmd, "true",
+                      interactive=True, line_fn=NotImplemented)
+
   def testSignal(self):
     """Test signal"""
     result = utils.RunCmd(["python", "-c",
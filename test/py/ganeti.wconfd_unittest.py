@@ -0,0 +1,102 @@
+#!/usr/bin/python
+#
+
+# Copyright (C) 2015 Google Inc.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+#
+# 1. Redistributions of source code must retain the above copyright notice,
+# this list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright
+# notice, this list of conditions and the following disclaimer in the
+# documentation and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS
+# IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED
+# TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR
+# PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR
+# CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+# EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+# PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR
+# PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF
+# LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
+# NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+
+"""Script for unittesting the wconfd module"""
+
+
+import unittest
+
+from ganeti import wconfd
+from ganeti.rpc import client
+from ganeti.rpc import errors as rpcerr
+
+import testutils
+
+
+class _FakeTransport(object):
+  def __init__(self, responses):
+    self._responses = responses
+    self.instances = []
+
+  def __call__(self, address, timeouts=None, allow_non_master=None):
+    self.instances.append(self)
+    return self
+
+  def Call(self, _):
+    result = self._responses.pop(0)
+    if isinstance(result, Exception):
+      raise result
+    return client.FormatResponse(True, result)
+
+  def Close(self):
+    pass
+
+
+class TestSharedClient(unittest.TestCase):
+  def testReconnect(self):
+    transport = _FakeTransport([1, rpcerr.TimeoutError("timeout"), 2])
+    cl = wconfd._SharedClient(transport=transport)
+    self.assertEqual(len(transport.instances), 1)
+    self.assertEqual(cl.CallMethod("Echo", ["x"]), 1)
+    self.assertRaises(rpcerr.TimeoutError, cl.CallMethod, "Echo", ["x"])
+    self.assertEqual(len(transport.instances), 1)
+    self.assertEqual(cl.CallMethod("Echo", ["x"]), 2)
+    self.assertEqual(len(transport.instances), 2)
+
+  def testGetSharedClient(self):
+    created = []
+
+    def _Create(**kwargs):
+      created.append(kwargs)
+      return object()
+
+    orig_class = wconfd._SharedClient
+    wconfd._shared_clients.clear()
+    wconfd._SharedClient = _Create
+    try:
+      first = wconfd.GetSharedClient()
+      self.assertTrue(wconfd.GetSharedClient() is first)
+      self.assertFalse(wconfd.GetSharedClient(allow_non_master=True) is first)
+      self.assertEqual(len(created), 2)
+
+      # a forked process gets its own client
+      ((pid, _), ) = [k for k in wconfd._shared_clients if not k[1]]
+      wconfd._shared_clients[(pid + 1, False)] = \
+        wconfd._shared_clients.pop((pid, False))
+      self.assertFalse(wconfd.GetSharedClient() is first)
+      self.assertEqual(len(created), 3)
+    finally:
+      wconfd._SharedClient = orig_class
+      wconfd._shared_clients.clear()
+
+
+if __name__ == "__main__":
+  testutils.GanetiTestProgram()
@@ -0,0 +1,230 @@
+#!/usr/bin/python
+#
+
+# Copyright (C) 2015 Google Inc.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+#
+# 1. Redistributions of source code must retain the above copyright notice,
+# this list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright
+# notice, this list of conditions and the following disclaimer in the
+# documentation and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS
+# IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED
+# TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR
+# PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR
+# CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+# EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+# PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR
+# PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF
+# LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
+# NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+"""Script for testing the performance of query filters"""
+
+import operator
+import optparse
+import random
+import time
+
+from ganeti import compat
+from ganeti import constants
+from ganeti import qlang
+from ganeti import query
+from ganeti import utils
+
+from testutils.config_mock import ConfigMock
+
+
+def ParseOptions():
+  """Parses the command line options.
+
+  In case of command line errors, it will show the usage and exit the
+  program.
+
+  @return: the options in a tuple
+
+  """
+  parser = optparse.OptionParser()
+  parser.add_option("-n", dest="counts", default="10000,100000",
+                    help="Comma-separated numbers of instances"
+                    " (default: %default)", metavar="NUMS")
+  parser.add_option("--nodes", dest="node_count", default=40, type="int",
+                    help="Number of nodes (default: %default)", metavar="NUM")
+  parser.add_option("-r", dest="repeat", default=3, type="int",
+                    help="Number of runs per filter", metavar="NUM")
+
+  (opts, args) = parser.parse_args()
+
+  if opts.repeat < 1:
+    parser.error("Number of runs must be at least 1")
+
+  if opts.node_count < 1:
+    parser.error("Number of nodes must be at least 1")
+
+  try:
+    opts.counts = [int(i) for i in opts.counts.split(",")]
+  except ValueError, err:
+    parser.error("Invalid number of instances: %s" % err)
+
+  return (opts, args)
+
+
+def _MatchNameComponent(lhs, rhs):
+  return utils.MatchNameComponent(rhs, [lhs], case_sensitive=False)
+
+
+def _WrapLogicOp(op_fn, sentences, ctx, item):
+  return op_fn(fn(ctx, item) for fn in sentences)
+
+
+def _WrapUnaryOp(op_fn, inner, ctx, item):
+  return op_fn(inner(ctx, item))
+
+
+def _WrapBinaryOp(op_fn, retrieval_fn, value, ctx, item):
+  return op_fn(retrieval_fn(ctx, item), value)
+
+
+# pylint: disable=W0212
+class _ClosureFilterCompiler(query._FilterCompilerHelper):
+  """Converts filters to nested closures, the way L{query} used to.
+
+  """
+
+  _LOGIC_FNS = {
+    qlang.OP_OR: compat.any,
+    qlang.OP_AND: compat.all,
+    }
+
+  def _BuildFunction(self, fn):
+    return fn
+
+  def _HandleLogicOp(self, hints_fn, level, op, op_fn, operands):
+    if hints_fn:
+      hints_fn(op)
+
+    return compat.partial(_WrapLogicOp, self._LOGIC_FNS[op],
+                          [self._Compile(i, level + 1) for i in operands])
+
+  def _HandleUnaryOp(self, hints_fn, level, op, op_fn, operands):
+    if op == qlang.OP_TRUE:
+      (_, datakind, _, retrieval_fn) = self._LookupField(operands[0])
+
+      if hints_fn:
+        hints_fn(op, datakind)
+
+      return compat.partial(_WrapUnaryOp, operator.truth, retrieval_fn)
+
+    if hints_fn:
+      hints_fn(op, None)
+
+    return compat.partial(_WrapUnaryOp, operator.not_,
+                          self._Compile(operands[0], level + 1))
+
+  def _MakeLeaf(self, fdef, retrieval_fn, fn, valprepfn, value):
+    if fn is query._MatchHostname:
+      fn = _MatchNameComponent
+    elif valprepfn:
+      value = valprepfn(value)
+
+    return compat.partial(_WrapBinaryOp, fn, retrieval_fn, value)
+
+
+def _BuildData(count, opts):
+  """Builds a cluster configuration with the given number of instances.
+
+  @return: tuple of data container and a list of filters by name
+
+  """
+  rnd = random.Random(count)
+
+  cfg = ConfigMock()
+  nodes = [cfg.AddNewNode() for _ in range(opts.node_count)]
+
+  for _ in range(count):
+    cfg.AddNewInstance(primary_node=rnd.choice(nodes), disks=[], nics=[],
+                       admin_state=rnd.choice(list(constants.ADMINST_ALL)))
+
+  instances = cfg.GetAllInstancesInfo().values()
+  ctx = query.InstanceQueryData(instances, cfg.GetClusterInfo(), {}, [], [],
+                                {}, set(), {}, cfg.GetAllNodesInfo(),
+                                cfg.GetAllNodeGroupsInfo(),
+                                cfg.GetAllNetworksInfo())
+
+  some_nodes = [node.name for node in rnd.sample(nodes, min(5, len(nodes)))]
+  some_instances = [inst.name.split(".")[0]
+                    for inst in rnd.sample(instances, min(50, count))]
+
+  filters = [
+    ("names", qlang.MakeSimpleFilter("name", some_instances)),
+    ("nodes", qlang.MakeSimpleFilter("pnode", some_nodes)),
+    ("states", ["|", ["=", "admin_state", constants.ADMINST_UP],
+                ["=", "admin_state", constants.ADMINST_OFFLINE]]),
+    ("regex", ["|", ["=~", "name", r"_1\d*\."], ["=~", "name", r"_2\d*\."],
+               ["&", ["=~", "name", r"_1\d*\."], ["?", "network_port"]]]),
+    ("mixed", ["&", ["=", "admin_state", constants.ADMINST_UP],
+               ["!", ["=~", "name", "7"]],
+               ["|"] + [["=", "pnode", name] for name in some_nodes],
+               ["|", ["&"], ["=", "os", "unknown"]]]),
+    ]
+
+  return (ctx, filters)
+
+
+def _Measure(compiler_cls, ctx, qfilter, opts):
+  """Measures the time needed to compile and evaluate a filter.
+
+  @return: tuple of compilation time, average evaluation time in seconds and
+    the number of matching instances
+
+  """
+  start = time.time()
+  filter_fn = compiler_cls(query.INSTANCE_FIELDS)(None, qfilter)
+  compile_time = time.time() - start
+
+  # The filters only use fields which don't need the per-instance state set
+  # up while iterating over the data container
+  items = ctx.instances
+
+  start = time.time()
+  for _ in range(opts.repeat):
+    matches = [item for item in items if filter_fn(ctx, item)]
+  duration = time.time() - start
+
+  return (compile_time, duration / opts.repeat,
+          [item.name for item in matches])
+
+
+def main():
+  (opts, _) = ParseOptions()
+
+  print ("%8s %-8s %8s %14s %14s %14s %8s" %
+         ("Count", "Filter", "Matches", "Compile (ms)", "Old (ms)",
+          "New (ms)", "Speedup"))
+  for count in opts.counts:
+    (ctx, filters) = _BuildData(count, opts)
+
+    for (name, qfilter) in filters:
+      (_, old, old_matches) = \
+        _Measure(_ClosureFilterCompiler, ctx, qfilter, opts)
+      (compile_time, new, new_matches) = \
+        _Measure(query._FilterCompilerHelper, # pylint: disable=W0212
+                 ctx, qfilter, opts)
+      assert old_matches == new_matches
+
+      print ("%8d %-8s %8d %14.2f %14.2f %14.2f %7.1fx" %
+             (count, name, len(new_matches), 1000.0 * compile_time,
+              1000.0 * old, 1000.0 * new, old / max(new, 1e-9)))
+
+
+if __name__ == "__main__":
+  main()
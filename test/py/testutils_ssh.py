@@ -30,6 +30,8 @@
 
 """Helper class to test ssh-related code."""
 
+import threading
+
 from ganeti import constants
 from ganeti import pathutils
 from ganeti import errors
@@ -76,6 +78,9 @@ class FakeSshFileManager(object):
     # Dictionary mapping nodes by name to number of retries which
     # 'RunCommand' has already carried out.
     self._retries = {}
+    # Lock serializing 'RunCommand', which is called for several nodes in
+    # parallel
+    self._lock = threading.Lock()
 
     self._AssertTypePublicKeys()
     self._AssertTypeAuthorizedKeys()
@@ -503,7 +508,7 @@ class FakeSshFileManager(object):
   def RunCommand(self, cluster_name, node, base_cmd, port, data,
                  debug=False, verbose=False, use_cluster_key=False,
                  ask_key=False, strict_host_check=False,
-                 ensure_version=False):
+                 ensure_version=False, timeout=None):
     """This emulates ssh.RunSshCmdWithStdin calling ssh_update.
 
     While in real SSH operations, ssh.RunSshCmdWithStdin is called
@@ -513,6 +518,14 @@ class FakeSshFileManager(object):
     of SSH keys. No actual key files of any node is touched.
 
     """
+    self._lock.acquire()
+    try:
+      self._RunCommandUnlocked(node, base_cmd, data)
+    finally:
+      self._lock.release()
+  # pylint: enable=W0613
+
+  def _RunCommandUnlocked(self, node, base_cmd, data):
     if node in self._max_retries:
       if node not in self._retries:
         self._retries[node] = 0
@@ -532,7 +545,6 @@ class FakeSshFileManager(object):
     if constants.SSHS_GENERATE in data:
       instructions_generate = data[constants.SSHS_GENERATE]
       self._GenerateNewKey(instructions_generate, node)
-  # pylint: enable=W0613
 
   def _GenerateNewKey(self, instructions_generate, node):
     """Generates a new key for the given node.
@@ -0,0 +1,197 @@
+#!/usr/bin/python
+#
+
+# Copyright (C) 2015 Google Inc.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are
+# met:
+#
+# 1. Redistributions of source code must retain the above copyright notice,
+# this list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright
+# notice, this list of conditions and the following disclaimer in the
+# documentation and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS
+# IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED
+# TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR
+# PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR
+# CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+# EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+# PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR
+# PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF
+# LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
+# NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+"""Script for testing the performance of receiving RPC messages"""
+
+import collections
+import optparse
+import os
+import socket
+import threading
+import time
+
+from ganeti import constants
+from ganeti.rpc import transport
+
+
+#: Default message sizes, from 1 KB to 50 MB
+_DEFAULT_SIZES = "1K,64K,1M,10M,50M"
+
+_UNITS = {
+  "K": 1024,
+  "M": 1024 * 1024,
+  }
+
+
+def ParseOptions():
+  """Parses the command line options.
+
+  In case of command line errors, it will show the usage and exit the
+  program.
+
+  @return: the options in a tuple
+
+  """
+  parser = optparse.OptionParser()
+  parser.add_option("-s", dest="sizes", default=_DEFAULT_SIZES,
+                    help="Comma-separated message sizes, with an optional"
+                    " K or M suffix (default: %s)" % _DEFAULT_SIZES,
+                    metavar="SIZES")
+  parser.add_option("-r", dest="repeat", default=3, type="int",
+                    help="Number of messages of each size", metavar="NUM")
+  parser.add_option("--chunk", dest="chunk", default=4096, type="int",
+                    help="Read size of the old framing", metavar="BYTES")
+  parser.add_option("--old-max", dest="old_max", default="4M",
+                    help="Largest message size to measure the old framing"
+                    " for; it is quadratic and very slow on large messages"
+                    " (default: %default)", metavar="SIZE")
+
+  (opts, args) = parser.parse_args()
+
+  if opts.repeat < 1:
+    parser.error("Number of messages must be at least 1")
+
+  try:
+    opts.sizes = [_ParseSize(i) for i in opts.sizes.split(",")]
+    opts.old_max = _ParseSize(opts.old_max)
+  except ValueError, err:
+    parser.error("Invalid message size: %s" % err)
+
+  return (opts, args)
+
+
+def _ParseSize(text):
+  """Parses a size with an optional unit suffix.
+
+  """
+  text = text.strip().upper()
+  if text and text[-1] in _UNITS:
+    return int(text[:-1]) * _UNITS[text[-1]]
+  return int(text)
+
+
+def _Writer(fd, msg, count):
+  """Thread function writing messages to a file descriptor.
+
+  """
+  data = msg + constants.LUXI_EOM
+  for _ in range(count):
+    view = buffer(data)
+    while view:
+      written = os.write(fd, view)
+      view = buffer(view, written)
+
+
+def _OldReceiver(fd, opts):
+  """Returns a function receiving messages the way L{transport} used to.
+
+  Every chunk re-copies and re-splits the data received so far.
+
+  """
+  state = {
+    "buffer": "",
+    "msgs": collections.deque(),
+    }
+
+  def _Recv():
+    while not state["msgs"]:
+      data = os.read(fd, opts.chunk)
+      if not data:
+        raise EOFError()
+      new_msgs = (state["buffer"] + data).split(constants.LUXI_EOM)
+      state["buffer"] = new_msgs.pop()
+      state["msgs"].extend(new_msgs)
+    return state["msgs"].popleft()
+
+  return _Recv
+
+
+def _NewReceiver(fd, _):
+  """Returns a function receiving messages using L{transport.MessageBuffer}.
+
+  """
+  msgbuf = transport.MessageBuffer()
+
+  def _Recv():
+    while not msgbuf.HasMessages():
+      data = os.read(fd, msgbuf.read_size)
+      if not data:
+        raise EOFError()
+      msgbuf.Feed(data)
+    return msgbuf.PopMessage()
+
+  return _Recv
+
+
+def _Measure(receiver_fn, size, opts):
+  """Measures the time needed to receive messages of the given size.
+
+  @return: the average time per message in seconds
+
+  """
+  msg = "x" * size
+  (rsock, wsock) = socket.socketpair()
+  try:
+    writer = threading.Thread(target=_Writer,
+                              args=(wsock.fileno(), msg, opts.repeat))
+    writer.setDaemon(True)
+    writer.start()
+
+    recv_fn = receiver_fn(rsock.fileno(), opts)
+    start = time.time()
+    for _ in range(opts.repeat):
+      result = recv_fn()
+      assert len(result) == size
+    duration = time.time() - start
+
+    writer.join()
+  finally:
+    rsock.close()
+    wsock.close()
+
+  return duration / opts.repeat
+
+
+def main():
+  (opts, _) = ParseOptions()
+
+  print "%12s %14s %14s %14s" % ("Size", "Old (ms)", "New (ms)", "New (MB/s)")
+  for size in opts.sizes:
+    if size > opts.old_max:
+      old = "-"
+    else:
+      old = "%0.2f" % (1000.0 * _Measure(_OldReceiver, size, opts))
+    new = max(_Measure(_NewReceiver, size, opts), 1e-9)
+    print ("%12d %14s %14.2f %14.1f" %
+           (size, old, 1000.0 * new, size / (new * 1024 * 1024)))
+
+
+if __name__ == "__main__":
+  main()